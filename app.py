@@ -3,22 +3,452 @@
 Flask交通流量数据展示系统
 """
 
+import os
+import time
+import logging
+
 # 导入Flask相关模块
-from flask import Flask, render_template, request, jsonify
-from datetime import datetime, timezone, timedelta
+from flask import Flask, Response, render_template, request, jsonify, g
+from datetime import datetime
 
 # 导入我们自己的数据库模块
-from utils.database import get_database
+from utils.database import (get_database, get_page_anchor_stats, get_pool_stats, get_single_flight_stats,
+                            parse_time_bound, resolve_db_path, LOCAL_TZ, PLATE_LOOKUP_MAX_LIMIT, DEFAULT_PER_PAGE,
+                            MAX_PER_PAGE)
+# 导入多路口分片
+from utils.shards import resolve_intersections
 # 导入图表生成器
 from utils.chart_generator import create_pie_chart_data_for_ajax, create_trend_chart_data_for_ajax, create_weekday_weekend_trend_chart_for_ajax
 # 导入常量
-from utils.constants import get_time_text, get_direction_text, DIRECTION_MAP
+from utils.constants import get_time_text, get_direction_text, DIRECTION_MAP, TIME_RANGE_MAP
+# 导入响应缓存
+from utils.cache import ResponseCache
+# 导入搜索结果导出
+from utils.export import EXPORT_FORMATS, ARROW_FORMATS, iter_export, pyarrow_available
+# 导入记录序列化
+from utils.serialization import PAYLOAD_FORMATS, FastJSONProvider, columnar_payload, format_local_times, record_dicts
+# 导入实时推送
+from utils.live import LIVE_SUBSCRIPTION_KEY, LiveSubscription, get_live_feed, get_live_feed_stats, iter_live_messages
+# 导入指标、耗时区段和慢查询记录
+from utils.metrics import (PROMETHEUS_CONTENT_TYPE, REQUEST_SECONDS, REQUESTS_TOTAL, configure_logging, current_spans,
+                           finish_request_spans, render_prometheus, server_timing, span, start_request_spans)
+from utils.profiling import SLOW_QUERY_MS, get_recent_slow_queries
 
 # 创建Flask应用实例
 app = Flask(__name__)
+# 更快的JSON序列化（安装orjson时使用orjson）
+app.json = FastJSONProvider(app)
+
+# 分级日志：TRAFFIC_LOG_LEVEL=DEBUG 时输出每个请求的参数和耗时区段（默认INFO）
+configure_logging()
+logger = logging.getLogger(__name__)
+
+
+def get_db():
+    """
+    获取当前请求的数据库实例（应用上下文资源）
+    
+    同一请求内多次调用复用同一个连接，连接从共享只读连接池借出，
+    请求结束时由teardown_db自动归还。分片部署时只包含 intersection 参数指定的路口。
+    
+    Returns:
+        TrafficDatabase: 已连接的数据库实例，连接失败时返回None
+    """
+    if 'db' not in g:
+        db = get_database(pooled=True, intersections=g.get('intersections'))
+        with span('connect'):
+            connected = db.connect()
+        if not connected:
+            return None
+        g.db = db
+    return g.db
+
+
+@app.teardown_appcontext
+def teardown_db(exception):
+    """请求结束时把连接归还连接池"""
+    db = g.pop('db', None)
+    if db is not None:
+        db.disconnect()
+
+
+@app.before_request
+def start_request_timing():
+    """开始记录请求耗时和耗时区段"""
+    g.request_started = time.perf_counter()
+    g.span_token = start_request_spans()
+
+
+@app.before_request
+def parse_intersection_filter():
+    """解析所有接口共用的 intersection 参数（逗号分隔的路口名称，仅分片部署），无效时返回400"""
+    if not request.path.startswith('/api/'):
+        return None
+    try:
+        g.intersections = resolve_intersections(resolve_db_path(), request.args.get('intersection', '', type=str))
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'message': 'intersection参数无效'
+        }), 400
+    return None
+
+
+@app.after_request
+def record_request_timing(response):
+    """
+    记录请求耗时：按路由累计到直方图，耗时区段写入 Server-Timing 响应头
+    （流式响应只统计到返回响应头为止）
+    """
+    started = g.pop('request_started', None)
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    REQUEST_SECONDS.observe((route, request.method), elapsed)
+    REQUESTS_TOTAL.inc((route, request.method, str(response.status_code)))
+
+    spans = current_spans()
+    response.headers['Server-Timing'] = server_timing(spans, elapsed)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("request route=%s method=%s status=%d total_ms=%.2f spans=%s",
+                     route, request.method, response.status_code, elapsed * 1000,
+                     ','.join(f'{name}:{seconds * 1000:.2f}' for name, seconds in spans))
+    return response
+
+
+@app.teardown_request
+def finish_request_timing(exception):
+    """结束耗时区段收集"""
+    token = g.pop('span_token', None)
+    if token is not None:
+        finish_request_spans(token)
+
+
+# 图表响应缓存 - 键为 (图表名称, 筛选条件, 时间窗口, 数据版本)，写入新数据后自动失效
+chart_cache = ResponseCache(
+    max_entries=int(os.environ.get('TRAFFIC_CACHE_MAX_ENTRIES', '128')),
+    ttl=float(os.environ.get('TRAFFIC_CACHE_TTL', '300'))
+)
+
+# 图表名称 -> (生成函数, 筛选参数名)
+CHART_BUILDERS = {
+    'pie': (create_pie_chart_data_for_ajax, 'time_range'),
+    'trend': (create_trend_chart_data_for_ajax, 'direction_filter'),
+    'weekday_weekend': (create_weekday_weekend_trend_chart_for_ajax, 'direction_filter')
+}
+
+
+def get_chart_data(chart_name: str, filter_value=None, start: float = None, end: float = None) -> dict:
+    """
+    获取图表配置（优先读取缓存）
+    
+    Args:
+        chart_name: CHART_BUILDERS中的图表名称
+        filter_value: 筛选条件（时间段或方向），None表示不筛选
+        start: 时间窗口起始时间戳（包含），None表示不限
+        end: 时间窗口结束时间戳（不包含），None表示不限
+        
+    Returns:
+        dict: Plotly图表配置数据
+    """
+    builder, filter_name = CHART_BUILDERS[chart_name]
+    db = get_db()
+    if db is None:
+        raise Exception("无法连接数据库")
+    
+    cache_key = (chart_name, filter_value, start, end, db.db_path, db.get_data_version())
+    with span('chart'):
+        return chart_cache.get_or_compute(
+            cache_key, lambda: builder(**{filter_name: filter_value}, db=db, start=start, end=end)
+        )
+
+
+def parse_time_window() -> tuple:
+    """
+    读取请求中的时间窗口参数 start/end
+    
+    两者都可以是Unix时间戳、'YYYY-MM-DD' 日期或ISO格式时间（不带时区时按统计时区解析），
+    窗口为 [start, end)，end只给出日期时包含当天。
+    
+    Returns:
+        tuple: (start, end) 时间戳，未提供的一端为None
+        
+    Raises:
+        ValueError: 参数无法解析或 start 不早于 end
+    """
+    start = parse_time_bound(request.args.get('start', '', type=str))
+    end = parse_time_bound(request.args.get('end', '', type=str), is_end=True)
+    if start is not None and end is not None and start >= end:
+        raise ValueError("开始时间必须早于结束时间")
+    return start, end
+
+
+def parse_per_page() -> int:
+    """
+    读取请求中的每页记录数参数 per_page
+    
+    Returns:
+        int: 每页记录数，未提供时为 DEFAULT_PER_PAGE
+        
+    Raises:
+        ValueError: 参数不是整数或超出 1-MAX_PER_PAGE
+    """
+    value = request.args.get('per_page', '', type=str).strip()
+    if not value:
+        return DEFAULT_PER_PAGE
+    try:
+        per_page = int(value)
+    except ValueError:
+        raise ValueError(f"每页记录数必须是整数: {value}") from None
+    if not 1 <= per_page <= MAX_PER_PAGE:
+        raise ValueError(f"每页记录数必须在1到{MAX_PER_PAGE}之间")
+    return per_page
+
+
+def format_time_window(start: float = None, end: float = None) -> str:
+    """生成时间窗口的中文描述，未指定窗口时返回空字符串"""
+    if start is None and end is None:
+        return ''
+    
+    def format_bound(timestamp):
+        if timestamp is None:
+            return '不限'
+        return datetime.fromtimestamp(timestamp, tz=LOCAL_TZ).strftime('%Y-%m-%d %H:%M')
+    
+    return f"{format_bound(start)} ~ {format_bound(end)}"
+
+
+def invalid_window_response(error: ValueError):
+    """时间窗口参数无效时的400响应"""
+    return jsonify({
+        'success': False,
+        'error': str(error),
+        'message': '时间窗口参数无效'
+    }), 400
+
+
+def invalid_page_size_response(error: ValueError):
+    """每页记录数参数无效时的400响应"""
+    return jsonify({
+        'success': False,
+        'error': str(error),
+        'message': '每页记录数参数无效'
+    }), 400
+
+
+def invalid_format_response(payload_format: str):
+    """数据格式参数无效时的400响应"""
+    return jsonify({
+        'success': False,
+        'error': f'不支持的数据格式: {payload_format}',
+        'message': f"可选格式: {', '.join(PAYLOAD_FORMATS)}"
+    }), 400
+
+
+def warm_chart_cache():
+    """预热图表缓存：计算所有时间段和方向组合的图表"""
+    logger.info("🔥 正在预热图表缓存...")
+    with app.app_context():
+        for time_range in [None] + list(TIME_RANGE_MAP):
+            get_chart_data('pie', time_range)
+        for direction in [None] + [str(direction) for direction in DIRECTION_MAP]:
+            get_chart_data('trend', direction)
+            get_chart_data('weekday_weekend', direction)
+    logger.info("✅ 图表缓存预热完成：%d 个条目", chart_cache.stats()['entries'])
+
+
+def format_traffic_records(records: list) -> list:
+    """
+    为记录添加 formatted_time（北京时间）和 direction_text 字段
+    
+    Args:
+        records: 记录字典列表（原地修改）
+        
+    Returns:
+        list: 同一个列表
+    """
+    formatted_times = format_local_times([record['time'] for record in records])
+    for record, formatted_time in zip(records, formatted_times):
+        record['formatted_time'] = formatted_time
+        record['direction_text'] = get_direction_text(record['direction'])
+    return records
+
+
+def build_traffic_page(db, time_range: str = '', direction: str = '', page: int = 1, mode: str = 'offset',
+                       after: str = '', before: str = '', sort: str = 'id', estimate: bool = False,
+                       start: float = None, end: float = None, per_page: int = DEFAULT_PER_PAGE,
+                       payload_format: str = 'records') -> dict:
+    """
+    查询一页交通数据并生成接口响应（/api/traffic-data 和 /api/dashboard 共用）
+    
+    Args:
+        db: 已连接的数据库实例
+        time_range: 时间段筛选
+        direction: 方向筛选
+        page: 页码
+        mode: 分页模式，offset 或 cursor
+        after: 下一页游标
+        before: 上一页游标
+        sort: 游标分页的排序键
+        estimate: 是否允许返回估算的总数
+        start: 时间窗口起始时间戳（包含），None表示不限
+        end: 时间窗口结束时间戳（不包含），None表示不限
+        per_page: 每页记录数
+        payload_format: 'records'（每条记录一个字典）或 'columns'（列式，时间由浏览器格式化）
+        
+    Returns:
+        dict: 包含 data、pagination、search_info、filters 的响应数据
+        
+    Raises:
+        ValueError: 游标无效
+    """
+    # 查询数据（记录按元组读取，由serialization模块批量转换）
+    time_filter = time_range if time_range and time_range.strip() else None
+    direction_filter = direction if direction and direction.strip() else None
+
+    # 先获取总数（同一搜索翻页时命中缓存，不再重复COUNT）
+    with span('count'):
+        total_records, is_estimate = db.count_with_filters(
+            time_range=time_filter,
+            direction_filter=direction_filter,
+            estimate=estimate,
+            start=start,
+            end=end
+        )
+
+    cursor_info = {}
+    with span('query'):
+        if mode == 'cursor' or after or before:
+            result = db.search_with_cursor(
+                time_range=time_filter,
+                direction_filter=direction_filter,
+                after=after or None,
+                before=before or None,
+                page=page,
+                per_page=per_page,
+                sort=sort,
+                total_records=total_records,
+                start=start,
+                end=end,
+                as_tuples=True
+            )
+            # 页码范围验证（游标翻页时页码只用于显示）
+            if not (after or before) and page > result['total_pages'] and result['total_pages'] > 0:
+                page = result['total_pages']
+                result = db.search_with_cursor(
+                    time_range=time_filter,
+                    direction_filter=direction_filter,
+                    page=page,
+                    per_page=per_page,
+                    sort=sort,
+                    total_records=total_records,
+                    start=start,
+                    end=end,
+                    as_tuples=True
+                )
+
+            traffic_records = result['records']
+            total_records = result['total_records']
+            total_pages = result['total_pages']
+            page = max(1, min(page, total_pages)) if total_pages > 0 else 1
+            # 游标翻页时页码只是显示提示，是否还有上一页/下一页以游标查询的结果为准
+            cursor_info = {
+                'mode': 'cursor',
+                'sort': sort,
+                'next_cursor': result['next_cursor'],
+                'prev_cursor': result['prev_cursor'],
+                'has_prev': result['has_prev'],
+                'has_next': result['has_next'],
+                'prev_page': max(page - 1, 1) if result['has_prev'] else None,
+                'next_page': page + 1 if result['has_next'] else None
+            }
+        else:
+            traffic_records, total_records, total_pages = db.search_with_filters(
+                time_range=time_filter,
+                direction_filter=direction_filter,
+                page=page,
+                per_page=per_page,
+                total_records=total_records,
+                start=start,
+                end=end,
+                as_tuples=True
+            )
+
+            # 页码范围验证
+            if page > total_pages and total_pages > 0:
+                page = total_pages
+                traffic_records, total_records, total_pages = db.search_with_filters(
+                    time_range=time_filter,
+                    direction_filter=direction_filter,
+                    page=page,
+                    per_page=per_page,
+                    total_records=total_records,
+                    start=start,
+                    end=end,
+                    as_tuples=True
+                )
+
+    # 生成搜索状态描述
+    search_parts = []
+    if time_range and time_range.strip():
+        time_text = get_time_text(time_range)
+        search_parts.append(f"时间段'{time_text}'")
+    if direction and direction.strip():
+        direction_text = get_direction_text(direction)
+        search_parts.append(f"方向'{direction_text}'")
+    window_text = format_time_window(start, end)
+    if window_text:
+        search_parts.append(f"时间窗口'{window_text}'")
+
+    search_info = f"搜索: {'+'.join(search_parts)}" if search_parts else "显示所有记录"
+
+    # 处理时间格式转换
+    with span('serialize'):
+        if payload_format == 'columns':
+            data = columnar_payload(traffic_records, db.record_columns)
+        else:
+            data = record_dicts(traffic_records, db.record_columns)
+
+    # 计算分页信息
+    start_record = (page - 1) * per_page + 1
+    end_record = min(page * per_page, total_records)
+
+    # 计算分页导航信息
+    has_prev = page > 1
+    has_next = page < total_pages
+    prev_page = page - 1 if has_prev else None
+    next_page = page + 1 if has_next else None
+
+    pagination = {
+        'current_page': page,
+        'total_pages': total_pages,
+        'total_records': total_records,
+        'per_page': per_page,
+        'start_record': start_record,
+        'end_record': end_record,
+        'has_prev': has_prev,
+        'has_next': has_next,
+        'prev_page': prev_page,
+        'next_page': next_page,
+        'is_estimate': is_estimate
+    }
+    pagination.update(cursor_info)
+
+    return {
+        'success': True,
+        'data': data,
+        'pagination': pagination,
+        'search_info': search_info,
+        'filters': {
+            'time_range': time_range,
+            'direction': direction,
+            'start': start,
+            'end': end
+        }
+    }
 
-# 调试开关 - 控制是否显示详细日志
-DEBUG_LOGS = True  # 设为True可以看到详细日志
 
 @app.route('/')
 def index():
@@ -31,13 +461,18 @@ def api_trend_chart():
     try:
         # 获取搜索参数
         direction_filter = request.args.get('direction', '', type=str)
+        try:
+            start, end = parse_time_window()
+        except ValueError as e:
+            return invalid_window_response(e)
 
-        if DEBUG_LOGS:
-            print(f"🔥 API调用: 24小时趋势图请求，方向='{direction_filter}'")
+        logger.debug("🔥 API调用: 24小时趋势图请求，方向='%s'", direction_filter)
         
         # 生成24小时趋势图数据（调用新的AJAX专用函数）
-        chart_data = create_trend_chart_data_for_ajax(
-            direction_filter=direction_filter if direction_filter and direction_filter.strip() else None
+        chart_data = get_chart_data(
+            'trend',
+            direction_filter if direction_filter and direction_filter.strip() else None,
+            start, end
         )
         
         # 返回JSON响应（包含图表数据）
@@ -48,7 +483,7 @@ def api_trend_chart():
         })
         
     except Exception as e:
-        print(f"❌ 24小时趋势图API错误: {str(e)}")
+        logger.exception("❌ 24小时趋势图API错误")
         return jsonify({
             'success': False,
             'error': str(e),
@@ -61,13 +496,19 @@ def api_pie_chart():
     try:
         # 获取搜索参数
         time_range = request.args.get('time_range', '', type=str)
+        try:
+            start, end = parse_time_window()
+        except ValueError as e:
+            return invalid_window_response(e)
         
         # 记录API调用
-        print(f"🔥 API调用: 饼图请求，时间段='{time_range}'")
+        logger.debug("🔥 API调用: 饼图请求，时间段='%s'", time_range)
         
         # 生成饼图数据（调用chart_generator中的函数）
-        chart_data = create_pie_chart_data_for_ajax(
-            time_range=time_range if time_range and time_range.strip() else None
+        chart_data = get_chart_data(
+            'pie',
+            time_range if time_range and time_range.strip() else None,
+            start, end
         )
         
         # 返回JSON响应（包含图表数据）
@@ -78,7 +519,7 @@ def api_pie_chart():
         })
         
     except Exception as e:
-        print(f"❌ 饼图API错误: {str(e)}")
+        logger.exception("❌ 饼图API错误")
         return jsonify({
             'success': False,
             'error': str(e),
@@ -91,13 +532,18 @@ def api_weekday_weekend_chart():
     try:
         #获取搜索参数
         direction_filter = request.args.get('direction', '', type=str)              #这个图只受方向选择的影响
+        try:
+            start, end = parse_time_window()
+        except ValueError as e:
+            return invalid_window_response(e)
 
         #记录api调用
-        if DEBUG_LOGS:
-            print(f"🔥 API调用: 工作日vs周末对比图请求，方向='{direction_filter}'")
+        logger.debug("🔥 API调用: 工作日vs周末对比图请求，方向='%s'", direction_filter)
         # 生成工作日vs周末对比图数据
-        chart_data = create_weekday_weekend_trend_chart_for_ajax(
-            direction_filter=direction_filter if direction_filter and direction_filter.strip() else None        #判断是否有数据输入
+        chart_data = get_chart_data(
+            'weekday_weekend',
+            direction_filter if direction_filter and direction_filter.strip() else None,        #判断是否有数据输入
+            start, end
         )
         #返回json响应（包含图表数据）
         return jsonify({
@@ -106,7 +552,7 @@ def api_weekday_weekend_chart():
             'message': f'工作日vs周末对比图更新成功，方向: {direction_filter or "全部方向"}'
         })
     except Exception as e:
-        print(f"❌ 工作日vs周末对比图API错误: {str(e)}")
+        logger.exception("❌ 工作日vs周末对比图API错误")
         return jsonify({
             'success': False,
             'error': str(e),
@@ -121,21 +567,113 @@ def api_traffic_data():
         time_range = request.args.get('time_range', '', type=str)
         direction = request.args.get('direction', '', type=str)
         page = request.args.get('page', 1, type=int)
+        # 分页模式：offset（默认，LIMIT/OFFSET）或 cursor（游标分页，深页与第1页代价相同）
+        mode = request.args.get('mode', 'offset', type=str)
+        after = request.args.get('after', '', type=str)
+        before = request.args.get('before', '', type=str)
+        sort = request.args.get('sort', 'id', type=str)
+        # 估算模式：复杂筛选条件下快速返回估算的总数（pagination.is_estimate为true）
+        estimate = request.args.get('estimate', '', type=str).lower() in ('1', 'true')
+        # 数据格式：records（默认）或 columns（列式，时间和方向由浏览器格式化）
+        payload_format = request.args.get('format', 'records', type=str)
+        try:
+            start, end = parse_time_window()
+        except ValueError as e:
+            return invalid_window_response(e)
+        # 每页记录数：默认20，上限MAX_PER_PAGE
+        try:
+            per_page = parse_per_page()
+        except ValueError as e:
+            return invalid_page_size_response(e)
+        if payload_format not in PAYLOAD_FORMATS:
+            return invalid_format_response(payload_format)
         
         # 记录API调用
-        if DEBUG_LOGS:
-            print(f"🔢 API调用: 交通数据请求，页码={page}")
-            if time_range:
-                print(f"🕒 搜索时间段: '{time_range}'")
-            if direction:
-                print(f"🧭 筛选方向: '{direction}'")
+        logger.debug("🔢 API调用: 交通数据请求，页码=%s，每页=%s，模式=%s，时间段='%s'，方向='%s'",
+                     page, per_page, mode, time_range, direction)
         
         # 参数验证
         if page < 1:
             page = 1
         
-        # 创建数据库连接
-        db = get_database()
+        # 获取数据库连接（从连接池借出，请求结束自动归还）
+        db = get_db()
+        if db is None:
+            return jsonify({
+                'success': False,
+                'error': '数据库连接失败',
+                'message': '无法连接到交通数据库'
+            }), 500
+        
+        try:
+            payload = build_traffic_page(db, time_range, direction, page, mode, after, before, sort, estimate,
+                                         start, end, per_page=per_page, payload_format=payload_format)
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e),
+                'message': '分页参数无效'
+            }), 400
+        with span('serialize'):
+            return jsonify(payload)
+        
+    except Exception as e:
+        logger.exception("❌ 交通数据API错误")
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'message': '获取交通数据失败'
+        }), 500
+
+
+def stream_then_release(chunks, db):
+    """
+    逐块输出响应数据，全部发送完毕后立即归还数据库连接
+    
+    不依赖WSGI服务器调用响应的close()（部分客户端读完数据后不会关闭响应），
+    避免导出连接长期占用连接池。
+    """
+    try:
+        yield from chunks
+    finally:
+        db.disconnect()
+
+
+@app.route('/api/traffic-data/export')
+def api_traffic_data_export():
+    """
+    API接口 - 流式导出当前筛选条件下的全部记录
+    
+    format=csv（默认）逐批输出CSV；安装pyarrow后支持 format=parquet / arrow。
+    记录通过服务器端游标的fetchmany分批读取、分批编码，边查询边发送，
+    导出数百万条记录时内存占用保持不变。导出期间单独占用一个连接池连接。
+    """
+    try:
+        time_range = request.args.get('time_range', '', type=str)
+        direction = request.args.get('direction', '', type=str)
+        file_format = request.args.get('format', 'csv', type=str).lower()
+        try:
+            start, end = parse_time_window()
+        except ValueError as e:
+            return invalid_window_response(e)
+        
+        if file_format not in EXPORT_FORMATS:
+            return jsonify({
+                'success': False,
+                'error': f'不支持的导出格式: {file_format}',
+                'message': f"可选格式: {', '.join(EXPORT_FORMATS)}"
+            }), 400
+        if file_format in ARROW_FORMATS and not pyarrow_available():
+            return jsonify({
+                'success': False,
+                'error': '未安装pyarrow',
+                'message': f'{file_format}导出需要安装pyarrow，可以使用 format=csv'
+            }), 501
+        
+        logger.debug("📤 API调用: 导出请求，时间段='%s'，方向='%s'，格式=%s", time_range, direction, file_format)
+        
+        # 导出时间可能很长，不使用请求上下文的连接（请求结束时就会归还）
+        db = get_database(pooled=True, intersections=g.get('intersections'))
         if not db.connect():
             return jsonify({
                 'success': False,
@@ -143,89 +681,316 @@ def api_traffic_data():
                 'message': '无法连接到交通数据库'
             }), 500
         
-        # 查询数据
-        per_page = 20
-        traffic_records, total_records, total_pages = db.search_with_filters(
+        batches = db.iter_filtered_rows(
             time_range=time_range if time_range and time_range.strip() else None,
             direction_filter=direction if direction and direction.strip() else None,
-            page=page,
-            per_page=per_page
+            start=start,
+            end=end
         )
+        mimetype, extension = EXPORT_FORMATS[file_format]
+        filename = f"traffic_{datetime.now(tz=LOCAL_TZ):%Y%m%d-%H%M%S}.{extension}"
+        chunks = iter_export(batches, file_format, columns=db.record_columns)
+        response = Response(stream_then_release(chunks, db), mimetype=mimetype, headers={
+            'Content-Disposition': f'attachment; filename="{filename}"',
+            'X-Accel-Buffering': 'no'      # 反向代理不缓冲，边生成边发送
+        })
+        # 客户端中途断开时由服务器关闭响应，关闭游标并归还连接
+        response.call_on_close(batches.close)
+        response.call_on_close(db.disconnect)
+        return response
         
-        # 页码范围验证
-        if page > total_pages and total_pages > 0:
-            page = total_pages
-            traffic_records, total_records, total_pages = db.search_with_filters(
-                time_range=time_range if time_range and time_range.strip() else None,
-                direction_filter=direction if direction and direction.strip() else None,
-                page=page,
-                per_page=per_page
-            )
+    except Exception as e:
+        logger.exception("❌ 导出API错误")
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'message': '导出数据失败'
+        }), 500
+
+
+@app.route('/api/dashboard')
+def api_dashboard():
+    """
+    API接口 - 一次返回全部图表和第1页数据（页面加载和搜索时使用）
+    
+    三个图表和表格总数共享一次 小时×星期×方向 聚合（有汇总表时不扫描traffic表），
+    代替分别请求三个图表接口和 /api/traffic-data 的四次往返和四次扫描。
+    指定 start/end 时图表和表格都限定在该时间窗口内（按time索引范围扫描）。
+    返回的 last_id 为数据包含的最大id，用于订阅 /api/stream（live为false时不支持实时推送）。
+    """
+    try:
+        time_range = request.args.get('time_range', '', type=str)
+        direction = request.args.get('direction', '', type=str)
+        mode = request.args.get('mode', 'offset', type=str)
+        sort = request.args.get('sort', 'id', type=str)
+        estimate = request.args.get('estimate', '', type=str).lower() in ('1', 'true')
+        payload_format = request.args.get('format', 'records', type=str)
+        try:
+            start, end = parse_time_window()
+        except ValueError as e:
+            return invalid_window_response(e)
+        try:
+            per_page = parse_per_page()
+        except ValueError as e:
+            return invalid_page_size_response(e)
+        if payload_format not in PAYLOAD_FORMATS:
+            return invalid_format_response(payload_format)
         
-        # 生成搜索状态描述
-        search_parts = []
-        if time_range and time_range.strip():
-            time_text = get_time_text(time_range)
-            search_parts.append(f"时间段'{time_text}'")
-        if direction and direction.strip():
-            direction_text = get_direction_text(direction)
-            search_parts.append(f"方向'{direction_text}'")
-        
-        search_info = f"搜索: {'+'.join(search_parts)}" if search_parts else "显示所有记录"
-        
-        # 处理时间格式转换
-        for record in traffic_records:
-            timestamp = record['time']
-            beijing_tz = timezone(timedelta(hours=8))
-            beijing_time = datetime.fromtimestamp(timestamp, tz=beijing_tz)
-            record['formatted_time'] = beijing_time.strftime('%Y-%m-%d %H:%M:%S (北京时间)')
-            record['direction_text'] = get_direction_text(record['direction'])
-        
-        # 计算分页信息
-        start_record = (page - 1) * per_page + 1
-        end_record = min(page * per_page, total_records)
-        
-        # 断开数据库连接
-        db.disconnect()
+        logger.debug("🔥 API调用: 仪表盘请求，时间段='%s'，方向='%s'", time_range, direction)
+        
+        db = get_db()
+        if db is None:
+            return jsonify({
+                'success': False,
+                'error': '数据库连接失败',
+                'message': '无法连接到交通数据库'
+            }), 500
+        
+        time_filter = time_range if time_range and time_range.strip() else None
+        direction_filter = direction if direction and direction.strip() else None
+        # 饼图只受时间段影响，两个趋势图只受方向影响
+        chart_filters = {
+            'pie': (time_filter, f'时间段: {time_range or "全部时间"}'),
+            'trend': (direction_filter, f'方向: {direction or "全部方向"}'),
+            'weekday_weekend': (direction_filter, f'方向: {direction or "全部方向"}')
+        }
+        
+        # 图表和表格包含的最大id，客户端从这里开始订阅 /api/stream 的增量（多个路口分片时不支持实时推送）
+        live = db.live_db_path is not None
+        last_id = db.get_data_version()[0] if live else None
+        with db.shared_aggregates():
+            charts = {}
+            for chart_name, (filter_value, filter_text) in chart_filters.items():
+                try:
+                    charts[chart_name] = {
+                        'success': True,
+                        'chart_data': get_chart_data(chart_name, filter_value, start, end),
+                        'message': f'图表更新成功，{filter_text}'
+                    }
+                except Exception as e:
+                    # 单个图表没有数据时不影响其他图表和表格
+                    charts[chart_name] = {
+                        'success': False,
+                        'error': str(e),
+                        'message': '图表生成失败'
+                    }
+            table = build_traffic_page(db, time_range, direction, 1, mode, sort=sort, estimate=estimate,
+                                       start=start, end=end, per_page=per_page, payload_format=payload_format)
+        
+        with span('serialize'):
+            return jsonify({
+                'success': True,
+                'charts': charts,
+                'table': table,
+                'last_id': last_id,
+                'live': live,
+                'filters': {
+                    'time_range': time_range,
+                    'direction': direction,
+                    'start': start,
+                    'end': end
+                }
+            })
+        
+    except Exception as e:
+        logger.exception("❌ 仪表盘API错误")
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'message': '获取仪表盘数据失败'
+        }), 500
+
+
+@app.route('/api/stream')
+def api_stream():
+    """
+    API接口 - Server-Sent Events 实时推送新增记录
+    
+    筛选参数与 /api/dashboard 相同；last_id 为客户端数据已包含的最大id
+    （断线重连时浏览器发送的 Last-Event-ID 优先）。新记录由进程内共享的轮询线程发现，
+    推送的是各图表的变化量（delta事件），数据被删除或客户端落后太多时推送reset事件。
+    """
+    try:
+        time_range = request.args.get('time_range', '', type=str)
+        direction = request.args.get('direction', '', type=str)
+        try:
+            start, end = parse_time_window()
+        except ValueError as e:
+            return invalid_window_response(e)
         
-        # 计算分页导航信息
-        has_prev = page > 1
-        has_next = page < total_pages
-        prev_page = page - 1 if has_prev else None
-        next_page = page + 1 if has_next else None
+        after_id = request.headers.get('Last-Event-ID') or request.args.get('last_id', '', type=str)
+        try:
+            after_id = int(after_id) if after_id.strip() else None
+        except ValueError:
+            return jsonify({
+                'success': False,
+                'error': f'无效的last_id: {after_id}',
+                'message': 'last_id必须是整数'
+            }), 400
         
-        # 返回JSON响应
+        live_db_path = get_database(pooled=True, intersections=g.get('intersections')).live_db_path
+        if live_db_path is None:
+            return jsonify({
+                'success': False,
+                'error': '多个路口的数据不支持实时推送',
+                'message': '请用intersection参数指定单个路口'
+            }), 400
+        
+        subscription = LiveSubscription(
+            get_live_feed(live_db_path),
+            time_range=time_range if time_range and time_range.strip() else None,
+            direction_filter=direction if direction and direction.strip() else None,
+            start=start,
+            end=end,
+            after_id=after_id
+        )
+        # ASGI入口发现该键时直接在事件循环中驱动订阅，不占用线程池
+        request.environ[LIVE_SUBSCRIPTION_KEY] = subscription
+        response = Response(iter_live_messages(subscription), mimetype='text/event-stream', headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        })
+        response.call_on_close(subscription.close)
+        return response
+        
+    except Exception as e:
+        logger.exception("❌ 实时推送API错误")
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'message': '订阅实时数据失败'
+        }), 500
+
+
+@app.route('/api/plate/<plate>')
+def api_plate(plate):
+    """
+    API接口 - 车牌查询
+    
+    默认返回该车牌按时间顺序的通行记录；prefix=1 时把plate作为前缀，
+    返回匹配的车牌及通行次数。两者都按 (plate, time, direction) 索引定位，
+    支持 limit 和 start/end 时间窗口参数。
+    """
+    try:
+        prefix = request.args.get('prefix', '', type=str).lower() in ('1', 'true')
+        default_limit = 20 if prefix else 100
+        limit = request.args.get('limit', default_limit, type=int)
+        try:
+            start, end = parse_time_window()
+        except ValueError as e:
+            return invalid_window_response(e)
+        
+        logger.debug("🚗 API调用: 车牌%s查询 '%s'，limit=%d", '前缀' if prefix else '', plate, limit)
+        
+        db = get_db()
+        if db is None:
+            return jsonify({
+                'success': False,
+                'error': '数据库连接失败',
+                'message': '无法连接到交通数据库'
+            }), 500
+        
+        try:
+            with span('query'):
+                if prefix:
+                    matches = db.search_plates(plate, limit=limit, start=start, end=end)
+                else:
+                    passages = format_traffic_records(db.find_by_plate(plate, limit=limit, start=start, end=end))
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e),
+                'message': f'查询参数无效（limit上限为{PLATE_LOOKUP_MAX_LIMIT}）'
+            }), 400
+        
+        if prefix:
+            return jsonify({
+                'success': True,
+                'prefix': plate.strip(),
+                'matches': matches,
+                'count': len(matches),
+                'truncated': len(matches) == limit
+            })
         return jsonify({
             'success': True,
-            'data': traffic_records,
-            'pagination': {
-                'current_page': page,
-                'total_pages': total_pages,
-                'total_records': total_records,
-                'per_page': per_page,
-                'start_record': start_record,
-                'end_record': end_record,
-                'has_prev': has_prev,
-                'has_next': has_next,
-                'prev_page': prev_page,
-                'next_page': next_page
-            },
-            'search_info': search_info,
-            'filters': {
-                'time_range': time_range,
-                'direction': direction
-            }
+            'plate': plate.strip(),
+            'passages': passages,
+            'count': len(passages),
+            'truncated': len(passages) == limit
         })
         
     except Exception as e:
-        print(f"❌ 交通数据API错误: {str(e)}")
+        logger.exception("❌ 车牌查询API错误")
         return jsonify({
             'success': False,
             'error': str(e),
-            'message': '获取交通数据失败'
+            'message': '车牌查询失败'
         }), 500
 
 
+@app.route('/api/pool-stats')
+def api_pool_stats():
+    """API接口 - 返回当前工作进程的数据库连接池统计（用于评估连接池大小）"""
+    return jsonify({
+        'success': True,
+        'pools': get_pool_stats()
+    })
+
+
+@app.route('/api/cache-stats')
+def api_cache_stats():
+    """API接口 - 返回当前工作进程的图表缓存、页锚点缓存、聚合查询合并和实时推送轮询统计"""
+    return jsonify({
+        'success': True,
+        'cache': chart_cache.stats(),
+        'page_anchors': get_page_anchor_stats(),
+        'single_flight': get_single_flight_stats(),
+        'live_feeds': get_live_feed_stats()
+    })
+
+
+@app.route('/api/slow-queries')
+def api_slow_queries():
+    """API接口 - 返回当前工作进程最近的慢查询及其执行计划（最新的在前）"""
+    return jsonify({
+        'success': True,
+        'threshold_ms': SLOW_QUERY_MS,
+        'queries': get_recent_slow_queries()
+    })
+
+
+def runtime_gauges() -> list:
+    """连接池、缓存和聚合查询合并的即时统计，转换为 render_prometheus 的额外指标"""
+    pools = get_pool_stats()
+    caches = [({'cache': 'chart'}, chart_cache.stats()), ({'cache': 'page_anchor'}, get_page_anchor_stats())]
+    single_flight = get_single_flight_stats()
+    return [
+        ('traffic_pool_connections_in_use', 'gauge', '连接池借出中的连接数',
+         [({'db_path': pool['db_path']}, pool['in_use']) for pool in pools]),
+        ('traffic_pool_connections_idle', 'gauge', '连接池空闲连接数',
+         [({'db_path': pool['db_path']}, pool['idle']) for pool in pools]),
+        ('traffic_pool_wait_seconds_total', 'counter', '等待空闲连接的累计秒数',
+         [({'db_path': pool['db_path']}, pool['wait_seconds']) for pool in pools]),
+        ('traffic_cache_entries', 'gauge', '缓存条目数', [(labels, stats['entries']) for labels, stats in caches]),
+        ('traffic_cache_hits_total', 'counter', '缓存命中次数', [(labels, stats['hits']) for labels, stats in caches]),
+        ('traffic_cache_misses_total', 'counter', '缓存未命中次数',
+         [(labels, stats['misses']) for labels, stats in caches]),
+        ('traffic_single_flight_collapsed_total', 'counter', '合并到进行中查询的聚合调用数',
+         [({}, single_flight['collapsed'])]),
+    ]
+
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus抓取接口 - 路由/数据库方法/请求区段/SQL语句耗时直方图和运行时统计（当前工作进程）"""
+    return Response(render_prometheus(runtime_gauges()), content_type=PROMETHEUS_CONTENT_TYPE)
+
+
+# 设置环境变量 TRAFFIC_CACHE_WARMUP=1 时在启动时预热图表缓存
+if os.environ.get('TRAFFIC_CACHE_WARMUP') == '1':
+    warm_chart_cache()
+
+
 if __name__ == '__main__':
     # 启动Flask应用
     print(" 启动交通流量数据展示系统...")
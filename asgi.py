@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+ASGI入口 - 在事件循环中服务Flask应用的同一组路由
+
+- SQLite查询在有界线程池中执行（线程数默认等于连接池大小），事件循环不被阻塞
+- 同一图表/数据接口的相同请求（路径+查询参数相同）在执行期间合并为一次查询，
+  后到的请求直接等待并复用第一个请求的响应
+- 导出等大响应逐块从线程池取出并立即发送，不在内存中拼接完整响应
+- /api/stream（SSE）由Flask校验参数并注册订阅后，改在事件循环中等待共享轮询线程的通知，
+  每个连接不长期占用线程池中的线程
+- /api/asgi-stats 返回请求数、实际执行数、合并数等统计
+
+运行：
+    uvicorn asgi:app --host 0.0.0.0 --port 5001 --workers 4
+"""
+
+import asyncio
+import io
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from urllib.parse import parse_qsl
+
+from app import app as flask_app
+from utils.database import DEFAULT_POOL_SIZE
+from utils.live import KEEPALIVE_MESSAGE, LIVE_SUBSCRIPTION_KEY, STREAM_KEEPALIVE
+
+# 执行Flask处理函数的线程数（与连接池大小一致时每个线程都能立即拿到连接）
+ASGI_WORKERS = int(os.environ.get('TRAFFIC_ASGI_WORKERS', str(DEFAULT_POOL_SIZE)))
+
+# 只读、结果只取决于查询参数的接口，相同的并发请求可以合并
+COALESCED_PATHS = frozenset({
+    '/api/dashboard',
+    '/api/pie-chart',
+    '/api/trend-chart',
+    '/api/weekday-weekend-chart',
+    '/api/traffic-data',
+})
+
+# 响应体逐块发送的接口（数据量可能很大）
+STREAMED_PATHS = frozenset({
+    '/api/traffic-data/export',
+})
+
+# Server-Sent Events 实时推送
+LIVE_PATH = '/api/stream'
+
+STATS_PATH = '/api/asgi-stats'
+
+
+class CoalescingASGIApp:
+    """把WSGI应用包装为ASGI应用，在线程池中执行并合并相同的并发请求"""
+
+    def __init__(self, wsgi_app, max_workers: int = ASGI_WORKERS):
+        """
+        初始化
+
+        Args:
+            wsgi_app: Flask（WSGI）应用
+            max_workers: 执行处理函数的线程数
+        """
+        self.wsgi_app = wsgi_app
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='traffic-db')
+        # 执行中的请求 {合并键: asyncio.Task}
+        self._in_flight = {}
+        self.stats = {'requests': 0, 'executed': 0, 'coalesced': 0, 'max_in_flight': 0,
+                      'live_streams': 0, 'max_live_streams': 0}
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+
+        body = await self._read_body(receive)
+        self.stats['requests'] += 1
+
+        if scope['path'] in STREAMED_PATHS:
+            await self._stream(scope, body, send)
+            return
+        if scope['path'] == LIVE_PATH:
+            await self._live(scope, body, receive, send)
+            return
+        if scope['path'] == STATS_PATH:
+            response = self._stats_response()
+        else:
+            response = await self._dispatch(scope, body, self._coalesce_key(scope))
+
+        status, headers, content = response
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': content})
+
+    async def _lifespan(self, receive, send):
+        """处理服务器启动/关闭事件"""
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    @staticmethod
+    async def _read_body(receive) -> bytes:
+        """读取完整的请求体"""
+        chunks = []
+        while True:
+            message = await receive()
+            if message['type'] != 'http.request':
+                break
+            chunks.append(message.get('body', b''))
+            if not message.get('more_body'):
+                break
+        return b''.join(chunks)
+
+    @staticmethod
+    def _coalesce_key(scope) -> Optional[tuple]:
+        """可合并请求的键（路径+排序后的查询参数），不可合并时返回None"""
+        if scope['method'] not in ('GET', 'HEAD') or scope['path'] not in COALESCED_PATHS:
+            return None
+        params = parse_qsl(scope['query_string'].decode('latin-1'), keep_blank_values=True)
+        return scope['method'], scope['path'], tuple(sorted(params))
+
+    async def _dispatch(self, scope, body: bytes, key: Optional[tuple]) -> tuple:
+        """执行请求；相同的请求正在执行时等待其结果"""
+        if key is None:
+            return await self._run(scope, body)
+
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.stats['coalesced'] += 1
+        else:
+            task = asyncio.ensure_future(self._run(scope, body))
+            self._in_flight[key] = task
+            self.stats['max_in_flight'] = max(self.stats['max_in_flight'], len(self._in_flight))
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        # shield：某个客户端断开时不取消其他请求共享的查询
+        return await asyncio.shield(task)
+
+    async def _run(self, scope, body: bytes) -> tuple:
+        """在线程池中调用WSGI应用"""
+        self.stats['executed'] += 1
+        environ = build_environ(scope, body)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, call_wsgi, self.wsgi_app, environ)
+
+    async def _stream(self, scope, body: bytes, send) -> None:
+        """在线程池中逐块迭代WSGI响应，每取出一块立即发送"""
+        self.stats['executed'] += 1
+        loop = asyncio.get_running_loop()
+        status, headers, result = await loop.run_in_executor(
+            self.executor, start_wsgi, self.wsgi_app, build_environ(scope, body)
+        )
+        iterator = iter(result)
+        try:
+            await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+            while True:
+                chunk = await loop.run_in_executor(self.executor, next, iterator, None)
+                if chunk is None:
+                    break
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            if hasattr(result, 'close'):
+                await loop.run_in_executor(self.executor, result.close)
+
+    async def _live(self, scope, body: bytes, receive, send) -> None:
+        """
+        SSE实时推送：在线程池中执行Flask处理函数（校验参数、注册订阅），
+        之后在事件循环中等待轮询线程的通知，只有生成消息时才进入线程池
+        """
+        self.stats['executed'] += 1
+        loop = asyncio.get_running_loop()
+        environ = build_environ(scope, body)
+        status, headers, result = await loop.run_in_executor(self.executor, start_wsgi, self.wsgi_app, environ)
+        subscription = environ.get(LIVE_SUBSCRIPTION_KEY)
+        if subscription is None:
+            # 参数错误等普通响应
+            content = await loop.run_in_executor(self.executor, finish_wsgi, result)
+            await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+            await send({'type': 'http.response.body', 'body': content})
+            return
+
+        wake = asyncio.Event()
+
+        def notify():
+            loop.call_soon_threadsafe(wake.set)
+
+        subscription.feed.add_listener(notify)
+        disconnected = asyncio.ensure_future(receive())
+        self.stats['live_streams'] += 1
+        self.stats['max_live_streams'] = max(self.stats['max_live_streams'], self.stats['live_streams'])
+        try:
+            await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+            message = subscription.ready_message()
+            # 订阅之前已有更新时立即补发
+            wake.set()
+            while True:
+                if message:
+                    await send({'type': 'http.response.body', 'body': message.encode('utf-8'), 'more_body': True})
+                woken = asyncio.ensure_future(wake.wait())
+                done, _ = await asyncio.wait({woken, disconnected}, timeout=STREAM_KEEPALIVE,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                woken.cancel()
+                if disconnected in done:
+                    break
+                if woken in done:
+                    wake.clear()
+                    message = await loop.run_in_executor(self.executor, subscription.poll_message)
+                else:
+                    message = KEEPALIVE_MESSAGE
+        finally:
+            self.stats['live_streams'] -= 1
+            subscription.feed.remove_listener(notify)
+            disconnected.cancel()
+            # 不迭代响应体（无限的SSE生成器），只关闭以注销订阅
+            if hasattr(result, 'close'):
+                await loop.run_in_executor(self.executor, result.close)
+
+    def _stats_response(self) -> tuple:
+        """统计信息响应"""
+        payload = dict(self.stats, workers=self.max_workers, in_flight=len(self._in_flight))
+        content = json.dumps({'success': True, 'asgi': payload}).encode('utf-8')
+        return 200, [(b'content-type', b'application/json'), (b'content-length', str(len(content)).encode())], content
+
+
+def build_environ(scope, body: bytes) -> dict:
+    """
+    由ASGI scope构建WSGI environ
+
+    Args:
+        scope: ASGI HTTP scope
+        body: 请求体
+
+    Returns:
+        dict: WSGI environ
+    """
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client')
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0] if client else '',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            key = name
+        else:
+            key = f'HTTP_{name}'
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def start_wsgi(wsgi_app, environ: dict) -> tuple:
+    """
+    同步调用WSGI应用，返回状态、响应头和尚未迭代的响应体
+
+    Returns:
+        tuple: (状态码, ASGI格式的响应头, WSGI响应体可迭代对象)
+    """
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response['status'] = int(status.split(' ', 1)[0])
+        response['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                               for name, value in headers]
+
+    result = wsgi_app(environ, start_response)
+    return response['status'], response['headers'], result
+
+
+def finish_wsgi(result) -> bytes:
+    """读取完整的WSGI响应体并关闭（触发响应的call_on_close回调）"""
+    try:
+        return b''.join(result)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+
+
+def call_wsgi(wsgi_app, environ: dict) -> tuple:
+    """
+    同步调用WSGI应用并收集完整响应（在线程池中执行）
+
+    Returns:
+        tuple: (状态码, ASGI格式的响应头, 响应体)
+    """
+    status, headers, result = start_wsgi(wsgi_app, environ)
+    return status, headers, finish_wsgi(result)
+
+
+app = CoalescingASGIApp(flask_app)
@@ -0,0 +1,9 @@
+"""
+性能基准测试
+生成合成交通数据库，测量TrafficDatabase各方法和/api/*接口的延迟，
+输出JSON结果以便在不同提交之间对比
+
+用法：
+    python -m benchmarks.run --rows 1000000
+    python -m benchmarks.compare benchmarks/results/base.json benchmarks/results/new.json
+"""
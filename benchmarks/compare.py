@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+对比两次基准测试结果
+按 (数据集行数, 用例名称) 匹配用例，p95延迟或虚拟机步数增长超过阈值时视为性能退化
+
+用法：
+    python -m benchmarks.compare benchmarks/results/base.json benchmarks/results/new.json
+    python -m benchmarks.compare base.json new.json --threshold 0.2
+"""
+
+import json
+import sys
+from typing import List
+
+# 小于该值的延迟变化视为噪声（毫秒）
+MIN_DELTA_MS = 1.0
+
+
+def load_results(path: str) -> dict:
+    """
+    读取结果文件
+
+    Returns:
+        dict: {(行数, 用例名称): 用例结果}
+    """
+    with open(path, 'r', encoding='utf-8') as handle:
+        report = json.load(handle)
+    return {
+        (run['dataset']['rows'], result['name']): result
+        for run in report['runs']
+        for result in run['results']
+        if result['status'] != 'error'
+    }
+
+
+def compare(base: dict, new: dict, threshold: float = 0.1) -> List[dict]:
+    """
+    对比两组结果
+
+    Args:
+        base: 基准结果（load_results的返回值）
+        new: 新结果
+        threshold: 允许的相对增长比例
+
+    Returns:
+        list: 每个共同用例的对比 {'key', 'base_p95_ms', 'new_p95_ms', 'p95_change', 'steps_change', 'regression'}
+    """
+    rows = []
+    for key in sorted(set(base) & set(new), key=lambda item: (item[0], item[1])):
+        before, after = base[key], new[key]
+        p95_change = _relative_change(before['p95_ms'], after['p95_ms'])
+        steps_change = _relative_change(before['vm_steps'], after['vm_steps'])
+        slower = p95_change > threshold and after['p95_ms'] - before['p95_ms'] > MIN_DELTA_MS
+        rows.append({
+            'key': key,
+            'base_p95_ms': before['p95_ms'],
+            'new_p95_ms': after['p95_ms'],
+            'p95_change': p95_change,
+            'steps_change': steps_change,
+            'regression': slower or steps_change > threshold
+        })
+    return rows
+
+
+def _relative_change(before: float, after: float) -> float:
+    """相对变化比例（基准为0时按0处理）"""
+    if not before:
+        return 0.0 if not after else float('inf')
+    return (after - before) / before
+
+
+def main(argv: List[str] = None) -> int:
+    """命令行入口，存在退化时返回1"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="对比两次基准测试结果")
+    parser.add_argument('base', help='基准结果文件')
+    parser.add_argument('new', help='新结果文件')
+    parser.add_argument('--threshold', type=float, default=0.1, help='允许的相对增长比例（默认0.1，即10%%）')
+    args = parser.parse_args(argv)
+
+    rows = compare(load_results(args.base), load_results(args.new), args.threshold)
+    for row in rows:
+        dataset_rows, name = row['key']
+        marker = '🔺' if row['regression'] else ('🔻' if row['p95_change'] < -args.threshold else '  ')
+        print(f"{marker} {dataset_rows:>10,} {name:<50} p95 {row['base_p95_ms']:>9.2f} -> {row['new_p95_ms']:>9.2f}ms "
+              f"({row['p95_change']:+.0%})  steps {row['steps_change']:+.0%}")
+
+    regressions = [row for row in rows if row['regression']]
+    print(f"📊 共对比 {len(rows)} 个用例，{len(regressions)} 个退化")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+并发负载测试
+在同一进程内模拟N个并发客户端（默认200个），分别测量：
+- wsgi: 每个客户端一个线程直接调用Flask应用（相当于多线程WSGI服务器）
+- asgi: 所有客户端在一个事件循环中调用asgi.app（有界线程池 + 相同请求合并）
+输出吞吐量（请求/秒）、延迟分位数和合并统计
+
+用法：
+    python -m benchmarks.load --rows 1000000 --clients 200
+    python -m benchmarks.load --db data/traffic.db --mode asgi --requests 10
+"""
+
+import asyncio
+import contextlib
+import io
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import List
+
+# 添加项目根目录到Python路径
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from benchmarks.datagen import generate_database
+from benchmarks.run import BENCHMARK_DIR, git_info, percentile
+
+# 页面加载和搜索时的请求组合（按出现频率重复）
+REQUEST_MIX = [
+    '/api/dashboard?mode=cursor',
+    '/api/dashboard?mode=cursor',
+    '/api/dashboard?time_range=morning&direction=&mode=cursor',
+    '/api/dashboard?time_range=&direction=1&mode=cursor',
+    '/api/pie-chart',
+    '/api/pie-chart?time_range=evening',
+    '/api/trend-chart',
+    '/api/trend-chart?direction=2',
+    '/api/weekday-weekend-chart',
+    '/api/traffic-data?mode=cursor&page=1',
+    '/api/traffic-data?mode=cursor&page=2',
+    '/api/traffic-data?time_range=noon&mode=cursor&page=1',
+]
+
+
+def build_plan(clients: int, requests_per_client: int, seed: int = 7) -> List[List[str]]:
+    """为每个客户端生成请求序列（两种模式使用相同的序列）"""
+    rng = random.Random(seed)
+    return [[rng.choice(REQUEST_MIX) for _ in range(requests_per_client)] for _ in range(clients)]
+
+
+def make_scope(url: str) -> dict:
+    """构造ASGI HTTP scope"""
+    path, _, query = url.partition('?')
+    return {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': path,
+        'root_path': '',
+        'query_string': query.encode('latin-1'),
+        'headers': [(b'host', b'localhost')],
+        'server': ('localhost', 5001),
+        'client': ('127.0.0.1', 0),
+    }
+
+
+async def asgi_request(asgi_app, url: str) -> int:
+    """通过ASGI接口发送一个请求，返回状态码"""
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    await asgi_app(make_scope(url), receive, send)
+    return messages[0]['status']
+
+
+def reset_caches() -> None:
+    """清空进程内缓存，两种模式都从冷状态开始"""
+    import app as app_module
+    from utils import database
+
+    app_module.chart_cache.clear()
+    database._count_cache.clear()
+
+
+def summarize(latencies: List[float], statuses: List[int], elapsed: float) -> dict:
+    """汇总延迟和吞吐量"""
+    return {
+        'requests': len(latencies),
+        'errors': sum(1 for status in statuses if status != 200),
+        'seconds': round(elapsed, 3),
+        'throughput_rps': round(len(latencies) / elapsed, 1) if elapsed else 0,
+        'p50_ms': round(percentile(latencies, 0.50), 2),
+        'p95_ms': round(percentile(latencies, 0.95), 2),
+        'p99_ms': round(percentile(latencies, 0.99), 2),
+        'max_ms': round(max(latencies), 2),
+    }
+
+
+def run_wsgi(plan: List[List[str]]) -> dict:
+    """每个客户端一个线程，同步调用Flask应用"""
+    from app import app as flask_app
+    from asgi import build_environ, call_wsgi
+
+    latencies, statuses = [], []
+    lock = threading.Lock()
+
+    def client(urls):
+        for url in urls:
+            start = time.perf_counter()
+            status, _, _ = call_wsgi(flask_app, build_environ(make_scope(url), b''))
+            with lock:
+                latencies.append((time.perf_counter() - start) * 1000)
+                statuses.append(status)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(plan)) as executor:
+        list(executor.map(client, plan))
+    return summarize(latencies, statuses, time.perf_counter() - start)
+
+
+def run_asgi(plan: List[List[str]], workers: int) -> dict:
+    """所有客户端共享一个事件循环，通过ASGI应用发送请求"""
+    from app import app as flask_app
+    from asgi import CoalescingASGIApp
+
+    asgi_app = CoalescingASGIApp(flask_app, max_workers=workers)
+    latencies, statuses = [], []
+
+    async def client(urls):
+        for url in urls:
+            start = time.perf_counter()
+            statuses.append(await asgi_request(asgi_app, url))
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    async def main():
+        await asyncio.gather(*(client(urls) for urls in plan))
+
+    start = time.perf_counter()
+    asyncio.run(main())
+    elapsed = time.perf_counter() - start
+    asgi_app.executor.shutdown(wait=True)
+
+    result = summarize(latencies, statuses, elapsed)
+    result.update(workers=workers, executed=asgi_app.stats['executed'], coalesced=asgi_app.stats['coalesced'])
+    return result
+
+
+def run_load_test(db_path: str, clients: int = 200, requests_per_client: int = 5,
+                  modes: tuple = ('wsgi', 'asgi'), workers: int = None) -> dict:
+    """
+    对一个数据库执行负载测试
+
+    Args:
+        db_path: 数据库文件路径
+        clients: 并发客户端数
+        requests_per_client: 每个客户端依次发送的请求数
+        modes: 测试模式
+        workers: ASGI线程池大小，默认见asgi.ASGI_WORKERS
+
+    Returns:
+        dict: {模式: 结果}
+    """
+    os.environ['TRAFFIC_DB_PATH'] = os.path.abspath(db_path)
+    import app as app_module
+    from asgi import ASGI_WORKERS
+
+    # 只输出错误日志（基准查询本身就会触发慢查询警告）
+    logging.getLogger().setLevel(logging.ERROR)
+    plan = build_plan(clients, requests_per_client)
+    results = {}
+    for mode in modes:
+        reset_caches()
+        with contextlib.redirect_stdout(io.StringIO()):
+            if mode == 'wsgi':
+                results[mode] = run_wsgi(plan)
+            else:
+                results[mode] = run_asgi(plan, workers or ASGI_WORKERS)
+        result = results[mode]
+        print(f"🚦 {mode}: {result['throughput_rps']} 请求/秒，p50 {result['p50_ms']}ms，"
+              f"p95 {result['p95_ms']}ms，p99 {result['p99_ms']}ms，错误 {result['errors']}"
+              + (f"，实际执行 {result['executed']}，合并 {result['coalesced']}" if mode == 'asgi' else ''))
+    return results
+
+
+def main(argv: List[str] = None) -> int:
+    """命令行入口"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="并发负载测试（WSGI线程 vs ASGI）")
+    parser.add_argument('--rows', type=int, default=1000000, help='合成数据库的记录数')
+    parser.add_argument('--db', default=None, help='使用已有数据库代替合成数据库')
+    parser.add_argument('--clients', type=int, default=200, help='并发客户端数')
+    parser.add_argument('--requests', type=int, default=5, help='每个客户端发送的请求数')
+    parser.add_argument('--mode', choices=['wsgi', 'asgi', 'both'], default='both', help='测试模式')
+    parser.add_argument('--workers', type=int, default=None, help='ASGI线程池大小')
+    parser.add_argument('--output', default=None, help='结果文件路径，默认 benchmarks/results/load-<时间>.json')
+    args = parser.parse_args(argv)
+
+    db_path = args.db or generate_database(os.path.join(BENCHMARK_DIR, 'data', f'traffic_{args.rows}.db'), args.rows)
+    modes = ('wsgi', 'asgi') if args.mode == 'both' else (args.mode,)
+    results = run_load_test(db_path, args.clients, args.requests, modes, args.workers)
+
+    created_at = datetime.now(timezone.utc)
+    report = {
+        'created_at': created_at.isoformat(timespec='seconds'),
+        'git': git_info(),
+        'db_path': os.path.abspath(db_path),
+        'clients': args.clients,
+        'requests_per_client': args.requests,
+        'results': results
+    }
+    output = args.output or os.path.join(BENCHMARK_DIR, 'results', f"load-{created_at:%Y%m%dT%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as handle:
+        json.dump(report, handle, ensure_ascii=False, indent=2)
+    print(f"📄 结果已写入: {output}")
+    return 1 if any(result['errors'] for result in results.values()) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
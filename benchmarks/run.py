@@ -0,0 +1,447 @@
+#!/usr/bin/env python3
+"""
+数据库查询与API接口基准测试
+在合成数据库上测量TrafficDatabase各方法和每个/api/*路由（通过Flask测试客户端）的
+延迟分位数（p50/p95/p99）、SQLite虚拟机步数（扫描行数的近似）、语句数和内存峰值，
+结果写入JSON文件，可用benchmarks/compare.py对比两次提交
+
+用法：
+    python -m benchmarks.run --rows 1000000
+    python -m benchmarks.run --rows 1000000 10000000 50000000 --repeat 20 --label after-rollup
+    python -m benchmarks.run --db data/traffic.db --maintain --warm
+    python -m benchmarks.run --rows 10000000 --only trend --aggregate-workers 4 --label parallel-4
+"""
+
+import contextlib
+import io
+import json
+import logging
+import os
+import platform
+import resource
+import sqlite3
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Callable, List, Optional
+from urllib.parse import quote, unquote
+
+# 添加项目根目录到Python路径
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from benchmarks.datagen import START_TIME, generate_database
+from utils import database
+from utils.database import ConnectionPool, TrafficDatabase
+
+RESULT_SCHEMA_VERSION = 1
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+# 车牌查询用例（合成数据的车牌为 粤B00000-粤B99999）
+BENCHMARK_PLATE = '粤B12345'
+BENCHMARK_PLATE_PREFIX = '粤B123'
+# 时间窗口用例：合成数据第2天（2025-03-04，北京时间）
+WINDOW_START = START_TIME + 86400
+WINDOW_END = START_TIME + 2 * 86400
+# 大页面序列化用例的每页记录数
+LARGE_PAGE_SIZES = (100, 1000, 5000)
+# 进度回调的间隔（虚拟机指令数），越小计数越精确、开销越大
+_PROGRESS_INTERVAL = 100
+
+
+class StatementCounter:
+    """统计一个连接上执行的SQL语句数和SQLite虚拟机步数"""
+
+    def __init__(self, connection: sqlite3.Connection):
+        self.connection = connection
+        self.statements = 0
+        self._progress_calls = 0
+        connection.set_trace_callback(self._on_statement)
+        connection.set_progress_handler(self._on_progress, _PROGRESS_INTERVAL)
+
+    def _on_statement(self, sql: str) -> None:
+        self.statements += 1
+
+    def _on_progress(self) -> int:
+        self._progress_calls += 1
+        return 0
+
+    @property
+    def vm_steps(self) -> int:
+        """已执行的虚拟机指令数（精确到_PROGRESS_INTERVAL）"""
+        return self._progress_calls * _PROGRESS_INTERVAL
+
+    def reset(self) -> None:
+        self.statements = 0
+        self._progress_calls = 0
+
+    def detach(self) -> None:
+        self.connection.set_trace_callback(None)
+        self.connection.set_progress_handler(None, 0)
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    """最近秩法计算分位数"""
+    ordered = sorted(samples)
+    rank = max(1, int(-(-fraction * len(ordered) // 1)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def clear_caches() -> None:
+    """清空进程内的查询缓存（总数、页边界、页锚点、图表响应），模拟冷请求"""
+    import app as app_module
+
+    database._count_cache.clear()
+    database._page_index_cache.clear()
+    database._page_anchor_cache.clear()
+    app_module.chart_cache.clear()
+
+
+def run_case(name: str, kind: str, call: Callable[[], object], counter: StatementCounter,
+             repeat: int, warmup: int, warm: bool) -> dict:
+    """
+    重复执行一个用例并汇总统计
+
+    Args:
+        name: 用例名称
+        kind: 'database' 或 'api'
+        call: 被测函数，返回值为False时视为失败
+        counter: 连接上的语句计数器
+        repeat: 计时次数
+        warmup: 预热次数（不计时）
+        warm: 是否保留缓存（False时每次执行前清空缓存）
+
+    Returns:
+        dict: 用例结果
+    """
+    sink = io.StringIO()
+    samples = []
+    vm_steps = []
+    statements = []
+    status = 'ok'
+
+    try:
+        with contextlib.redirect_stdout(sink):
+            for _ in range(warmup):
+                call()
+            for _ in range(repeat):
+                if not warm:
+                    clear_caches()
+                counter.reset()
+                start = time.perf_counter()
+                outcome = call()
+                samples.append((time.perf_counter() - start) * 1000)
+                vm_steps.append(counter.vm_steps)
+                statements.append(counter.statements)
+                if outcome is False:
+                    status = 'failed'
+
+            # 单独执行一次测量内存峰值（tracemalloc会拖慢执行，不与计时混在一起）
+            if not warm:
+                clear_caches()
+            tracemalloc.start()
+            call()
+            peak_bytes = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+    except Exception as e:
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        return {'name': name, 'kind': kind, 'status': 'error', 'error': str(e)}
+
+    return {
+        'name': name,
+        'kind': kind,
+        'status': status,
+        'iterations': len(samples),
+        'p50_ms': round(percentile(samples, 0.50), 3),
+        'p95_ms': round(percentile(samples, 0.95), 3),
+        'p99_ms': round(percentile(samples, 0.99), 3),
+        'mean_ms': round(sum(samples) / len(samples), 3),
+        'min_ms': round(min(samples), 3),
+        'max_ms': round(max(samples), 3),
+        'vm_steps': int(percentile(vm_steps, 0.50)),
+        'statements': int(percentile(statements, 0.50)),
+        'peak_alloc_kb': round(peak_bytes / 1024, 1)
+    }
+
+
+def database_cases(db: TrafficDatabase, deep_page: int) -> list:
+    """TrafficDatabase方法的用例列表 [(名称, 函数)]"""
+    return [
+        ('get_data_version', lambda: db.get_data_version()),
+        ('get_paginated_records[page=1]', lambda: db.get_paginated_records('traffic', 1, 20)),
+        ('count_with_filters[all]', lambda: db.count_with_filters()),
+        ('count_with_filters[morning,1]', lambda: db.count_with_filters('morning', '1')),
+        ('count_with_filters[morning,1,estimate]', lambda: db.count_with_filters('morning', '1', estimate=True)),
+        ('search_with_filters[page=1]', lambda: db.search_with_filters(page=1, per_page=20)),
+        (f'search_with_filters[page={deep_page}]', lambda: db.search_with_filters(page=deep_page, per_page=20)),
+        ('search_with_filters[morning,1]', lambda: db.search_with_filters('morning', '1', page=1, per_page=20)),
+        ('search_with_cursor[page=1]', lambda: db.search_with_cursor(page=1, per_page=20)),
+        (f'search_with_cursor[page={deep_page}]', lambda: db.search_with_cursor(page=deep_page, per_page=20)),
+        ('search_with_cursor[sort=time]', lambda: db.search_with_cursor(page=1, per_page=20, sort='time')),
+        ('get_hourly_traffic_trend', lambda: db.get_hourly_traffic_trend()),
+        ('get_hourly_traffic_trend[1]', lambda: db.get_hourly_traffic_trend('1')),
+        ('get_hourly_traffic_trend_by_weekday', lambda: db.get_hourly_traffic_trend_by_weekday()),
+        ('get_direction_distribution', lambda: db.get_direction_distribution()),
+        ('get_direction_distribution[morning]', lambda: db.get_direction_distribution('morning')),
+        ('count_with_filters[window=1d]', lambda: db.count_with_filters(start=WINDOW_START, end=WINDOW_END)),
+        ('search_with_cursor[window=1d]',
+         lambda: db.search_with_cursor(page=1, per_page=20, start=WINDOW_START, end=WINDOW_END)),
+        ('get_hourly_traffic_trend[window=1d]',
+         lambda: db.get_hourly_traffic_trend(start=WINDOW_START, end=WINDOW_END)),
+        ('find_by_plate', lambda: db.find_by_plate(BENCHMARK_PLATE)),
+        ('search_plates[prefix]', lambda: db.search_plates(BENCHMARK_PLATE_PREFIX)),
+    ]
+
+
+def serialization_cases(db: TrafficDatabase, app_module) -> list:
+    """
+    大页面的查询+序列化用例 [(名称, 函数)]
+
+    与 /api/traffic-data 相同的路径：build_traffic_page（元组查询、批量格式化）+ 应用的JSON编码
+    """
+    from utils.serialization import PAYLOAD_FORMATS
+
+    def page_call(per_page, payload_format):
+        return lambda: app_module.app.json.dumps(
+            app_module.build_traffic_page(db, mode='cursor', per_page=per_page, payload_format=payload_format))
+
+    return [(f'traffic_page[per_page={per_page},{payload_format}]', page_call(per_page, payload_format))
+            for per_page in LARGE_PAGE_SIZES for payload_format in PAYLOAD_FORMATS]
+
+
+def api_cases(deep_page: int) -> list:
+    """API路由的用例列表 [URL]（每个/api/*路由至少一个）"""
+    return [
+        '/api/trend-chart',
+        '/api/trend-chart?direction=1',
+        '/api/pie-chart',
+        '/api/pie-chart?time_range=morning',
+        '/api/weekday-weekend-chart',
+        '/api/weekday-weekend-chart?direction=2',
+        '/api/traffic-data',
+        f'/api/traffic-data?page={deep_page}',
+        f'/api/traffic-data?mode=cursor&page={deep_page}',
+        '/api/traffic-data?mode=cursor&per_page=1000&page=3',
+        '/api/traffic-data?time_range=morning&direction=1',
+        '/api/traffic-data?time_range=evening&estimate=1',
+        '/api/dashboard',
+        '/api/dashboard?time_range=morning&direction=1&mode=cursor',
+        '/api/dashboard?start=2025-03-04&end=2025-03-04&mode=cursor',
+        '/api/traffic-data/export?start=2025-03-04&end=2025-03-04&direction=1',
+        f'/api/plate/{quote(BENCHMARK_PLATE)}',
+        f'/api/plate/{quote(BENCHMARK_PLATE_PREFIX)}?prefix=1',
+        '/api/pool-stats',
+        '/api/cache-stats',
+    ]
+
+
+def describe_dataset(db: TrafficDatabase, rows: Optional[int]) -> dict:
+    """记录数据集规模和已应用的维护操作"""
+    cursor = db.connection.cursor()
+    cursor.execute("SELECT COUNT(*) FROM traffic")
+    return {
+        'rows': rows if rows is not None else cursor.fetchone()[0],
+        'db_path': db.db_path,
+        'size_bytes': os.path.getsize(db.db_path),
+        'rollup': db._get_rollup_last_id() is not None,
+        'local_time_columns': db._local_time_sql()['hour'] == 'local_hour',
+        'time_index': all(db._has_index(name) for name in database.SEARCH_INDEXES)
+    }
+
+
+def run_benchmarks(db_path: str, repeat: int = 10, warmup: int = 1, warm: bool = False,
+                   rows: Optional[int] = None, only: str = None) -> dict:
+    """
+    对一个数据库执行全部用例
+
+    Args:
+        db_path: 数据库文件路径
+        repeat: 每个用例的计时次数
+        warmup: 每个用例的预热次数
+        warm: 是否保留缓存
+        rows: 数据集记录数（仅用于记录，None时自动统计）
+        only: 只运行名称包含该字符串的用例
+
+    Returns:
+        dict: {'dataset': {...}, 'results': [...]}
+    """
+    db_path = os.path.abspath(db_path)
+    os.environ['TRAFFIC_DB_PATH'] = db_path
+
+    import app as app_module
+    # 只输出错误日志（基准查询本身就会触发慢查询警告）
+    logging.getLogger().setLevel(logging.ERROR)
+
+    # 使用单连接的连接池：直接调用和经由Flask路由的查询走同一个被统计的连接
+    pool = ConnectionPool(db_path, max_size=1)
+    with database._pools_lock:
+        database._pools[(os.getpid(), db_path)] = pool
+    connection = pool.acquire()
+    counter = StatementCounter(connection)
+    pool.release(connection)
+
+    db = TrafficDatabase(db_path, pool=pool)
+    results = []
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            db.connect()
+            dataset = describe_dataset(db, rows)
+            total_pages = db.search_with_filters(page=1, per_page=20)[2]
+            db.disconnect()
+        deep_page = max(1, total_pages // 2)
+
+        def database_call(method):
+            def call():
+                db.connect()
+                try:
+                    return method()
+                finally:
+                    db.disconnect()
+            return call
+
+        db_cases = database_cases(db, deep_page)
+        for name, method in db_cases:
+            if only and only not in name:
+                continue
+            results.append(run_case(name, 'database', database_call(method), counter, repeat, warmup, warm))
+            print(format_result(results[-1]))
+
+        for name, method in serialization_cases(db, app_module):
+            if only and only not in name:
+                continue
+            results.append(run_case(name, 'serialization', database_call(method), counter, repeat, warmup, warm))
+            print(format_result(results[-1]))
+
+        client = app_module.app.test_client()
+
+        def api_call(url):
+            def call():
+                response = client.get(url)
+                response.get_data()     # 流式响应（导出）需读完数据才完成查询
+                response.close()
+                return response.status_code == 200
+            return call
+
+        urls = api_cases(deep_page)
+        adapter = app_module.app.url_map.bind('localhost')
+        covered = {adapter.match(unquote(url.split('?')[0]))[0] for url in urls}
+        # /api/stream 为不结束的SSE长连接，不适合按请求延迟测量
+        for rule in app_module.app.url_map.iter_rules():
+            if rule.rule.startswith('/api/') and rule.rule != '/api/stream' and rule.endpoint not in covered:
+                print(f"⚠️ 路由 {rule.rule} 没有基准用例")
+        for url in urls:
+            if only and only not in url:
+                continue
+            results.append(run_case(url, 'api', api_call(url), counter, repeat, warmup, warm))
+            print(format_result(results[-1]))
+    finally:
+        counter.detach()
+        with database._pools_lock:
+            database._pools.pop((os.getpid(), db_path), None)
+        pool.close()
+
+    return {'dataset': dataset, 'results': results}
+
+
+def format_result(result: dict) -> str:
+    """格式化单个用例结果"""
+    if result['status'] == 'error':
+        return f"❌ {result['name']}: {result['error']}"
+    marker = '✅' if result['status'] == 'ok' else '⚠️'
+    return (f"{marker} {result['name']:<50} p50 {result['p50_ms']:>9.2f}ms  p95 {result['p95_ms']:>9.2f}ms  "
+            f"p99 {result['p99_ms']:>9.2f}ms  steps {result['vm_steps']:>12,}  mem {result['peak_alloc_kb']:>9.1f}KB")
+
+
+def git_info() -> dict:
+    """当前提交信息（不在git仓库中时为空）"""
+    def git(*args):
+        return subprocess.run(['git', *args], cwd=ROOT_DIR, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    try:
+        return {'commit': git('rev-parse', 'HEAD'), 'dirty': bool(git('status', '--porcelain', '--', 'utils', 'app.py'))}
+    except (OSError, subprocess.CalledProcessError):
+        return {}
+
+
+def main(argv: List[str] = None) -> int:
+    """命令行入口"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="数据库查询与API接口基准测试")
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000000],
+                        help='合成数据库的记录数，可指定多个（如 1000000 10000000 50000000）')
+    parser.add_argument('--db', default=None, help='使用已有数据库代替合成数据库')
+    parser.add_argument('--data-dir', default=os.path.join(BENCHMARK_DIR, 'data'), help='合成数据库目录')
+    parser.add_argument('--repeat', type=int, default=10, help='每个用例的计时次数')
+    parser.add_argument('--warmup', type=int, default=1, help='每个用例的预热次数')
+    parser.add_argument('--warm', action='store_true', help='保留缓存（默认每次执行前清空，测量冷请求）')
+    parser.add_argument('--maintain', action='store_true', help='测试前执行本地时间列迁移、建立时间索引和刷新汇总表')
+    parser.add_argument('--backend', choices=['sql', 'numpy'], default=None, help='聚合查询后端')
+    parser.add_argument('--aggregate-workers', type=int, default=None,
+                        help='全表扫描聚合的并行进程数（1为串行；并行段在工作进程中执行，步数只统计主进程）')
+    parser.add_argument('--only', default=None, help='只运行名称包含该字符串的用例')
+    parser.add_argument('--label', default=None, help='结果标签（写入结果文件名）')
+    parser.add_argument('--output', default=None, help='结果文件路径，默认 benchmarks/results/<时间>-<标签>.json')
+    args = parser.parse_args(argv)
+
+    if args.backend:
+        database.ANALYTICS_BACKEND = args.backend
+    if args.aggregate_workers is not None:
+        database.AGGREGATE_WORKERS = args.aggregate_workers
+
+    targets = [(args.db, None)] if args.db else [
+        (os.path.join(args.data_dir, f'traffic_{rows}.db'), rows) for rows in args.rows
+    ]
+
+    runs = []
+    for db_path, rows in targets:
+        if rows is not None:
+            generate_database(db_path, rows)
+        if args.maintain:
+            maintenance_db = TrafficDatabase(db_path)
+            if maintenance_db.connect():
+                maintenance_db.migrate_local_time_columns()
+                maintenance_db.create_search_indexes()
+                maintenance_db.refresh_rollup()
+                maintenance_db.disconnect()
+        print(f"🏁 基准测试: {db_path}")
+        runs.append(run_benchmarks(db_path, repeat=args.repeat, warmup=args.warmup, warm=args.warm,
+                                   rows=rows, only=args.only))
+
+    created_at = datetime.now(timezone.utc)
+    report = {
+        'schema_version': RESULT_SCHEMA_VERSION,
+        'label': args.label,
+        'created_at': created_at.isoformat(timespec='seconds'),
+        'git': git_info(),
+        'environment': {
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'analytics_backend': database.ANALYTICS_BACKEND,
+            'aggregate_workers': database.AGGREGATE_WORKERS,
+            'cache': 'warm' if args.warm else 'cold'
+        },
+        'config': {'repeat': args.repeat, 'warmup': args.warmup},
+        # Linux上ru_maxrss单位为KB
+        'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'runs': runs
+    }
+
+    output = args.output
+    if output is None:
+        suffix = f"-{args.label}" if args.label else ''
+        output = os.path.join(BENCHMARK_DIR, 'results', f"{created_at:%Y%m%dT%H%M%S}{suffix}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as handle:
+        json.dump(report, handle, ensure_ascii=False, indent=2)
+    print(f"📄 结果已写入: {output}")
+
+    failed = [result for run in runs for result in run['results'] if result['status'] != 'ok']
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
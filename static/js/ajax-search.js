@@ -3,6 +3,20 @@
  * 负责处理搜索表单的AJAX提交、图表更新和数据表格更新
  */
 
+// 构建接口URL：附加非空的筛选参数和时间窗口（开始/结束日期）
+function buildApiUrl(path, filters) {
+    const params = new URLSearchParams();
+    Object.entries(filters).forEach(([name, value]) => {
+        if (value) {
+            params.set(name, value);
+        }
+    });
+    const timeWindow = window.getTimeWindowParams ? window.getTimeWindowParams() : {};
+    Object.entries(timeWindow).forEach(([name, value]) => params.set(name, value));
+    const query = params.toString();
+    return query ? `${path}?${query}` : path;
+}
+
 // 发送AJAX请求更新饼图
 function updatePieChart(timeRange) {
     console.log('🔄 开始更新饼图，时间段:', timeRange);
@@ -16,7 +30,7 @@ function updatePieChart(timeRange) {
     }
     
     // 构建API请求URL
-    const apiUrl = '/api/pie-chart' + (timeRange ? `?time_range=${timeRange}` : '');
+    const apiUrl = buildApiUrl('/api/pie-chart', { time_range: timeRange });
     console.log('🌐 请求URL:', apiUrl);
     
     // 显示加载状态
@@ -86,8 +100,8 @@ function updateTrendChart(direction){
         return;
     }
     
-    // 构建API请求URL（只传递方向参数）
-    const apiUrl = '/api/trend-chart' + (direction ? `?direction=${direction}` : '');
+    // 构建API请求URL（方向参数和时间窗口）
+    const apiUrl = buildApiUrl('/api/trend-chart', { direction: direction });
     console.log('🌐 趋势图请求URL:', apiUrl);
     
     // 显示加载状态
@@ -156,7 +170,7 @@ function updateWeekdayWeekendChart(direction) {
     }
     
     // 构建API请求URL
-    const apiUrl = '/api/weekday-weekend-chart' + (direction ? `?direction=${direction}` : '');
+    const apiUrl = buildApiUrl('/api/weekday-weekend-chart', { direction: direction });
     console.log('🌐 工作日vs周末对比图请求URL:', apiUrl);
     
     // 显示加载状态
@@ -210,6 +224,114 @@ function updateWeekdayWeekendChart(direction) {
             alert('工作日vs周末对比图网络请求失败: ' + error.message);
         });
 }
+// 在容器中绘制图表（Plotly未加载时先加载）
+function drawChart(container, chartData, label) {
+    container.innerHTML = '';
+    if (window.Plotly) {
+        Plotly.newPlot(container, chartData.data, chartData.layout, {responsive: true});
+        console.log(`✅ ${label}更新成功`);
+    } else {
+        console.log('📚 Plotly库未加载，正在加载...');
+        const script = document.createElement('script');
+        script.src = 'https://cdn.plot.ly/plotly-latest.min.js';
+        script.onload = function() {
+            Plotly.newPlot(container, chartData.data, chartData.layout, {responsive: true});
+            console.log(`✅ ${label}更新成功（已加载Plotly）`);
+        };
+        document.head.appendChild(script);
+    }
+}
+
+// 仪表盘中各图表对应的容器
+const DASHBOARD_CHARTS = {
+    pie: { containerId: 'pie-chart-container', label: '饼图' },
+    trend: { containerId: 'trend-chart', label: '趋势图' },
+    weekday_weekend: { containerId: 'weekday-weekend-chart', label: '工作日vs周末对比图' }
+};
+
+// 一次请求加载全部图表和第1页数据（/api/dashboard），失败时退回分别请求
+function loadDashboard(timeRange, direction) {
+    console.log('🔄 开始加载仪表盘，搜索条件:', { time_range: timeRange, direction: direction });
+    
+    if (window.showLoadingState) {
+        window.showLoadingState(1);
+    }
+    // 搜索条件变化，旧的实时增量和预取的页不再适用
+    if (window.stopLiveUpdates) {
+        window.stopLiveUpdates();
+    }
+    if (window.clearPageCache) {
+        window.clearPageCache();
+    }
+    
+    const params = new URLSearchParams({
+        time_range: timeRange,
+        direction: direction,
+        mode: window.PAGINATION_MODE || 'offset',
+        format: window.PAYLOAD_FORMAT || 'records',
+        per_page: window.getPageSize ? window.getPageSize() : 20,
+        ...(window.getTimeWindowParams ? window.getTimeWindowParams() : {})
+    });
+    
+    fetch(`/api/dashboard?${params}`)
+        .then(response => {
+            console.log('📡 仪表盘响应状态:', response.status);
+            if (!response.ok) {
+                throw new Error(`HTTP error! status: ${response.status}`);
+            }
+            return response.json();
+        })
+        .then(data => {
+            if (!data.success) {
+                throw new Error(data.message || '仪表盘加载失败');
+            }
+            
+            // 绘制图表（单个图表失败时只在对应容器显示错误）
+            Object.entries(DASHBOARD_CHARTS).forEach(([name, chart]) => {
+                const container = document.getElementById(chart.containerId);
+                const result = data.charts[name];
+                if (!container || !result) {
+                    return;
+                }
+                if (result.success) {
+                    drawChart(container, result.chart_data, chart.label);
+                } else {
+                    container.innerHTML = `<div style="padding: 20px; color: red;">❌ ${result.message}</div>`;
+                    console.error(`❌ ${chart.label}更新失败:`, result.error);
+                }
+            });
+            
+            // 渲染第1页数据
+            if (data.table && window.renderTrafficPage) {
+                window.renderTrafficPage(data.table, timeRange, direction);
+            }
+            console.log('✅ 仪表盘加载完成');
+            
+            // 从本次数据包含的最大id开始接收新增记录的增量（多个路口分片时服务端不支持实时推送）
+            if (window.startLiveUpdates && data.live !== false) {
+                window.startLiveUpdates({
+                    time_range: timeRange,
+                    direction: direction,
+                    ...(window.getTimeWindowParams ? window.getTimeWindowParams() : {})
+                }, data.last_id);
+            }
+        })
+        .catch(error => {
+            console.error('❌ 仪表盘请求失败，改为分别请求:', error);
+            updatePieChart(timeRange);
+            updateTrendChart(direction);
+            updateWeekdayWeekendChart(direction);
+            if (window.loadPage) {
+                window.loadPage(1);
+            }
+        })
+        .finally(() => {
+            if (window.hideLoadingState) {
+                window.hideLoadingState();
+            }
+        });
+}
+
 // 设置搜索表单AJAX拦截
 function setupSearchForm() {
     const searchForm = document.querySelector('.search-form');
@@ -233,21 +355,9 @@ function setupSearchForm() {
                 direction: direction
             });
             
-            // 同时调用多个图表更新函数
+            // 一次请求更新全部图表和数据表格（重置到第1页）
             console.log('🎯 开始批量更新图表和数据表格...');
-            updatePieChart(timeRange);
-            updateTrendChart(direction);
-            updateWeekdayWeekendChart(direction);
-            
-            // 更新数据表格（重置到第1页）
-            if (window.loadPage) {
-                console.log('� 更新数据表格，重置到第1页');
-                window.loadPage(1);
-            } else {
-                console.warn('⚠️ loadPage函数未找到，跳过数据表格更新');
-            }
-            
-            console.log('�🚀 所有更新请求已发送');
+            loadDashboard(timeRange, direction);
         });
         
         return true;
@@ -257,6 +367,26 @@ function setupSearchForm() {
     }
 }
 
+// 导出链接：点击时按当前搜索条件生成导出地址（服务器流式返回全部匹配记录的CSV）
+function setupExportLink() {
+    const exportLink = document.getElementById('exportCsvLink');
+    const searchForm = document.querySelector('.search-form');
+    if (!exportLink || !searchForm) {
+        return false;
+    }
+    
+    exportLink.addEventListener('click', function() {
+        const formData = new FormData(searchForm);
+        exportLink.href = buildApiUrl('/api/traffic-data/export', {
+            time_range: formData.get('time_range') || '',
+            direction: formData.get('direction') || '',
+            format: 'csv'
+        });
+        console.log('📤 导出搜索结果:', exportLink.href);
+    });
+    return true;
+}
+
 // 页面加载完成后初始化AJAX系统
 document.addEventListener('DOMContentLoaded', function() {
     console.log('🚀 AJAX搜索系统初始化中...');
@@ -270,12 +400,10 @@ document.addEventListener('DOMContentLoaded', function() {
         
         // 设置搜索表单拦截
         setupSearchForm();
+        setupExportLink();
         
-        // 自动加载初始图表（无搜索条件）
+        // 自动加载初始图表和第1页数据（无搜索条件）
         console.log('🎯 自动加载初始图表...');
-        updatePieChart('');
-        updateTrendChart('');  // 空字符串表示不限制方向
-        updateWeekdayWeekendChart('');  // 加载工作日vs周末图表
-        console.log('✅ 初始图表加载请求已发送');
+        loadDashboard('', '');
     }, 100); // 等待100毫秒
 });
@@ -0,0 +1,128 @@
+/**
+ * 实时更新 JavaScript
+ * 通过 /api/stream（Server-Sent Events）接收新增记录的增量，
+ * 在已绘制的图表上直接累加（Plotly.restyle / Plotly.extendTraces），不重新请求图表配置
+ */
+
+// 当前的实时连接和对应的搜索条件
+let liveSource = null;
+let liveFilters = null;
+let liveNewRecords = 0;
+
+// 开始接收实时增量：lastId 为当前图表数据已包含的最大id（/api/dashboard 返回的 last_id）
+function startLiveUpdates(filters, lastId) {
+    stopLiveUpdates();
+    if (!window.EventSource) {
+        console.log('⚠️ 浏览器不支持EventSource，不启用实时更新');
+        return false;
+    }
+
+    liveFilters = filters;
+    liveNewRecords = 0;
+    const params = new URLSearchParams();
+    Object.entries(filters).forEach(([name, value]) => {
+        if (value) {
+            params.set(name, value);
+        }
+    });
+    if (lastId !== undefined && lastId !== null) {
+        params.set('last_id', lastId);
+    }
+
+    // 断线后浏览器自动重连，并通过Last-Event-ID从最后收到的增量继续
+    liveSource = new EventSource(`/api/stream?${params}`);
+    liveSource.addEventListener('ready', () => updateLiveStatus());
+    liveSource.addEventListener('delta', event => applyLiveDelta(JSON.parse(event.data)));
+    liveSource.addEventListener('reset', () => {
+        // 数据被删除或落后太多，无法累加：按当前条件重新加载
+        console.log('🔄 实时数据需要重新加载');
+        stopLiveUpdates();
+        if (window.loadDashboard) {
+            window.loadDashboard(liveFilters.time_range || '', liveFilters.direction || '');
+        }
+    });
+    liveSource.onerror = () => updateLiveStatus('⚪ 实时更新连接中断，正在重连...');
+    console.log('📡 已订阅实时更新:', filters, 'last_id =', lastId);
+    return true;
+}
+
+// 关闭实时连接（重新搜索前调用）
+function stopLiveUpdates() {
+    if (liveSource) {
+        liveSource.close();
+        liveSource = null;
+    }
+}
+
+// 已绘制的Plotly图表（尚未绘制时返回null）
+function getPlottedChart(containerId) {
+    const container = document.getElementById(containerId);
+    return container && container.data ? container : null;
+}
+
+// 把增量累加到图表和记录数上
+function applyLiveDelta(delta) {
+    if (!window.Plotly) {
+        return;
+    }
+
+    // 24小时趋势图：固定24个点，替换y值
+    const trend = getPlottedChart('trend-chart');
+    if (trend) {
+        const y = trend.data[0].y.map((value, hour) => value + delta.trend[hour]);
+        Plotly.restyle(trend, { y: [y] }, [0]);
+    }
+
+    // 工作日vs周末对比图：两条曲线分别累加平均值的变化
+    const weekly = getPlottedChart('weekday-weekend-chart');
+    if (weekly) {
+        const weekday = weekly.data[0].y.map((value, hour) => value + delta.weekday[hour]);
+        const weekend = weekly.data[1].y.map((value, hour) => value + delta.weekend[hour]);
+        Plotly.restyle(weekly, { y: [weekday, weekend] }, [0, 1]);
+    }
+
+    // 方向饼图：已有方向累加数量，新出现的方向追加扇区
+    const pie = getPlottedChart('pie-chart-container');
+    if (pie) {
+        const labels = pie.data[0].labels;
+        const values = pie.data[0].values.slice();
+        const newLabels = [];
+        const newValues = [];
+        Object.entries(delta.pie).forEach(([label, count]) => {
+            const index = labels.indexOf(label);
+            if (index >= 0) {
+                values[index] += count;
+            } else {
+                newLabels.push(label);
+                newValues.push(count);
+            }
+        });
+        Plotly.restyle(pie, { values: [values] }, [0]);
+        if (newLabels.length) {
+            Plotly.extendTraces(pie, { labels: [newLabels], values: [newValues] }, [0]);
+        }
+    }
+
+    liveNewRecords += delta.new_records;
+    updateLiveStatus();
+    console.log(`📡 实时增量: 新增 ${delta.new_records} 条匹配记录 (last_id = ${delta.last_id})`);
+}
+
+// 更新实时状态显示
+function updateLiveStatus(text) {
+    const statusElement = document.getElementById('live-status-text');
+    if (!statusElement) {
+        return;
+    }
+    if (text) {
+        statusElement.textContent = text;
+    } else if (liveNewRecords > 0) {
+        statusElement.innerHTML = `🟢 实时更新中 - 打开后新增 <strong>${liveNewRecords.toLocaleString()}</strong> 条匹配记录`;
+    } else {
+        statusElement.textContent = '🟢 实时更新中';
+    }
+}
+
+// 导出函数供其他脚本使用
+window.startLiveUpdates = startLiveUpdates;
+window.stopLiveUpdates = stopLiveUpdates;
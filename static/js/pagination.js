@@ -6,12 +6,121 @@
 // 当前页码（全局变量）
 let currentPage = 1;
 
-// AJAX加载指定页码的数据
+// 游标分页状态：相邻页通过游标定位，深页翻页与第1页代价相同
+const PAGINATION_MODE = 'cursor';
+// 表格数据使用列式格式（format=columns），时间和方向描述在浏览器端格式化
+const PAYLOAD_FORMAT = 'columns';
+let cursorState = {
+    filters: null,      // 游标对应的搜索条件，条件变化后游标失效
+    nextCursor: null,
+    prevCursor: null
+};
+
+// 每页记录数（表格上方的下拉框选择，服务器上限1000）
+const DEFAULT_PAGE_SIZE = 20;
+// 预取：渲染一页后在后台请求相邻页（N±1），翻到相邻页时直接从缓存渲染
+const PREFETCH_ADJACENT = true;
+// 客户端页缓存（LRU）：{键: {request: Promise, expiresAt}}，Map按插入顺序，最久未使用的在最前
+const PAGE_CACHE_SIZE = 8;
+const PAGE_CACHE_TTL_MS = 60000;
+const pageCache = new Map();
+
+// 当前选择的每页记录数
+function getPageSize() {
+    const pageSize = parseInt(document.getElementById('pageSizeSelect')?.value);
+    return isNaN(pageSize) ? DEFAULT_PAGE_SIZE : pageSize;
+}
+
+// 读取缓存的页（未缓存或已过期时返回null），命中的条目移到最后
+function getCachedPage(key) {
+    const entry = pageCache.get(key);
+    if (!entry) {
+        return null;
+    }
+    pageCache.delete(key);
+    if (entry.expiresAt < Date.now()) {
+        return null;
+    }
+    pageCache.set(key, entry);
+    return entry.request;
+}
+
+// 缓存一页的请求（请求进行中也可以被复用），超出容量时淘汰最久未使用的页
+function cachePage(key, request) {
+    pageCache.delete(key);
+    pageCache.set(key, { request: request, expiresAt: Date.now() + PAGE_CACHE_TTL_MS });
+    while (pageCache.size > PAGE_CACHE_SIZE) {
+        pageCache.delete(pageCache.keys().next().value);
+    }
+    // 失败的请求不保留，下次重新请求
+    request.catch(error => {
+        if (pageCache.get(key)?.request === request) {
+            pageCache.delete(key);
+        }
+        console.log(`⚠️ 第${key.split('|').pop()}页请求失败:`, error.message);
+    });
+}
+
+// 清空页缓存（重新搜索或数据更新后调用）
+function clearPageCache() {
+    pageCache.clear();
+}
+
+// 构建 /api/traffic-data 请求参数
+function buildPageParams(page, timeRange, direction, timeWindow, pageSize, cursorParams) {
+    return new URLSearchParams({
+        page: page,
+        per_page: pageSize,
+        time_range: timeRange,
+        direction: direction,
+        mode: PAGINATION_MODE,
+        format: PAYLOAD_FORMAT,
+        ...timeWindow,
+        ...cursorParams
+    });
+}
+
+// 请求一页数据，返回响应数据（success为false时抛出错误）
+async function fetchTrafficPage(params) {
+    const response = await fetch(`/api/traffic-data?${params}`);
+    const data = await response.json();
+    if (!data.success) {
+        throw new Error(data.message || '数据加载失败');
+    }
+    return data;
+}
+
+// 读取时间窗口输入框（开始/结束日期），只返回已填写的参数
+function getTimeWindowParams() {
+    const params = {};
+    const start = document.getElementById('startDateInput')?.value || '';
+    const end = document.getElementById('endDateInput')?.value || '';
+    if (start) {
+        params.start = start;
+    }
+    if (end) {
+        params.end = end;
+    }
+    return params;
+}
+
+// 根据目标页码选择游标参数（只有相邻页才能使用游标）
+function getCursorParams(page, filterKey) {
+    if (cursorState.filters !== filterKey) {
+        return {};
+    }
+    if (page === currentPage + 1 && cursorState.nextCursor) {
+        return { after: cursorState.nextCursor };
+    }
+    if (page === currentPage - 1 && cursorState.prevCursor) {
+        return { before: cursorState.prevCursor };
+    }
+    return {};
+}
+
+// AJAX加载指定页码的数据（已预取的相邻页直接从缓存渲染）
 async function loadPage(page) {
     try {
-        // 显示加载状态
-        showLoadingState(page);
-        
         // 获取当前搜索条件
         const timeRangeElement = document.getElementById('timeRangeSelect');
         const directionElement = document.getElementById('directionSelect');
@@ -25,34 +134,29 @@ async function loadPage(page) {
             directionValue: direction
         });
         
-        // 构建API请求URL
-        const params = new URLSearchParams({
-            page: page,
-            time_range: timeRange,
-            direction: direction
-        });
-        
-        console.log(`🔢 AJAX翻页: 加载第${page}页，搜索条件: 时间="${timeRange}", 方向="${direction}"`);
+        // 构建API请求URL（跳页时由服务器通过页边界索引定位）
+        const timeWindow = getTimeWindowParams();
+        const pageSize = getPageSize();
+        const filterKey = getFilterKey(timeRange, direction, timeWindow, pageSize);
+        const cacheKey = `${filterKey}|${page}`;
         
-        // 调用API
-        const response = await fetch(`/api/traffic-data?${params}`);
-        const data = await response.json();
-        
-        if (data.success) {
-            // 更新表格内容
-            updateTableContent(data.data);
-            // 更新分页UI
-            updatePaginationUI(data.pagination);
-            // 更新搜索信息显示
-            updateSearchInfo(data.search_info, data.pagination.total_records, timeRange, direction);
-            // 更新当前页码
-            currentPage = data.pagination.current_page;
-            
-            console.log(`✅ 翻页成功: 第${data.pagination.current_page}页，共${data.pagination.total_records}条记录`);
+        let request = getCachedPage(cacheKey);
+        if (request) {
+            console.log(`⚡ AJAX翻页: 第${page}页已预取，直接渲染`);
         } else {
-            throw new Error(data.message || '数据加载失败');
+            // 显示加载状态
+            showLoadingState(page);
+            console.log(`🔢 AJAX翻页: 加载第${page}页，搜索条件: 时间="${timeRange}", 方向="${direction}"`);
+            const params = buildPageParams(page, timeRange, direction, timeWindow, pageSize,
+                                           getCursorParams(page, filterKey));
+            request = fetchTrafficPage(params);
+            cachePage(cacheKey, request);
         }
         
+        const data = await request;
+        renderTrafficPage(data, timeRange, direction);
+        console.log(`✅ 翻页成功: 第${data.pagination.current_page}页，共${data.pagination.total_records}条记录`);
+        
     } catch (error) {
         console.error('❌ 翻页失败:', error);
         showErrorMessage('翻页失败: ' + error.message);
@@ -61,6 +165,79 @@ async function loadPage(page) {
     }
 }
 
+// 搜索条件和每页记录数的键（游标和缓存的页只在两者都相同时有效）
+function getFilterKey(timeRange, direction, timeWindow, pageSize) {
+    return `${timeRange}|${direction}|${timeWindow.start || ''}|${timeWindow.end || ''}|${pageSize}`;
+}
+
+// 在后台预取相邻页（带游标，服务器直接定位；已缓存的页不重复请求）
+function prefetchAdjacentPages(pagination, timeRange, direction) {
+    if (!PREFETCH_ADJACENT) {
+        return;
+    }
+    const timeWindow = getTimeWindowParams();
+    const filterKey = getFilterKey(timeRange, direction, timeWindow, pagination.per_page);
+    const neighbours = [];
+    if (pagination.has_next) {
+        neighbours.push([pagination.next_page, pagination.next_cursor ? { after: pagination.next_cursor } : {}]);
+    }
+    if (pagination.has_prev) {
+        neighbours.push([pagination.prev_page, pagination.prev_cursor ? { before: pagination.prev_cursor } : {}]);
+    }
+    
+    neighbours.forEach(([page, cursorParams]) => {
+        const cacheKey = `${filterKey}|${page}`;
+        if (getCachedPage(cacheKey)) {
+            return;
+        }
+        const params = buildPageParams(page, timeRange, direction, timeWindow, pagination.per_page, cursorParams);
+        cachePage(cacheKey, fetchTrafficPage(params));
+    });
+}
+
+// 按统计时区格式化时间戳，与服务器的 formatted_time 相同（先舍入到微秒再截断到秒）
+function formatLocalTime(timestamp, offsetMinutes, timeLabel) {
+    const seconds = Math.floor(timestamp + offsetMinutes * 60 + 5e-7);
+    const text = new Date(seconds * 1000).toISOString().slice(0, 19).replace('T', ' ');
+    return `${text} (${timeLabel})`;
+}
+
+// 列式数据 {columns, rows} 转换为记录（已是记录列表时原样返回）
+function toTrafficRecords(data) {
+    if (Array.isArray(data)) {
+        return data;
+    }
+    return data.rows.map(row => {
+        const record = {};
+        data.columns.forEach((name, index) => {
+            record[name] = row[index];
+        });
+        record.formatted_time = formatLocalTime(record.time, data.utc_offset_minutes, data.time_label);
+        record.direction_text = data.direction_labels[record.direction] || `方向${record.direction}`;
+        return record;
+    });
+}
+
+// 渲染一页数据（翻页响应和 /api/dashboard 的 table 部分格式相同）
+function renderTrafficPage(data, timeRange, direction) {
+    // 更新表格内容
+    updateTableContent(toTrafficRecords(data.data));
+    // 更新分页UI
+    updatePaginationUI(data.pagination);
+    // 更新搜索信息显示
+    updateSearchInfo(data.search_info, data.pagination.total_records, timeRange, direction, data.pagination.is_estimate);
+    // 更新当前页码
+    currentPage = data.pagination.current_page;
+    // 保存相邻页游标
+    cursorState = {
+        filters: getFilterKey(timeRange, direction, getTimeWindowParams(), data.pagination.per_page),
+        nextCursor: data.pagination.next_cursor || null,
+        prevCursor: data.pagination.prev_cursor || null
+    };
+    // 在后台准备上一页和下一页
+    prefetchAdjacentPages(data.pagination, timeRange, direction);
+}
+
 // 显示加载状态
 function showLoadingState(targetPage) {
     const tableBody = document.querySelector('#traffic-table tbody');
@@ -126,7 +303,7 @@ function updatePaginationUI(pagination) {
     // 更新页码显示信息
     const recordInfo = document.querySelector('.record-info');
     if (recordInfo) {
-        recordInfo.textContent = `显示第 ${pagination.start_record}-${pagination.end_record} 条，共 ${pagination.total_records} 条记录`;
+        recordInfo.textContent = `显示第 ${pagination.start_record}-${pagination.end_record} 条，共 ${pagination.is_estimate ? '约 ' : ''}${pagination.total_records} 条记录`;
     }
     
     // 更新页码输入框
@@ -213,7 +390,7 @@ function regeneratePaginationButtons(pagination) {
 
 // 更新分页按钮状态
 // 更新搜索信息显示
-function updateSearchInfo(searchInfo, totalRecords, timeRange, direction) {
+function updateSearchInfo(searchInfo, totalRecords, timeRange, direction, isEstimate = false) {
     // 更新下方的搜索信息
     const searchInfoElement = document.querySelector('.search-info');
     if (searchInfoElement) {
@@ -224,12 +401,16 @@ function updateSearchInfo(searchInfo, totalRecords, timeRange, direction) {
     const searchStatusElement = document.getElementById('search-status-text');
     if (searchStatusElement) {
         // 判断是否有搜索条件
-        const hasSearchConditions = timeRange || direction;
+        const timeWindow = getTimeWindowParams();
+        const hasSearchConditions = timeRange || direction || timeWindow.start || timeWindow.end;
+        
+        // 估算的总数前加"约"
+        const approx = isEstimate ? '约 ' : '';
         
         if (hasSearchConditions) {
-            searchStatusElement.innerHTML = `🎯 ${searchInfo} - 找到 <strong>${totalRecords.toLocaleString()}</strong> 条记录`;
+            searchStatusElement.innerHTML = `🎯 ${searchInfo} - 找到 ${approx}<strong>${totalRecords.toLocaleString()}</strong> 条记录`;
         } else {
-            searchStatusElement.innerHTML = `📋 ${searchInfo} - 共 <strong>${totalRecords.toLocaleString()}</strong> 条记录`;
+            searchStatusElement.innerHTML = `📋 ${searchInfo} - 共 ${approx}<strong>${totalRecords.toLocaleString()}</strong> 条记录`;
         }
     }
 }
@@ -314,11 +495,24 @@ document.addEventListener('DOMContentLoaded', function() {
     // 设置分页事件监听器
     setupPaginationEvents();
     
-    // 加载第一页数据
+    // 修改每页记录数后回到第1页
+    const pageSizeSelect = document.getElementById('pageSizeSelect');
+    if (pageSizeSelect) {
+        pageSizeSelect.addEventListener('change', () => loadPage(1));
+    }
+    
+    // 第一页数据随 /api/dashboard 一起加载（见ajax-search.js）
     console.log('🚀 初始化AJAX分页系统');
-    loadPage(1);
 });
 
 // 导出函数供其他脚本使用
 window.loadPage = loadPage;
+window.renderTrafficPage = renderTrafficPage;
+window.showLoadingState = showLoadingState;
+window.hideLoadingState = hideLoadingState;
+window.PAGINATION_MODE = PAGINATION_MODE;
+window.PAYLOAD_FORMAT = PAYLOAD_FORMAT;
+window.getPageSize = getPageSize;
+window.clearPageCache = clearPageCache;
+window.getTimeWindowParams = getTimeWindowParams;
 window.jumpToPage = jumpToPage;
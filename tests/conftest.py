@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+测试公共夹具 - 生成小规模的合成交通数据库
+"""
+
+import os
+import random
+import sqlite3
+import sys
+
+import pytest
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 合成数据起始时间：2025-03-03 00:00:00（北京时间，周一）
+SAMPLE_START_TIME = 1740931200
+# 合成数据覆盖两周
+SAMPLE_DURATION = 14 * 24 * 3600
+SAMPLE_ROWS = 3000
+
+
+def build_sample_database(db_path: str, rows: int = SAMPLE_ROWS, seed: int = 42) -> str:
+    """
+    创建与真实数据结构一致的traffic表并写入随机数据
+    
+    Args:
+        db_path: 数据库文件路径
+        rows: 记录条数
+        seed: 随机种子
+        
+    Returns:
+        str: 数据库文件路径
+    """
+    rng = random.Random(seed)
+    connection = sqlite3.connect(db_path)
+    connection.execute("""
+        CREATE TABLE traffic (
+            id INTEGER PRIMARY KEY,
+            direction INTEGER,
+            time REAL,
+            plate TEXT
+        )
+    """)
+    records = []
+    for row_id in range(1, rows + 1):
+        # 时间大体随id递增，但允许少量乱序，便于验证 (time, id) 排序
+        base = SAMPLE_START_TIME + SAMPLE_DURATION * row_id / rows
+        timestamp = base + rng.uniform(-600, 600)
+        plate = f"粤B{rng.randint(0, 99999):05d}"
+        records.append((row_id, rng.randint(1, 4), timestamp, plate))
+    connection.executemany("INSERT INTO traffic VALUES (?, ?, ?, ?)", records)
+    connection.commit()
+    connection.close()
+    return db_path
+
+
+@pytest.fixture
+def sample_db_path(tmp_path):
+    """合成数据库文件路径"""
+    return build_sample_database(str(tmp_path / 'traffic.db'))
+
+
+@pytest.fixture
+def sample_db(sample_db_path):
+    """已连接的合成数据库"""
+    from utils.database import TrafficDatabase
+    db = TrafficDatabase(sample_db_path)
+    assert db.connect()
+    yield db
+    db.disconnect()
+
+
+@pytest.fixture
+def clear_count_cache():
+    """每个测试使用空的总数缓存（计数结果和命中统计不受其他测试影响）"""
+    from utils.database import _count_cache
+    _count_cache.clear()
+
+
+@pytest.fixture
+def client(sample_db_path, monkeypatch, clear_count_cache):
+    """指向合成数据库的Flask测试客户端（图表缓存和总数缓存已清空）"""
+    monkeypatch.setenv('TRAFFIC_DB_PATH', sample_db_path)
+    from app import app, chart_cache
+    app.config['TESTING'] = True
+    chart_cache.clear()
+    with app.test_client() as client:
+        yield client
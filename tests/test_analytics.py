@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+测试NumPy列式分析引擎 - pytest版本
+"""
+
+import numpy as np
+import pytest
+
+from utils import database as database_module
+from utils.analytics import ColumnarAnalytics, local_hour_weekday, verify
+from utils.snapshot import export_snapshot
+
+
+class TestColumnarAnalytics:
+    """列式分析引擎测试类"""
+    
+    def test_local_time_matches_sqlite(self, sample_db):
+        """测试本地小时/星期的计算与SQLite一致（包括接近整点的小数秒）"""
+        times = np.array([1740931199.9994, 1740931199.9996, 1740970800.0, 1741017599.5, 0.25])
+        hours, weekdays = local_hour_weekday(times, database_module.TIMEZONE_OFFSET_MINUTES)
+        
+        for value, hour, weekday in zip(times, hours, weekdays):
+            row = sample_db.connection.execute(
+                f"SELECT {database_module.LOCAL_HOUR_SQL}, {database_module.LOCAL_WEEKDAY_SQL} "
+                f"FROM (SELECT ? AS time)", (float(value),)
+            ).fetchone()
+            assert (int(hour), int(weekday)) == tuple(row)
+    
+    def test_backend_identical_to_sql(self, sample_db_path):
+        """测试NumPy后端与SQL后端在所有筛选组合下结果一致"""
+        assert verify(sample_db_path)
+    
+    def test_incremental_sync(self, sample_db):
+        """测试增量加载新记录"""
+        engine = ColumnarAnalytics(sample_db.db_path)
+        assert engine.sync(sample_db.connection) == 3000
+        assert engine.sync(sample_db.connection) == 0
+        
+        sample_db.connection.execute("INSERT INTO traffic (direction, time, plate) VALUES (2, 1741000000, 'X')")
+        assert engine.sync(sample_db.connection) == 1
+        assert sum(count for _, count in engine.aggregate(['direction'])) == 3001
+    
+    def test_database_uses_numpy_backend(self, sample_db, monkeypatch):
+        """测试配置numpy后端后聚合方法由引擎计算"""
+        expected = sample_db.get_direction_distribution(time_range='night')
+        monkeypatch.setattr(database_module, 'ANALYTICS_BACKEND', 'numpy')
+        monkeypatch.setattr(database_module.TrafficDatabase, '_local_time_sql',
+                            lambda self: pytest.fail('不应执行SQL聚合'))
+        
+        assert sample_db.get_direction_distribution(time_range='night') == expected
+    
+    def test_reload_after_deletes(self, sample_db, monkeypatch):
+        """测试记录被删除（最早、最新或中间的记录）后引擎重新加载，结果与SQL一致"""
+        engine = ColumnarAnalytics(sample_db.db_path, snapshot_path='/nonexistent')
+        engine.sync(sample_db.connection)
+        
+        sample_db.connection.execute("DELETE FROM traffic WHERE id <= 10 OR id > 2990")
+        assert engine.sync(sample_db.connection) == 2980
+        assert engine.aggregate(['direction']) == sample_db._query_aggregate_counts(['direction'])
+        
+        # 中间的记录被删除时最小/最大id不变，按间隔核对记录数
+        sample_db.connection.execute("DELETE FROM traffic WHERE id BETWEEN 1000 AND 1099")
+        assert engine.sync(sample_db.connection) == 0
+        monkeypatch.setattr('utils.analytics.ROW_COUNT_CHECK_SECONDS', 0)
+        assert engine.sync(sample_db.connection) == 2880
+        assert engine.aggregate(['hour', 'weekday']) == sample_db._query_aggregate_counts(['hour', 'weekday'])
+    
+    @pytest.mark.parametrize('group_columns, direction_filter', [
+        (['direction'], None),
+        (['hour', 'weekday'], None),
+        (['hour', 'weekday', 'direction'], None),
+        (['hour'], '2'),
+    ])
+    def test_null_direction_matches_sql(self, sample_db, group_columns, direction_filter):
+        """测试方向为NULL的记录与SQL一样单独成组（快照和增量加载都一样）"""
+        sample_db.connection.execute("INSERT INTO traffic (direction, time, plate) VALUES (NULL, 1741000000, 'X')")
+        sample_db.connection.commit()
+        export_snapshot(sample_db.db_path)
+        sample_db.connection.execute("INSERT INTO traffic (direction, time, plate) VALUES (NULL, 1741003600, 'Y')")
+        expected = sample_db._query_aggregate_counts(group_columns, direction_filter=direction_filter)
+        
+        engine = ColumnarAnalytics(sample_db.db_path)
+        assert engine.sync(sample_db.connection) == 1
+        assert engine._base is not None
+        assert engine.aggregate(group_columns, direction_filter=direction_filter) == expected
+        if group_columns == ['direction']:
+            assert expected[0] == (None, 2)
+
+    @pytest.mark.parametrize('group_columns,time_range', [
+        (['hour'], None),
+        (['weekday', 'hour'], None),
+        (['hour', 'weekday', 'direction'], None),
+        (['direction'], 'night'),
+        (['hour'], 'morning'),
+    ])
+    def test_null_time_matches_sql(self, sample_db, group_columns, time_range):
+        """测试时间为NULL的记录与SQL一样按小时/星期单独成组，且不属于任何时间段"""
+        sample_db.connection.execute("INSERT INTO traffic (direction, time, plate) VALUES (2, NULL, 'X')")
+        sample_db.connection.commit()
+        export_snapshot(sample_db.db_path)
+        sample_db.connection.execute("INSERT INTO traffic (direction, time, plate) VALUES (2, NULL, 'Y')")
+        expected = sample_db._query_aggregate_counts(group_columns, time_range=time_range)
+
+        engine = ColumnarAnalytics(sample_db.db_path)
+        assert engine.sync(sample_db.connection) == 1
+        assert engine._base is not None
+        assert engine.aggregate(group_columns, time_range=time_range) == expected
+        if group_columns == ['hour', 'weekday', 'direction']:
+            assert expected[0] == (None, None, 2, 2)
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+测试ASGI入口 - pytest版本
+"""
+
+import asyncio
+import json
+import threading
+
+import pytest
+
+from asgi import CoalescingASGIApp, build_environ
+from benchmarks.load import make_scope
+
+
+async def request(asgi_app, url):
+    """发送一个GET请求，返回 (状态码, 响应体)"""
+    messages = []
+    
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+    
+    async def send(message):
+        messages.append(message)
+    
+    await asgi_app(make_scope(url), receive, send)
+    return messages[0]['status'], messages[1]['body']
+
+
+class BlockingApp:
+    """记录调用次数、在事件触发前阻塞的WSGI应用"""
+    
+    def __init__(self):
+        self.calls = []
+        self.release = threading.Event()
+    
+    def __call__(self, environ, start_response):
+        self.calls.append((environ['PATH_INFO'], environ['QUERY_STRING']))
+        self.release.wait(5)
+        start_response('200 OK', [('Content-Type', 'text/plain')])
+        return [f"{environ['PATH_INFO']}?{environ['QUERY_STRING']}#{len(self.calls)}".encode()]
+
+
+class TestCoalescingASGIApp:
+    """ASGI入口测试类"""
+    
+    def run_concurrently(self, asgi_app, wsgi_app, urls):
+        """并发发送请求，所有请求到达后再放行"""
+        async def main():
+            asyncio.get_running_loop().call_later(0.2, wsgi_app.release.set)
+            return await asyncio.gather(*(request(asgi_app, url) for url in urls))
+        return asyncio.run(main())
+    
+    def test_identical_requests_coalesced(self):
+        """测试相同的并发请求只执行一次"""
+        wsgi_app = BlockingApp()
+        asgi_app = CoalescingASGIApp(wsgi_app, max_workers=4)
+        
+        responses = self.run_concurrently(asgi_app, wsgi_app, ['/api/pie-chart?time_range=morning'] * 10)
+        
+        assert len(wsgi_app.calls) == 1
+        assert asgi_app.stats['coalesced'] == 9
+        assert len({body for _, body in responses}) == 1
+        assert asgi_app._in_flight == {}
+    
+    def test_parameter_order_ignored(self):
+        """测试查询参数顺序不同的请求也会合并，参数不同的请求分别执行"""
+        wsgi_app = BlockingApp()
+        asgi_app = CoalescingASGIApp(wsgi_app, max_workers=4)
+        
+        self.run_concurrently(asgi_app, wsgi_app, [
+            '/api/dashboard?time_range=noon&direction=1',
+            '/api/dashboard?direction=1&time_range=noon',
+            '/api/dashboard?time_range=noon&direction=2',
+        ])
+        
+        assert len(wsgi_app.calls) == 2
+    
+    def test_other_paths_not_coalesced(self):
+        """测试不在合并列表中的路径每次都执行"""
+        wsgi_app = BlockingApp()
+        asgi_app = CoalescingASGIApp(wsgi_app, max_workers=4)
+        
+        self.run_concurrently(asgi_app, wsgi_app, ['/api/pool-stats'] * 3)
+        
+        assert len(wsgi_app.calls) == 3
+        assert asgi_app.stats['coalesced'] == 0
+    
+    def test_build_environ(self):
+        """测试environ包含查询参数和请求头"""
+        scope = make_scope('/api/traffic-data?page=2')
+        scope['headers'] = [(b'content-type', b'application/json'), (b'x-request-id', b'abc')]
+        environ = build_environ(scope, b'')
+        
+        assert environ['PATH_INFO'] == '/api/traffic-data'
+        assert environ['QUERY_STRING'] == 'page=2'
+        assert environ['CONTENT_TYPE'] == 'application/json'
+        assert environ['HTTP_X_REQUEST_ID'] == 'abc'
+
+
+class TestFlaskOverASGI:
+    """通过ASGI调用Flask路由测试类"""
+    
+    @pytest.fixture
+    def asgi_app(self, sample_db_path, monkeypatch):
+        """指向合成数据库的ASGI应用"""
+        monkeypatch.setenv('TRAFFIC_DB_PATH', sample_db_path)
+        from app import app as flask_app
+        asgi_app = CoalescingASGIApp(flask_app, max_workers=2)
+        yield asgi_app
+        asgi_app.executor.shutdown(wait=True)
+    
+    def test_matches_flask_response(self, asgi_app):
+        """测试ASGI响应与Flask测试客户端一致"""
+        from app import app as flask_app
+        status, body = asyncio.run(request(asgi_app, '/api/pie-chart?time_range=morning'))
+        expected = flask_app.test_client().get('/api/pie-chart?time_range=morning').get_json()
+        
+        assert status == 200
+        assert json.loads(body) == expected
+    
+    def test_stats_endpoint(self, asgi_app):
+        """测试统计接口"""
+        asyncio.run(request(asgi_app, '/api/trend-chart'))
+        status, body = asyncio.run(request(asgi_app, '/api/asgi-stats'))
+        stats = json.loads(body)['asgi']
+        
+        assert status == 200
+        assert stats['requests'] == 2
+        assert stats['executed'] == 1
+        assert stats['workers'] == 2
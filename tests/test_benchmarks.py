@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+测试性能基准测试工具 - pytest版本
+"""
+
+import json
+import sqlite3
+
+from benchmarks.compare import compare, load_results
+from benchmarks.datagen import generate_database
+from benchmarks.run import main, percentile
+
+
+class TestBenchmarks:
+    """基准测试工具测试类"""
+    
+    def test_generate_database(self, tmp_path):
+        """测试合成数据库的规模和id/时间顺序"""
+        path = generate_database(str(tmp_path / 'bench.db'), rows=5000)
+        connection = sqlite3.connect(path)
+        times = [row[0] for row in connection.execute("SELECT time FROM traffic ORDER BY id")]
+        directions = {row[0] for row in connection.execute("SELECT DISTINCT direction FROM traffic")}
+        connection.close()
+        
+        assert len(times) == 5000
+        assert times == sorted(times)
+        assert directions == {1, 2, 3, 4}
+    
+    def test_percentile(self):
+        """测试最近秩法分位数"""
+        samples = list(range(1, 101))
+        assert percentile(samples, 0.50) == 50
+        assert percentile(samples, 0.95) == 95
+        assert percentile(samples, 0.99) == 99
+        assert percentile([3.0], 0.99) == 3.0
+    
+    def test_run_writes_results(self, sample_db_path, tmp_path, monkeypatch):
+        """测试在小数据库上运行全部用例并写出结果文件"""
+        monkeypatch.setenv('TRAFFIC_DB_PATH', sample_db_path)
+        output = tmp_path / 'result.json'
+        
+        assert main(['--db', sample_db_path, '--repeat', '2', '--output', str(output)]) == 0
+        
+        report = json.loads(output.read_text(encoding='utf-8'))
+        results = report['runs'][0]['results']
+        assert report['runs'][0]['dataset']['rows'] == 3000
+        assert {result['kind'] for result in results} == {'database', 'serialization', 'api'}
+        assert all(result['status'] == 'ok' for result in results)
+        assert all(result['p50_ms'] <= result['p95_ms'] <= result['p99_ms'] for result in results)
+        # 没有汇总表时聚合查询需要扫描数据
+        trend = next(result for result in results if result['name'] == 'get_hourly_traffic_trend')
+        assert trend['vm_steps'] > 0
+        assert trend['statements'] >= 1
+    
+    def test_compare_flags_regression(self, tmp_path):
+        """测试延迟明显变慢时判定为退化"""
+        def write(name, p95_ms):
+            report = {'runs': [{'dataset': {'rows': 1000}, 'results': [
+                {'name': 'case', 'status': 'ok', 'p95_ms': p95_ms, 'vm_steps': 100}
+            ]}]}
+            path = tmp_path / name
+            path.write_text(json.dumps(report), encoding='utf-8')
+            return str(path)
+        
+        base = load_results(write('base.json', 10.0))
+        slower = load_results(write('slower.json', 20.0))
+        noise = load_results(write('noise.json', 10.5))
+        
+        assert compare(base, slower)[0]['regression']
+        assert not compare(base, noise)[0]['regression']
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+测试图表响应缓存 - pytest版本
+"""
+
+import sqlite3
+import threading
+import time
+
+from utils import database as database_module
+from utils.cache import ResponseCache, SingleFlight
+from utils.database import TrafficDatabase
+
+
+class TestResponseCache:
+    """ResponseCache功能测试类"""
+    
+    def test_lru_eviction(self):
+        """测试超过容量后淘汰最久未使用的条目"""
+        cache = ResponseCache(max_entries=2, ttl=0)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        assert cache.get('a') == 1      # a变为最近使用
+        cache.set('c', 3)
+        
+        assert cache.get('b') is None
+        assert cache.get('a') == 1
+        assert cache.get('c') == 3
+        assert cache.stats()['evictions'] == 1
+    
+    def test_ttl_expiration(self):
+        """测试条目过期"""
+        cache = ResponseCache(ttl=0.05)
+        cache.set('a', 1)
+        assert cache.get('a') == 1
+        time.sleep(0.1)
+        assert cache.get('a') is None
+        assert cache.stats()['expirations'] == 1
+    
+    def test_get_or_compute(self):
+        """测试未命中时计算并缓存"""
+        cache = ResponseCache()
+        calls = []
+        compute = lambda: calls.append(1) or 'value'
+        
+        assert cache.get_or_compute('k', compute) == 'value'
+        assert cache.get_or_compute('k', compute) == 'value'
+        assert len(calls) == 1
+        assert cache.stats()['hit_rate'] == 0.5
+
+
+class TestSingleFlight:
+    """SingleFlight功能测试类"""
+    
+    def run_concurrently(self, flight, key, func, threads=10):
+        """多个线程同时调用do，返回各线程的结果"""
+        barrier = threading.Barrier(threads)
+        results = [None] * threads
+        
+        def worker(index):
+            barrier.wait()
+            try:
+                results[index] = flight.do(key, func)
+            except Exception as e:
+                results[index] = e
+        
+        workers = [threading.Thread(target=worker, args=(index,)) for index in range(threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        return results
+    
+    def test_concurrent_calls_collapsed(self):
+        """测试相同的并发调用只执行一次并共享结果"""
+        flight = SingleFlight()
+        calls = []
+        
+        def slow():
+            calls.append(1)
+            time.sleep(0.2)
+            return ['shared']
+        
+        results = self.run_concurrently(flight, 'k', slow)
+        
+        assert len(calls) == 1
+        assert all(result is results[0] for result in results)
+        stats = flight.stats()
+        assert stats['executions'] == 1
+        assert stats['collapsed'] == 9
+        assert stats['collapse_rate'] == 0.9
+        assert stats['in_flight'] == 0
+    
+    def test_error_shared(self):
+        """测试执行失败时等待的调用收到同一个异常"""
+        flight = SingleFlight()
+        
+        def failing():
+            time.sleep(0.2)
+            raise sqlite3.OperationalError('database is locked')
+        
+        results = self.run_concurrently(flight, 'k', failing, threads=4)
+        
+        assert all(isinstance(result, sqlite3.OperationalError) for result in results)
+        assert flight.stats()['executions'] == 1
+    
+    def test_sequential_calls_not_cached(self):
+        """测试执行结束后不保留结果"""
+        flight = SingleFlight()
+        assert flight.do('k', lambda: 1) == 1
+        assert flight.do('k', lambda: 2) == 2
+        assert flight.stats()['collapsed'] == 0
+    
+    def test_database_aggregate_collapsed(self, sample_db_path, monkeypatch):
+        """测试多个连接同时查询方向分布时只扫描一次"""
+        original = TrafficDatabase._query_aggregate_counts
+        scans = []
+        
+        def slow_query(self, *args, **kwargs):
+            scans.append(args)
+            time.sleep(0.2)
+            return original(self, *args, **kwargs)
+        
+        monkeypatch.setattr(TrafficDatabase, '_query_aggregate_counts', slow_query)
+        before = database_module.get_single_flight_stats()['collapsed']
+        
+        def query():
+            db = TrafficDatabase(sample_db_path)
+            db.connect()
+            try:
+                return db.get_direction_distribution()
+            finally:
+                db.disconnect()
+        
+        expected = query()
+        barrier = threading.Barrier(8)
+        outputs = []
+        
+        def worker():
+            barrier.wait()
+            outputs.append(query())
+        
+        workers = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        
+        assert len(scans) == 2          # 预先的单次查询 + 8个并发查询合并后的一次
+        assert len(outputs) == 8
+        assert all(output == expected for output in outputs)
+        assert database_module.get_single_flight_stats()['collapsed'] - before == 7
+
+
+class TestChartCacheApi:
+    """图表接口缓存测试类"""
+    
+    def test_repeated_requests_hit_cache(self, client):
+        """测试相同筛选条件的重复请求命中缓存"""
+        from app import chart_cache
+        client.get('/api/pie-chart?time_range=morning')
+        hits = chart_cache.stats()['hits']
+        second = client.get('/api/pie-chart?time_range=morning')
+        
+        assert second.status_code == 200
+        assert chart_cache.stats()['hits'] == hits + 1
+    
+    def test_new_data_invalidates_cache(self, client, sample_db_path):
+        """测试写入新数据后缓存自动失效"""
+        before = client.get('/api/pie-chart').get_json()['chart_data']['data'][0]['values']
+        
+        connection = sqlite3.connect(sample_db_path)
+        connection.execute("INSERT INTO traffic (direction, time, plate) VALUES (1, 1741000000, '粤A00001')")
+        connection.commit()
+        connection.close()
+        
+        after = client.get('/api/pie-chart').get_json()['chart_data']['data'][0]['values']
+        assert sum(after) == sum(before) + 1
+    
+    def test_warm_up_covers_all_combinations(self, client):
+        """测试预热覆盖所有时间段和方向组合"""
+        from app import chart_cache, warm_chart_cache
+        warm_chart_cache()
+        # 饼图6种时间段 + 趋势图和对比图各5种方向
+        assert chart_cache.stats()['entries'] == 16
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+测试模板化图表配置 - pytest版本
+与原实现（字典拼装 / plotly.graph_objects）的输出逐项比较
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from utils.chart_generator import (
+    build_pie_chart_config, build_trend_chart_config, build_weekday_weekend_chart_config,
+    create_pie_chart_data_for_ajax, create_trend_chart_data_for_ajax,
+    create_weekday_weekend_trend_chart_for_ajax, load_plotly_theme
+)
+from utils.constants import TIME_RANGE_MAP, DIRECTION_STR_MAP, CHART_COLORS
+
+
+def legacy_pie_chart(direction_data, time_range=None):
+    """原饼图实现"""
+    labels = []
+    values = []
+    for direction_id, count in direction_data.items():
+        labels.append(DIRECTION_STR_MAP.get(str(direction_id), f"方向{direction_id}"))
+        values.append(count)
+    title_suffix = TIME_RANGE_MAP.get(time_range, '') if time_range else ''
+    title = f"交通方向分布{' - ' + title_suffix if title_suffix else ''}"
+    return {
+        'data': [{
+            'labels': labels, 'values': values, 'type': 'pie', 'hole': 0.3,
+            'marker': {'colors': CHART_COLORS['directions'][:len(labels)]}
+        }],
+        'layout': {
+            'title': {'text': title, 'x': 0.5, 'font': {'size': 18, 'family': 'Arial, sans-serif'}},
+            'font': {'size': 14},
+            'showlegend': True,
+            'legend': {'orientation': 'h', 'yanchor': 'bottom', 'y': -0.2, 'xanchor': 'center', 'x': 0.5},
+            'margin': {'t': 60, 'b': 100, 'l': 20, 'r': 20},
+            'height': 400
+        }
+    }
+
+
+def legacy_trend_chart(hourly_data, direction_filter=None):
+    """原24小时趋势图实现"""
+    hours = list(range(24))
+    title = "24小时车流量趋势"
+    if direction_filter:
+        title += f" - {DIRECTION_STR_MAP.get(str(direction_filter), f'方向{direction_filter}')}"
+    return {
+        'data': [{
+            'x': [f"{hour:02d}:00" for hour in hours],
+            'y': [hourly_data[hour] for hour in hours],
+            'mode': 'lines+markers', 'name': '车流量', 'type': 'scatter',
+            'line': {'color': CHART_COLORS['trend_line'], 'width': 3, 'shape': 'spline'},
+            'marker': {'size': 8, 'color': CHART_COLORS['trend_marker'], 'line': {'color': 'white', 'width': 2}},
+            'hovertemplate': '<b>时间：%{x}</b><br>车流量：%{y}辆<br><extra></extra>'
+        }],
+        'layout': {
+            'title': {'text': title, 'x': 0.5, 'font': {'size': 18, 'family': 'Arial, sans-serif'}},
+            'xaxis': {
+                'title': '时间（小时）', 'tickangle': 45, 'showgrid': True, 'gridwidth': 1,
+                'gridcolor': 'rgba(128,128,128,0.2)', 'tickmode': 'array',
+                'tickvals': list(range(0, 24, 2)), 'ticktext': [f"{hour:02d}:00" for hour in range(0, 24, 2)]
+            },
+            'yaxis': {'title': '车流量（辆）', 'showgrid': True, 'gridwidth': 1, 'gridcolor': 'rgba(128,128,128,0.2)'},
+            'font': {'size': 12},
+            'showlegend': False,
+            'margin': {'t': 60, 'b': 80, 'l': 80, 'r': 40},
+            'height': 400,
+            'plot_bgcolor': 'rgba(0,0,0,0)',
+            'paper_bgcolor': 'rgba(0,0,0,0)',
+            'autosize': True
+        }
+    }
+
+
+def legacy_weekday_weekend_chart(trend_data, direction_filter=None):
+    """原工作日vs周末对比图实现（plotly.graph_objects）"""
+    go = pytest.importorskip('plotly.graph_objects')
+    hours = list(range(24))
+    fig = go.Figure()
+    for kind, name, color, label in (('weekday', '工作日平均', '#1f77b4', '工作日'),
+                                     ('weekend', '周末平均', '#ff7f0e', '周末')):
+        fig.add_trace(go.Scatter(
+            x=hours, y=[trend_data[kind].get(hour, 0) for hour in hours],
+            mode='lines+markers', name=name, line=dict(color=color, width=3), marker=dict(size=6),
+            hovertemplate=f'<b>{label}</b><br>时间: %{{x}}:00<br>平均车流量: %{{y}}<extra></extra>'
+        ))
+    direction_text = {'1': '北往南', '2': '南往北', '3': '东往西', '4': '西往东'}.get(direction_filter, '全部方向')
+    fig.update_layout(
+        title=f'📊 工作日vs周末流量对比 ({direction_text})',
+        xaxis_title='时间 (小时)',
+        yaxis_title='平均车流量',
+        xaxis=dict(tickmode='linear', tick0=0, dtick=2, range=[-0.5, 23.5]),
+        yaxis=dict(title='平均车流量', showgrid=True),
+        hovermode='x unified',
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1),
+        height=400,
+        margin=dict(l=50, r=50, t=80, b=50),
+        autosize=True,
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)'
+    )
+    return {'data': [trace.to_plotly_json() for trace in fig.data], 'layout': fig.layout.to_plotly_json()}
+
+
+def as_json(config):
+    """按JSON序列化结果比较（忽略键顺序）"""
+    return json.loads(json.dumps(config, sort_keys=True))
+
+
+class TestChartTemplates:
+    """模板化图表配置测试类"""
+    
+    @pytest.mark.parametrize('time_range', [None, 'morning', 'night'])
+    def test_pie_matches_legacy(self, sample_db, time_range):
+        """测试饼图配置与原实现一致"""
+        direction_data = sample_db.get_direction_distribution(time_range=time_range)
+        expected = legacy_pie_chart(direction_data, time_range)
+        
+        assert as_json(build_pie_chart_config(direction_data, time_range)) == as_json(expected)
+        assert as_json(create_pie_chart_data_for_ajax(time_range, db=sample_db)) == as_json(expected)
+    
+    @pytest.mark.parametrize('direction', [None, '1', '4'])
+    def test_trend_matches_legacy(self, sample_db, direction):
+        """测试趋势图配置与原实现一致"""
+        hourly_data = sample_db.get_hourly_traffic_trend(direction_filter=direction)
+        expected = legacy_trend_chart(hourly_data, direction)
+        
+        assert as_json(create_trend_chart_data_for_ajax(direction, db=sample_db)) == as_json(expected)
+    
+    @pytest.mark.parametrize('direction', [None, '2', '3'])
+    def test_weekday_weekend_matches_plotly(self, sample_db, direction):
+        """测试工作日vs周末对比图与plotly.graph_objects生成的配置一致"""
+        trend_data = sample_db.get_hourly_traffic_trend_by_weekday(direction_filter=direction)
+        expected = legacy_weekday_weekend_chart(trend_data, direction)
+        
+        assert as_json(build_weekday_weekend_chart_config(trend_data, direction)) == as_json(expected)
+        assert as_json(create_weekday_weekend_trend_chart_for_ajax(direction, db=sample_db)) == as_json(expected)
+    
+    def test_templates_not_mutated(self):
+        """测试多次生成互不影响（共享模板没有被修改）"""
+        first = as_json(build_trend_chart_config({hour: 1 for hour in range(24)}, '1'))
+        build_trend_chart_config({hour: 99 for hour in range(24)}, '2')
+        
+        assert as_json(build_trend_chart_config({hour: 1 for hour in range(24)}, '1')) == first
+    
+    def test_theme_matches_installed_plotly(self):
+        """测试导出的主题与已安装plotly的默认主题一致（升级plotly后需重新导出）"""
+        pio = pytest.importorskip('plotly.io')
+        assert load_plotly_theme() == as_json(pio.templates['plotly'].to_plotly_json())
+    
+    def test_plotly_not_imported(self):
+        """测试导入图表生成器不会加载plotly.graph_objects"""
+        code = "import sys, utils.chart_generator; print('plotly.graph_objects' in sys.modules)"
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True, cwd=root)
+        assert result.stdout.strip().splitlines()[-1] == 'False'
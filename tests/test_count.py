@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+测试搜索总数的缓存、汇总表计数和估算 - pytest版本
+"""
+
+import pytest
+
+from utils import database as database_module
+
+
+@pytest.mark.usefixtures('clear_count_cache')
+class TestSearchCount:
+    """搜索总数测试类"""
+    
+    def exact(self, db, where):
+        """直接执行COUNT(*)"""
+        return db.connection.execute(f"SELECT COUNT(*) FROM traffic WHERE {where}").fetchone()[0]
+    
+    def test_count_is_cached_across_pages(self, sample_db):
+        """测试同一搜索的总数在翻页时复用"""
+        first = sample_db.count_with_filters('morning', '2')
+        hits = database_module._count_cache.stats()['hits']
+        sample_db.search_with_filters('morning', '2', page=3, per_page=5)
+        
+        assert first[1] is False
+        assert database_module._count_cache.stats()['hits'] == hits + 1
+    
+    def test_cache_invalidated_by_new_rows(self, sample_db):
+        """测试新增数据后重新计数"""
+        total, _ = sample_db.count_with_filters(direction_filter='1')
+        sample_db.connection.execute("INSERT INTO traffic (direction, time, plate) VALUES (1, 1741000000, 'X')")
+        assert sample_db.count_with_filters(direction_filter='1') == (total + 1, False)
+    
+    def test_count_from_rollup(self, sample_db):
+        """测试存在汇总表时由汇总表计数，结果与COUNT(*)一致"""
+        sample_db.refresh_rollup()
+        total, is_estimate = sample_db.count_with_filters('night', '4')
+        conditions, params = sample_db._build_filter_conditions('night', '4')
+        expected = sample_db.connection.execute(
+            f"SELECT COUNT(*) FROM traffic WHERE {' AND '.join(conditions)}", params
+        ).fetchone()[0]
+        
+        assert (total, is_estimate) == (expected, False)
+    
+    def test_estimated_count(self, sample_db, monkeypatch):
+        """测试估算模式返回接近真实值的估算总数"""
+        monkeypatch.setattr(database_module, 'ESTIMATE_SAMPLE_IDS', 1000)
+        monkeypatch.setattr(database_module, 'ESTIMATE_SAMPLE_WINDOWS', 10)
+        
+        total, is_estimate = sample_db.count_with_filters(direction_filter='3', estimate=True)
+        expected = self.exact(sample_db, 'direction = 3')
+        
+        assert is_estimate is True
+        assert abs(total - expected) < expected * 0.2
+    
+    def test_page_query_runs_when_estimate_is_zero(self, sample_db):
+        """测试调用方传入的总数为0（可能是估算值）时仍执行分页查询"""
+        records, _, _ = sample_db.search_with_filters(direction_filter='1', total_records=0)
+        assert records
+        assert sample_db.search_with_cursor(direction_filter='1', total_records=0)['records']
+    
+    def test_small_table_counts_exactly(self, sample_db):
+        """测试数据量小于抽样规模时仍精确计数"""
+        total, is_estimate = sample_db.count_with_filters(direction_filter='3', estimate=True)
+        assert (total, is_estimate) == (self.exact(sample_db, 'direction = 3'), False)
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+测试共享聚合和仪表盘接口 - pytest版本
+"""
+
+import pytest
+
+from utils import database as database_module
+from utils.constants import TIME_RANGE_HOURS
+
+
+@pytest.mark.usefixtures('clear_count_cache')
+class TestSharedAggregates:
+    """共享聚合测试类"""
+    
+    def collect(self, db):
+        """收集所有图表聚合和计数结果"""
+        results = {}
+        for time_range in [None] + list(TIME_RANGE_HOURS):
+            results[f'direction:{time_range}'] = db.get_direction_distribution(time_range=time_range)
+        for direction in [None, '1', '2', '3', '4']:
+            results[f'hourly:{direction}'] = db.get_hourly_traffic_trend(direction_filter=direction)
+            results[f'weekday:{direction}'] = db.get_hourly_traffic_trend_by_weekday(direction_filter=direction)
+        for time_range in [None, 'morning', 'night']:
+            for direction in [None, '3']:
+                results[f'count:{time_range}:{direction}'] = db.count_with_filters(time_range, direction)
+        return results
+    
+    def test_results_match_direct_queries(self, sample_db):
+        """测试共享聚合的结果与逐个查询完全相同"""
+        expected = self.collect(sample_db)
+        database_module._count_cache.clear()
+        
+        with sample_db.shared_aggregates():
+            shared = self.collect(sample_db)
+        
+        assert shared == expected
+    
+    def test_single_scan(self, sample_db):
+        """测试上下文内只扫描一次traffic表"""
+        statements = []
+        sample_db.connection.set_trace_callback(statements.append)
+        try:
+            with sample_db.shared_aggregates():
+                self.collect(sample_db)
+        finally:
+            sample_db.connection.set_trace_callback(None)
+        
+        scans = [sql for sql in statements if 'GROUP BY' in sql]
+        assert len(scans) == 1
+    
+    def test_cube_released_after_context(self, sample_db):
+        """测试退出上下文后不再使用共享统计"""
+        with sample_db.shared_aggregates():
+            sample_db.get_hourly_traffic_trend()
+        assert sample_db._shared_cube is None
+        
+        sample_db.connection.execute("INSERT INTO traffic (direction, time, plate) VALUES (1, 1741050000, '粤B99999')")
+        assert sum(sample_db.get_direction_distribution().values()) == 3001
+
+
+class TestDashboardApi:
+    """仪表盘接口测试类"""
+    
+    def test_matches_individual_endpoints(self, client):
+        """测试仪表盘返回的图表和第1页与各个接口一致"""
+        dashboard = client.get('/api/dashboard?time_range=evening&direction=2&mode=cursor').get_json()
+        assert dashboard['success']
+        
+        pie = client.get('/api/pie-chart?time_range=evening').get_json()
+        trend = client.get('/api/trend-chart?direction=2').get_json()
+        weekday = client.get('/api/weekday-weekend-chart?direction=2').get_json()
+        table = client.get('/api/traffic-data?time_range=evening&direction=2&mode=cursor').get_json()
+        
+        assert dashboard['charts']['pie']['chart_data'] == pie['chart_data']
+        assert dashboard['charts']['trend']['chart_data'] == trend['chart_data']
+        assert dashboard['charts']['weekday_weekend']['chart_data'] == weekday['chart_data']
+        assert dashboard['table']['data'] == table['data']
+        assert dashboard['table']['pagination'] == table['pagination']
+    
+    def test_without_filters(self, client):
+        """测试无筛选条件时返回全部记录的第1页"""
+        dashboard = client.get('/api/dashboard').get_json()
+        
+        assert all(chart['success'] for chart in dashboard['charts'].values())
+        assert dashboard['table']['pagination']['total_records'] == 3000
+        assert dashboard['table']['pagination']['current_page'] == 1
+        assert len(dashboard['table']['data']) == 20
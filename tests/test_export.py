@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+测试搜索结果流式导出 - pytest版本
+"""
+
+import asyncio
+import csv
+import io
+import tracemalloc
+
+import pytest
+
+from utils import database as database_module
+from utils.database import TrafficDatabase
+from utils.export import EXPORT_HEADER, iter_csv
+
+from conftest import SAMPLE_START_TIME, build_sample_database
+
+# 合成数据第2天（2025-03-04，北京时间）
+WINDOW_START = SAMPLE_START_TIME + 86400
+WINDOW_END = SAMPLE_START_TIME + 2 * 86400
+
+
+def parse_csv(content: bytes) -> list:
+    """解析导出的CSV，返回行字典列表"""
+    return list(csv.DictReader(io.StringIO(content.decode('utf-8'))))
+
+
+class TestIterFilteredRows:
+    """分批读取测试类"""
+
+    def test_batches_cover_all_matches(self, sample_db):
+        """测试分批读取的记录与筛选结果完全一致"""
+        batches = list(sample_db.iter_filtered_rows('morning', '2', batch_size=50))
+        rows = [row for batch in batches for row in batch]
+
+        total, _ = sample_db.count_with_filters('morning', '2')
+        assert len(rows) == total
+        assert all(len(batch) <= 50 for batch in batches)
+        assert [row[0] for row in rows] == sorted(row[0] for row in rows)
+        assert all(row[1] == 2 for row in rows)
+
+    def test_memory_stays_flat(self, tmp_path):
+        """测试导出内存占用与记录总数无关"""
+        db = TrafficDatabase(build_sample_database(str(tmp_path / 'large.db'), rows=60000))
+        assert db.connect()
+        try:
+            chunks = iter_csv(db.iter_filtered_rows(batch_size=500))
+            # 表头和第1批之后再开始统计，排除一次性的初始化开销
+            total_bytes = len(next(chunks)) + len(next(chunks))
+            tracemalloc.start()
+            for chunk in chunks:
+                total_bytes += len(chunk)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        finally:
+            db.disconnect()
+
+        assert total_bytes > 3 * 1024 * 1024
+        assert peak < total_bytes / 5
+
+
+class TestExportApi:
+    """导出接口测试类"""
+
+    def test_csv_export(self, client, sample_db):
+        """测试CSV包含全部匹配记录"""
+        response = client.get(f'/api/traffic-data/export?direction=3&start={WINDOW_START}&end={WINDOW_END}')
+        assert response.status_code == 200
+        assert response.mimetype == 'text/csv'
+        assert 'attachment' in response.headers['Content-Disposition']
+
+        rows = parse_csv(response.data)
+        expected = [tuple(row) for row in sample_db.connection.execute(
+            "SELECT id, time, plate FROM traffic WHERE direction = 3 AND time >= ? AND time < ? ORDER BY id",
+            (WINDOW_START, WINDOW_END))]
+        assert list(rows[0]) == EXPORT_HEADER
+        assert [(int(row['id']), float(row['time']), row['plate']) for row in rows] == expected
+        assert rows[0]['direction_text'] == '东往西'
+        assert rows[0]['local_time'].startswith('2025-03-04')
+
+    def test_streamed_and_connection_released(self, client, sample_db_path):
+        """测试响应为流式，发送完毕后连接归还连接池"""
+        response = client.get('/api/traffic-data/export', buffered=False)
+        assert response.is_streamed
+        chunks = list(response.response)
+        pool = database_module.get_connection_pool(sample_db_path)
+        # 读完数据即归还连接，不依赖close()
+        assert pool.stats()['in_use'] == 0
+        response.close()
+
+        assert len(chunks) > 1
+        assert len(parse_csv(b''.join(chunks))) == 3000
+        assert pool.stats()['in_use'] == 0
+
+    def test_connection_released_on_disconnect(self, client, sample_db_path):
+        """测试客户端中途断开时同样归还连接"""
+        response = client.get('/api/traffic-data/export', buffered=False)
+        next(iter(response.response))
+        pool = database_module.get_connection_pool(sample_db_path)
+        assert pool.stats()['in_use'] == 1
+        response.close()
+        assert pool.stats()['in_use'] == 0
+
+    @pytest.mark.parametrize('file_format', ['parquet', 'arrow'])
+    def test_arrow_formats(self, client, file_format):
+        """测试Parquet和Arrow导出与CSV内容一致"""
+        pa = pytest.importorskip('pyarrow')
+        import pyarrow.parquet as pq
+
+        response = client.get(f'/api/traffic-data/export?time_range=morning&format={file_format}')
+        assert response.status_code == 200
+        if file_format == 'parquet':
+            table = pq.read_table(pa.BufferReader(response.data))
+        else:
+            table = pa.ipc.open_stream(response.data).read_all()
+
+        rows = parse_csv(client.get('/api/traffic-data/export?time_range=morning').data)
+        assert table.column_names == EXPORT_HEADER
+        assert table.column('id').to_pylist() == [int(row['id']) for row in rows]
+        assert table.column('local_time').to_pylist() == [row['local_time'] for row in rows]
+
+    def test_unknown_format(self, client):
+        """测试不支持的格式返回400"""
+        response = client.get('/api/traffic-data/export?format=xlsx')
+        assert response.status_code == 400
+        assert response.get_json()['success'] is False
+
+    def test_asgi_streams_chunks(self, client):
+        """测试ASGI入口逐块发送导出数据"""
+        from app import app
+        from asgi import CoalescingASGIApp
+        from benchmarks.load import make_scope
+
+        asgi_app = CoalescingASGIApp(app, max_workers=2)
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            messages.append(message)
+
+        asyncio.run(asgi_app(make_scope('/api/traffic-data/export?direction=1'), receive, send))
+        asgi_app.executor.shutdown(wait=True)
+
+        bodies = [message for message in messages if message['type'] == 'http.response.body']
+        assert messages[0]['status'] == 200
+        assert len(bodies) > 2
+        assert all(message['more_body'] for message in bodies[:-1]) and not bodies[-1].get('more_body')
+        assert b''.join(message['body'] for message in bodies) == client.get('/api/traffic-data/export?direction=1').data
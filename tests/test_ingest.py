@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+测试批量导入模块 - pytest版本
+"""
+
+import gzip
+import json
+import sqlite3
+
+import pytest
+
+from utils.database import TrafficDatabase
+from utils.ingest import TrafficIngestor, main, parse_record
+
+
+class TestIngest:
+    """批量导入测试类"""
+    
+    @pytest.fixture
+    def csv_file(self, tmp_path):
+        """包含1条重复和2条无效记录的CSV文件"""
+        path = tmp_path / 'batch.csv'
+        lines = ['direction,time,plate']
+        lines += [f"{i % 4 + 1},{1742000000 + i * 30},粤C{i:05d}" for i in range(100)]
+        lines += ['1,1742000000,粤C00000', '9,1742000000,粤C99999', '2,not-a-time,粤C88888']
+        path.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+        return str(path)
+    
+    @pytest.fixture
+    def jsonl_file(self, tmp_path):
+        """gzip压缩的JSONL文件，时间使用字符串格式"""
+        path = tmp_path / 'batch.jsonl.gz'
+        with gzip.open(path, 'wt', encoding='utf-8') as handle:
+            for i in range(20):
+                record = {'direction': 3, 'time': f'2025-03-20 08:{i:02d}:00', 'plate': f'粤D{i:05d}'}
+                handle.write(json.dumps(record, ensure_ascii=False) + '\n')
+        return str(path)
+    
+    def count_rows(self, db_path):
+        connection = sqlite3.connect(db_path)
+        total = connection.execute("SELECT COUNT(*) FROM traffic").fetchone()[0]
+        connection.close()
+        return total
+    
+    def test_parse_record(self):
+        """测试记录校验"""
+        assert parse_record({'direction': '2', 'time': '1742000000.5', 'plate': ' 粤A1 '}) == (2, 1742000000.5, '粤A1')
+        assert parse_record({'direction': '5', 'time': '1742000000', 'plate': '粤A1'}) is None
+        assert parse_record({'direction': '1', 'plate': '粤A1'}) is None
+    
+    def test_ingest_and_deduplicate(self, sample_db_path, csv_file):
+        """测试导入、去重和无效记录统计"""
+        stats = TrafficIngestor(sample_db_path, chunk_size=30, commit_rows=60).ingest_files([csv_file])
+        assert stats['read'] == 103
+        assert stats['inserted'] == 100
+        assert stats['duplicates'] == 1
+        assert stats['rejected'] == 2
+        assert self.count_rows(sample_db_path) == 3100
+        
+        # 重复导入同一文件不产生新记录
+        again = TrafficIngestor(sample_db_path).ingest_files([csv_file])
+        assert again['inserted'] == 0
+        assert self.count_rows(sample_db_path) == 3100
+    
+    def test_ingest_uses_wal(self, sample_db_path, jsonl_file):
+        """测试导入后数据库处于WAL模式，JSONL时间字符串按统计时区解析"""
+        assert main(['--db', sample_db_path, jsonl_file]) == 0
+        connection = sqlite3.connect(sample_db_path)
+        assert connection.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+        assert connection.execute("SELECT COUNT(*) FROM traffic WHERE plate LIKE '粤D%'").fetchone()[0] == 20
+        connection.close()
+    
+    def test_ingest_fills_local_columns_and_rollup(self, sample_db_path, csv_file):
+        """测试已迁移数据库导入后本地时间列和汇总表保持最新"""
+        db = TrafficDatabase(sample_db_path)
+        db.connect()
+        db.migrate_local_time_columns()
+        db.refresh_rollup()
+        db.disconnect()
+        
+        TrafficIngestor(sample_db_path).ingest_files([csv_file])
+        
+        db.connect()
+        missing = db.connection.execute("SELECT COUNT(*) FROM traffic WHERE local_hour IS NULL").fetchone()[0]
+        rolled = db.connection.execute("SELECT SUM(count) FROM traffic_rollup").fetchone()[0]
+        db.disconnect()
+        assert missing == 0
+        assert rolled == 3100
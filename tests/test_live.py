@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+测试实时推送（Server-Sent Events） - pytest版本
+"""
+
+import asyncio
+import json
+import sqlite3
+
+import pytest
+
+from utils import database as database_module
+from utils import live as live_module
+from utils.constants import DIRECTION_STR_MAP
+from utils.live import LiveFeed, LiveSubscription
+
+from conftest import SAMPLE_START_TIME, SAMPLE_ROWS
+
+# 合成数据第2天到第4天（北京时间整点）
+WINDOW_START = SAMPLE_START_TIME + 86400
+WINDOW_END = SAMPLE_START_TIME + 4 * 86400
+
+# 新增记录：窗口内外、工作日和周末、各个方向都有
+NEW_ROWS = [
+    (direction, SAMPLE_START_TIME + day * 86400 + hour * 3600 + 120, f'粤A{day}{hour:02d}{direction}')
+    for day in (0, 2, 3, 5, 6) for hour in (1, 7, 8, 18, 21) for direction in (1, 2, 3)
+]
+
+
+def insert_rows(db_path: str, rows: list) -> int:
+    """写入新记录，返回写入后的最大id"""
+    connection = sqlite3.connect(db_path)
+    try:
+        connection.executemany("INSERT INTO traffic (direction, time, plate) VALUES (?, ?, ?)", rows)
+        connection.commit()
+        return connection.execute("SELECT MAX(id) FROM traffic").fetchone()[0]
+    finally:
+        connection.close()
+
+
+def parse_sse(message: str) -> dict:
+    """解析一条SSE消息为 {'id', 'event', 'data'}"""
+    fields = {}
+    for line in message.strip().split('\n'):
+        name, _, value = line.partition(': ')
+        fields[name] = value
+    if 'data' in fields:
+        fields['data'] = json.loads(fields['data'])
+    return fields
+
+
+@pytest.fixture
+def feed(sample_db_path):
+    """轮询间隔很长的轮询器，测试中手动调用poll()"""
+    feed = LiveFeed(sample_db_path, interval=3600)
+    yield feed
+    feed.close()
+
+
+class TestLiveFeed:
+    """共享轮询器测试类"""
+
+    def snapshot(self, db, time_range, direction):
+        """读取仪表盘在该筛选条件下的全部统计"""
+        database_module._count_cache.clear()
+        window = {'start': WINDOW_START, 'end': WINDOW_END}
+        return {
+            'pie': db.get_direction_distribution(time_range, **window),
+            'trend': db.get_hourly_traffic_trend(direction, **window),
+            'weekday': db.get_hourly_traffic_trend_by_weekday(direction, **window),
+            'total': db.count_with_filters(time_range, direction, **window)[0]
+        }
+
+    @pytest.mark.parametrize('time_range,direction', [(None, None), ('morning', '2'), ('night', None)])
+    def test_delta_matches_aggregates(self, feed, sample_db, sample_db_path, time_range, direction):
+        """测试推送的增量与重新统计的差值完全一致"""
+        subscription = LiveSubscription(feed, time_range, direction, start=WINDOW_START, end=WINDOW_END)
+        before = self.snapshot(sample_db, time_range, direction)
+
+        insert_rows(sample_db_path, NEW_ROWS)
+        feed.poll()
+        delta = parse_sse(subscription.poll_message())['data']
+        after = self.snapshot(sample_db, time_range, direction)
+
+        assert delta['new_records'] == after['total'] - before['total'] > 0
+        for direction_id, count in after['pie'].items():
+            label = DIRECTION_STR_MAP[str(direction_id)]
+            assert delta['pie'].get(label, 0) == count - before['pie'].get(direction_id, 0)
+        assert delta['trend'] == [after['trend'][hour] - before['trend'][hour] for hour in range(24)]
+        for kind in ('weekday', 'weekend'):
+            assert delta[kind] == pytest.approx([after['weekday'][kind][hour] - before['weekday'][kind][hour]
+                                                 for hour in range(24)])
+        subscription.close()
+
+    def test_shared_polling(self, feed, sample_db_path):
+        """测试多个订阅者共享一次轮询和一次增量统计"""
+        subscriptions = [LiveSubscription(feed, direction_filter=str(direction)) for direction in (1, 2, 3)]
+        assert feed.stats()['subscribers'] == 3
+
+        last_id = insert_rows(sample_db_path, NEW_ROWS)
+        feed.poll()
+        messages = [parse_sse(subscription.poll_message()) for subscription in subscriptions]
+
+        assert feed.stats()['deltas'] == 1
+        assert all(message['id'] == str(last_id) for message in messages)
+        assert [message['data']['new_records'] for message in messages] == [25, 25, 25]
+        assert all(subscription.poll_message() is None for subscription in subscriptions)
+
+        for subscription in subscriptions:
+            subscription.close()
+            subscription.close()
+        assert feed.stats()['subscribers'] == 0
+
+    def test_history_catch_up_and_reset(self, feed, sample_db_path):
+        """测试重连补发：历史内拼接增量、历史外重新统计、id超前时reset"""
+        current = LiveSubscription(feed)
+        insert_rows(sample_db_path, NEW_ROWS[:10])
+        feed.poll()
+        last_id = insert_rows(sample_db_path, NEW_ROWS[10:])
+        feed.poll()
+
+        from_history = parse_sse(LiveSubscription(feed, after_id=SAMPLE_ROWS).poll_message())
+        assert from_history['data']['new_records'] == len(NEW_ROWS)
+        assert feed.stats()['catch_ups'] == 0
+
+        catch_up = parse_sse(LiveSubscription(feed, after_id=SAMPLE_ROWS - 5).poll_message())
+        assert catch_up['data']['new_records'] == len(NEW_ROWS) + 5
+        assert feed.stats()['catch_ups'] == 1
+
+        reset = parse_sse(LiveSubscription(feed, after_id=last_id + 100).poll_message())
+        assert reset['event'] == 'reset' and reset['data']['last_id'] == last_id
+        assert parse_sse(current.poll_message())['id'] == str(last_id)
+
+    def test_unaffected_subscription_advances_id(self, feed, sample_db_path):
+        """测试增量与筛选条件无关时只推进事件id"""
+        # 新增记录都不在中午时段，也没有方向4
+        subscription = LiveSubscription(feed, 'noon', '4', start=WINDOW_START, end=WINDOW_END)
+        last_id = insert_rows(sample_db_path, NEW_ROWS)
+        feed.poll()
+        assert subscription.poll_message() == f'id: {last_id}\n\n'
+
+
+class TestStreamApi:
+    """实时推送接口测试类"""
+
+    @pytest.fixture
+    def client(self, client):
+        """测试客户端（结束后关闭测试中启动的实时推送）"""
+        yield client
+        with live_module._feeds_lock:
+            feeds = list(live_module._feeds.values())
+            live_module._feeds.clear()
+        for feed in feeds:
+            feed.close()
+
+    def test_dashboard_last_id(self, client):
+        """测试仪表盘返回数据包含的最大id"""
+        assert client.get('/api/dashboard').get_json()['last_id'] == SAMPLE_ROWS
+
+    def test_stream_pushes_delta(self, client, sample_db_path):
+        """测试新记录写入后推送增量，断开后注销订阅"""
+        response = client.get(f'/api/stream?last_id={SAMPLE_ROWS}&direction=1', buffered=False)
+        assert response.mimetype == 'text/event-stream'
+        chunks = iter(response.response)
+        ready = parse_sse(next(chunks).decode('utf-8').split('\n', 1)[1])
+        assert ready['event'] == 'ready' and ready['data']['last_id'] == SAMPLE_ROWS
+
+        last_id = insert_rows(sample_db_path, NEW_ROWS)
+        feed = live_module.get_live_feed()
+        feed.poll()
+        delta = parse_sse(next(chunks).decode('utf-8'))
+        assert delta['event'] == 'delta' and delta['id'] == str(last_id)
+        assert delta['data']['new_records'] == 25
+        assert delta['data']['pie'] == {'北往南': 25, '南往北': 25, '东往西': 25}
+
+        response.close()
+        assert feed.stats()['subscribers'] == 0
+
+    def test_last_event_id_header(self, client, sample_db_path):
+        """测试重连时Last-Event-ID优先于last_id参数"""
+        insert_rows(sample_db_path, NEW_ROWS)
+        response = client.get('/api/stream?last_id=1', headers={'Last-Event-ID': str(SAMPLE_ROWS)},
+                              buffered=False)
+        chunks = iter(response.response)
+        next(chunks)
+        delta = parse_sse(next(chunks).decode('utf-8'))
+        assert delta['data']['new_records'] == len(NEW_ROWS)
+        response.close()
+
+    @pytest.mark.parametrize('query', ['last_id=abc', 'start=someday'])
+    def test_invalid_parameters(self, client, query):
+        """测试无效参数返回400"""
+        response = client.get(f'/api/stream?{query}')
+        assert response.status_code == 400
+        assert response.get_json()['success'] is False
+
+    def test_asgi_stream(self, client, sample_db_path):
+        """测试ASGI入口在事件循环中推送增量，断开后注销订阅"""
+        from app import app
+        from asgi import CoalescingASGIApp
+        from benchmarks.load import make_scope
+
+        asgi_app = CoalescingASGIApp(app, max_workers=2)
+        messages = []
+
+        async def run():
+            disconnect = asyncio.Event()
+            requested = False
+
+            async def receive():
+                nonlocal requested
+                if not requested:
+                    requested = True
+                    return {'type': 'http.request', 'body': b'', 'more_body': False}
+                await disconnect.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                messages.append(message)
+
+            task = asyncio.ensure_future(asgi_app(make_scope(f'/api/stream?last_id={SAMPLE_ROWS}'), receive, send))
+            while len(messages) < 2:
+                await asyncio.sleep(0.01)
+            assert asgi_app.stats['live_streams'] == 1
+
+            insert_rows(sample_db_path, NEW_ROWS)
+            await asyncio.to_thread(live_module.get_live_feed().poll)
+            while len(messages) < 3:
+                await asyncio.sleep(0.01)
+            disconnect.set()
+            await asyncio.wait_for(task, timeout=5)
+
+        asyncio.run(run())
+        asgi_app.executor.shutdown(wait=True)
+
+        assert messages[0]['status'] == 200
+        assert (b'content-type', b'text/event-stream; charset=utf-8') in messages[0]['headers']
+        delta = parse_sse(messages[2]['body'].decode('utf-8'))
+        assert delta['event'] == 'delta' and delta['data']['new_records'] == len(NEW_ROWS)
+        assert asgi_app.stats['live_streams'] == 0
+        assert live_module.get_live_feed().stats()['subscribers'] == 0
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+测试指标、请求耗时区段和慢查询分析 - pytest版本
+"""
+
+import gc
+import os
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+
+from utils import metrics as metrics_module
+from utils import profiling as profiling_module
+from utils.database import TrafficDatabase
+from utils.metrics import Counter, Histogram, render_prometheus, server_timing, span
+
+
+class TestMetrics:
+    """直方图、计数器和Prometheus输出测试类"""
+
+    def test_histogram_buckets_are_cumulative(self):
+        """测试直方图输出累积分桶、总和与次数"""
+        histogram = Histogram('test_latency_seconds', '测试', ('route',), buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 0.5, 3.0):
+            histogram.observe(('/a',), value)
+
+        lines = histogram.render()
+        assert 'test_latency_seconds_bucket{route="/a",le="0.1"} 1' in lines
+        assert 'test_latency_seconds_bucket{route="/a",le="1"} 3' in lines
+        assert 'test_latency_seconds_bucket{route="/a",le="+Inf"} 4' in lines
+        assert 'test_latency_seconds_count{route="/a"} 4' in lines
+        assert histogram.snapshot(('/a',)) == {'count': 4, 'sum': 4.05}
+
+    def test_render_prometheus_with_extra_gauges(self):
+        """测试已注册指标和额外即时指标的文本格式"""
+        counter = Counter('test_render_total', '测试计数', ('status',))
+        counter.inc(('200',), 2)
+
+        text = render_prometheus([('test_gauge', 'gauge', '测试仪表', [({'db_path': 'a"b'}, 3)])])
+        assert '# TYPE test_render_total counter' in text
+        assert 'test_render_total{status="200"} 2' in text
+        assert 'test_gauge{db_path="a\\"b"} 3' in text
+
+    def test_span_outside_request(self):
+        """测试请求之外的区段只累计到直方图"""
+        before = metrics_module.SPAN_SECONDS.snapshot(('test-span',))['count']
+        with span('test-span'):
+            pass
+        assert metrics_module.SPAN_SECONDS.snapshot(('test-span',))['count'] == before + 1
+        assert metrics_module.current_spans() == []
+
+    def test_span_disabled(self, monkeypatch):
+        """测试关闭指标时区段不记录"""
+        monkeypatch.setattr(metrics_module, 'METRICS_ENABLED', False)
+        token = metrics_module.start_request_spans()
+        try:
+            with span('disabled-span'):
+                pass
+            assert metrics_module.current_spans() == []
+        finally:
+            metrics_module.finish_request_spans(token)
+
+    def test_server_timing_merges_spans(self):
+        """测试同名区段合并并附加总耗时"""
+        header = server_timing([('query', 0.001), ('query', 0.002), ('serialize', 0.0005)], 0.01)
+        assert header == 'query;dur=3.00, serialize;dur=0.50, total;dur=10.00'
+
+
+class TestSlowQueries:
+    """慢查询分析测试类"""
+
+    @pytest.fixture
+    def profiled_db(self, sample_db_path, monkeypatch):
+        """启用语句分析后连接的数据库（阈值极小，所有查询都是慢查询）"""
+        monkeypatch.setattr(profiling_module, 'SLOW_QUERY_MS', 0.000001)
+        db = TrafficDatabase(sample_db_path)
+        assert db.connect()
+        yield db
+        db.disconnect()
+
+    def test_profiling_disabled_by_default(self, sample_db):
+        """测试默认不分析语句：连接是普通的 sqlite3.Connection"""
+        assert profiling_module.SLOW_QUERY_MS == 0
+        assert type(sample_db.connection) is sqlite3.Connection
+        assert type(sample_db.connection.cursor()) is sqlite3.Cursor
+
+    def test_slow_query_records_plan(self, profiled_db):
+        """测试超过阈值的查询由后台线程记录执行计划"""
+        before = profiling_module.SLOW_QUERIES_TOTAL.get()
+
+        profiled_db.connection.execute("SELECT COUNT(*) FROM traffic WHERE plate LIKE ?", ('%1%',)).fetchone()
+        profiled_db.disconnect()
+        profiling_module.wait_slow_queries()
+
+        assert profiling_module.SLOW_QUERIES_TOTAL.get() == before + 1
+        entry = profiling_module.get_recent_slow_queries()[0]
+        assert entry['sql'] == "SELECT COUNT(*) FROM traffic WHERE plate LIKE ?"
+        assert entry['params'] == ['%1%']
+        assert any('SCAN' in line for line in entry['plan'])
+
+    def test_abandoned_cursor_recorded_on_owner_thread(self, profiled_db):
+        """测试只读取部分结果的游标不在回收时记录，而在连接创建下一个游标或关闭时记录"""
+        before = profiling_module.SLOW_QUERIES_TOTAL.get()
+        cursor = profiled_db.connection.execute("SELECT id FROM traffic")
+        cursor.fetchone()
+        del cursor
+        gc.collect()
+        assert profiling_module.SLOW_QUERIES_TOTAL.get() == before
+
+        profiled_db.connection.cursor()
+        assert profiling_module.SLOW_QUERIES_TOTAL.get() == before + 1
+
+        profiled_db.connection.execute("SELECT id FROM traffic WHERE id = 1").fetchone()
+        profiled_db.disconnect()
+        assert profiling_module.SLOW_QUERIES_TOTAL.get() == before + 2
+
+    def test_fast_query_not_recorded(self, profiled_db, monkeypatch):
+        """测试未超过阈值的查询只累计耗时"""
+        monkeypatch.setattr(profiling_module, 'SLOW_QUERY_MS', 60000)
+        before = profiling_module.SLOW_QUERIES_TOTAL.get()
+        statements = profiling_module.SQL_SECONDS.snapshot()['count']
+
+        profiled_db.connection.execute("SELECT id FROM traffic WHERE id = 1").fetchall()
+
+        assert profiling_module.SLOW_QUERIES_TOTAL.get() == before
+        assert profiling_module.SQL_SECONDS.snapshot()['count'] == statements + 1
+
+    def test_iteration_is_timed_in_batches(self, profiled_db):
+        """测试逐行迭代按批读取，整条语句只记录一次且行数完整"""
+        statements = profiling_module.SQL_SECONDS.snapshot()['count']
+        ids = [row[0] for row in profiled_db.connection.execute("SELECT id FROM traffic WHERE id <= 600")]
+        profiling_module.wait_slow_queries()
+
+        assert ids == list(range(1, 601))
+        assert profiling_module.SQL_SECONDS.snapshot()['count'] == statements + 1
+        assert profiling_module.get_recent_slow_queries()[0]['rows'] == 600
+
+    def test_non_select_has_no_plan(self, sample_db):
+        """测试非查询语句不分析执行计划"""
+        assert profiling_module.explain_query_plan(sample_db.connection, "DELETE FROM traffic") == []
+
+    def test_analyze_plan(self):
+        """测试区分全表扫描和索引使用"""
+        scan = profiling_module.analyze_plan(['SCAN traffic', 'USE TEMP B-TREE FOR ORDER BY'])
+        assert scan['full_scan'] is True
+        assert scan['scanned_tables'] == ['traffic']
+        assert scan['temp_btree'] is True
+
+        indexed = profiling_module.analyze_plan([
+            'SEARCH traffic USING INDEX idx_traffic_time_direction (time>? AND time<?)',
+            'SCAN traffic USING COVERING INDEX idx_traffic_plate',
+            'SEARCH traffic USING INTEGER PRIMARY KEY (rowid>?)',
+            'SCAN (subquery-1)'
+        ])
+        assert indexed['full_scan'] is False
+        assert indexed['indexes'] == ['idx_traffic_time_direction', 'idx_traffic_plate', 'PRIMARY KEY']
+
+    def test_slow_query_side_table(self, profiled_db, sample_db_path):
+        """测试慢查询写入与数据库同目录的旁路表，并按语句汇总报告"""
+        for direction in (1, 2, 3):
+            profiled_db.connection.execute("SELECT id FROM traffic WHERE direction = ?", (direction,)).fetchall()
+        for row in profiled_db.connection.execute("SELECT id FROM traffic WHERE id <= 5"):
+            pass
+        profiling_module.wait_slow_queries()
+
+        entry = profiling_module.get_recent_slow_queries()[0]
+        assert entry['rows'] == 5
+        assert entry['indexes'] == ['PRIMARY KEY']
+
+        log_path = profiling_module.default_slow_query_log_path(sample_db_path)
+        assert os.path.dirname(log_path) == os.path.dirname(sample_db_path)
+        groups = profiling_module.get_slow_query_log(log_path).report(sort='count')
+        by_sql = {group['sql']: group for group in groups}
+
+        scan = by_sql['SELECT id FROM traffic WHERE direction = ?']
+        assert scan['count'] == 3
+        assert scan['full_scan'] is True
+        assert scan['max_rows'] > 0
+        assert any('SCAN traffic' in line for line in scan['plan'])
+        assert by_sql['SELECT id FROM traffic WHERE id <= 5']['full_scan'] is False
+
+    def test_side_table_rotation(self, tmp_path):
+        """测试旁路表超过上限时删除最旧的记录"""
+        slow_query_log = profiling_module.SlowQueryLog(str(tmp_path / 'slow.db'), max_rows=3)
+        for index in range(5):
+            slow_query_log.record({
+                'timestamp': index, 'db_path': '', 'sql': f'SELECT {index}', 'params': [], 'duration_ms': index,
+                'rows': 1, 'full_scan': False, 'indexes': [], 'plan': []
+            })
+        groups = slow_query_log.report(sort='max')
+        slow_query_log.close()
+        assert [group['sql'] for group in groups] == ['SELECT 4', 'SELECT 3', 'SELECT 2']
+
+    def test_report_cli(self, tmp_path):
+        """测试慢查询报告命令行"""
+        log_path = str(tmp_path / 'slow.db')
+        slow_query_log = profiling_module.SlowQueryLog(log_path)
+        slow_query_log.record({
+            'timestamp': 1.0, 'db_path': '', 'sql': 'SELECT id FROM traffic WHERE direction = ?', 'params': [2],
+            'duration_ms': 250.0, 'rows': 750, 'full_scan': True, 'indexes': [], 'plan': ['SCAN traffic']
+        })
+        slow_query_log.close()
+
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        result = subprocess.run([sys.executable, '-m', 'utils.profiling', 'report', '--log', log_path],
+                                capture_output=True, text=True, check=True, cwd=root)
+        assert '全表扫描' in result.stdout
+        assert 'SELECT id FROM traffic WHERE direction = ?' in result.stdout
+        assert '| SCAN traffic' in result.stdout
+
+
+class TestMetricsApi:
+    """指标接口测试类"""
+
+    def test_server_timing_header(self, client):
+        """测试数据接口返回各区段耗时"""
+        response = client.get('/api/traffic-data?time_range=morning')
+        timing = response.headers['Server-Timing']
+        for name in ('connect', 'count', 'query', 'serialize', 'total'):
+            assert f'{name};dur=' in timing
+
+        chart = client.get('/api/pie-chart')
+        assert 'chart;dur=' in chart.headers['Server-Timing']
+
+    def test_metrics_endpoint(self, client):
+        """测试/metrics输出路由和数据库方法直方图"""
+        client.get('/api/traffic-data')
+        response = client.get('/metrics')
+
+        assert response.status_code == 200
+        assert response.content_type.startswith('text/plain')
+        text = response.get_data(as_text=True)
+        assert 'traffic_http_request_duration_seconds_count{route="/api/traffic-data",method="GET"}' in text
+        assert 'traffic_http_requests_total{route="/api/traffic-data",method="GET",status="200"}' in text
+        assert 'traffic_db_method_duration_seconds_count{method="count_with_filters"}' in text
+        assert 'traffic_pool_connections_in_use{' in text
+
+    def test_slow_queries_endpoint(self, client, monkeypatch):
+        """测试慢查询接口返回最近的慢查询"""
+        monkeypatch.setattr(profiling_module, 'SLOW_QUERY_MS', 0.000001)
+        client.get('/api/traffic-data?direction=2')
+        profiling_module.wait_slow_queries()
+
+        payload = client.get('/api/slow-queries').get_json()
+        assert payload['success']
+        assert payload['queries']
+        assert all(query['plan'] for query in payload['queries'] if query['sql'].startswith('SELECT'))
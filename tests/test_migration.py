@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+测试本地时间列迁移功能 - pytest版本
+"""
+
+from datetime import datetime, timezone, timedelta
+
+from utils.constants import TIMEZONE_OFFSET_HOURS
+
+
+class TestLocalTimeMigration:
+    """本地时间列迁移测试类"""
+    
+    def snapshot(self, db):
+        """收集搜索和聚合结果"""
+        records, total, _ = db.search_with_filters(time_range='night', direction_filter='3', per_page=5000)
+        return {
+            'night_ids': sorted(record['id'] for record in records),
+            'night_total': total,
+            'direction': db.get_direction_distribution(time_range='evening'),
+            'hourly': db.get_hourly_traffic_trend(direction_filter='2'),
+            'weekday': db.get_hourly_traffic_trend_by_weekday()
+        }
+    
+    def test_migration_preserves_results(self, sample_db):
+        """测试迁移前后搜索和聚合结果一致"""
+        before = self.snapshot(sample_db)
+        assert sample_db.migrate_local_time_columns(batch_size=700)
+        assert sample_db._local_time_sql()['hour'] == 'local_hour'
+        assert self.snapshot(sample_db) == before
+    
+    def test_columns_use_fixed_timezone(self, sample_db):
+        """测试本地时间列按配置的固定时区计算"""
+        sample_db.migrate_local_time_columns()
+        tz = timezone(timedelta(hours=TIMEZONE_OFFSET_HOURS))
+        
+        rows = sample_db.connection.execute(
+            "SELECT time, local_hour, local_weekday, local_date FROM traffic LIMIT 50"
+        ).fetchall()
+        for timestamp, hour, weekday, date in rows:
+            local = datetime.fromtimestamp(timestamp, tz=tz)
+            assert hour == local.hour
+            assert weekday == (local.weekday() + 1) % 7
+            assert date == local.strftime('%Y-%m-%d')
+    
+    def test_search_uses_index(self, sample_db):
+        """测试迁移后时间段+方向搜索命中复合索引"""
+        sample_db.migrate_local_time_columns()
+        conditions, params = sample_db._build_filter_conditions('morning', '1')
+        plan = sample_db.connection.execute(
+            f"EXPLAIN QUERY PLAN SELECT * FROM traffic WHERE {' AND '.join(conditions)}", params
+        ).fetchall()
+        assert any('idx_traffic_direction_local_hour' in row[-1] for row in plan)
+    
+    def test_new_rows_are_filled_by_trigger(self, sample_db):
+        """测试迁移后新插入的记录自动填充本地时间列"""
+        sample_db.migrate_local_time_columns()
+        sample_db.connection.execute(
+            "INSERT INTO traffic (direction, time, plate) VALUES (1, 1741000000, '粤A00001')"
+        )
+        row = sample_db.connection.execute(
+            "SELECT local_hour, local_date FROM traffic ORDER BY id DESC LIMIT 1"
+        ).fetchone()
+        assert row[0] is not None and row[1] is not None
+    
+    def test_migration_is_resumable(self, sample_db):
+        """测试重复执行迁移不会出错"""
+        assert sample_db.migrate_local_time_columns()
+        assert sample_db.migrate_local_time_columns()
+    
+    def test_offset_pages_stable_after_migration(self, sample_db):
+        """测试迁移后页码分页仍按id排序，逐页结果与游标分页一致"""
+        sample_db.migrate_local_time_columns()
+        records, total, total_pages = sample_db.search_with_filters('morning', '1', per_page=5000)
+        expected = sorted(record['id'] for record in records)
+        
+        offset_ids, cursor_ids, after = [], [], None
+        for page in range(1, -(-total // 3) + 1):
+            offset_ids += [record['id'] for record in
+                           sample_db.search_with_filters('morning', '1', page=page, per_page=3)[0]]
+            result = sample_db.search_with_cursor('morning', '1', after=after, per_page=3)
+            cursor_ids += [record['id'] for record in result['records']]
+            after = result['next_cursor']
+        
+        assert total_pages == 1 and total > 6
+        assert offset_ids == cursor_ids == expected
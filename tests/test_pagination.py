@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+测试游标（keyset）分页功能 - pytest版本
+"""
+
+import pytest
+
+from utils import database as database_module
+from utils.database import encode_cursor, decode_cursor
+
+
+class TestCursorPagination:
+    """游标分页功能测试类"""
+    
+    def collect_all_pages(self, db, **filters):
+        """沿着next_cursor遍历所有页，返回全部记录id"""
+        result = db.search_with_cursor(per_page=50, **filters)
+        ids = [record['id'] for record in result['records']]
+        while result['next_cursor']:
+            result = db.search_with_cursor(after=result['next_cursor'], per_page=50, **filters)
+            ids.extend(record['id'] for record in result['records'])
+        return ids
+    
+    def test_cursor_round_trip(self):
+        """测试游标编码和解码"""
+        token = encode_cursor('time', (1740931200.5, 42))
+        assert decode_cursor(token, 'time') == (1740931200.5, 42)
+        
+        with pytest.raises(ValueError):
+            decode_cursor(token, 'id')
+        with pytest.raises(ValueError):
+            decode_cursor('not-a-cursor', 'id')
+    
+    @pytest.mark.parametrize('values', [[[1]], [None], ['5'], [True], [{'a': 1}], [float('nan')]])
+    def test_cursor_value_types(self, values):
+        """测试游标中的取值必须是数字"""
+        token = encode_cursor('id', values)
+        with pytest.raises(ValueError):
+            decode_cursor(token, 'id')
+    
+    def test_walk_matches_offset_pagination(self, sample_db):
+        """测试游标遍历结果与按id排序的完整结果一致"""
+        ids = self.collect_all_pages(sample_db, direction_filter='2')
+        cursor = sample_db.connection.execute("SELECT id FROM traffic WHERE direction = 2 ORDER BY id")
+        assert ids == [row[0] for row in cursor.fetchall()]
+    
+    def test_walk_by_time(self, sample_db):
+        """测试按 (time, id) 排序的游标遍历"""
+        result = sample_db.search_with_cursor(time_range='morning', per_page=10, sort='time')
+        times = [record['time'] for record in result['records']]
+        assert times == sorted(times)
+        
+        second = sample_db.search_with_cursor(time_range='morning', after=result['next_cursor'],
+                                              per_page=10, sort='time')
+        assert second['records'][0]['time'] >= times[-1]
+    
+    def test_prev_cursor_returns_previous_page(self, sample_db):
+        """测试上一页游标"""
+        first = sample_db.search_with_cursor(per_page=20)
+        second = sample_db.search_with_cursor(after=first['next_cursor'], per_page=20)
+        back = sample_db.search_with_cursor(before=second['prev_cursor'], per_page=20)
+        
+        assert first['has_prev'] is False
+        assert second['has_prev'] is True
+        assert [r['id'] for r in back['records']] == [r['id'] for r in first['records']]
+        assert back['has_prev'] is False
+    
+    def test_jump_uses_page_boundaries(self, sample_db, monkeypatch):
+        """测试通过稀疏页边界索引跳页"""
+        monkeypatch.setattr(database_module, 'PAGE_INDEX_STRIDE', 3)
+        
+        result = sample_db.search_with_cursor(direction_filter='1', page=8, per_page=10)
+        cursor = sample_db.connection.execute(
+            "SELECT id FROM traffic WHERE direction = 1 ORDER BY id LIMIT 10 OFFSET 70"
+        )
+        assert [r['id'] for r in result['records']] == [row[0] for row in cursor.fetchall()]
+        assert result['has_prev'] is True
+
+
+    def test_boundaries_extended_after_inserts(self, sample_db, monkeypatch):
+        """测试新增记录后按id排序的页边界索引只为新记录编号，结果与全量重建相同"""
+        monkeypatch.setattr(database_module, 'PAGE_INDEX_STRIDE', 3)
+        conditions, params = sample_db._build_filter_conditions('', '1')
+        sample_db._get_page_boundary(conditions, params, 'id', 10, 8)
+        
+        sample_db.connection.executemany(
+            "INSERT INTO traffic (direction, time, plate) VALUES (?, ?, ?)",
+            [(1 + i % 2, 1741000000 + i, f"粤B{i:05d}") for i in range(200)]
+        )
+        statements = []
+        sample_db.connection.set_trace_callback(statements.append)
+        try:
+            extended = sample_db._get_page_boundary(conditions, params, 'id', 10, 40)
+        finally:
+            sample_db.connection.set_trace_callback(None)
+        assert any('ROW_NUMBER' in sql and 'id > 3000' in sql for sql in statements)
+        
+        cache_key = (sample_db.db_path, tuple(conditions), tuple(params), 'id', 10)
+        extended_index = database_module._page_index_cache.get(cache_key)
+        database_module._page_index_cache.clear()
+        assert sample_db._get_page_boundary(conditions, params, 'id', 10, 40) == extended
+        assert database_module._page_index_cache.get(cache_key) == extended_index
+        result = sample_db.search_with_cursor(direction_filter='1', page=40, per_page=10)
+        cursor = sample_db.connection.execute(
+            "SELECT id FROM traffic WHERE direction = 1 ORDER BY id LIMIT 10 OFFSET 390"
+        )
+        assert [r['id'] for r in result['records']] == [row[0] for row in cursor.fetchall()]
+
+
+class TestPageAnchors:
+    """页锚点缓存测试类"""
+    
+    def expected_ids(self, db, page, per_page=10):
+        """用OFFSET查询第page页的记录id（方向1，按id排序）"""
+        cursor = db.connection.execute(
+            "SELECT id FROM traffic WHERE direction = 1 ORDER BY id LIMIT ? OFFSET ?",
+            (per_page, (page - 1) * per_page)
+        )
+        return [row[0] for row in cursor.fetchall()]
+    
+    def forbid_boundary_index(self, monkeypatch):
+        """之后的跳页不允许使用页边界索引"""
+        def fail(*args, **kwargs):
+            raise AssertionError("应从页锚点定位")
+        monkeypatch.setattr(database_module.TrafficDatabase, '_get_page_boundary', fail)
+    
+    def test_adjacent_page_by_number(self, sample_db, monkeypatch):
+        """测试返回第N页后，按页码请求第N+1页和第N页直接从锚点定位"""
+        sample_db.search_with_cursor(direction_filter='1', page=5, per_page=10)
+        self.forbid_boundary_index(monkeypatch)
+        
+        following = sample_db.search_with_cursor(direction_filter='1', page=6, per_page=10)
+        assert [r['id'] for r in following['records']] == self.expected_ids(sample_db, 6)
+        # 第6页经锚点定位，页码可信，继续记录第7页的锚点
+        assert [r['id'] for r in sample_db.search_with_cursor(direction_filter='1', page=7, per_page=10)['records']] \
+            == self.expected_ids(sample_db, 7)
+    
+    def test_cursor_pages_extend_anchors(self, sample_db, monkeypatch):
+        """测试沿游标翻页（前后两个方向）时记录锚点"""
+        fifth = sample_db.search_with_cursor(direction_filter='1', page=5, per_page=10)
+        sixth = sample_db.search_with_cursor(direction_filter='1', page=6, after=fifth['next_cursor'], per_page=10)
+        sample_db.search_with_cursor(direction_filter='1', page=4, before=fifth['prev_cursor'], per_page=10)
+        self.forbid_boundary_index(monkeypatch)
+        
+        for page in (4, 7):
+            result = sample_db.search_with_cursor(direction_filter='1', page=page, per_page=10)
+            assert [r['id'] for r in result['records']] == self.expected_ids(sample_db, page)
+        assert sixth['has_prev'] is True
+    
+    def test_mismatched_page_number_not_recorded(self, sample_db):
+        """测试游标与页码不符时不记录锚点（不影响之后按页码请求）"""
+        first = sample_db.search_with_cursor(direction_filter='1', per_page=10)
+        sample_db.search_with_cursor(direction_filter='1', page=5, after=first['next_cursor'], per_page=10)
+        
+        result = sample_db.search_with_cursor(direction_filter='1', page=6, per_page=10)
+        assert [r['id'] for r in result['records']] == self.expected_ids(sample_db, 6)
+    
+    def test_anchors_keyed_by_page_size(self, sample_db):
+        """测试锚点按每页记录数区分"""
+        sample_db.search_with_cursor(direction_filter='1', page=3, per_page=10)
+        result = sample_db.search_with_cursor(direction_filter='1', page=4, per_page=25)
+        assert [r['id'] for r in result['records']] == self.expected_ids(sample_db, 4, per_page=25)
+
+
+class TestCursorPaginationApi:
+    """游标分页API测试类"""
+    
+    def test_cursor_mode_pagination_payload(self, client):
+        """测试cursor模式返回游标信息并可继续翻页"""
+        first = client.get('/api/traffic-data?mode=cursor').get_json()
+        assert first['success']
+        assert first['pagination']['mode'] == 'cursor'
+        assert first['pagination']['prev_cursor'] is None
+        
+        next_cursor = first['pagination']['next_cursor']
+        second = client.get(f'/api/traffic-data?mode=cursor&page=2&after={next_cursor}').get_json()
+        assert second['pagination']['current_page'] == 2
+        assert second['data'][0]['id'] > first['data'][-1]['id']
+    
+    def test_cursor_flags_follow_keyset_result(self, client):
+        """测试游标翻页时上一页/下一页以游标查询结果为准，不由客户端传来的页码推算"""
+        first = client.get('/api/traffic-data?mode=cursor&direction=1&per_page=500').get_json()['pagination']
+        last = client.get(f"/api/traffic-data?mode=cursor&direction=1&per_page=500&page=1"
+                          f"&after={first['next_cursor']}").get_json()['pagination']
+        assert first['total_pages'] == 2
+        assert last['has_next'] is False and last['next_page'] is None and last['next_cursor'] is None
+        assert last['has_prev'] is True and last['prev_page'] == 1
+
+        back = client.get(f"/api/traffic-data?mode=cursor&direction=1&per_page=500&page=2"
+                          f"&before={last['prev_cursor']}").get_json()['pagination']
+        assert back['has_prev'] is False and back['prev_page'] is None
+        assert back['has_next'] is True
+
+    def test_invalid_cursor(self, client):
+        """测试无效游标返回400"""
+        response = client.get('/api/traffic-data?mode=cursor&after=bogus')
+        assert response.status_code == 400
+        assert response.get_json()['success'] is False
+        
+        # 格式正确但取值类型错误的游标同样返回400，而不是空页
+        response = client.get(f"/api/traffic-data?mode=cursor&after={encode_cursor('id', [[1]])}")
+        assert response.status_code == 400
+    
+    def test_per_page(self, client):
+        """测试per_page参数同时作用于数据接口和仪表盘"""
+        data = client.get('/api/traffic-data?mode=cursor&per_page=50').get_json()
+        assert len(data['data']) == 50
+        assert data['pagination']['per_page'] == 50
+        assert data['pagination']['total_pages'] == -(-data['pagination']['total_records'] // 50)
+        
+        dashboard = client.get('/api/dashboard?mode=cursor&per_page=1000').get_json()
+        assert len(dashboard['table']['data']) == 1000
+    
+    @pytest.mark.parametrize('per_page', ['0', '1001', 'abc'])
+    def test_invalid_per_page(self, client, per_page):
+        """测试超出范围或非整数的per_page返回400"""
+        for route in ['/api/traffic-data', '/api/dashboard']:
+            response = client.get(f'{route}?per_page={per_page}')
+            assert response.status_code == 400
+            assert response.get_json()['success'] is False
+    
+    def test_adjacent_page_requests_hit_anchors(self, client):
+        """测试按页码请求相邻页时命中页锚点缓存"""
+        client.get('/api/traffic-data?mode=cursor&page=3')
+        hits = client.get('/api/cache-stats').get_json()['page_anchors']['hits']
+        client.get('/api/traffic-data?mode=cursor&page=4')
+        assert client.get('/api/cache-stats').get_json()['page_anchors']['hits'] == hits + 1
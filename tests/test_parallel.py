@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+测试按id范围并行聚合 - pytest版本
+"""
+
+import pytest
+
+from utils import database as database_module
+from utils.parallel import parallel_aggregate, split_id_range
+
+
+@pytest.fixture
+def parallel_workers(monkeypatch):
+    """开启两个进程的并行聚合（合成数据规模很小，取消最小记录数限制）"""
+    monkeypatch.setattr(database_module, 'AGGREGATE_WORKERS', 2)
+    monkeypatch.setattr(database_module, 'AGGREGATE_PARALLEL_MIN_ROWS', 0)
+
+
+class TestParallelAggregate:
+    """并行聚合测试类"""
+
+    def test_split_id_range(self):
+        """测试切分后的各段首尾相接、覆盖整个范围"""
+        assert split_id_range(1, 3001, 4) == [(1, 751), (751, 1501), (1501, 2251), (2251, 3001)]
+        assert split_id_range(1, 8, 3) == [(1, 4), (4, 7), (7, 8)]
+        assert split_id_range(5, 7, 4) == [(5, 6), (6, 7)]
+
+    @pytest.mark.parametrize('group_columns, time_range, direction_filter', [
+        (['hour'], None, None),
+        (['direction'], 'morning', None),
+        (['hour', 'weekday', 'direction'], None, '2'),
+    ])
+    def test_matches_serial_scan(self, sample_db, parallel_workers, group_columns, time_range, direction_filter):
+        """测试并行统计结果与串行全表扫描相同"""
+        expected = sample_db._query_aggregate_counts(group_columns, time_range, direction_filter, parallel=False)
+        assert parallel_aggregate(sample_db.db_path, (1, 3001), group_columns, time_range, direction_filter) == \
+            expected
+        assert sample_db._query_aggregate_counts(group_columns, time_range, direction_filter) == expected
+
+    def test_id_range_chunk(self, sample_db):
+        """测试只统计指定id范围内的记录"""
+        rows = sample_db._query_aggregate_counts(['direction'], id_range=(1001, 2001))
+        assert sum(count for _, count in rows) == 1000
+
+    def test_serial_when_not_worthwhile(self, sample_db, parallel_workers, monkeypatch):
+        """测试有时间窗口或汇总表时不启动并行"""
+        monkeypatch.setattr(database_module.TrafficDatabase, '_parallel_aggregate_counts',
+                            lambda self, *args: pytest.fail("不应并行统计"))
+
+        start = sample_db.connection.execute("SELECT MIN(time) FROM traffic").fetchone()[0]
+        assert sum(sample_db.get_hourly_traffic_trend(start=start, end=start + 86400).values()) > 0
+
+        assert sample_db.refresh_rollup() == 3000
+        assert sum(sample_db.get_hourly_traffic_trend().values()) == 3000
+
+    def test_threshold(self, sample_db, parallel_workers, monkeypatch):
+        """测试记录数低于阈值时串行统计"""
+        monkeypatch.setattr(database_module, 'AGGREGATE_PARALLEL_MIN_ROWS', 3001)
+        assert sample_db._parallel_aggregate_counts(['hour']) is None
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+测试按时间分区存储 - pytest版本
+"""
+
+import gzip
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+
+from tests.conftest import SAMPLE_START_TIME, build_sample_database
+from utils.database import TrafficDatabase, get_database
+from utils.ingest import TrafficIngestor
+from utils.live import LiveFeed
+from utils.partitions import archive_partitions, month_start, partition_database, period_bounds
+from utils.snapshot import export_snapshot
+
+# 北京时间 2025-04-01 00:00:00 / 2025-05-01 00:00:00
+APRIL = 1743436800
+MAY = 1746028800
+PARTITIONS = ['traffic_p202503', 'traffic_p202504', 'traffic_p202505', 'traffic_p202506']
+
+
+@pytest.fixture
+def plain_db_path(tmp_path):
+    """覆盖2025年3月到6月的合成数据库（未分区）"""
+    db_path = build_sample_database(str(tmp_path / 'plain.db'), rows=4000)
+    connection = sqlite3.connect(db_path)
+    connection.execute("UPDATE traffic SET time = ? + (time - ?) * 8", (SAMPLE_START_TIME, SAMPLE_START_TIME))
+    connection.commit()
+    connection.close()
+    return db_path
+
+
+@pytest.fixture
+def partitioned_db_path(plain_db_path, tmp_path):
+    """同样数据按月分区后的数据库"""
+    db_path = str(tmp_path / 'traffic.db')
+    shutil.copy(plain_db_path, db_path)
+    db = TrafficDatabase(db_path)
+    assert db.connect()
+    assert partition_database(db, months=1)
+    db.disconnect()
+    return db_path
+
+
+@pytest.fixture
+def databases(plain_db_path, partitioned_db_path):
+    """(未分区, 已分区) 两个已连接的数据库"""
+    plain, partitioned = TrafficDatabase(plain_db_path), TrafficDatabase(partitioned_db_path)
+    assert plain.connect() and partitioned.connect()
+    yield plain, partitioned
+    plain.disconnect()
+    partitioned.disconnect()
+
+
+class TestPartitioning:
+    """分区转换与分区裁剪测试类"""
+
+    def test_period_bounds(self):
+        """测试分区按统计时区的月份对齐"""
+        assert period_bounds(APRIL - 1, months=1) == (1740758400, APRIL)
+        assert period_bounds(APRIL, months=1) == (APRIL, MAY)
+        assert period_bounds(MAY, months=3) == (APRIL, 1751299200)
+        assert month_start(1, now=MAY + 86400) == APRIL
+
+    def test_partition_preserves_records(self, databases):
+        """测试转换后记录、id和最大id保持不变"""
+        plain, partitioned = databases
+        assert [name for name, _, _ in partitioned._partitions()] == PARTITIONS
+        query = "SELECT id, direction, time, plate FROM traffic ORDER BY id"
+        assert [tuple(row) for row in partitioned.connection.execute(query)] == \
+            [tuple(row) for row in plain.connection.execute(query)]
+        assert partitioned.get_data_version()[0] == plain.get_data_version()[0] == 4000
+        assert plain._partitions() is None
+
+    def test_window_prunes_partitions(self, databases):
+        """测试时间窗口只访问重叠的分区"""
+        _, partitioned = databases
+        assert partitioned._source() == 'traffic'
+        assert partitioned._source(APRIL + 86400, APRIL + 2 * 86400) == 'traffic_p202504 AS traffic'
+        assert partitioned._source(APRIL - 86400, APRIL + 86400) == \
+            '(SELECT * FROM traffic_p202503 UNION ALL SELECT * FROM traffic_p202504) AS traffic'
+        assert partitioned.count_with_filters(start=0, end=1000) == (0, False)
+
+        statements = []
+        partitioned.connection.set_trace_callback(statements.append)
+        try:
+            partitioned.search_with_cursor(start=APRIL + 86400, end=APRIL + 2 * 86400, sort='time')
+        finally:
+            partitioned.connection.set_trace_callback(None)
+        queries = [sql for sql in statements if 'ORDER BY' in sql]
+        assert queries and all('traffic_p202504' in sql and 'traffic_p202503' not in sql for sql in queries)
+
+    @pytest.mark.parametrize('filters', [{}, {'start': APRIL + 3600, 'end': MAY + 86400},
+                                         {'direction_filter': '3', 'start': MAY}])
+    def test_queries_match_unpartitioned(self, databases, filters):
+        """测试计数、游标分页、聚合和车牌查询与未分区时一致"""
+        plain, partitioned = databases
+        assert partitioned.count_with_filters(**filters) == plain.count_with_filters(**filters)
+        for sort in ('id', 'time'):
+            expected = plain.search_with_cursor(page=3, per_page=50, sort=sort, as_tuples=True, **filters)
+            actual = partitioned.search_with_cursor(page=3, per_page=50, sort=sort, as_tuples=True, **filters)
+            assert actual['records'] == expected['records']
+
+        window = {key: value for key, value in filters.items() if key in ('start', 'end')}
+        assert partitioned.get_hourly_traffic_trend(**window) == plain.get_hourly_traffic_trend(**window)
+        assert partitioned.search_plates('粤B1', **window) == plain.search_plates('粤B1', **window)
+
+    def test_ingest_routes_records(self, partitioned_db_path, tmp_path):
+        """测试导入按时间写入所属分区，缺少的月份自动建立分区"""
+        path = tmp_path / 'batch.csv'
+        path.write_text('direction,time,plate\n1,2025-04-02 08:00:00,粤A00001\n'
+                        '2,2025-08-02 08:00:00,粤A00002\n', encoding='utf-8')
+        assert TrafficIngestor(partitioned_db_path).ingest_files([str(path)])['inserted'] == 2
+        assert TrafficIngestor(partitioned_db_path).ingest_files([str(path)])['inserted'] == 0
+
+        connection = sqlite3.connect(partitioned_db_path)
+        assert connection.execute("SELECT id FROM traffic_p202504 WHERE plate = '粤A00001'").fetchone() == (4001,)
+        assert connection.execute("SELECT id FROM traffic_p202508 WHERE plate = '粤A00002'").fetchone() == (4002,)
+        connection.close()
+
+    def test_migrate_after_partition(self, partitioned_db_path):
+        """测试分区后迁移本地时间列，新记录经视图写入时同样填充"""
+        db = TrafficDatabase(partitioned_db_path)
+        assert db.connect()
+        try:
+            assert db.migrate_local_time_columns()
+            db.connection.execute("INSERT INTO traffic (direction, time, plate) VALUES (2, ?, '粤A99999')",
+                                  (MAY + 9 * 3600,))
+            db.connection.commit()
+            row = db.connection.execute("SELECT id, local_hour, local_date FROM traffic_p202505 "
+                                        "WHERE plate = '粤A99999'").fetchone()
+            assert tuple(row) == (4001, 9, '2025-05-01')
+            with pytest.raises(sqlite3.IntegrityError):
+                db.connection.execute("INSERT INTO traffic (direction, time, plate) VALUES (1, 0, '粤A0')")
+        finally:
+            db.disconnect()
+
+    def test_archive_partitions(self, partitioned_db_path, tmp_path):
+        """测试归档旧分区：导出压缩文件、删除分区、重建汇总表并删除列式快照"""
+        db = TrafficDatabase(partitioned_db_path)
+        assert db.connect()
+        try:
+            assert db.refresh_rollup() == 4000
+            snapshot_path = export_snapshot(partitioned_db_path)
+            archived = archive_partitions(db, MAY, str(tmp_path / 'archive'))
+            assert not os.path.exists(snapshot_path)
+            assert [entry['name'] for entry in archived] == PARTITIONS[:2]
+            assert [name for name, _, _ in db._partitions()] == PARTITIONS[2:]
+
+            remaining = db.count_with_filters()[0]
+            assert remaining == 4000 - sum(entry['rows'] for entry in archived)
+            assert sum(db.get_direction_distribution().values()) == remaining
+
+            # 最新的分区始终保留
+            assert [entry['name'] for entry in archive_partitions(db, 2e9, str(tmp_path / 'archive'))] == \
+                PARTITIONS[2:3]
+        finally:
+            db.disconnect()
+
+        with gzip.open(archived[0]['path'], 'rt', encoding='utf-8') as handle:
+            lines = handle.read().splitlines()
+        assert lines[0] == 'id,direction,time,plate'
+        assert len(lines) == archived[0]['rows'] + 1
+
+    def test_rollup_rebuilt_after_partition_delete(self, partitioned_db_path):
+        """测试删除分区中已汇总的记录后汇总表重建（触发器建立在各分区表上）"""
+        db = TrafficDatabase(partitioned_db_path)
+        assert db.connect()
+        try:
+            assert db.refresh_rollup() == 4000
+            assert db.refresh_rollup() == 0
+            db.connection.execute(f"DELETE FROM {PARTITIONS[1]} WHERE id % 2 = 0")
+            db.connection.commit()
+            remaining = db.connection.execute("SELECT COUNT(*) FROM traffic").fetchone()[0]
+            assert db.refresh_rollup() == remaining
+            assert sum(db.get_direction_distribution().values()) == remaining
+        finally:
+            db.disconnect()
+
+    def test_live_feed_on_partitions(self, partitioned_db_path):
+        """测试实时推送按分区读取最大id"""
+        feed = LiveFeed(partitioned_db_path, interval=3600)
+        try:
+            feed.poll()
+            assert feed.last_id == 4000
+        finally:
+            feed.close()
+
+    def test_cli(self, plain_db_path, tmp_path):
+        """测试 partition / archive 维护命令"""
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        archive_dir = str(tmp_path / 'archive')
+        commands = (['partition', '--months', '3'],
+                    ['archive', '--before', '2025-04-01', '--archive-dir', archive_dir])
+        for command in commands:
+            subprocess.run([sys.executable, '-m', 'utils.database', *command, '--db', plain_db_path],
+                           capture_output=True, text=True, check=True, cwd=root)
+
+        assert os.listdir(archive_dir) == ['traffic_p202501.csv.gz']
+        db = get_database(plain_db_path)
+        assert db.connect()
+        try:
+            assert [name for name, _, _ in db._partitions()] == ['traffic_p202504']
+        finally:
+            db.disconnect()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+测试车牌查询和车牌前缀搜索 - pytest版本
+"""
+
+from urllib.parse import quote
+
+import pytest
+
+from utils import database as database_module
+from utils.database import plate_prefix_range
+
+
+class TestPlateLookup:
+    """车牌查询测试类"""
+
+    @pytest.fixture
+    def plates(self, sample_db):
+        """各车牌的通行记录 {车牌: [(time, id)]}"""
+        passages = {}
+        for row in sample_db.connection.execute("SELECT plate, time, id FROM traffic"):
+            passages.setdefault(row['plate'], []).append((row['time'], row['id']))
+        return passages
+
+    def test_find_by_plate_chronological(self, sample_db, plates):
+        """测试返回该车牌全部记录并按时间排序"""
+        plate = max(plates, key=lambda name: len(plates[name]))
+        records = sample_db.find_by_plate(plate)
+
+        assert [(record['time'], record['id']) for record in records] == sorted(plates[plate])
+        assert all(record['plate'] == plate for record in records)
+
+    def test_find_by_plate_limit_and_window(self, sample_db, plates):
+        """测试limit和时间窗口"""
+        plate = max(plates, key=lambda name: len(plates[name]))
+        expected = sorted(plates[plate])
+        assert len(expected) >= 2
+
+        assert [record['id'] for record in sample_db.find_by_plate(plate, limit=1)] == [expected[0][1]]
+        later = sample_db.find_by_plate(plate, start=expected[1][0])
+        assert [record['id'] for record in later] == [row_id for _, row_id in expected[1:]]
+
+    def test_unknown_plate(self, sample_db):
+        """测试不存在的车牌返回空列表"""
+        assert sample_db.find_by_plate('京A00000') == []
+
+    @pytest.mark.parametrize('kwargs', [{'plate': '  '}, {'plate': '粤B00001', 'limit': 0},
+                                        {'plate': '粤B00001', 'limit': 1001}])
+    def test_invalid_arguments(self, sample_db, kwargs):
+        """测试空车牌和超出范围的limit"""
+        with pytest.raises(ValueError):
+            sample_db.find_by_plate(**kwargs)
+
+    def test_search_plates(self, sample_db, plates):
+        """测试前缀搜索返回匹配车牌及通行次数"""
+        prefix = '粤B1'
+        expected = sorted(plate for plate in plates if plate.startswith(prefix))[:20]
+        matches = sample_db.search_plates(prefix)
+
+        assert [match['plate'] for match in matches] == expected
+        for match in matches:
+            times = [timestamp for timestamp, _ in plates[match['plate']]]
+            assert match['passages'] == len(times)
+            assert (match['first_time'], match['last_time']) == (min(times), max(times))
+
+    def test_prefix_range(self):
+        """测试前缀范围的上界"""
+        assert plate_prefix_range('粤B12') == ('粤B12', '粤B13')
+        assert plate_prefix_range('粤') == ('粤', chr(ord('粤') + 1))
+
+    def test_index_seek(self, sample_db):
+        """测试建立索引后车牌查询和前缀搜索都是索引定位"""
+        assert sample_db.create_search_indexes()
+        assert all(sample_db._has_index(name) for name in database_module.SEARCH_INDEXES)
+
+        statements = []
+        sample_db.connection.set_trace_callback(statements.append)
+        try:
+            sample_db.find_by_plate('粤B00001')
+            sample_db.search_plates('粤B0')
+        finally:
+            sample_db.connection.set_trace_callback(None)
+
+        # 只检查车牌查询语句（分区路由的 PRAGMA schema_version 等簿记语句除外）
+        statements = [sql for sql in statements if 'plate' in sql]
+        assert len(statements) == 2
+        for sql in statements:
+            plan = ' '.join(row[3] for row in sample_db.connection.execute(f"EXPLAIN QUERY PLAN {sql}"))
+            assert 'idx_traffic_plate_time_direction' in plan
+            assert 'SCAN traffic' not in plan
+
+
+class TestPlateApi:
+    """车牌查询接口测试类"""
+
+    def test_plate_passages(self, client, sample_db):
+        """测试返回格式化后的通行记录"""
+        plate = sample_db.connection.execute("SELECT plate FROM traffic WHERE id = 1").fetchone()[0]
+        data = client.get(f'/api/plate/{quote(plate)}').get_json()
+
+        assert data['success'] and data['plate'] == plate
+        assert data['count'] == len(data['passages']) >= 1
+        assert data['truncated'] is False
+        assert all('formatted_time' in record and 'direction_text' in record for record in data['passages'])
+
+    def test_prefix_search(self, client):
+        """测试前缀搜索"""
+        data = client.get(f"/api/plate/{quote('粤B0')}?prefix=1&limit=5").get_json()
+
+        assert data['success'] and data['prefix'] == '粤B0'
+        assert data['count'] == 5 and data['truncated'] is True
+        assert all(match['plate'].startswith('粤B0') for match in data['matches'])
+
+    def test_invalid_limit(self, client):
+        """测试超出范围的limit返回400"""
+        response = client.get(f"/api/plate/{quote('粤B00001')}?limit=5000")
+        assert response.status_code == 400
+        assert response.get_json()['success'] is False
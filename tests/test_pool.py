@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+测试只读连接池 - pytest版本
+"""
+
+import sqlite3
+import threading
+
+import pytest
+
+from utils.database import ConnectionPool, TrafficDatabase
+
+
+class TestConnectionPool:
+    """连接池功能测试类"""
+    
+    def test_connections_are_reused(self, sample_db_path):
+        """测试归还的连接会被复用，并统计命中率"""
+        pool = ConnectionPool(sample_db_path, max_size=2)
+        first = pool.acquire()
+        pool.release(first)
+        second = pool.acquire()
+        pool.release(second)
+        
+        assert first is second
+        stats = pool.stats()
+        assert stats['created'] == 1
+        assert stats['checkouts'] == 2
+        assert stats['hits'] == 1
+        assert stats['hit_rate'] == 0.5
+        assert stats['in_use'] == 0
+        pool.close()
+    
+    def test_connections_are_read_only(self, sample_db_path):
+        """测试连接池中的连接拒绝写入"""
+        pool = ConnectionPool(sample_db_path, max_size=1)
+        with pool.connection() as connection:
+            assert connection.execute("PRAGMA query_only").fetchone()[0] == 1
+            assert connection.execute("PRAGMA temp_store").fetchone()[0] == 2
+            with pytest.raises(sqlite3.OperationalError):
+                connection.execute("DELETE FROM traffic")
+        pool.close()
+    
+    def test_bounded_size_and_waits(self, sample_db_path):
+        """测试连接数达到上限后等待归还，并记录等待次数"""
+        pool = ConnectionPool(sample_db_path, max_size=1, timeout=5)
+        held = pool.acquire()
+        acquired = []
+        
+        def worker():
+            with pool.connection() as connection:
+                acquired.append(connection)
+        
+        thread = threading.Thread(target=worker)
+        thread.start()
+        thread.join(0.2)
+        assert acquired == []
+        
+        pool.release(held)
+        thread.join(5)
+        assert acquired == [held]
+        assert pool.stats()['waits'] == 1
+        assert pool.stats()['created'] == 1
+        pool.close()
+    
+    def test_acquire_timeout(self, sample_db_path):
+        """测试等待超时"""
+        pool = ConnectionPool(sample_db_path, max_size=1, timeout=0.05)
+        held = pool.acquire()
+        with pytest.raises(sqlite3.OperationalError):
+            pool.acquire()
+        pool.release(held)
+        pool.close()
+    
+    def test_database_with_pool(self, sample_db_path):
+        """测试TrafficDatabase通过连接池连接和断开"""
+        pool = ConnectionPool(sample_db_path, max_size=2)
+        db = TrafficDatabase(sample_db_path, pool=pool)
+        assert db.connect()
+        assert sum(db.get_direction_distribution().values()) == 3000
+        db.disconnect()
+        assert pool.stats()['idle'] == 1
+        pool.close()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+测试汇总表（rollup）功能 - pytest版本
+"""
+
+import re
+
+
+class TestRollup:
+    """汇总表功能测试类"""
+    
+    def aggregates(self, db):
+        """收集所有聚合方法在各种筛选条件下的结果"""
+        results = {
+            'direction': {tr: db.get_direction_distribution(time_range=tr)
+                          for tr in (None, 'morning', 'noon', 'afternoon', 'evening', 'night')},
+            'hourly': {d: db.get_hourly_traffic_trend(direction_filter=d) for d in (None, '1', '4')},
+            'weekday': {d: db.get_hourly_traffic_trend_by_weekday(direction_filter=d) for d in (None, '2')}
+        }
+        return results
+    
+    def test_rollup_matches_full_scan(self, sample_db):
+        """测试汇总表结果与全表扫描一致"""
+        expected = self.aggregates(sample_db)
+        assert sample_db.refresh_rollup() == 3000
+        assert self.aggregates(sample_db) == expected
+    
+    def test_incremental_refresh(self, sample_db):
+        """测试新数据写入后汇总结果保持最新，并可增量刷新"""
+        sample_db.refresh_rollup()
+        
+        sample_db.connection.executemany(
+            "INSERT INTO traffic (direction, time, plate) VALUES (?, ?, ?)",
+            [(3, 1741000000 + i * 60, f"粤A{i:05d}") for i in range(50)]
+        )
+        sample_db.connection.commit()
+        
+        # 未刷新时新记录由实时尾部查询补齐
+        live = self.aggregates(sample_db)
+        assert sum(live['direction'][None].values()) == 3050
+        
+        assert sample_db.refresh_rollup() == 50
+        assert sample_db.refresh_rollup() == 0
+        assert self.aggregates(sample_db) == live
+    
+    def test_rollup_rebuild(self, sample_db):
+        """测试全量重建汇总表"""
+        sample_db.refresh_rollup()
+        assert sample_db.refresh_rollup(rebuild=True) == 3000
+        total = sample_db.connection.execute("SELECT SUM(count) FROM traffic_rollup").fetchone()[0]
+        assert total == 3000
+    
+    def test_rebuild_after_delete(self, sample_db):
+        """测试已汇总的记录被删除后，下次刷新全量重建汇总表"""
+        sample_db.refresh_rollup()
+        sample_db.connection.execute("INSERT INTO traffic (direction, time, plate) VALUES (1, 1741000000, 'X')")
+        sample_db.connection.execute("DELETE FROM traffic WHERE id = 3001")
+        sample_db.connection.commit()
+        assert sample_db.refresh_rollup() == 0
+        
+        sample_db.connection.execute("DELETE FROM traffic WHERE id BETWEEN 100 AND 199")
+        sample_db.connection.commit()
+        
+        assert sample_db.refresh_rollup() == 2900
+        assert sample_db.refresh_rollup() == 0
+        total = sample_db.connection.execute("SELECT SUM(count) FROM traffic_rollup").fetchone()[0]
+        assert total == 2900
+        assert sum(sample_db.get_direction_distribution().values()) == 2900
+    
+    def test_null_direction_and_time(self, sample_db):
+        """测试方向或时间为NULL的记录与全表扫描一样按NULL分组，增量刷新后仍然一致"""
+        insert = "INSERT INTO traffic (direction, time, plate) VALUES (?, ?, ?)"
+        sample_db.connection.executemany(insert, [(None, 1741000000, 'X1'), (2, None, 'X2')])
+        sample_db.connection.commit()
+        expected = sample_db._query_aggregate_counts(['hour', 'weekday', 'direction'])
+        assert (None, None, 2, 1) in expected
+        
+        assert sample_db.refresh_rollup() == 3002
+        sample_db.connection.executemany(insert, [(None, 1741000000, 'X3'), (2, None, 'X4')])
+        sample_db.connection.commit()
+        assert sample_db.refresh_rollup() == 2
+        
+        rows = sample_db._query_aggregate_counts(['hour', 'weekday', 'direction'])
+        assert (None, None, 2, 2) in rows
+        assert sum(row[-1] for row in rows if row[2] is None) == 2
+        assert sample_db._query_aggregate_counts(['direction'])[0] == (None, 2)
+    
+    def test_legacy_rollup_rebuilt(self, sample_db):
+        """测试早期格式（列不允许NULL）的汇总表在刷新时重建"""
+        sample_db.refresh_rollup()
+        sample_db.connection.execute("DELETE FROM traffic_rollup_meta WHERE key = 'version'")
+        sample_db.connection.commit()
+        assert sample_db.refresh_rollup() == 3000
+    
+    def test_rebuild_after_update(self, sample_db):
+        """测试修改已汇总记录的方向后，下次刷新全量重建汇总表"""
+        sample_db.refresh_rollup()
+        sample_db.connection.execute("UPDATE traffic SET direction = 4 WHERE id <= 100")
+        sample_db.connection.commit()
+        expected = sample_db.connection.execute(
+            "SELECT COUNT(*) FROM traffic WHERE direction = 4").fetchone()[0]
+        
+        assert sample_db.refresh_rollup() == 3000
+        assert sample_db.get_direction_distribution()[4] == expected
+    
+    def test_refresh_does_not_scan_rolled_up_rows(self, sample_db):
+        """测试增量刷新只按主键查找确认汇总表未过期，不对已汇总的记录计数"""
+        sample_db.refresh_rollup()
+        statements = []
+        sample_db.connection.set_trace_callback(statements.append)
+        try:
+            assert sample_db.refresh_rollup() == 0
+        finally:
+            sample_db.connection.set_trace_callback(None)
+        assert statements
+        assert not any(re.search(r'COUNT\(\*\) FROM traffic WHERE id <= \d', sql) for sql in statements)
@@ -10,8 +10,14 @@ import sys
 # 添加项目根目录到Python路径
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from datetime import timezone, timedelta
+
 from app import app
 from utils.database import TrafficDatabase
+from utils.constants import TIMEZONE_OFFSET_HOURS
+
+# 时间段搜索按固定的统计时区计算小时
+STATS_TZ = timezone(timedelta(hours=TIMEZONE_OFFSET_HOURS))
 
 
 class TestTimeSearch:
@@ -51,7 +57,7 @@ class TestTimeSearch:
             import datetime
             for record in records:
                 # 将Unix时间戳转换为时间对象验证小时
-                dt = datetime.datetime.fromtimestamp(record['time'])
+                dt = datetime.datetime.fromtimestamp(record['time'], tz=STATS_TZ)
                 hour = dt.hour
                 assert 7 <= hour <= 8, f"记录时间{hour}不在早高峰范围内"
     
@@ -68,7 +74,7 @@ class TestTimeSearch:
         if records:
             import datetime
             for record in records:
-                dt = datetime.datetime.fromtimestamp(record['time'])
+                dt = datetime.datetime.fromtimestamp(record['time'], tz=STATS_TZ)
                 hour = dt.hour
                 assert 17 <= hour <= 18, f"记录时间{hour}不在晚高峰范围内"
     
@@ -87,7 +93,7 @@ class TestTimeSearch:
         if records:
             import datetime
             for record in records:
-                dt = datetime.datetime.fromtimestamp(record['time'])
+                dt = datetime.datetime.fromtimestamp(record['time'], tz=STATS_TZ)
                 hour = dt.hour
                 assert (hour >= 20 or hour <= 5), f"记录时间{hour}不在夜间范围内"
     
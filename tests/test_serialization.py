@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+测试记录序列化（批量时间格式化、列式响应、JSON序列化） - pytest版本
+"""
+
+import json
+import random
+from datetime import datetime
+
+import pytest
+
+from utils import serialization as serialization_module
+from utils.constants import get_direction_text
+from utils.database import LOCAL_TZ, RECORD_COLUMNS
+from utils.serialization import format_local_times, record_dicts
+
+from conftest import SAMPLE_START_TIME
+
+
+def reference_time(timestamp: float) -> str:
+    """逐行使用datetime格式化（原实现）"""
+    return datetime.fromtimestamp(timestamp, tz=LOCAL_TZ).strftime('%Y-%m-%d %H:%M:%S (北京时间)')
+
+
+class TestFormatting:
+    """批量格式化测试类"""
+
+    def test_matches_datetime(self):
+        """测试与datetime逐行格式化的结果一致"""
+        rng = random.Random(7)
+        timestamps = [SAMPLE_START_TIME + rng.uniform(-5 * 365 * 86400, 5 * 365 * 86400) for _ in range(20000)]
+        # 整点、跨天和接近下一秒的边界
+        timestamps += [SAMPLE_START_TIME, SAMPLE_START_TIME - 0.25, SAMPLE_START_TIME + 86399.9999996,
+                       SAMPLE_START_TIME + 0.9999994, 0.0, 1e9]
+        assert format_local_times(timestamps) == [reference_time(timestamp) for timestamp in timestamps]
+
+    def test_record_dicts(self, sample_db):
+        """测试元组转换后的记录与原来的字典格式相同"""
+        rows = sample_db.connection.execute(f"SELECT {', '.join(RECORD_COLUMNS)} FROM traffic LIMIT 200").fetchall()
+        expected = []
+        for row in rows:
+            record = dict(row)
+            record['formatted_time'] = reference_time(record['time'])
+            record['direction_text'] = get_direction_text(record['direction'])
+            expected.append(record)
+        assert record_dicts([tuple(row) for row in rows]) == expected
+
+
+class TestTupleQueries:
+    """元组查询测试类"""
+
+    @pytest.mark.parametrize('sort', ['id', 'time'])
+    def test_cursor_tuples_match_dicts(self, sample_db, sort):
+        """测试as_tuples时记录和游标与字典结果一致"""
+        dicts = sample_db.search_with_cursor('evening', '', page=3, per_page=25, sort=sort)
+        tuples = sample_db.search_with_cursor('evening', '', page=3, per_page=25, sort=sort, as_tuples=True)
+
+        assert [tuple(record[column] for column in RECORD_COLUMNS) for record in dicts['records']] == tuples['records']
+        assert (dicts['next_cursor'], dicts['prev_cursor']) == (tuples['next_cursor'], tuples['prev_cursor'])
+
+        following = sample_db.search_with_cursor('evening', '', after=tuples['next_cursor'], per_page=25,
+                                                 sort=sort, as_tuples=True)
+        assert following['records'][0] != tuples['records'][-1]
+
+    def test_offset_tuples(self, sample_db):
+        """测试OFFSET分页的as_tuples"""
+        records, total, pages = sample_db.search_with_filters('', '3', page=2, per_page=30)
+        tuples, total_tuples, pages_tuples = sample_db.search_with_filters('', '3', page=2, per_page=30,
+                                                                           as_tuples=True)
+        assert (total, pages) == (total_tuples, pages_tuples)
+        assert [record['id'] for record in records] == [row[0] for row in tuples]
+
+
+class TestPayloadApi:
+    """数据格式接口测试类"""
+
+    def test_columns_payload(self, client):
+        """测试列式响应与行格式包含相同的数据"""
+        records = client.get('/api/traffic-data?time_range=morning&page=2').get_json()
+        columns = client.get('/api/traffic-data?time_range=morning&page=2&format=columns').get_json()
+
+        payload = columns['data']
+        assert payload['columns'] == list(RECORD_COLUMNS)
+        assert payload['utc_offset_minutes'] == 480 and payload['time_label'] == '北京时间'
+        assert [dict(zip(payload['columns'], row)) for row in payload['rows']] == [
+            {column: record[column] for column in RECORD_COLUMNS} for record in records['data']]
+        assert all(payload['direction_labels'][str(record['direction'])] == record['direction_text']
+                   for record in records['data'])
+        assert columns['pagination'] == records['pagination']
+
+    def test_dashboard_columns(self, client):
+        """测试仪表盘表格同样支持列式响应"""
+        data = client.get('/api/dashboard?mode=cursor&format=columns').get_json()
+        assert len(data['table']['data']['rows']) == data['table']['pagination']['per_page']
+
+    def test_unknown_format(self, client):
+        """测试不支持的数据格式返回400"""
+        for route in ['/api/traffic-data', '/api/dashboard']:
+            response = client.get(f'{route}?format=xml')
+            assert response.status_code == 400
+            assert response.get_json()['success'] is False
+
+    @pytest.mark.parametrize('use_orjson', [True, False])
+    def test_json_provider(self, client, monkeypatch, use_orjson):
+        """测试orjson和标准库两种序列化结果相同，中文不转义"""
+        if use_orjson:
+            pytest.importorskip('orjson')
+        else:
+            monkeypatch.setattr(serialization_module, 'orjson', None)
+
+        response = client.get('/api/traffic-data?direction=2')
+        body = response.get_data(as_text=True)
+        assert response.mimetype == 'application/json'
+        assert '南往北' in body
+        assert json.loads(body)['data'][0]['direction_text'] == '南往北'
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+测试多路口分片数据库 - pytest版本
+"""
+
+import sqlite3
+
+import pytest
+
+from tests.conftest import build_sample_database
+from utils import shards as shards_module
+from utils.database import TrafficDatabase, get_database
+from utils.shards import ShardedTrafficDatabase, merge_aggregate_counts, resolve_intersections
+
+INTERSECTIONS = ('east_gate', 'north_gate', 'south_gate')
+
+
+@pytest.fixture
+def shard_dir(tmp_path):
+    """三个路口分片（记录数和随机种子各不相同，id互相重叠）"""
+    directory = tmp_path / 'shards'
+    directory.mkdir()
+    for index, name in enumerate(INTERSECTIONS):
+        build_sample_database(str(directory / f'{name}.db'), rows=1000 + 500 * index, seed=index)
+    return str(directory)
+
+
+@pytest.fixture
+def sharded_db(shard_dir, monkeypatch):
+    """已连接的分片数据库（聚合在当前进程中依次执行）"""
+    monkeypatch.setattr(shards_module, 'SHARD_WORKERS', 1)
+    db = get_database(shard_dir, pooled=True)
+    assert db.connect()
+    yield db
+    db.disconnect()
+
+
+def all_rows(shard_dir, where='', params=()):
+    """读取全部分片的记录，附加路口名称"""
+    rows = []
+    for name in INTERSECTIONS:
+        connection = sqlite3.connect(f'{shard_dir}/{name}.db')
+        rows.extend(row + (name,) for row in connection.execute(
+            f"SELECT id, direction, time, plate FROM traffic {where}", params
+        ))
+        connection.close()
+    return rows
+
+
+class TestShardedDatabase:
+    """分片数据库测试类"""
+
+    def test_get_database_opens_directory(self, shard_dir):
+        """测试数据库路径为目录时按分片打开"""
+        db = get_database(shard_dir)
+        assert isinstance(db, ShardedTrafficDatabase)
+        assert db.intersections == list(INTERSECTIONS)
+        assert db.live_db_path is None
+        assert get_database(shard_dir, intersections=('north_gate',)).live_db_path.endswith('north_gate.db')
+
+    def test_resolve_intersections(self, shard_dir, sample_db_path):
+        """测试解析intersection参数"""
+        assert resolve_intersections(shard_dir, '') is None
+        assert resolve_intersections(shard_dir, 'south_gate, east_gate') == ('east_gate', 'south_gate')
+        with pytest.raises(ValueError):
+            resolve_intersections(shard_dir, 'west_gate')
+        with pytest.raises(ValueError):
+            resolve_intersections(sample_db_path, 'east_gate')
+
+    def test_merge_aggregate_counts(self):
+        """测试合并分组计数"""
+        merged = merge_aggregate_counts([[(1, 2, 5), (3, 1, 1)], [(1, 2, 4)]])
+        assert merged == [(1, 2, 9), (3, 1, 1)]
+
+    def test_count_and_aggregates(self, sharded_db, shard_dir):
+        """测试计数和图表聚合等于各分片之和"""
+        rows = all_rows(shard_dir)
+        total, is_estimate = sharded_db.count_with_filters(direction_filter='2')
+        assert total == sum(1 for row in rows if row[1] == 2)
+        assert is_estimate is False
+
+        distribution = sharded_db.get_direction_distribution()
+        expected = {}
+        for name in INTERSECTIONS:
+            shard = TrafficDatabase(f'{shard_dir}/{name}.db')
+            assert shard.connect()
+            for direction, count in shard.get_direction_distribution().items():
+                expected[direction] = expected.get(direction, 0) + count
+            shard.disconnect()
+        assert distribution == expected
+        assert sum(sharded_db.get_hourly_traffic_trend().values()) == len(rows)
+
+    def test_aggregates_in_process_pool(self, shard_dir, monkeypatch):
+        """测试在进程池中并行聚合"""
+        monkeypatch.setattr(shards_module, 'SHARD_WORKERS', 2)
+        db = get_database(shard_dir, pooled=True)
+        assert db.connect()
+        try:
+            trend = db.get_hourly_traffic_trend(direction_filter='1')
+        finally:
+            db.disconnect()
+        assert sum(trend.values()) == sum(1 for row in all_rows(shard_dir) if row[1] == 1)
+
+    def test_aggregate_keyword_arguments(self, sharded_db):
+        """测试聚合接受与单库相同的关键字参数：parallel被忽略，id_range被拒绝"""
+        rows = sharded_db._query_aggregate_counts(['direction'], parallel=False)
+        assert rows == sharded_db._query_aggregate_counts(['direction'])
+        with pytest.raises(ValueError):
+            sharded_db._query_aggregate_counts(['direction'], id_range=(1, 100))
+
+    def test_offset_search_is_merged_by_time(self, sharded_db, shard_dir):
+        """测试分页搜索按 (time, 路口, id) 归并"""
+        expected = sorted(all_rows(shard_dir, "WHERE direction = 3"), key=lambda row: (row[2], row[4], row[0]))
+        records, total_records, total_pages = sharded_db.search_with_filters(
+            direction_filter='3', page=4, per_page=25, as_tuples=True
+        )
+        assert records == expected[75:100]
+        assert total_records == len(expected)
+        assert total_pages == -(-len(expected) // 25)
+
+    def test_deep_offset_pages_seek_each_shard(self, sharded_db, shard_dir, monkeypatch):
+        """测试深页分段定位：每个分片的查询量不超过步长加一页，结果与归并排序相同"""
+        monkeypatch.setattr(shards_module, 'SHARD_SEEK_ROWS', 100)
+        limits = []
+        original = ShardedTrafficDatabase._fetch_merged
+
+        def fetch_merged(self, *args, **kwargs):
+            limits.append(args[5])
+            return original(self, *args, **kwargs)
+        monkeypatch.setattr(ShardedTrafficDatabase, '_fetch_merged', fetch_merged)
+
+        expected = sorted(all_rows(shard_dir), key=lambda row: (row[2], row[4], row[0]))
+        records, _, total_pages = sharded_db.search_with_filters(page=43, per_page=25, as_tuples=True)
+        assert records == expected[1050:1075]
+        assert max(limits) <= 125
+
+        last = sharded_db.search_with_filters(page=total_pages, per_page=25, as_tuples=True)[0]
+        assert last == expected[(total_pages - 1) * 25:]
+
+        result = sharded_db.search_with_cursor(page=43, per_page=25, sort='time', as_tuples=True)
+        assert result['records'] == expected[1050:1075]
+        assert result['has_prev'] and result['has_next']
+
+    @pytest.mark.parametrize('sort', ['id', 'time'])
+    def test_cursor_walk_matches_merged_order(self, sharded_db, shard_dir, sort):
+        """测试沿游标遍历所有页得到完整的归并结果，上一页游标返回上一页"""
+        merge_key = sharded_db._merge_key(sort)
+        expected = sorted(all_rows(shard_dir, "WHERE direction = 4"), key=merge_key)
+
+        pages = [sharded_db.search_with_cursor(direction_filter='4', per_page=100, sort=sort, as_tuples=True)]
+        while pages[-1]['next_cursor']:
+            pages.append(sharded_db.search_with_cursor(direction_filter='4', after=pages[-1]['next_cursor'],
+                                                       per_page=100, sort=sort, as_tuples=True))
+        assert [row for page in pages for row in page['records']] == expected
+
+        back = sharded_db.search_with_cursor(direction_filter='4', before=pages[2]['prev_cursor'],
+                                             per_page=100, sort=sort, as_tuples=True)
+        assert back['records'] == pages[1]['records']
+        assert back['has_prev'] is True
+
+    def test_single_database_cursor_rejected(self, sharded_db):
+        """测试单库游标不能用于分片数据库"""
+        with pytest.raises(ValueError):
+            sharded_db.search_with_cursor(after='eyJzIjoiaWQiLCJrIjpbNV19', sort='id')
+
+    def test_plate_lookups(self, sharded_db, shard_dir):
+        """测试车牌查询和前缀搜索合并各路口"""
+        rows = all_rows(shard_dir)
+        plate = rows[0][3]
+        passages = sharded_db.find_by_plate(plate)
+        assert [(record['intersection'], record['id']) for record in passages] == \
+            [(row[4], row[0]) for row in sorted((row for row in rows if row[3] == plate),
+                                                key=lambda row: (row[2], row[4], row[0]))]
+
+        matches = sharded_db.search_plates('粤B0', limit=5)
+        expected_plates = sorted({row[3] for row in rows if row[3].startswith('粤B0')})[:5]
+        assert [match['plate'] for match in matches] == expected_plates
+        assert matches[0]['passages'] == sum(1 for row in rows if row[3] == expected_plates[0])
+
+    def test_intersection_subset(self, shard_dir):
+        """测试只查询指定的路口"""
+        db = get_database(shard_dir, pooled=True, intersections=('south_gate',))
+        assert db.connect()
+        try:
+            records, total_records, _ = db.search_with_filters(per_page=10, as_tuples=True)
+        finally:
+            db.disconnect()
+        assert total_records == 2000
+        assert {row[4] for row in records} == {'south_gate'}
+
+
+class TestShardedApi:
+    """分片部署的接口测试类"""
+
+    @pytest.fixture
+    def client(self, shard_dir, monkeypatch):
+        """创建指向分片目录的测试客户端"""
+        monkeypatch.setenv('TRAFFIC_DB_PATH', shard_dir)
+        monkeypatch.setattr(shards_module, 'SHARD_WORKERS', 1)
+        from app import app
+        app.config['TESTING'] = True
+        with app.test_client() as client:
+            yield client
+
+    def test_traffic_data_with_intersection(self, client):
+        """测试数据接口按路口筛选，记录包含所属路口"""
+        payload = client.get('/api/traffic-data?intersection=north_gate,east_gate&mode=cursor').get_json()
+        assert payload['success']
+        assert payload['pagination']['total_records'] == 2500
+        assert {record['intersection'] for record in payload['data']} <= {'north_gate', 'east_gate'}
+
+        columns = client.get('/api/traffic-data?format=columns').get_json()
+        assert columns['data']['columns'][-1] == 'intersection'
+
+    def test_invalid_intersection(self, client):
+        """测试不存在的路口返回400"""
+        response = client.get('/api/pie-chart?intersection=west_gate')
+        assert response.status_code == 400
+        assert response.get_json()['success'] is False
+
+    def test_dashboard_and_stream(self, client):
+        """测试多个路口时不提供实时推送，单个路口时可以订阅"""
+        dashboard = client.get('/api/dashboard').get_json()
+        assert dashboard['live'] is False
+        assert dashboard['last_id'] is None
+        assert client.get('/api/stream').status_code == 400
+
+        single = client.get('/api/dashboard?intersection=east_gate').get_json()
+        assert single['live'] is True
+        assert single['last_id'] == 1000
+        assert sum(single['charts']['pie']['chart_data']['data'][0]['values']) == 1000
+
+    def test_export_includes_intersection(self, client):
+        """测试导出文件包含路口列"""
+        response = client.get('/api/traffic-data/export?intersection=south_gate&direction=1')
+        lines = response.get_data(as_text=True).splitlines()
+        assert lines[0].endswith(',intersection')
+        assert all(line.endswith(',south_gate') for line in lines[1:])
+
+    def test_intersection_requires_shards(self, sample_db_path, monkeypatch):
+        """测试未使用分片目录时指定路口返回400"""
+        monkeypatch.setenv('TRAFFIC_DB_PATH', sample_db_path)
+        from app import app
+        with app.test_client() as client:
+            assert client.get('/api/traffic-data?intersection=east_gate').status_code == 400
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+测试内存映射列式快照 - pytest版本
+"""
+
+import os
+
+import numpy as np
+
+from utils import analytics as analytics_module
+from utils.analytics import ColumnarAnalytics, discard_analytics_engine, get_analytics_engine
+from utils.snapshot import export_snapshot, load_snapshot, default_snapshot_path
+
+
+class TestColumnSnapshot:
+    """列式快照测试类"""
+    
+    def test_export_and_load(self, sample_db):
+        """测试导出后按列读取，数据与数据库一致"""
+        path = export_snapshot(sample_db.db_path)
+        assert path == default_snapshot_path(sample_db.db_path)
+        
+        snapshot = load_snapshot(path)
+        rows = sample_db.connection.execute("SELECT id, time, direction, plate FROM traffic ORDER BY id").fetchall()
+        
+        assert snapshot.row_count == 3000
+        assert snapshot.max_id == 3000
+        assert snapshot['id'].tolist() == [row[0] for row in rows]
+        assert snapshot['time'].tolist() == [row[1] for row in rows]
+        assert snapshot['direction'].tolist() == [row[2] for row in rows]
+        assert [snapshot.plate(index) for index in snapshot['plate_index'][:50]] == [row[3] for row in rows[:50]]
+    
+    def test_columns_are_memory_mapped(self, sample_db):
+        """测试列数组直接引用映射的内存（只读、不复制）"""
+        snapshot = load_snapshot(export_snapshot(sample_db.db_path))
+        column = snapshot['time']
+        assert not column.flags.writeable
+        assert not column.flags.owndata
+    
+    def test_invalid_file_is_ignored(self, tmp_path):
+        """测试格式不正确的文件返回None"""
+        path = tmp_path / 'broken.columns'
+        path.write_bytes(b'not a snapshot')
+        assert load_snapshot(str(path)) is None
+        assert load_snapshot(str(tmp_path / 'missing.columns')) is None
+    
+    def test_engine_uses_snapshot_and_tail(self, sample_db):
+        """测试分析引擎映射快照后只从数据库加载快照之后的新记录"""
+        expected = ColumnarAnalytics(sample_db.db_path, snapshot_path='/nonexistent')
+        export_snapshot(sample_db.db_path)
+        sample_db.connection.execute("INSERT INTO traffic (direction, time, plate) VALUES (4, 1741000000, 'X')")
+        
+        engine = ColumnarAnalytics(sample_db.db_path)
+        assert engine.sync(sample_db.connection) == 1
+        expected.sync(sample_db.connection)
+        assert engine.aggregate(['hour', 'weekday']) == expected.aggregate(['hour', 'weekday'])
+        assert isinstance(engine._base[0], np.ndarray) and not engine._base[0].flags.owndata
+    
+    def test_stale_snapshot_is_ignored(self, sample_db):
+        """测试快照中的记录已被删除时忽略快照、从数据库重新加载"""
+        export_snapshot(sample_db.db_path)
+        sample_db.connection.execute("DELETE FROM traffic WHERE id <= 100")
+        
+        engine = ColumnarAnalytics(sample_db.db_path)
+        assert engine.sync(sample_db.connection) == 2900
+        assert engine._base is None
+        
+        sample_db.connection.execute("DELETE FROM traffic WHERE id BETWEEN 1000 AND 1099")
+        assert ColumnarAnalytics(sample_db.db_path).sync(sample_db.connection) == 2800
+    
+    def test_discard_engine_and_snapshot(self, sample_db):
+        """测试丢弃引擎时删除过期的快照"""
+        path = export_snapshot(sample_db.db_path)
+        engine = get_analytics_engine(sample_db.db_path)
+        discard_analytics_engine(sample_db.db_path, remove_snapshot=True)
+        
+        assert sample_db.db_path not in analytics_module._engines
+        assert not os.path.exists(path)
+        assert get_analytics_engine(sample_db.db_path) is not engine
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+测试时间窗口（start/end）筛选 - pytest版本
+"""
+
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+from utils import database as database_module
+from utils.database import LOCAL_HOUR_SQL, LOCAL_TZ, parse_time_bound
+
+from conftest import SAMPLE_START_TIME
+
+# 合成数据第2天到第4天（2025-03-04 00:00 ~ 2025-03-07 00:00，北京时间）
+WINDOW_START = SAMPLE_START_TIME + 86400
+WINDOW_END = SAMPLE_START_TIME + 4 * 86400
+
+
+def local_hour(timestamp):
+    """按统计时区计算本地小时"""
+    return datetime.fromtimestamp(timestamp, tz=LOCAL_TZ).hour
+
+
+class TestParseTimeBound:
+    """时间参数解析测试类"""
+
+    def test_timestamp(self):
+        """测试Unix时间戳"""
+        assert parse_time_bound('1741017600') == 1741017600.0
+        assert parse_time_bound(1741017600.5) == 1741017600.5
+
+    def test_empty(self):
+        """测试空值表示不限"""
+        assert parse_time_bound(None) is None
+        assert parse_time_bound('  ') is None
+
+    def test_date_in_local_timezone(self):
+        """测试日期按统计时区解析，结束日期包含当天"""
+        assert parse_time_bound('2025-03-04') == WINDOW_START
+        assert parse_time_bound('2025-03-06', is_end=True) == WINDOW_END
+
+    def test_iso_datetime(self):
+        """测试ISO格式时间（带时区时按给定时区）"""
+        assert parse_time_bound('2025-03-04T08:00:00') == WINDOW_START + 8 * 3600
+        assert parse_time_bound('2025-03-04T00:00:00+00:00', is_end=True) == WINDOW_START + 8 * 3600
+
+    @pytest.mark.parametrize('value', ['yesterday', '2025-13-01', 'nan', 'inf'])
+    def test_invalid(self, value):
+        """测试无法解析的参数"""
+        with pytest.raises(ValueError):
+            parse_time_bound(value)
+
+
+@pytest.mark.usefixtures('clear_count_cache')
+class TestWindowQueries:
+    """数据库时间窗口查询测试类"""
+
+    def expected_rows(self, db, direction=None):
+        """直接读取窗口内的记录 [(id, direction, time)]"""
+        rows = db.connection.execute("SELECT id, direction, time FROM traffic ORDER BY id").fetchall()
+        return [tuple(row) for row in rows
+                if WINDOW_START <= row['time'] < WINDOW_END and direction in (None, row['direction'])]
+
+    def test_count_and_search(self, sample_db):
+        """测试计数、OFFSET分页和游标分页只返回窗口内的记录"""
+        expected = self.expected_rows(sample_db, direction=2)
+
+        total, is_estimate = sample_db.count_with_filters('', '2', start=WINDOW_START, end=WINDOW_END)
+        assert (total, is_estimate) == (len(expected), False)
+
+        records, total_records, _ = sample_db.search_with_filters('', '2', page=1, per_page=50,
+                                                                  start=WINDOW_START, end=WINDOW_END)
+        assert total_records == len(expected)
+        assert {record['id'] for record in records} <= {row[0] for row in expected}
+
+        result = sample_db.search_with_cursor('', '2', page=1, per_page=50, start=WINDOW_START, end=WINDOW_END)
+        assert [record['id'] for record in result['records']] == [row[0] for row in expected[:50]]
+
+        following = sample_db.search_with_cursor('', '2', after=result['next_cursor'], per_page=50,
+                                                 start=WINDOW_START, end=WINDOW_END)
+        assert [record['id'] for record in following['records']] == [row[0] for row in expected[50:100]]
+
+    def test_aggregates(self, sample_db):
+        """测试三个图表聚合只统计窗口内的记录"""
+        expected = self.expected_rows(sample_db)
+
+        distribution = sample_db.get_direction_distribution(start=WINDOW_START, end=WINDOW_END)
+        assert sum(distribution.values()) == len(expected)
+
+        hourly = sample_db.get_hourly_traffic_trend('3', start=WINDOW_START, end=WINDOW_END)
+        for hour in range(24):
+            assert hourly[hour] == sum(1 for _, direction, timestamp in expected
+                                       if direction == 3 and local_hour(timestamp) == hour)
+
+    def test_open_ended_window(self, sample_db):
+        """测试只指定一端的窗口"""
+        total = sample_db.connection.execute("SELECT COUNT(*) FROM traffic").fetchone()[0]
+        before, _ = sample_db.count_with_filters(end=WINDOW_START)
+        after, _ = sample_db.count_with_filters(start=WINDOW_START)
+        assert before + after == total
+        assert before > 0 and after > 0
+
+    def test_rollup_not_used_for_window(self, sample_db):
+        """测试存在汇总表时窗口查询仍然精确"""
+        assert sample_db.refresh_rollup() >= 0
+        expected = self.expected_rows(sample_db)
+
+        assert sum(sample_db.get_direction_distribution(start=WINDOW_START, end=WINDOW_END).values()) == len(expected)
+        assert sample_db.count_with_filters(start=WINDOW_START, end=WINDOW_END) == (len(expected), False)
+
+    def test_shared_aggregates_per_window(self, sample_db):
+        """测试共享统计按时间窗口区分"""
+        expected = {
+            'all': sample_db.get_hourly_traffic_trend(),
+            'window': sample_db.get_hourly_traffic_trend(start=WINDOW_START, end=WINDOW_END),
+            'count': sample_db.count_with_filters('night', '1', start=WINDOW_START, end=WINDOW_END)
+        }
+        database_module._count_cache.clear()
+
+        with sample_db.shared_aggregates():
+            shared = {
+                'all': sample_db.get_hourly_traffic_trend(),
+                'window': sample_db.get_hourly_traffic_trend(start=WINDOW_START, end=WINDOW_END),
+                'count': sample_db.count_with_filters('night', '1', start=WINDOW_START, end=WINDOW_END)
+            }
+
+        assert shared == expected
+        assert expected['all'] != expected['window']
+
+    def test_index_range_scan(self, sample_db):
+        """测试建立索引后窗口查询为索引范围扫描"""
+        assert sample_db.create_search_indexes()
+
+        plan = ' '.join(row[3] for row in sample_db.connection.execute(
+            f"EXPLAIN QUERY PLAN SELECT {LOCAL_HOUR_SQL}, direction, COUNT(*) FROM traffic "
+            "WHERE time >= ? AND time < ? GROUP BY 1, 2", (WINDOW_START, WINDOW_END)))
+        assert 'COVERING INDEX idx_traffic_time' in plan
+
+        # 只读连接同样可以使用索引
+        readonly = sqlite3.connect(f"file:{sample_db.db_path}?mode=ro", uri=True)
+        try:
+            plan = ' '.join(row[3] for row in readonly.execute(
+                "EXPLAIN QUERY PLAN SELECT COUNT(*) FROM traffic WHERE time >= ? AND time < ?",
+                (WINDOW_START, WINDOW_END)))
+        finally:
+            readonly.close()
+        assert 'idx_traffic_time' in plan
+
+
+class TestWindowApi:
+    """时间窗口接口测试类"""
+
+    def test_dashboard_window(self, client):
+        """测试仪表盘的图表和表格都限定在窗口内"""
+        response = client.get('/api/dashboard?start=2025-03-04&end=2025-03-06&mode=cursor')
+        data = response.get_json()
+        assert response.status_code == 200
+
+        pie_total = sum(data['charts']['pie']['chart_data']['data'][0]['values'])
+        trend_total = sum(data['charts']['trend']['chart_data']['data'][0]['y'])
+        assert data['table']['pagination']['total_records'] == pie_total == trend_total
+        assert data['filters']['start'] == WINDOW_START
+        assert data['filters']['end'] == WINDOW_END
+        assert all(WINDOW_START <= record['time'] < WINDOW_END for record in data['table']['data'])
+        assert '时间窗口' in data['table']['search_info']
+
+        full = client.get('/api/dashboard?mode=cursor').get_json()
+        assert full['table']['pagination']['total_records'] > pie_total
+
+    def test_chart_routes_accept_window(self, client):
+        """测试各图表接口接受时间窗口并分别缓存"""
+        for route in ['/api/pie-chart', '/api/trend-chart', '/api/weekday-weekend-chart']:
+            windowed = client.get(f'{route}?start={WINDOW_START}&end={WINDOW_END}').get_json()
+            full = client.get(route).get_json()
+            assert windowed['success'] and full['success']
+            assert windowed['chart_data'] != full['chart_data']
+
+    def test_estimate_with_narrow_window(self, client, sample_db, monkeypatch):
+        """测试估算模式下窄时间窗口精确计数，不因抽样未命中返回空页"""
+        monkeypatch.setattr(database_module, 'ESTIMATE_SAMPLE_IDS', 100)
+        monkeypatch.setattr(database_module, 'ESTIMATE_SAMPLE_WINDOWS', 10)
+        start, end = WINDOW_START + 8 * 3600, WINDOW_START + 8 * 3600 + 1800
+        expected = sample_db.connection.execute(
+            "SELECT COUNT(*) FROM traffic WHERE time >= ? AND time < ?", (start, end)).fetchone()[0]
+        assert expected > 0
+
+        for mode in ('offset', 'cursor'):
+            data = client.get(f'/api/traffic-data?estimate=1&start={start}&end={end}&mode={mode}').get_json()
+            assert data['pagination']['total_records'] == expected
+            assert data['pagination']['is_estimate'] is False
+            assert data['data']
+
+    @pytest.mark.parametrize('query', ['start=someday', 'start=2025-03-05&end=2025-03-04'])
+    def test_invalid_window(self, client, query):
+        """测试无效的时间窗口返回400"""
+        for route in ['/api/traffic-data', '/api/dashboard', '/api/pie-chart']:
+            response = client.get(f'{route}?{query}')
+            assert response.status_code == 400
+            assert response.get_json()['success'] is False
@@ -0,0 +1,414 @@
+#!/usr/bin/env python3
+"""
+列式内存分析引擎
+把traffic表的 time、direction 两列以NumPy数组的形式常驻内存，
+用向量化的bincount回答图表所需的聚合查询
+
+启用方式：设置环境变量 TRAFFIC_ANALYTICS_BACKEND=numpy
+TrafficDatabase的三个聚合方法会自动改用本引擎，结果与SQL路径完全一致。
+存在列式快照（见utils/snapshot.py）时直接映射快照中的列，只从SQLite读取快照之后的新记录。
+
+用法：
+    python -m utils.analytics snapshot   # 导出列式快照，加快下次启动
+    python -m utils.analytics verify     # 校验NumPy结果与SQL结果逐字节一致
+"""
+
+import os
+import sys
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import List, Optional
+
+import numpy as np
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from utils.constants import TIME_RANGE_HOURS, TIMEZONE_OFFSET_HOURS
+
+logger = logging.getLogger(__name__)
+
+# 与SQLite日期函数保持一致的常量
+# SQLite把Unix时间转换为儒略日毫秒数：(int)(t*1000 + 210866760000000 + 0.5)
+_JULIAN_EPOCH_MS = 210866760000000.0
+_MS_PER_HOUR = 3600000
+_MS_PER_DAY = 86400000
+# 1970-01-01是周四（%w: 0=周日）
+_EPOCH_WEEKDAY = 4
+
+# 每次从SQLite读取的行数
+_LOAD_CHUNK_ROWS = 500000
+
+# 核对已加载记录数（COUNT(*)，发现中间的记录被删除）的最小间隔（秒）；
+# 最小/最大id在每次同步时都会核对（发现归档、删除最早或最新的记录）
+ROW_COUNT_CHECK_SECONDS = 300
+
+# 分组维度的取值个数（方向以int8存储，预留0-127）
+_GROUP_SIZES = {'hour': 24, 'weekday': 7}
+_DIRECTION_SLOTS = 128
+
+# 方向列中的特殊取值：NULL（与SQL相同，按方向分组时单独成组）；
+# 超出0-127的方向（按方向分组和方向筛选时不计入，小时/星期统计照常计入）
+DIRECTION_NULL = -1
+DIRECTION_UNSUPPORTED = -2
+
+# 时间为NULL的记录的本地小时/星期（与SQL相同，按小时或星期分组时单独成组，不匹配任何时间段）
+LOCAL_TIME_NULL = -1
+
+
+def encode_directions(values: np.ndarray) -> np.ndarray:
+    """
+    把方向值转换为int8存储（NULL和超出范围的值转换为特殊取值）
+
+    Args:
+        values: 方向数组（float64，NULL为NaN）
+
+    Returns:
+        np.ndarray: 方向数组 int8
+    """
+    supported = (values >= 0) & (values < _DIRECTION_SLOTS) & (values == np.floor(values))
+    directions = np.where(supported, values, DIRECTION_UNSUPPORTED)
+    directions[np.isnan(values)] = DIRECTION_NULL
+    unsupported = int(np.count_nonzero(directions == DIRECTION_UNSUPPORTED))
+    if unsupported:
+        logger.warning("⚠️ %d 条记录的方向超出0-%d，按方向统计时不计入", unsupported, _DIRECTION_SLOTS - 1)
+    return directions.astype(np.int8)
+
+
+def local_hour_weekday(times: np.ndarray, offset_minutes: int) -> tuple:
+    """
+    按固定时区计算本地小时和星期几，舍入方式与SQLite完全相同
+
+    Args:
+        times: Unix时间戳数组（float64）
+        offset_minutes: 时区偏移（分钟）
+
+    Returns:
+        tuple: (小时数组 int8, 星期数组 int8，0=周日)；时间为NULL（NaN）时两者都为 LOCAL_TIME_NULL
+    """
+    valid = np.isfinite(times)
+    julian_ms = np.trunc(np.where(valid, times, 0.0) * 1000.0 + _JULIAN_EPOCH_MS + 0.5).astype(np.int64)
+    local_ms = julian_ms - int(_JULIAN_EPOCH_MS) + offset_minutes * 60000
+    hours = np.where(valid, (local_ms % _MS_PER_DAY) // _MS_PER_HOUR, LOCAL_TIME_NULL)
+    weekdays = np.where(valid, (local_ms // _MS_PER_DAY + _EPOCH_WEEKDAY) % 7, LOCAL_TIME_NULL)
+    return hours.astype(np.int8), weekdays.astype(np.int8)
+
+
+class ColumnarAnalytics:
+    """time/direction 列的内存分析引擎"""
+
+    def __init__(self, db_path: str, snapshot_path: Optional[str] = None):
+        """
+        初始化引擎（数据在首次sync时加载）
+
+        Args:
+            db_path: 数据库文件路径
+            snapshot_path: 列式快照路径，默认与数据库同目录
+        """
+        from utils.snapshot import default_snapshot_path
+
+        self.db_path = db_path
+        self.snapshot_path = snapshot_path or default_snapshot_path(db_path)
+        self.offset_minutes = int(round(TIMEZONE_OFFSET_HOURS * 60))
+        self.max_id = 0
+        # 已加载的最小id（没有数据时为None），用于发现归档或删除
+        self.min_id = None
+        self._verified_at = 0.0
+        # 数据分为两段：快照段（内存映射，多进程共享）和增量段（快照之后的新记录）
+        # 每段为 (小时, 星期, 方向) 三个数组
+        self._base = None
+        self._tail = None
+        self._lock = threading.Lock()
+        self._snapshot_checked = False
+
+    @property
+    def row_count(self) -> int:
+        """已加载的记录数"""
+        return sum(len(segment[0]) for segment in self._segments())
+
+    def _segments(self) -> list:
+        """返回非空的数据段"""
+        return [segment for segment in (self._base, self._tail) if segment is not None]
+
+    def _load_snapshot(self, connection: sqlite3.Connection, min_id: Optional[int]) -> None:
+        """映射列式快照（时区不一致、与数据库不一致或文件不存在时忽略）"""
+        from utils.snapshot import load_snapshot
+
+        self._snapshot_checked = True
+        snapshot = load_snapshot(self.snapshot_path)
+        if snapshot is None:
+            return
+        if snapshot.tz_offset_minutes != self.offset_minutes:
+            logger.warning("⚠️ 列式快照的时区与当前配置不一致，已忽略")
+            return
+        snapshot_min_id = int(snapshot['id'][0]) if snapshot.row_count else None
+        if snapshot.row_count and (snapshot_min_id != min_id
+                                   or self._count_through(connection, snapshot.max_id) != snapshot.row_count):
+            logger.warning("⚠️ 列式快照包含已删除或已归档的记录，已忽略（请重新执行 python -m utils.snapshot export）")
+            return
+        self._base = (snapshot['local_hour'], snapshot['local_weekday'], snapshot['direction'])
+        self.max_id = snapshot.max_id
+        self.min_id = snapshot_min_id
+        self._verified_at = time.monotonic()
+        logger.info("📦 已映射列式快照：%d 条记录，id ≤ %d", snapshot.row_count, self.max_id)
+
+    def _id_bounds(self, connection: sqlite3.Connection) -> tuple:
+        """数据库当前的 (最小id, 最大id)，没有记录时为 (None, None)"""
+        from utils.database import get_partitions, id_bound_sql
+
+        partitions = get_partitions(connection, self.db_path)
+        cursor = connection.cursor()
+        bounds = []
+        for function in ('MIN', 'MAX'):
+            cursor.execute(id_bound_sql(partitions, function))
+            bounds.append(cursor.fetchone()[0])
+        return tuple(bounds)
+
+    @staticmethod
+    def _count_through(connection: sqlite3.Connection, max_id: int) -> int:
+        """id不超过max_id的记录数"""
+        cursor = connection.cursor()
+        cursor.execute("SELECT COUNT(*) FROM traffic WHERE id <= ?", (max_id,))
+        return cursor.fetchone()[0]
+
+    def _is_stale(self, connection: sqlite3.Connection, min_id: Optional[int], max_id: Optional[int]) -> bool:
+        """已加载的数据是否包含已删除（或归档）的记录"""
+        if not self.max_id:
+            return False
+        if max_id is None or max_id < self.max_id or min_id != self.min_id:
+            return True
+        now = time.monotonic()
+        if now - self._verified_at < ROW_COUNT_CHECK_SECONDS:
+            return False
+        self._verified_at = now
+        return self._count_through(connection, self.max_id) != self.row_count
+
+    def _reset(self) -> None:
+        """丢弃已加载的数据，下次同步时重新核对快照并从头加载"""
+        self._base = None
+        self._tail = None
+        self.max_id = 0
+        self.min_id = None
+        self._snapshot_checked = False
+
+    def sync(self, connection: sqlite3.Connection) -> int:
+        """
+        增量加载id大于已加载位置的新记录
+
+        数据库的最小/最大id与已加载的范围不一致，或（每隔 ROW_COUNT_CHECK_SECONDS 秒核对一次）
+        记录数不一致时，说明有记录被删除或分区被归档，丢弃已加载的数据后重新加载。
+
+        Args:
+            connection: 数据库连接
+
+        Returns:
+            int: 本次加载的记录数
+        """
+        with self._lock:
+            min_id, max_id = self._id_bounds(connection)
+            if self._is_stale(connection, min_id, max_id):
+                logger.info("🧮 数据库中有记录被删除或归档，分析引擎重新加载")
+                self._reset()
+            if not self._snapshot_checked:
+                self._load_snapshot(connection, min_id)
+
+            max_id = max_id or 0
+            if max_id <= self.max_id:
+                return 0
+
+            cursor = connection.cursor()
+            cursor.execute("SELECT time, direction FROM traffic WHERE id > ? AND id <= ? ORDER BY id",
+                           (self.max_id, max_id))
+            hour_chunks, weekday_chunks, direction_chunks = [], [], []
+            while True:
+                rows = cursor.fetchmany(_LOAD_CHUNK_ROWS)
+                if not rows:
+                    break
+                columns = np.array(rows, dtype=np.float64).reshape(-1, 2)
+                hours, weekdays = local_hour_weekday(columns[:, 0], self.offset_minutes)
+                hour_chunks.append(hours)
+                weekday_chunks.append(weekdays)
+                direction_chunks.append(encode_directions(columns[:, 1]))
+
+            loaded = sum(len(chunk) for chunk in hour_chunks)
+            if loaded:
+                if self._tail is not None:
+                    hour_chunks.insert(0, self._tail[0])
+                    weekday_chunks.insert(0, self._tail[1])
+                    direction_chunks.insert(0, self._tail[2])
+                self._tail = (np.concatenate(hour_chunks), np.concatenate(weekday_chunks),
+                              np.concatenate(direction_chunks))
+            if loaded and self.min_id is None:
+                # 从头加载的数据与数据库一致，从此时开始计算核对间隔
+                self.min_id = min_id
+                self._verified_at = time.monotonic()
+            self.max_id = max_id
+            logger.debug("🧮 分析引擎已加载 %d 条新记录，共 %d 条", loaded, self.row_count)
+            return loaded
+
+    def aggregate(self, group_columns: List[str], time_range: str = None,
+                  direction_filter: str = None) -> list:
+        """
+        按本地小时/星期/方向分组计数（与TrafficDatabase._aggregate_counts返回格式相同）
+
+        Args:
+            group_columns: 分组列，取值为 'hour'、'weekday'、'direction'
+            time_range: 时间段筛选
+            direction_filter: 方向筛选 ('1', '2', '3', '4')
+
+        Returns:
+            list: [(分组值..., 数量)] 只包含数量大于0的组合，按分组列排序
+        """
+        with self._lock:
+            segments = self._segments()
+
+        # 各分组列的下标为取值+1，下标0为NULL（与SQL相同排在最前）
+        shape = tuple(_GROUP_SIZES.get(column, _DIRECTION_SLOTS) + 1 for column in group_columns)
+        counts = np.zeros(int(np.prod(shape)), dtype=np.int64)
+        for segment in segments:
+            counts += self._count_segment(segment, group_columns, shape, time_range, direction_filter)
+
+        nonzero = np.flatnonzero(counts)
+        groups = np.unravel_index(nonzero, shape)
+        return [tuple(int(group[i]) - 1 if group[i] else None for group in groups) + (int(counts[position]),)
+                for i, position in enumerate(nonzero)]
+
+    def _count_segment(self, segment: tuple, group_columns: List[str], shape: tuple,
+                       time_range: str, direction_filter: str) -> np.ndarray:
+        """对一个数据段做筛选和bincount"""
+        hours, weekdays, directions = segment
+
+        mask = None
+        if time_range in TIME_RANGE_HOURS:
+            start_hour, end_hour = TIME_RANGE_HOURS[time_range]
+            # 按 小时+1 查表，下标0（时间为NULL）不属于任何时间段
+            hour_lookup = np.zeros(25, dtype=bool)
+            if start_hour <= end_hour:
+                hour_lookup[start_hour + 1:end_hour + 2] = True
+            else:
+                hour_lookup[start_hour + 1:] = True
+                hour_lookup[1:end_hour + 2] = True
+            mask = hour_lookup[hours.astype(np.int16) + 1]
+        if direction_filter and direction_filter.strip():
+            value = int(direction_filter)
+            if 0 <= value < _DIRECTION_SLOTS:
+                direction_mask = directions == value
+            else:
+                direction_mask = np.zeros(len(directions), dtype=bool)
+            mask = direction_mask if mask is None else mask & direction_mask
+        if 'direction' in group_columns:
+            supported = directions != DIRECTION_UNSUPPORTED
+            mask = supported if mask is None else mask & supported
+
+        values = {'hour': hours, 'weekday': weekdays, 'direction': directions}
+
+        # 把多个分组列合并为一个整数下标，一次bincount完成统计
+        combined = np.zeros(len(hours), dtype=np.int64)
+        for column, size in zip(group_columns, shape):
+            combined = combined * size + values[column] + 1
+        if mask is not None:
+            combined = combined[mask]
+        return np.bincount(combined, minlength=int(np.prod(shape)))
+
+
+# 引擎注册表 {数据库路径: ColumnarAnalytics}，同一进程内共享
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def get_analytics_engine(db_path: str) -> ColumnarAnalytics:
+    """获取（按需创建）指定数据库的分析引擎"""
+    with _engines_lock:
+        engine = _engines.get(db_path)
+        if engine is None:
+            engine = ColumnarAnalytics(db_path)
+            _engines[db_path] = engine
+        return engine
+
+
+def discard_analytics_engine(db_path: str, remove_snapshot: bool = False) -> None:
+    """
+    丢弃指定数据库的分析引擎（下次使用时重新核对快照并加载）
+
+    Args:
+        db_path: 数据库文件路径
+        remove_snapshot: 是否同时删除列式快照（快照包含已删除的记录时）
+    """
+    with _engines_lock:
+        engine = _engines.pop(db_path, None)
+    if not remove_snapshot:
+        return
+
+    from utils.snapshot import default_snapshot_path
+
+    path = engine.snapshot_path if engine is not None else default_snapshot_path(db_path)
+    if os.path.exists(path):
+        # 已映射该文件的进程不受影响，引擎核对时会发现快照过期并丢弃
+        os.remove(path)
+        logger.info("🗑️ 已删除过期的列式快照: %s", path)
+
+
+def verify(db_path: str = None) -> bool:
+    """
+    校验NumPy引擎与SQL路径在所有筛选组合下的结果逐字节一致
+
+    Args:
+        db_path: 数据库文件路径
+
+    Returns:
+        bool: 是否完全一致
+    """
+    from utils import database
+    from utils.constants import DIRECTION_MAP
+
+    def collect(backend):
+        database.ANALYTICS_BACKEND = backend
+        db = database.get_database(db_path)
+        if not db.connect():
+            raise SystemExit(1)
+        try:
+            results = {}
+            for time_range in [None] + list(TIME_RANGE_HOURS):
+                results[f'direction:{time_range}'] = db.get_direction_distribution(time_range=time_range)
+            for direction in [None] + [str(direction) for direction in DIRECTION_MAP]:
+                results[f'hourly:{direction}'] = db.get_hourly_traffic_trend(direction_filter=direction)
+                results[f'weekday:{direction}'] = db.get_hourly_traffic_trend_by_weekday(direction_filter=direction)
+            return {key: json.dumps(value, sort_keys=True) for key, value in results.items()}
+        finally:
+            db.disconnect()
+
+    original_backend = database.ANALYTICS_BACKEND
+    try:
+        sql_results = collect('sql')
+        numpy_results = collect('numpy')
+    finally:
+        database.ANALYTICS_BACKEND = original_backend
+
+    mismatched = [key for key in sql_results if sql_results[key] != numpy_results[key]]
+    for key in mismatched:
+        logger.error("❌ 结果不一致: %s", key)
+    if not mismatched:
+        logger.info("✅ NumPy引擎与SQL结果完全一致（%d 组查询）", len(sql_results))
+    return not mismatched
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="列式内存分析引擎工具")
+    parser.add_argument('command', choices=['snapshot', 'verify'], help='snapshot: 保存列数据快照；verify: 校验结果一致性')
+    parser.add_argument('--db', default=None, help='数据库文件路径')
+    args = parser.parse_args()
+
+    from utils.metrics import configure_logging
+    configure_logging()
+
+    if args.command == 'snapshot':
+        from utils.database import resolve_db_path
+        from utils.snapshot import export_snapshot
+        export_snapshot(resolve_db_path(args.db))
+    else:
+        sys.exit(0 if verify(args.db) else 1)
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+响应缓存模块
+为图表接口提供带TTL和LRU淘汰的内存缓存，缓存键包含数据版本，
+traffic表写入新数据后旧的缓存条目自动失效；
+SingleFlight把相同的并发调用合并为一次执行
+"""
+
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+
+class ResponseCache:
+    """线程安全的 LRU + TTL 缓存"""
+    
+    def __init__(self, max_entries: int = 128, ttl: float = 300.0):
+        """
+        初始化缓存
+        
+        Args:
+            max_entries: 最大缓存条目数，超出后淘汰最久未使用的条目
+            ttl: 条目有效期（秒），0表示不过期
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # 统计信息
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+    
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        读取缓存条目
+        
+        Args:
+            key: 缓存键
+            default: 未命中时的返回值
+            
+        Returns:
+            Any: 缓存的值或default
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self._hits += 1
+                    return value
+                # 已过期
+                del self._entries[key]
+                self._expirations += 1
+            self._misses += 1
+            return default
+    
+    def set(self, key: Hashable, value: Any) -> None:
+        """
+        写入缓存条目
+        
+        Args:
+            key: 缓存键
+            value: 缓存的值
+        """
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+    
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """
+        读取缓存，未命中时调用compute计算并写入缓存
+        
+        Args:
+            key: 缓存键
+            compute: 计算函数
+            
+        Returns:
+            Any: 缓存或新计算的值
+        """
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            value = compute()
+            self.set(key, value)
+        return value
+    
+    def clear(self) -> None:
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+    
+    def stats(self) -> dict:
+        """
+        获取缓存统计信息
+        
+        Returns:
+            dict: 条目数、命中/未命中次数、命中率、淘汰和过期次数
+        """
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': round(self._hits / lookups, 4) if lookups else 0.0,
+                'evictions': self._evictions,
+                'expirations': self._expirations
+            }
+
+
+class _Call:
+    """一次正在执行的调用"""
+    
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    合并相同的并发调用（single-flight）
+    
+    同一个键同一时刻只执行一次，执行期间到达的相同调用等待并共享其结果（或异常）；
+    执行结束后不保留结果，之后的调用重新执行。
+    """
+    
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        # 统计信息
+        self._total = 0
+        self._executions = 0
+        self._collapsed = 0
+        self._max_waiters = 0
+    
+    def do(self, key: Hashable, func: Callable[[], Any]) -> Any:
+        """
+        执行func，相同键的调用正在执行时等待并返回其结果
+        
+        Args:
+            key: 调用键
+            func: 实际执行的函数
+            
+        Returns:
+            Any: func的返回值（与同时执行的调用共享同一个对象）
+        """
+        with self._lock:
+            self._total += 1
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self._collapsed += 1
+                self._max_waiters = max(self._max_waiters, call.waiters)
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self._executions += 1
+                leader = True
+        
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        
+        try:
+            call.result = func()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+    
+    def stats(self) -> dict:
+        """
+        获取合并统计信息
+        
+        Returns:
+            dict: 调用总数、实际执行次数、被合并的调用数、合并率、执行中的调用数、最大等待数
+        """
+        with self._lock:
+            return {
+                'calls': self._total,
+                'executions': self._executions,
+                'collapsed': self._collapsed,
+                'collapse_rate': round(self._collapsed / self._total, 4) if self._total else 0.0,
+                'in_flight': len(self._calls),
+                'max_waiters': self._max_waiters
+            }
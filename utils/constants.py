@@ -4,6 +4,12 @@
 统一管理系统中使用的各种常量和映射关系
 """
 
+import os
+
+# 统计使用的固定时区（相对UTC的小时偏移，默认北京时间UTC+8）
+# 可通过环境变量 TRAFFIC_TZ_OFFSET_HOURS 修改，不再依赖服务器的本地时区
+TIMEZONE_OFFSET_HOURS = float(os.environ.get('TRAFFIC_TZ_OFFSET_HOURS', '8'))
+
 # 时间段映射 - 将时间段代码映射为中文描述
 TIME_RANGE_MAP = {
     'morning': '早高峰 (07:00-09:00)',
@@ -13,6 +19,16 @@ TIME_RANGE_MAP = {
     'night': '夜间时段 (20:00-06:00)'
 }
 
+# 时间段对应的本地小时范围 (起始小时, 结束小时)，均为闭区间
+# 起始小时大于结束小时表示跨越午夜（如夜间 20:00-06:00）
+TIME_RANGE_HOURS = {
+    'morning': (7, 8),
+    'noon': (11, 12),
+    'afternoon': (14, 16),
+    'evening': (17, 18),
+    'night': (20, 5)
+}
+
 # 方向映射 - 将方向代码映射为中文描述
 DIRECTION_MAP = {
     1: '北往南', 
@@ -6,26 +6,529 @@
 
 import sqlite3
 import os
-from typing import List, Dict, Optional
+import json
+import math
+import base64
+import time
+import queue
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone, timedelta
+from typing import Iterator, List, Dict, Optional
 
 # 在作为模块运行时使用相对导入，作为脚本运行时使用绝对导入
 try:
-    from .constants import get_time_text, get_direction_text
+    from .constants import get_time_text, get_direction_text, TIME_RANGE_HOURS, TIMEZONE_OFFSET_HOURS
+    from .cache import ResponseCache, SingleFlight
+    from .metrics import configure_logging, instrument_methods
+    from .profiling import ProfiledConnection, connection_factory
 except ImportError:
-    from constants import get_time_text, get_direction_text
+    from constants import get_time_text, get_direction_text, TIME_RANGE_HOURS, TIMEZONE_OFFSET_HOURS
+    from cache import ResponseCache, SingleFlight
+    from metrics import configure_logging, instrument_methods
+    from profiling import ProfiledConnection, connection_factory
+
+logger = logging.getLogger(__name__)
+
+# 固定时区偏移（分钟），用于SQLite的日期修饰符
+TIMEZONE_OFFSET_MINUTES = int(round(TIMEZONE_OFFSET_HOURS * 60))
+_TZ_MODIFIER = f"'{TIMEZONE_OFFSET_MINUTES:+d} minutes'"
+
+# 本地时间的SQL表达式（按固定时区实时计算）
+LOCAL_HOUR_SQL = f"CAST(strftime('%H', datetime(time, 'unixepoch', {_TZ_MODIFIER})) AS INTEGER)"
+LOCAL_WEEKDAY_SQL = f"CAST(strftime('%w', datetime(time, 'unixepoch', {_TZ_MODIFIER})) AS INTEGER)"
+LOCAL_DATE_SQL = f"date(time, 'unixepoch', {_TZ_MODIFIER})"
+
+# 统计时区（解析不带时区的日期/时间参数）
+LOCAL_TZ = timezone(timedelta(minutes=TIMEZONE_OFFSET_MINUTES))
+
+# 迁移后traffic表上预先计算好的本地时间列
+LOCAL_TIME_COLUMNS = {
+    'local_hour': ('INTEGER', LOCAL_HOUR_SQL),
+    'local_weekday': ('INTEGER', LOCAL_WEEKDAY_SQL),
+    'local_date': ('TEXT', LOCAL_DATE_SQL)
+}
+
+# 本地时间列上的复合索引（id是rowid，会隐式附加在每个索引的末尾）
+LOCAL_TIME_INDEXES = {
+    'idx_traffic_direction_local_hour': '(direction, local_hour)',
+    'idx_traffic_local_hour_weekday': '(local_hour, local_weekday, direction)'
+}
+
+# 查询使用的索引（python -m utils.database index 建立）：
+# - idx_traffic_time: 按time范围定位，direction一并放入索引，窗口内的图表聚合（本地小时/星期由time计算）无需回表
+# - idx_traffic_plate_time_direction: 车牌查询和车牌前缀搜索，与批量导入的去重索引相同（见utils/ingest.py）
+SEARCH_INDEXES = {
+    'idx_traffic_time': '(time, direction)',
+    'idx_traffic_plate_time_direction': '(plate, time, direction)'
+}
+
+# 车牌查询返回的最大记录数
+PLATE_LOOKUP_MAX_LIMIT = 1000
+
+# 表格每页记录数的默认值和上限（/api/traffic-data 的 per_page 参数）
+DEFAULT_PER_PAGE = 20
+MAX_PER_PAGE = 1000
+
+# 接口返回的记录列（as_tuples=True 时元组按此顺序）
+RECORD_COLUMNS = ('id', 'direction', 'time', 'plate')
+
+# 导出的列和每批从游标取出的记录数
+EXPORT_COLUMNS = RECORD_COLUMNS
+EXPORT_BATCH_ROWS = 10000
+
+# 游标分页支持的排序键 - 排序名称映射为参与比较的列（最后一列必须唯一）
+CURSOR_SORT_KEYS = {
+    'id': ('id',),
+    'time': ('time', 'id')
+}
+
+# 稀疏页边界索引的步长：每隔多少页记录一次起始位置
+# 跳页时最多只需跳过 (PAGE_INDEX_STRIDE - 1) * per_page 条记录
+PAGE_INDEX_STRIDE = 100
+
+# 页边界索引缓存 {(数据库路径, 筛选条件, 排序, 每页条数): (最小id, 最大id, 边界列表, 已编号的匹配记录数)}
+# per_page可由请求指定，按LRU限制条目数
+_page_index_cache = ResponseCache(max_entries=64, ttl=0)
+
+# 页锚点缓存 {(数据库路径, 筛选条件, 排序, 每页条数, 数据版本, 页码): 该页第一条记录之前的排序键}
+# 每次返回一页后记录本页和下一页的锚点，相邻页按页码请求时直接从锚点定位，
+# 不再经过页边界索引和OFFSET；锚点只短期有效
+PAGE_ANCHOR_TTL = 120
+_page_anchor_cache = ResponseCache(max_entries=1024, ttl=PAGE_ANCHOR_TTL)
+
+
+def encode_cursor(sort: str, values: tuple) -> str:
+    """
+    将排序键的取值编码为不透明的游标字符串
+    
+    Args:
+        sort: 排序名称（CURSOR_SORT_KEYS中的键）
+        values: 排序列对应的取值
+        
+    Returns:
+        str: URL安全的游标字符串
+    """
+    payload = json.dumps({'s': sort, 'k': list(values)}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token: str, sort: str, key_length: int = None) -> tuple:
+    """
+    解析游标字符串
+    
+    Args:
+        token: encode_cursor生成的游标
+        sort: 当前请求使用的排序名称
+        key_length: 排序键的取值个数，默认为排序列数（分片数据库的游标还包含路口）
+        
+    Returns:
+        tuple: 排序列的取值
+        
+    Raises:
+        ValueError: 游标格式错误或与排序方式不匹配
+    """
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+        values = tuple(payload['k'])
+        cursor_sort = payload['s']
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError(f"无效的分页游标: {token}") from e
+    
+    if key_length is None:
+        key_length = len(CURSOR_SORT_KEYS[sort])
+    if cursor_sort != sort or len(values) != key_length:
+        raise ValueError(f"分页游标与排序方式'{sort}'不匹配")
+    # 排序列都是数值列，取值必须是有限的数字（分片游标中的路口名称由调用方单独校验）
+    for value in values:
+        if isinstance(value, str) and key_length > len(CURSOR_SORT_KEYS[sort]):
+            continue
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+            raise ValueError(f"无效的分页游标: {token}")
+    return values
+
+
+def parse_time_bound(value, is_end: bool = False) -> Optional[float]:
+    """
+    解析时间窗口的起止参数
+
+    Args:
+        value: Unix时间戳（数字或数字字符串）、'YYYY-MM-DD' 日期或ISO格式时间，
+               不带时区时按统计时区解析；空值表示不限
+        is_end: 是否为结束时间；结束时间只给出日期时包含当天（取次日零点）
+
+    Returns:
+        Optional[float]: Unix时间戳，空值返回None
+
+    Raises:
+        ValueError: 无法解析
+    """
+    if value is None:
+        return None
+    text = str(value).strip()
+    if not text:
+        return None
+    try:
+        timestamp = float(text)
+    except ValueError:
+        try:
+            moment = datetime.fromisoformat(text)
+        except ValueError as e:
+            raise ValueError(f"无效的时间: {text}") from e
+        if moment.tzinfo is None:
+            moment = moment.replace(tzinfo=LOCAL_TZ)
+        if is_end and len(text) == 10:
+            moment += timedelta(days=1)
+        timestamp = moment.timestamp()
+    if not math.isfinite(timestamp):
+        raise ValueError(f"无效的时间: {text}")
+    return timestamp
+
+
+def window_conditions(start: Optional[float] = None, end: Optional[float] = None) -> tuple:
+    """
+    时间窗口 [start, end) 的WHERE条件（time列有索引时为范围扫描）
+
+    Args:
+        start: 起始时间戳（包含），None表示不限
+        end: 结束时间戳（不包含），None表示不限
+
+    Returns:
+        tuple: (条件列表, 参数列表)
+    """
+    conditions = []
+    params = []
+    if start is not None:
+        conditions.append("time >= ?")
+        params.append(start)
+    if end is not None:
+        conditions.append("time < ?")
+        params.append(end)
+    return conditions, params
+
+
+def plate_prefix_range(prefix: str) -> tuple:
+    """
+    车牌前缀对应的范围 [lower, upper)，用于 plate >= ? AND plate < ? 的索引范围扫描
+    （LIKE 'prefix%' 在默认的大小写不敏感设置下无法使用索引）
+
+    Args:
+        prefix: 车牌前缀（非空）
+
+    Returns:
+        tuple: (下界, 上界)
+    """
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+# 按时间分区存储（python -m utils.database partition，见utils/partitions.py）：
+# traffic变为各分区表的UNION ALL视图，注册表记录每个分区覆盖的 [start_time, end_time)
+PARTITION_REGISTRY = 'traffic_partitions'
+
+# 分区列表缓存 {数据库路径: (schema_version, 分区列表)}，分区增删会改变schema_version
+_partition_cache = {}
+
+
+def get_partitions(connection: sqlite3.Connection, db_path: str) -> Optional[List[tuple]]:
+    """
+    读取分区注册表（按数据库结构版本缓存，每次只需读取一次schema_version）
+
+    Args:
+        connection: 数据库连接
+        db_path: 数据库文件路径（缓存键）
+
+    Returns:
+        Optional[List[tuple]]: [(分区表名, 起始时间戳, 结束时间戳)] 按时间排序，未分区时返回None
+    """
+    cursor = connection.cursor(sqlite3.Cursor)
+    version = cursor.execute("PRAGMA schema_version").fetchone()[0]
+    cached = _partition_cache.get(db_path)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    partitions = None
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (PARTITION_REGISTRY,))
+    if cursor.fetchone():
+        cursor.execute(f"SELECT name, start_time, end_time FROM {PARTITION_REGISTRY} ORDER BY start_time")
+        partitions = [tuple(row) for row in cursor.fetchall()]
+    _partition_cache[db_path] = (version, partitions)
+    return partitions
+
+
+def select_partitions(partitions: List[tuple], start: Optional[float] = None,
+                      end: Optional[float] = None) -> List[str]:
+    """返回与时间窗口 [start, end) 重叠的分区表名"""
+    return [name for name, partition_start, partition_end in partitions
+            if (end is None or partition_start < end) and (start is None or partition_end > start)]
+
+
+def traffic_source(partitions: Optional[List[tuple]], start: Optional[float] = None,
+                   end: Optional[float] = None) -> str:
+    """
+    查询的FROM来源：分区存储时只包含与时间窗口重叠的分区（分区裁剪）
+
+    UNION ALL子查询会被SQLite展开，WHERE条件下推到每个分区，ORDER BY ... LIMIT
+    按各分区的索引顺序归并；来源的别名固定为traffic，查询语句无需区分。
+
+    Args:
+        partitions: get_partitions的结果
+        start: 时间窗口起始时间戳（包含），None表示不限
+        end: 时间窗口结束时间戳（不包含），None表示不限
+
+    Returns:
+        str: 'traffic'（未分区或涉及全部分区时）、单个分区表或分区的UNION ALL子查询
+    """
+    if not partitions:
+        return 'traffic'
+    names = select_partitions(partitions, start, end)
+    if len(names) == len(partitions):
+        return 'traffic'
+    if not names:
+        # 窗口内没有分区：保留表结构，结果为空
+        return f"(SELECT * FROM {partitions[0][0]} WHERE 0) AS traffic"
+    if len(names) == 1:
+        return f"{names[0]} AS traffic"
+    return f"({' UNION ALL '.join(f'SELECT * FROM {name}' for name in names)}) AS traffic"
+
+
+def partition_object_name(name: str, table: str) -> str:
+    """traffic表的索引/触发器在分区表上对应的名称（idx_traffic_time → idx_traffic_p202503_time）"""
+    return name if table == 'traffic' else name.replace('_traffic_', f'_{table}_', 1)
+
+
+def id_bound_sql(partitions: Optional[List[tuple]], function: str = 'MAX') -> str:
+    """
+    最小/最大记录id的查询
+
+    聚合UNION ALL视图无法使用主键的MIN/MAX优化，分区存储时分别取各分区的边界再合并。
+
+    Args:
+        partitions: get_partitions的结果
+        function: 'MIN' 或 'MAX'
+
+    Returns:
+        str: 返回单个值（没有记录时为NULL）的SQL
+    """
+    if not partitions:
+        return f"SELECT {function}(id) FROM traffic"
+    arms = ' UNION ALL '.join(f"SELECT (SELECT {function}(id) FROM {name}) AS id" for name, _, _ in partitions)
+    return f"SELECT {function}(id) FROM ({arms})"
+
+
+# 聚合查询后端：sql（默认）或 numpy（列式内存引擎，见utils/analytics.py）
+ANALYTICS_BACKEND = os.environ.get('TRAFFIC_ANALYTICS_BACKEND', 'sql')
+
+# 全表扫描聚合的并行进程数（见utils/parallel.py）：大于1时把id范围切分到进程池中分段统计，
+# 0或1为在当前连接上串行扫描；id范围小于 TRAFFIC_AGGREGATE_MIN_ROWS 时不值得启动并行
+AGGREGATE_WORKERS = int(os.environ.get('TRAFFIC_AGGREGATE_WORKERS', '0'))
+AGGREGATE_PARALLEL_MIN_ROWS = int(os.environ.get('TRAFFIC_AGGREGATE_MIN_ROWS', '1000000'))
+
+# 搜索总数缓存 - 键包含筛选条件和数据版本，同一搜索翻页时复用总数
+_count_cache = ResponseCache(max_entries=256, ttl=600)
+
+# 聚合查询合并 - 多个请求同时发起相同的聚合/计数查询时只扫描一次，共享结果
+_single_flight = SingleFlight()
+
+# 汇总表格式版本（traffic_rollup_meta.version 不同时下次刷新全量重建）
+ROLLUP_VERSION = 2
+
+# 删除或修改已汇总的记录时标记汇总表过期的触发器 {名称: 触发事件}
+ROLLUP_TRIGGERS = {
+    'trg_traffic_rollup_delete': 'DELETE',
+    'trg_traffic_rollup_update': 'UPDATE OF id, time, direction'
+}
+
+# 估算总数时抽样的id区间总大小（分成若干段均匀分布在整个id范围内）
+ESTIMATE_SAMPLE_IDS = 200000
+ESTIMATE_SAMPLE_WINDOWS = 20
+
+
+# 只读连接池的默认大小（可通过环境变量 TRAFFIC_POOL_SIZE 调整）
+DEFAULT_POOL_SIZE = int(os.environ.get('TRAFFIC_POOL_SIZE', '8'))
+
+# 面向读负载的连接参数
+READ_PRAGMAS = (
+    "PRAGMA query_only = ON",
+    "PRAGMA mmap_size = 268435456",      # 256MB 内存映射，减少read系统调用
+    "PRAGMA cache_size = -65536",        # 64MB 页缓存（负数表示KB）
+    "PRAGMA temp_store = MEMORY"         # GROUP BY / ORDER BY 的临时数据放在内存
+)
+
+
+class ConnectionPool:
+    """
+    线程安全的只读SQLite连接池
+    
+    使用有界的LIFO队列保存空闲连接（最近归还的连接页缓存最热），
+    连接数达到上限后新的请求会等待其他请求归还连接。
+    """
+    
+    def __init__(self, db_path: str, max_size: int = DEFAULT_POOL_SIZE, timeout: float = 30.0):
+        """
+        初始化连接池（连接按需创建）
+        
+        Args:
+            db_path: 数据库文件路径
+            max_size: 最大连接数
+            timeout: 等待空闲连接的超时时间（秒）
+        """
+        self.db_path = db_path
+        self.max_size = max_size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._closed = False
+        # 统计信息
+        self._checkouts = 0
+        self._hits = 0
+        self._waits = 0
+        self._wait_seconds = 0.0
+        self._in_use = 0
+    
+    def _create_connection(self) -> sqlite3.Connection:
+        """创建一个按读负载调优的新连接"""
+        connection = sqlite3.connect(self.db_path, check_same_thread=False, factory=connection_factory())
+        connection.row_factory = sqlite3.Row
+        for pragma in READ_PRAGMAS:
+            connection.execute(pragma)
+        return connection
+    
+    def acquire(self) -> sqlite3.Connection:
+        """
+        取出一个连接
+        
+        Returns:
+            sqlite3.Connection: 只读连接
+            
+        Raises:
+            sqlite3.OperationalError: 连接池已关闭或等待超时
+        """
+        if self._closed:
+            raise sqlite3.OperationalError("连接池已关闭")
+        
+        connection = None
+        hit = False
+        try:
+            connection = self._idle.get_nowait()
+            hit = True
+        except queue.Empty:
+            with self._lock:
+                can_create = self._created < self.max_size
+                if can_create:
+                    self._created += 1
+            if can_create:
+                try:
+                    connection = self._create_connection()
+                except sqlite3.Error:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+        
+        if connection is None:
+            # 连接数已达上限，等待其他请求归还
+            wait_start = time.perf_counter()
+            try:
+                connection = self._idle.get(timeout=self.timeout)
+            except queue.Empty:
+                raise sqlite3.OperationalError(f"等待数据库连接超时（{self.timeout}秒）")
+            finally:
+                with self._lock:
+                    self._waits += 1
+                    self._wait_seconds += time.perf_counter() - wait_start
+            hit = True
+        
+        with self._lock:
+            self._checkouts += 1
+            self._in_use += 1
+            if hit:
+                self._hits += 1
+        return connection
+    
+    def release(self, connection: sqlite3.Connection) -> None:
+        """
+        归还连接
+        
+        Args:
+            connection: acquire取出的连接
+        """
+        # 记录在该连接上只读取了部分结果的语句（连接交给其他线程之前）
+        if isinstance(connection, ProfiledConnection):
+            connection.flush_statements()
+        with self._lock:
+            self._in_use -= 1
+        
+        if self._closed:
+            connection.close()
+            return
+        if connection.in_transaction:
+            connection.rollback()
+        self._idle.put(connection)
+    
+    @contextmanager
+    def connection(self):
+        """以上下文管理器的方式使用连接"""
+        connection = self.acquire()
+        try:
+            yield connection
+        finally:
+            self.release(connection)
+    
+    def stats(self) -> dict:
+        """
+        获取连接池统计信息
+        
+        Returns:
+            dict: 连接数、借出次数、等待次数、复用命中率等
+        """
+        with self._lock:
+            checkouts = self._checkouts
+            return {
+                'db_path': self.db_path,
+                'max_size': self.max_size,
+                'created': self._created,
+                'idle': self._idle.qsize(),
+                'in_use': self._in_use,
+                'checkouts': checkouts,
+                'hits': self._hits,
+                'hit_rate': round(self._hits / checkouts, 4) if checkouts else 0.0,
+                'waits': self._waits,
+                'wait_seconds': round(self._wait_seconds, 6)
+            }
+    
+    def close(self) -> None:
+        """关闭所有空闲连接，借出中的连接归还时关闭"""
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
 
 class TrafficDatabase:
     """交通数据库管理类"""
     
-    def __init__(self, db_path: str = "data/traffic.db"):
+    # as_tuples 记录元组的列（分片数据库附加所属路口）
+    record_columns = RECORD_COLUMNS
+    
+    def __init__(self, db_path: str = "data/traffic.db", pool: Optional[ConnectionPool] = None):
         """
         初始化数据库连接
         
         Args:
             db_path: 数据库文件路径
+            pool: 只读连接池，提供时connect/disconnect从连接池借出/归还连接
         """
         self.db_path = db_path
+        self.pool = pool
         self.connection = None
+        self._local_columns_ready = None
+        # 共享聚合：shared_aggregates() 期间所有聚合查询复用同一个 小时×星期×方向 统计
+        self._shared_depth = 0
+        self._shared_cube = None
         
     def connect(self) -> bool:
         """
@@ -37,24 +540,75 @@ class TrafficDatabase:
         try:
             # 检查数据库文件是否存在
             if not os.path.exists(self.db_path):
-                print(f"❌ 数据库文件不存在: {self.db_path}")
+                logger.error("❌ 数据库文件不存在: %s", self.db_path)
                 return False
             
-            # 建立连接
-            self.connection = sqlite3.connect(self.db_path)
-            self.connection.row_factory = sqlite3.Row  # 让结果可以像字典一样访问
+            # 建立连接（使用连接池时借出一个已预热的只读连接）
+            if self.pool is not None:
+                self.connection = self.pool.acquire()
+            else:
+                self.connection = sqlite3.connect(self.db_path, factory=connection_factory())
+                self.connection.row_factory = sqlite3.Row  # 让结果可以像字典一样访问
+            self._local_columns_ready = None
             return True
             
         except sqlite3.Error as e:
-            print(f"❌ 数据库连接失败: {e}")
+            logger.error("❌ 数据库连接失败: %s", e)
             return False
     
     def disconnect(self):
-        """断开数据库连接"""
+        """断开数据库连接（使用连接池时归还连接）"""
         if self.connection:
-            self.connection.close()
+            if self.pool is not None:
+                self.pool.release(self.connection)
+            else:
+                self.connection.close()
             self.connection = None
     
+    @property
+    def live_db_path(self) -> Optional[str]:
+        """实时推送轮询的数据库文件"""
+        return self.db_path
+    
+    def _partitions(self) -> Optional[List[tuple]]:
+        """当前数据库的分区列表（未分区时为None）"""
+        return get_partitions(self.connection, self.db_path)
+    
+    def _source(self, start: float = None, end: float = None) -> str:
+        """与时间窗口重叠的数据来源（见traffic_source）"""
+        return traffic_source(self._partitions(), start, end)
+    
+    def _storage_tables(self) -> List[str]:
+        """实际存放记录的表：未分区时为traffic，否则为各分区表"""
+        partitions = self._partitions()
+        return ['traffic'] if partitions is None else [name for name, _, _ in partitions]
+    
+    def _id_bound(self, function: str = 'MAX') -> Optional[int]:
+        """最小/最大记录id（主键查找，分区存储时逐个分区查找）"""
+        cursor = self.connection.cursor()
+        cursor.execute(id_bound_sql(self._partitions(), function))
+        return cursor.fetchone()[0]
+    
+    def get_data_version(self) -> tuple:
+        """
+        获取数据版本，用于使缓存失效
+        
+        由最大记录id（主键查找，代价恒定）和数据库文件（含WAL文件）的修改时间组成，
+        新增、删除或修改数据后版本都会变化。
+        
+        Returns:
+            tuple: (最大id, 数据库文件修改时间, WAL文件修改时间)
+        """
+        max_id = self._id_bound() or 0
+        
+        mtimes = []
+        for path in (self.db_path, self.db_path + '-wal'):
+            try:
+                mtimes.append(os.stat(path).st_mtime_ns)
+            except OSError:
+                mtimes.append(0)
+        return (max_id, *mtimes)
+
     def get_paginated_records(self, table_name: str, page: int = 1, per_page: int = 20) -> tuple:
         """
         获取指定表的分页记录
@@ -68,7 +622,7 @@ class TrafficDatabase:
             tuple: (记录列表, 总记录数, 总页数)
         """
         if not self.connection:
-            print("❌ 请先连接数据库")
+            logger.error("❌ 请先连接数据库")
             return [], 0, 0
         
         try:
@@ -104,10 +658,114 @@ class TrafficDatabase:
             return records, total_records, total_pages
             
         except sqlite3.Error as e:
-            print(f"❌ 分页查询失败: {e}")
+            logger.error("❌ 分页查询失败: %s", e)
             return [], 0, 0
     
-    def search_with_filters(self, time_range: str = '', direction_filter: str = '', page: int = 1, per_page: int = 20) -> tuple:
+    def count_with_filters(self, time_range: str = '', direction_filter: str = '',
+                           estimate: bool = False, start: float = None, end: float = None) -> tuple:
+        """
+        获取组合搜索的匹配总数
+        
+        依次尝试：
+        1. 总数缓存（同一搜索的翻页请求直接复用，数据版本变化后失效）
+        2. 汇总表（筛选条件只有时间段和方向时，无需扫描traffic表）
+        3. 抽样估算（estimate=True且没有时间窗口时，在均匀分布的id区间内计数后按比例放大；
+           估算为0时不采用，改为精确计数）
+        4. 精确的 COUNT(*) 查询（有时间窗口时按time索引范围扫描，代价本来就小）
+        
+        Args:
+            time_range: 时间段筛选（可为空）
+            direction_filter: 方向筛选（1-4的字符串，可为空）
+            estimate: 无法精确快速计数时是否允许返回估算值
+            start: 时间窗口起始时间戳（包含），None表示不限
+            end: 时间窗口结束时间戳（不包含），None表示不限
+            
+        Returns:
+            tuple: (总记录数, 是否为估算值)
+        """
+        where_conditions, params = self._build_filter_conditions(time_range, direction_filter, start, end)
+        version = self.get_data_version()
+        exact_key = (self.db_path, tuple(where_conditions), tuple(params), version, False)
+        estimate_key = exact_key[:-1] + (True,)
+        
+        cached = _count_cache.get(exact_key)
+        if cached is not None:
+            return cached, False
+        if estimate:
+            cached = _count_cache.get(estimate_key)
+            if cached is not None:
+                return cached, True
+        
+        # 共享聚合或汇总表可以直接回答 时间段+方向 的计数（汇总表不区分时间窗口）
+        windowed = start is not None or end is not None
+        if self._shared_depth or (not windowed and self._get_rollup_last_id() is not None):
+            rows = self._aggregate_counts(['direction'], time_range=time_range,
+                                          direction_filter=direction_filter, start=start, end=end)
+            total = sum(count for _, count in rows)
+            _count_cache.set(exact_key, total)
+            return total, False
+        
+        cursor = self.connection.cursor()
+        if estimate and not windowed:
+            total = self._estimate_count(where_conditions, params, self._source(start, end))
+            # 抽样区间都没有命中不代表没有匹配记录，0不作为估算结果
+            if total:
+                _count_cache.set(estimate_key, total)
+                return total, True
+        
+        where_clause = f"WHERE {' AND '.join(where_conditions)}" if where_conditions else ""
+        
+        def count():
+            cursor.execute(f"SELECT COUNT(*) FROM {self._source(start, end)} {where_clause}", params)
+            return cursor.fetchone()[0]
+        
+        if self.connection.in_transaction:
+            total = count()
+        else:
+            total = _single_flight.do(('count', self.db_path, tuple(where_conditions), tuple(params)), count)
+        _count_cache.set(exact_key, total)
+        return total, False
+
+    def _estimate_count(self, where_conditions: list, params: list, source: str = 'traffic') -> Optional[int]:
+        """
+        抽样估算匹配总数
+        
+        在整个id范围内均匀选取 ESTIMATE_SAMPLE_WINDOWS 个id区间，
+        统计区间内匹配的记录数，再按 id范围 / 抽样id范围 的比例放大。
+        
+        Args:
+            where_conditions: 筛选条件列表
+            params: 筛选条件参数
+            source: 数据来源（分区存储时为与时间窗口重叠的分区）
+            
+        Returns:
+            Optional[int]: 估算值；数据量小于抽样规模时返回None（直接精确计数即可）
+        """
+        cursor = self.connection.cursor()
+        min_id, max_id = self._id_bound('MIN'), self._id_bound('MAX')
+        if min_id is None:
+            return 0
+        
+        id_span = max_id - min_id + 1
+        if id_span <= ESTIMATE_SAMPLE_IDS:
+            return None
+        
+        window = ESTIMATE_SAMPLE_IDS // ESTIMATE_SAMPLE_WINDOWS
+        step = id_span // ESTIMATE_SAMPLE_WINDOWS
+        conditions = ' AND '.join(['id >= ? AND id < ?'] + where_conditions)
+        
+        matched = 0
+        for index in range(ESTIMATE_SAMPLE_WINDOWS):
+            window_start = min_id + index * step
+            cursor.execute(f"SELECT COUNT(*) FROM {source} WHERE {conditions}",
+                           [window_start, window_start + window] + list(params))
+            matched += cursor.fetchone()[0]
+        
+        return round(matched * id_span / (window * ESTIMATE_SAMPLE_WINDOWS))
+
+    def search_with_filters(self, time_range: str = '', direction_filter: str = '', page: int = 1,
+                            per_page: int = 20, total_records: int = None,
+                            start: float = None, end: float = None, as_tuples: bool = False) -> tuple:
         """
         根据时间段和方向进行组合搜索（支持分页）
         
@@ -116,65 +774,61 @@ class TrafficDatabase:
             direction_filter: 方向筛选（1-4的字符串，可为空）
             page: 页码（从1开始）
             per_page: 每页记录数，默认20
+            total_records: 已知的匹配总数（如count_with_filters的结果），为None时自动获取
+            start: 时间窗口起始时间戳（包含），None表示不限
+            end: 时间窗口结束时间戳（不包含），None表示不限
+            as_tuples: 为True时记录为RECORD_COLUMNS顺序的元组（不构造sqlite3.Row和字典）
             
         Returns:
             tuple: (记录列表, 总记录数, 总页数)
         """
         if not self.connection:
-            print("❌ 请先连接数据库")
+            logger.error("❌ 请先连接数据库")
             return [], 0, 0
         
         try:
             cursor = self.connection.cursor()
             
             # 构建WHERE条件和参数列表
-            where_conditions = []
-            params = []
-            
-            # 处理时间段搜索条件
-            if time_range and time_range.strip():
-                time_condition = self._get_time_condition(time_range.strip())
-                if time_condition:
-                    where_conditions.append(time_condition)
-            
-            # 处理方向筛选条件
-            if direction_filter and direction_filter.strip():
-                where_conditions.append("direction = ?")
-                params.append(int(direction_filter))
+            where_conditions, params = self._build_filter_conditions(time_range, direction_filter, start, end)
             
             # 构建完整的WHERE子句
             where_clause = ""
             if where_conditions:
                 where_clause = "WHERE " + " AND ".join(where_conditions)
             
-            # 第1步：获取匹配的总记录数
-            count_query = f"SELECT COUNT(*) FROM traffic {where_clause}"
-            cursor.execute(count_query, params)
-            total_records = cursor.fetchone()[0]
+            # 第1步：获取匹配的总记录数（翻页时复用缓存的总数）
+            counted = total_records is None
+            if counted:
+                total_records, _ = self.count_with_filters(time_range, direction_filter, start=start, end=end)
             
             # 第2步：计算总页数
             total_pages = (total_records + per_page - 1) // per_page
             
-            # 如果没有找到匹配记录，直接返回
-            if total_records == 0:
+            # 精确计数没有匹配记录时直接返回（调用方传入的总数可能是估算值，仍执行分页查询）
+            if counted and total_records == 0:
                 return [], 0, 0
             
             # 第3步：计算OFFSET
             offset = (page - 1) * per_page
             
-            # 第4步：执行分页查询
+            # 第4步：执行分页查询（按id排序：不指定顺序时SQLite按所选索引的顺序返回，
+            # 迁移本地时间列后页内顺序会随索引改变，与游标分页的默认排序也不一致）
+            if as_tuples:
+                cursor.row_factory = None
             search_query = f"""
-                SELECT * FROM traffic 
+                SELECT {', '.join(RECORD_COLUMNS) if as_tuples else '*'} FROM {self._source(start, end)}
                 {where_clause}
+                ORDER BY id
                 LIMIT ? OFFSET ?
             """
             # 添加分页参数
             params.extend([per_page, offset])
             cursor.execute(search_query, params)
             
-            # 第5步：将结果转换为字典列表
+            # 第5步：将结果转换为字典列表（as_tuples时直接返回元组）
             rows = cursor.fetchall()
-            records = [dict(row) for row in rows]
+            records = rows if as_tuples else [dict(row) for row in rows]
             
             # 生成搜索描述
             search_desc = []
@@ -186,94 +840,1006 @@ class TrafficDatabase:
                 search_desc.append(f"方向'{direction_text}'")
             
             if search_desc:
-                print(f"🔍 搜索{'+'.join(search_desc)}找到 {total_records} 条记录")
+                logger.debug("🔍 搜索%s找到 %d 条记录", '+'.join(search_desc), total_records)
             
             return records, total_records, total_pages
             
         except sqlite3.Error as e:
-            print(f"❌ 组合搜索失败: {e}")
+            logger.error("❌ 组合搜索失败: %s", e)
             return [], 0, 0
 
-    def _get_time_condition(self, time_range: str) -> str:
+    def search_with_cursor(self, time_range: str = '', direction_filter: str = '', after: str = None,
+                           before: str = None, page: int = 1, per_page: int = 20, sort: str = 'id',
+                           total_records: int = None, start: float = None, end: float = None,
+                           as_tuples: bool = False) -> dict:
+        """
+        基于游标（keyset/seek）的组合搜索分页
+        
+        与search_with_filters的LIMIT/OFFSET不同，上一页/下一页通过排序键直接定位，
+        无论翻到多深，每次查询的代价都与第1页相同；跳转到任意页则借助稀疏页边界索引，
+        最多跳过 PAGE_INDEX_STRIDE 页的数据。最近返回过的页及其下一页的起始位置记录在
+        页锚点缓存中，再按页码请求这些页时直接定位。
+        
+        Args:
+            time_range: 时间段筛选（可为空）
+            direction_filter: 方向筛选（1-4的字符串，可为空）
+            after: 下一页游标（取该游标之后的记录）
+            before: 上一页游标（取该游标之前的记录）
+            page: 未提供游标时表示要跳转的页码；提供游标时仅用于计算显示的页码
+            per_page: 每页记录数，默认20
+            sort: 排序方式，'id' 或 'time'（按 (time, id) 排序）
+            total_records: 已知的匹配总数，为None时自动获取
+            start: 时间窗口起始时间戳（包含），None表示不限
+            end: 时间窗口结束时间戳（不包含），None表示不限
+            as_tuples: 为True时记录为RECORD_COLUMNS顺序的元组（不构造sqlite3.Row和字典）
+            
+        Returns:
+            dict: {
+                'records': 记录列表,
+                'total_records': 总记录数,
+                'total_pages': 总页数,
+                'next_cursor': 下一页游标（没有下一页时为None）,
+                'prev_cursor': 上一页游标（没有上一页时为None）,
+                'has_next': 是否有下一页,
+                'has_prev': 是否有上一页
+            }
+            
+        Raises:
+            ValueError: 排序方式或游标无效
+        """
+        empty_result = {
+            'records': [], 'total_records': 0, 'total_pages': 0,
+            'next_cursor': None, 'prev_cursor': None, 'has_next': False, 'has_prev': False
+        }
+        
+        if sort not in CURSOR_SORT_KEYS:
+            raise ValueError(f"不支持的排序方式: {sort}")
+        
+        if not self.connection:
+            logger.error("❌ 请先连接数据库")
+            return empty_result
+        
+        sort_columns = CURSOR_SORT_KEYS[sort]
+        
+        try:
+            cursor = self.connection.cursor()
+            where_conditions, params = self._build_filter_conditions(time_range, direction_filter, start, end)
+            
+            # 第1步：获取匹配的总记录数（翻页时复用缓存的总数）
+            counted = total_records is None
+            if counted:
+                total_records, _ = self.count_with_filters(time_range, direction_filter, start=start, end=end)
+            total_pages = (total_records + per_page - 1) // per_page
+            
+            # 调用方传入的总数可能是估算值，为0时仍执行定位查询
+            if counted and total_records == 0:
+                return empty_result
+            
+            # 第2步：根据游标或页码确定定位条件
+            # 多取一条记录用于判断是否还有更多数据
+            seek_conditions = list(where_conditions)
+            seek_params = list(params)
+            offset = 0
+            descending = False
+            
+            # 页锚点：第N页第一条记录之前的排序键
+            anchor_key = (self.db_path, tuple(where_conditions), tuple(params), sort, per_page,
+                          self.get_data_version())
+            # 本页之前的排序键（已知时）；页码是否可信（游标请求的页码由客户端提供，
+            # 只有与已记录的锚点吻合时才用来记录新的锚点）
+            preceding_key = None
+            page_trusted = not (after or before)
+            leading_rows = 0
+            
+            if after:
+                values = decode_cursor(after, sort)
+                seek_conditions.append(self._seek_condition(sort_columns, '>'))
+                seek_params.extend(values)
+                preceding_key = values
+                page_trusted = _page_anchor_cache.get(anchor_key + (page,)) == values
+            elif before:
+                values = decode_cursor(before, sort)
+                seek_conditions.append(self._seek_condition(sort_columns, '<'))
+                seek_params.extend(values)
+                descending = True
+            elif page > 1:
+                anchor = _page_anchor_cache.get(anchor_key + (page,))
+                if anchor is not None:
+                    # 相邻页：从锚点直接定位
+                    seek_conditions.append(self._seek_condition(sort_columns, '>'))
+                    seek_params.extend(anchor)
+                    preceding_key = anchor
+                else:
+                    # 跳页：先定位到最近的页边界，再跳过不超过一个步长的记录
+                    boundary_page, boundary_key = self._get_page_boundary(
+                        where_conditions, params, sort, per_page, page, self._source(start, end)
+                    )
+                    if boundary_key is not None:
+                        seek_conditions.append(self._seek_condition(sort_columns, '>='))
+                        seek_params.extend(boundary_key)
+                    offset = (page - boundary_page) * per_page
+                    # 多取本页之前的一条记录作为本页的锚点
+                    if offset > 0:
+                        offset -= 1
+                        leading_rows = 1
+            
+            seek_where = f"WHERE {' AND '.join(seek_conditions)}" if seek_conditions else ""
+            order = 'DESC' if descending else 'ASC'
+            order_clause = ', '.join(f"{column} {order}" for column in sort_columns)
+            
+            # 第3步：执行定位查询
+            if as_tuples:
+                cursor.row_factory = None
+            cursor.execute(f"""
+                SELECT {', '.join(RECORD_COLUMNS) if as_tuples else '*'} FROM {self._source(start, end)}
+                {seek_where}
+                ORDER BY {order_clause}
+                LIMIT ? OFFSET ?
+            """, seek_params + [per_page + 1 + leading_rows, offset])
+            
+            rows = cursor.fetchall()
+            records = rows if as_tuples else [dict(row) for row in rows]
+            leading_record = records[0] if leading_rows and records else None
+            records = records[leading_rows:]
+            has_more = len(records) > per_page
+            extra_record = records[per_page] if has_more else None
+            records = records[:per_page]
+            if descending:
+                records.reverse()
+            
+            # 第4步：计算翻页状态
+            if after:
+                has_prev, has_next = True, has_more
+            elif before:
+                has_prev, has_next = has_more, True
+            else:
+                has_prev, has_next = page > 1, has_more
+            
+            if not records:
+                has_prev = has_next = False
+            
+            # 元组按列位置取排序键，字典按列名
+            key_fields = [RECORD_COLUMNS.index(column) for column in sort_columns] if as_tuples else sort_columns
+            
+            def record_key(record):
+                return tuple(record[field] for field in key_fields)
+            
+            # 第5步：记录本页和下一页的锚点
+            if leading_record is not None:
+                preceding_key = record_key(leading_record)
+            if records:
+                last_key = record_key(records[-1])
+                if before:
+                    # 倒序多取的一条正是本页之前的记录
+                    preceding_key = record_key(extra_record) if has_more else None
+                    page_trusted = _page_anchor_cache.get(anchor_key + (page + 1,)) == last_key
+                if page_trusted:
+                    if preceding_key is not None and page > 1:
+                        _page_anchor_cache.set(anchor_key + (page,), preceding_key)
+                    if has_next:
+                        _page_anchor_cache.set(anchor_key + (page + 1,), last_key)
+            
+            return {
+                'records': records,
+                'total_records': total_records,
+                'total_pages': total_pages,
+                'next_cursor': encode_cursor(sort, record_key(records[-1])) if has_next else None,
+                'prev_cursor': encode_cursor(sort, record_key(records[0])) if has_prev else None,
+                'has_next': has_next,
+                'has_prev': has_prev
+            }
+            
+        except sqlite3.Error as e:
+            logger.error("❌ 游标分页查询失败: %s", e)
+            return empty_result
+
+    def iter_filtered_rows(self, time_range: str = '', direction_filter: str = '', start: float = None,
+                           end: float = None, batch_size: int = EXPORT_BATCH_ROWS) -> Iterator[list]:
+        """
+        按id顺序分批读取全部匹配记录（导出使用）
+
+        查询只执行一次，结果通过fetchmany逐批取出，任意时刻内存中只有一批记录，
+        导出数百万条记录时内存占用保持不变。
+
+        Args:
+            time_range: 时间段筛选（可为空）
+            direction_filter: 方向筛选（1-4的字符串，可为空）
+            start: 时间窗口起始时间戳（包含），None表示不限
+            end: 时间窗口结束时间戳（不包含），None表示不限
+            batch_size: 每批记录数
+
+        Yields:
+            list: 一批 (id, direction, time, plate) 元组
+        """
+        where_conditions, params = self._build_filter_conditions(time_range, direction_filter, start, end)
+        where_clause = f"WHERE {' AND '.join(where_conditions)}" if where_conditions else ""
+
+        cursor = self.connection.cursor()
+        # 导出只需要原始列，按元组返回，不构造sqlite3.Row
+        cursor.row_factory = None
+        cursor.execute(f"SELECT {', '.join(EXPORT_COLUMNS)} FROM {self._source(start, end)} {where_clause} ORDER BY id",
+                       params)
+        try:
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            cursor.close()
+
+    def find_by_plate(self, plate: str, limit: int = 100, start: float = None, end: float = None) -> list:
+        """
+        按时间顺序返回一辆车的通行记录（按 (plate, time, direction) 索引定位）
+        
+        Args:
+            plate: 完整车牌号
+            limit: 最多返回的记录数（1-PLATE_LOOKUP_MAX_LIMIT）
+            start: 时间窗口起始时间戳（包含），None表示不限
+            end: 时间窗口结束时间戳（不包含），None表示不限
+            
+        Returns:
+            list: 按 (time, id) 排序的记录字典列表
+            
+        Raises:
+            ValueError: 车牌为空或limit超出范围
+        """
+        plate = (plate or '').strip()
+        if not plate:
+            raise ValueError("车牌号不能为空")
+        if not 1 <= limit <= PLATE_LOOKUP_MAX_LIMIT:
+            raise ValueError(f"limit必须在1到{PLATE_LOOKUP_MAX_LIMIT}之间")
+        
+        conditions, params = window_conditions(start, end)
+        where_clause = ' AND '.join(['plate = ?'] + conditions)
+        cursor = self.connection.cursor()
+        cursor.execute(f"""
+            SELECT * FROM {self._source(start, end)}
+            WHERE {where_clause}
+            ORDER BY time, id
+            LIMIT ?
+        """, [plate] + params + [limit])
+        return [dict(row) for row in cursor.fetchall()]
+
+    def search_plates(self, prefix: str, limit: int = 20, start: float = None, end: float = None) -> list:
+        """
+        车牌前缀搜索，返回匹配的车牌及其通行次数
+        
+        按车牌顺序扫描索引中的前缀范围，取满limit个车牌即停止，不读取表数据。
+        
+        Args:
+            prefix: 车牌前缀
+            limit: 最多返回的车牌数（1-PLATE_LOOKUP_MAX_LIMIT）
+            start: 时间窗口起始时间戳（包含），None表示不限
+            end: 时间窗口结束时间戳（不包含），None表示不限
+            
+        Returns:
+            list: [{'plate', 'passages', 'first_time', 'last_time'}] 按车牌排序
+            
+        Raises:
+            ValueError: 前缀为空或limit超出范围
+        """
+        prefix = (prefix or '').strip()
+        if not prefix:
+            raise ValueError("车牌前缀不能为空")
+        if not 1 <= limit <= PLATE_LOOKUP_MAX_LIMIT:
+            raise ValueError(f"limit必须在1到{PLATE_LOOKUP_MAX_LIMIT}之间")
+        
+        conditions, params = window_conditions(start, end)
+        where_clause = ' AND '.join(['plate >= ? AND plate < ?'] + conditions)
+        cursor = self.connection.cursor()
+        cursor.execute(f"""
+            SELECT plate, COUNT(*) AS passages, MIN(time) AS first_time, MAX(time) AS last_time
+            FROM {self._source(start, end)}
+            WHERE {where_clause}
+            GROUP BY plate
+            ORDER BY plate
+            LIMIT ?
+        """, list(plate_prefix_range(prefix)) + params + [limit])
+        return [dict(row) for row in cursor.fetchall()]
+
+    def _seek_condition(self, sort_columns: tuple, operator: str) -> str:
+        """
+        生成游标定位条件，多列排序时使用行值比较 (a, b) > (?, ?)
+        
+        Args:
+            sort_columns: 排序列
+            operator: 比较运算符
+            
+        Returns:
+            str: SQL WHERE条件字符串
+        """
+        if len(sort_columns) == 1:
+            return f"{sort_columns[0]} {operator} ?"
+        columns = ', '.join(sort_columns)
+        placeholders = ', '.join('?' for _ in sort_columns)
+        return f"({columns}) {operator} ({placeholders})"
+
+    def _get_page_boundary(self, where_conditions: list, params: list, sort: str,
+                           per_page: int, page: int, source: str = 'traffic') -> tuple:
+        """
+        从稀疏页边界索引中查找不超过目标页的最近边界
+        
+        索引记录第 1, 1+STRIDE, 1+2*STRIDE... 页首条记录的排序键，每种筛选条件只需扫描一次。
+        数据表最大id变化后：按id排序时新记录只会追加在末尾，保留已有边界，
+        只从上次的最大id之后继续编号（主键范围扫描）；最小id变化（删除或归档）
+        或按时间排序（新记录可能插入中间）时全量重建。
+        
+        Args:
+            where_conditions: 筛选条件列表
+            params: 筛选条件参数
+            sort: 排序方式
+            per_page: 每页记录数
+            page: 目标页码
+            source: 数据来源（分区存储时为与时间窗口重叠的分区）
+            
+        Returns:
+            tuple: (边界页码, 边界排序键)，没有可用边界时为 (1, None)
+        """
+        cursor = self.connection.cursor()
+        min_id, max_id = self._id_bound('MIN'), self._id_bound()
+        
+        cache_key = (self.db_path, tuple(where_conditions), tuple(params), sort, per_page)
+        # 缓存值: (最小id, 最大id, 边界列表, 已编号的匹配记录数)
+        cached = _page_index_cache.get(cache_key)
+        stride_rows = PAGE_INDEX_STRIDE * per_page
+        sort_columns = CURSOR_SORT_KEYS[sort]
+        column_list = ', '.join(sort_columns)
+        
+        if cached and cached[:2] == (min_id, max_id):
+            boundaries = cached[2]
+        else:
+            conditions = list(where_conditions)
+            query_params = list(params)
+            boundaries, numbered = [], 0
+            extending = (cached is not None and sort == 'id' and cached[0] == min_id
+                         and max_id is not None and cached[1] is not None and max_id > cached[1])
+            if extending:
+                # 只为上次最大id之后的新记录编号，接在已编号的记录之后
+                boundaries, numbered = list(cached[2]), cached[3]
+                conditions += ["id > ?", "id <= ?"]
+                query_params += [cached[1], max_id]
+            where_clause = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+            # 最后一条记录总是返回，用于取得本次编号的记录数
+            cursor.execute(f"""
+                SELECT {column_list}, row_num, total FROM (
+                    SELECT {column_list},
+                           ROW_NUMBER() OVER (ORDER BY {column_list}) - 1 + ? AS row_num,
+                           COUNT(*) OVER () AS total
+                    FROM {source}
+                    {where_clause}
+                )
+                WHERE row_num % ? = 0 OR row_num = ? + total - 1
+                ORDER BY row_num
+            """, [numbered] + query_params + [stride_rows, numbered])
+            rows = [tuple(row) for row in cursor.fetchall()]
+            key_length = len(sort_columns)
+            boundaries += [row[:key_length] for row in rows if row[key_length] % stride_rows == 0]
+            if rows:
+                numbered += rows[-1][-1]
+            _page_index_cache.set(cache_key, (min_id, max_id, boundaries, numbered))
+            logger.debug("🗂️ 已%s页边界索引：%d 个边界，步长 %d 页", '扩展' if extending else '建立',
+                         len(boundaries), PAGE_INDEX_STRIDE)
+        
+        if not boundaries:
+            return 1, None
+        
+        index = min((page - 1) // PAGE_INDEX_STRIDE, len(boundaries) - 1)
+        return index * PAGE_INDEX_STRIDE + 1, boundaries[index]
+
+    def _build_filter_conditions(self, time_range: str = '', direction_filter: str = '',
+                                 start: float = None, end: float = None) -> tuple:
+        """
+        根据时间段、方向和时间窗口构建WHERE条件
+        
+        Args:
+            time_range: 时间段筛选（可为空）
+            direction_filter: 方向筛选（1-4的字符串，可为空）
+            start: 时间窗口起始时间戳（包含），None表示不限
+            end: 时间窗口结束时间戳（不包含），None表示不限
+            
+        Returns:
+            tuple: (条件列表, 参数列表)
+        """
+        where_conditions = []
+        params = []
+        
+        # 处理时间段搜索条件（已迁移时使用带索引的local_hour列）
+        if time_range and time_range.strip():
+            time_condition = self._get_time_condition(time_range.strip(), self._local_time_sql()['hour'])
+            if time_condition:
+                where_conditions.append(time_condition)
+        
+        # 处理方向筛选条件
+        if direction_filter and direction_filter.strip():
+            where_conditions.append("direction = ?")
+            params.append(int(direction_filter))
+        
+        # 处理时间窗口条件（按time索引范围扫描）
+        window, window_params = window_conditions(start, end)
+        where_conditions.extend(window)
+        params.extend(window_params)
+        
+        return where_conditions, params
+
+    def _get_time_condition(self, time_range: str, hour_column: str = None) -> str:
         """
         根据时间段返回SQL查询条件
         
         Args:
             time_range: 时间段标识
+            hour_column: 表示本地小时的列或表达式，默认从time实时计算
             
         Returns:
             str: SQL WHERE条件字符串
         """
         # 由于时间戳是Unix时间戳，我们需要用HOUR函数来提取小时
         # SQLite中可以使用strftime('%H', datetime(time, 'unixepoch'))来获取小时
+        if time_range not in TIME_RANGE_HOURS:
+            return ""
         
-        time_conditions = {
-            'morning': "CAST(strftime('%H', datetime(time, 'unixepoch', 'localtime')) AS INTEGER) BETWEEN 7 AND 8",
-            'noon': "CAST(strftime('%H', datetime(time, 'unixepoch', 'localtime')) AS INTEGER) BETWEEN 11 AND 12", 
-            'afternoon': "CAST(strftime('%H', datetime(time, 'unixepoch', 'localtime')) AS INTEGER) BETWEEN 14 AND 16",
-            'evening': "CAST(strftime('%H', datetime(time, 'unixepoch', 'localtime')) AS INTEGER) BETWEEN 17 AND 18",
-            'night': "(CAST(strftime('%H', datetime(time, 'unixepoch', 'localtime')) AS INTEGER) >= 20 OR CAST(strftime('%H', datetime(time, 'unixepoch', 'localtime')) AS INTEGER) <= 5)"
-        }
+        hour = hour_column or LOCAL_HOUR_SQL
+        start_hour, end_hour = TIME_RANGE_HOURS[time_range]
+        if start_hour <= end_hour:
+            return f"{hour} BETWEEN {start_hour} AND {end_hour}"
+        # 跨越午夜的时间段
+        return f"({hour} >= {start_hour} OR {hour} <= {end_hour})"
+
+    def _has_table(self, table_name: str) -> bool:
+        """检查数据库中是否存在指定的表"""
+        cursor = self.connection.cursor()
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table_name,))
+        return cursor.fetchone() is not None
+
+    def _has_index(self, index_name: str) -> bool:
+        """检查数据库中是否存在指定的索引"""
+        cursor = self.connection.cursor()
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?", (index_name,))
+        return cursor.fetchone() is not None
+
+    def _get_meta(self, table_name: str, key: str) -> Optional[str]:
+        """读取 key/value 元数据表中的值，表或键不存在时返回None"""
+        if not self._has_table(table_name):
+            return None
+        cursor = self.connection.cursor()
+        cursor.execute(f"SELECT value FROM {table_name} WHERE key = ?", (key,))
+        row = cursor.fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, table_name: str, key: str, value) -> None:
+        """写入 key/value 元数据表（表不存在时自动创建）"""
+        cursor = self.connection.cursor()
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table_name} (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            )
+        """)
+        cursor.execute(f"INSERT OR REPLACE INTO {table_name} (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def _local_time_sql(self) -> dict:
+        """
+        返回本地小时/星期/日期对应的SQL
+        
+        traffic表已完成迁移（本地时间列回填完毕且时区一致）时返回列名，
+        可以利用索引；否则返回按固定时区实时计算的表达式。
         
-        return time_conditions.get(time_range, "")
+        Returns:
+            dict: {'hour': ..., 'weekday': ..., 'date': ...}
+        """
+        if self._local_columns_ready is None:
+            ready_tz = self._get_meta('traffic_schema_meta', 'local_time_tz_minutes')
+            self._local_columns_ready = ready_tz == str(TIMEZONE_OFFSET_MINUTES)
+        
+        if self._local_columns_ready:
+            return {'hour': 'local_hour', 'weekday': 'local_weekday', 'date': 'local_date'}
+        return {'hour': LOCAL_HOUR_SQL, 'weekday': LOCAL_WEEKDAY_SQL, 'date': LOCAL_DATE_SQL}
 
-    def get_hourly_traffic_trend(self, direction_filter: str = None) -> dict:
+    def migrate_local_time_columns(self, batch_size: int = 100000) -> bool:
         """
-        获取24小时车流量趋势数据
+        迁移traffic表：增加预计算的本地时间列并建立复合索引
+        
+        1. 增加 local_hour / local_weekday / local_date 列（按固定时区计算）
+        2. 按id区间分批回填，每批单独提交，中断后重新执行会从未回填的记录继续
+        3. 建立 (direction, local_hour, id) 等复合索引
+        4. 创建插入触发器，保证之后写入的新记录自动填充本地时间列
+        
+        时区配置变化后重新执行会按新时区重新计算全部记录。按时间分区存储时对每个分区表执行。
         
         Args:
-            direction_filter: 方向筛选 ('1', '2', '3', '4')
+            batch_size: 每批回填的id区间大小
             
         Returns:
-            dict: {hour: count} 格式的24小时数据
+            bool: 迁移是否成功
+        """
+        if not self.connection:
+            logger.error("❌ 请先连接数据库")
+            return False
+        
+        try:
+            cursor = self.connection.cursor()
+            tables = self._storage_tables()
+            
+            # 第1步：增加缺失的列
+            for table in tables:
+                cursor.execute(f"PRAGMA table_info({table})")
+                existing_columns = {row[1] for row in cursor.fetchall()}
+                for column, (column_type, _) in LOCAL_TIME_COLUMNS.items():
+                    if column not in existing_columns:
+                        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+                        logger.info("🧱 已添加列: %s.%s", table, column)
+            
+            # 时区变化时需要重新计算所有记录，先使迁移状态失效
+            previous_tz = self._get_meta('traffic_schema_meta', 'local_time_tz_minutes')
+            recompute_all = previous_tz is not None and previous_tz != str(TIMEZONE_OFFSET_MINUTES)
+            self._set_meta('traffic_schema_meta', 'local_time_tz_minutes', 'pending')
+            self.connection.commit()
+            self._local_columns_ready = False
+            
+            # 第2步：分批回填
+            assignments = ', '.join(f"{column} = {expression}"
+                                    for column, (_, expression) in LOCAL_TIME_COLUMNS.items())
+            pending_condition = "" if recompute_all else " AND local_hour IS NULL"
+            
+            updated = 0
+            for table in tables:
+                cursor.execute(f"SELECT MIN(id), MAX(id) FROM {table}")
+                min_id, max_id = cursor.fetchone()
+                if min_id is None:
+                    continue
+                for batch_start in range(min_id, max_id + 1, batch_size):
+                    cursor.execute(
+                        f"UPDATE {table} SET {assignments} WHERE id >= ? AND id < ?{pending_condition}",
+                        (batch_start, batch_start + batch_size)
+                    )
+                    updated += cursor.rowcount
+                    self.connection.commit()
+                    logger.info("⏳ 回填进度: %s id %d/%d，已更新 %d 条",
+                                table, min(batch_start + batch_size - 1, max_id), max_id, updated)
+            
+            for table in tables:
+                # 第3步：建立索引
+                for index_name, columns in LOCAL_TIME_INDEXES.items():
+                    cursor.execute(f"CREATE INDEX IF NOT EXISTS {partition_object_name(index_name, table)} "
+                                   f"ON {table} {columns}")
+                
+                # 第4步：新记录自动填充本地时间列
+                trigger_name = partition_object_name('trg_traffic_local_time', table)
+                cursor.execute(f"DROP TRIGGER IF EXISTS {trigger_name}")
+                cursor.execute(f"""
+                    CREATE TRIGGER {trigger_name} AFTER INSERT ON {table}
+                    WHEN NEW.local_hour IS NULL
+                    BEGIN
+                        UPDATE {table} SET {assignments} WHERE id = NEW.id;
+                    END
+                """)
+                cursor.execute(f"ANALYZE {table}")
+            
+            if tables != ['traffic']:
+                # 视图的插入触发器按分区表的列生成，增加列后重新生成
+                try:
+                    from .partitions import rebuild_router
+                except ImportError:
+                    from partitions import rebuild_router
+                rebuild_router(self)
+            self._set_meta('traffic_schema_meta', 'local_time_tz_minutes', TIMEZONE_OFFSET_MINUTES)
+            self.connection.commit()
+            self._local_columns_ready = True
+            
+            logger.info("✅ 本地时间列迁移完成：回填 %d 条记录，时区偏移 %+d 分钟", updated, TIMEZONE_OFFSET_MINUTES)
+            return True
+            
+        except sqlite3.Error as e:
+            self.connection.rollback()
+            logger.error("❌ 本地时间列迁移失败: %s", e)
+            return False
+
+    def create_search_indexes(self) -> bool:
+        """
+        建立时间窗口和车牌查询使用的索引（SEARCH_INDEXES）并更新统计信息（分区存储时建在每个分区表上）
+
+        Returns:
+            bool: 是否成功
+        """
+        if not self.connection:
+            logger.error("❌ 请先连接数据库")
+            return False
+
+        try:
+            cursor = self.connection.cursor()
+            for table in self._storage_tables():
+                for index_name, columns in SEARCH_INDEXES.items():
+                    started = time.perf_counter()
+                    index_name = partition_object_name(index_name, table)
+                    cursor.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON {table} {columns}")
+                    logger.info("🗂️ 索引 %s %s 已就绪，耗时 %.1fs", index_name, columns, time.perf_counter() - started)
+                cursor.execute(f"ANALYZE {table}")
+            self.connection.commit()
+            return True
+
+        except sqlite3.Error as e:
+            self.connection.rollback()
+            logger.error("❌ 建立索引失败: %s", e)
+            return False
+
+    def _get_rollup_last_id(self) -> Optional[int]:
+        """
+        读取汇总表已累计到的最大记录id
+        
+        Returns:
+            Optional[int]: 汇总表不存在或时区与当前配置不一致时返回None
+        """
+        if self._get_meta('traffic_rollup_meta', 'tz_minutes') != str(TIMEZONE_OFFSET_MINUTES):
+            return None
+        
+        last_id = self._get_meta('traffic_rollup_meta', 'last_id')
+        return int(last_id) if last_id is not None else None
+
+    def _rollup_is_stale(self, last_id: int) -> bool:
         """
+        已汇总的记录是否可能被删除或修改
+        
+        触发器标记过期时为True；包含已汇总记录的表（未分区时为traffic，否则为最小id
+        不超过汇总位置的分区）缺少触发器时无法确认，同样视为过期。只做主键和元数据查找。
+        
+        Args:
+            last_id: 汇总位置
+            
+        Returns:
+            bool: 是否需要全量重建
+        """
+        if self._get_meta('traffic_rollup_meta', 'stale') is not None:
+            return True
+        cursor = self.connection.cursor()
+        for table in self._storage_tables():
+            cursor.execute(f"SELECT MIN(id) FROM {table}")
+            min_id = cursor.fetchone()[0]
+            if min_id is None or min_id > last_id:
+                continue
+            for trigger in ROLLUP_TRIGGERS:
+                cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = ?",
+                               (partition_object_name(trigger, table),))
+                if cursor.fetchone() is None:
+                    return True
+        return False
+
+    def _install_rollup_triggers(self) -> None:
+        """在存放记录的各表上建立标记汇总表过期的触发器（只对id不超过汇总位置的记录生效）"""
+        cursor = self.connection.cursor()
+        for table in self._storage_tables():
+            for trigger, event in ROLLUP_TRIGGERS.items():
+                cursor.execute(f"""
+                    CREATE TRIGGER IF NOT EXISTS {partition_object_name(trigger, table)} AFTER {event} ON {table}
+                    WHEN OLD.id <= (SELECT CAST(value AS INTEGER) FROM traffic_rollup_meta WHERE key = 'last_id')
+                    BEGIN
+                        INSERT OR REPLACE INTO traffic_rollup_meta (key, value) VALUES ('stale', '1');
+                    END
+                """)
+
+    def refresh_rollup(self, rebuild: bool = False) -> int:
+        """
+        增量刷新 小时×星期×日期×方向 汇总表
+        
+        只统计id大于上次刷新位置的新记录，并累加到已有的汇总行上；
+        首次调用（或rebuild=True）时会扫描整张traffic表建立汇总。
+        
+        汇总行无法扣减：存放记录的表上有触发器，删除或修改（id、时间、方向）已汇总的记录时
+        在traffic_rollup_meta中标记汇总表过期，下次刷新时全量重建（见_rollup_is_stale）。
+        
+        Args:
+            rebuild: 是否删除已有汇总并全量重建
+            
+        Returns:
+            int: 本次累计的新记录数，失败时返回-1
+        """
+        if not self.connection:
+            logger.error("❌ 请先连接数据库")
+            return -1
+        
         try:
-            # 构建SQL查询，按小时统计车流量
-            base_query = """
-                SELECT CAST(strftime('%H', datetime(time, 'unixepoch', 'localtime')) AS INTEGER) as hour,
-                       COUNT(*) as count
+            cursor = self.connection.cursor()
+            # 汇总表按时区计算，时区配置变化后必须重建
+            stored_tz = self._get_meta('traffic_rollup_meta', 'tz_minutes')
+            if stored_tz is not None and stored_tz != str(TIMEZONE_OFFSET_MINUTES):
+                logger.warning("⚠️ 汇总表时区与当前配置不一致，将全量重建")
+                rebuild = True
+            
+            stored_last_id = self._get_meta('traffic_rollup_meta', 'last_id')
+            if not rebuild and stored_last_id is not None and self._rollup_is_stale(int(stored_last_id)):
+                logger.warning("⚠️ 汇总后有记录被删除或修改，将全量重建汇总表")
+                rebuild = True
+            
+            # 早期版本的汇总列不允许NULL（方向或时间为NULL的记录使刷新失败），需要重建
+            stored_version = self._get_meta('traffic_rollup_meta', 'version')
+            if not rebuild and stored_tz is not None and stored_version != str(ROLLUP_VERSION):
+                logger.warning("⚠️ 汇总表格式已更新，将全量重建")
+                rebuild = True
+            
+            if rebuild:
+                cursor.execute("DROP TABLE IF EXISTS traffic_rollup")
+                cursor.execute("DROP TABLE IF EXISTS traffic_rollup_meta")
+            
+            # 方向或时间为NULL的记录与实时查询一样按NULL分组；UNIQUE约束中NULL互不相等，
+            # 这些组每次刷新追加一行而不是累加，读取时按分组求和，结果相同
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS traffic_rollup (
+                    local_date TEXT,
+                    hour INTEGER,
+                    weekday INTEGER,
+                    direction INTEGER,
+                    count INTEGER NOT NULL,
+                    UNIQUE (local_date, hour, direction)
+                )
+            """)
+            
+            last_id = int(self._get_meta('traffic_rollup_meta', 'last_id') or 0)
+            max_id = self._id_bound() or 0
+            local = self._local_time_sql()
+            
+            # 按id区间累计新记录（id是主键，区间扫描只读取新增部分）
+            cursor.execute(f"""
+                INSERT INTO traffic_rollup (local_date, hour, weekday, direction, count)
+                SELECT {local['date']}, {local['hour']}, {local['weekday']}, direction, COUNT(*)
                 FROM traffic
-            """
+                WHERE id > ? AND id <= ?
+                GROUP BY 1, 2, 3, 4
+                ON CONFLICT (local_date, hour, direction)
+                DO UPDATE SET count = count + excluded.count
+            """, (last_id, max_id))
+            
+            cursor.execute("SELECT COUNT(*) FROM traffic WHERE id > ? AND id <= ?", (last_id, max_id))
+            folded = cursor.fetchone()[0]
+            
+            self._set_meta('traffic_rollup_meta', 'last_id', max_id)
+            self._set_meta('traffic_rollup_meta', 'tz_minutes', TIMEZONE_OFFSET_MINUTES)
+            self._set_meta('traffic_rollup_meta', 'version', ROLLUP_VERSION)
+            self._install_rollup_triggers()
+            self.connection.commit()
+            
+            logger.info("🧮 汇总表已刷新：新增 %d 条记录，累计到 id=%s", folded, max_id)
+            return folded
             
-            # 添加方向筛选条件
+        except sqlite3.Error as e:
+            self.connection.rollback()
+            logger.error("❌ 刷新汇总表失败: %s", e)
+            return -1
+
+    @contextmanager
+    def shared_aggregates(self):
+        """
+        在上下文内共享一次聚合扫描
+        
+        首次聚合时按 小时×星期×方向 统计全部数据（最多 24×7×方向数 行），
+        之后上下文内相同时间窗口的图表聚合和计数都从这份统计中筛选汇总，不再访问traffic表。
+        用于一次请求需要多个图表的场景（如 /api/dashboard）。
+        """
+        self._shared_depth += 1
+        try:
+            yield self
+        finally:
+            self._shared_depth -= 1
+            if not self._shared_depth:
+                self._shared_cube = None
+
+    def _aggregate_counts(self, group_columns: List[str], time_range: str = None,
+                          direction_filter: str = None, start: float = None, end: float = None) -> list:
+        """
+        按本地小时/星期/方向分组统计车流量（在shared_aggregates上下文内复用共享统计）
+        
+        Args:
+            group_columns: 分组列，取值为 'hour'、'weekday'、'direction'
+            time_range: 时间段筛选
+            direction_filter: 方向筛选 ('1', '2', '3', '4')
+            start: 时间窗口起始时间戳（包含），None表示不限
+            end: 时间窗口结束时间戳（不包含），None表示不限
+            
+        Returns:
+            list: [(分组值..., 数量)] 按分组列排序
+        """
+        if not self._shared_depth:
+            return self._single_flight_aggregate(group_columns, time_range, direction_filter, start, end)
+        
+        # 共享统计按时间窗口区分：(窗口, 统计结果)
+        window = (start, end)
+        if self._shared_cube is None or self._shared_cube[0] != window:
+            self._shared_cube = (window, self._single_flight_aggregate(list(CUBE_COLUMNS), start=start, end=end))
+        return reduce_aggregate_cube(self._shared_cube[1], group_columns, time_range, direction_filter)
+
+    def _single_flight_aggregate(self, group_columns: List[str], time_range: str = None,
+                                 direction_filter: str = None, start: float = None, end: float = None) -> list:
+        """执行聚合查询，其他线程正在执行相同查询时等待并共享其结果"""
+        def query():
+            return self._query_aggregate_counts(group_columns, time_range, direction_filter, start, end)
+        
+        # 有未提交写入的连接看到的数据与其他连接不同，不参与合并
+        if self.connection.in_transaction:
+            return query()
+        direction = direction_filter.strip() if direction_filter and direction_filter.strip() else None
+        key = ('aggregate', self.db_path, tuple(group_columns), time_range or None, direction, start, end)
+        return _single_flight.do(key, query)
+
+    def _query_aggregate_counts(self, group_columns: List[str], time_range: str = None,
+                                direction_filter: str = None, start: float = None, end: float = None,
+                                id_range: tuple = None, parallel: bool = True) -> list:
+        """
+        按本地小时/星期/方向分组统计车流量
+        
+        汇总表存在时，已汇总部分直接读取traffic_rollup，只对id大于汇总位置的
+        新记录实时计算，因此新增记录总是计入（已汇总的记录被删除或修改后，直到下次refresh_rollup
+        重建前仍按原值计入统计，见refresh_rollup）；汇总表不存在时退回全表扫描
+        （已迁移本地时间列时使用列和索引，否则逐行计算本地时间）。
+        配置 TRAFFIC_ANALYTICS_BACKEND=numpy 时改由内存中的列式引擎计算。
+        
+        指定时间窗口时汇总表和列式引擎都无法按任意时刻切分，改为按 (time, direction)
+        索引范围扫描窗口内的记录，本地小时/星期由time计算，无需回表。
+        
+        没有汇总表的全表扫描在配置 TRAFFIC_AGGREGATE_WORKERS 后按id范围切分，
+        在进程池中各自用只读连接统计后合并（见utils/parallel.py）。
+        
+        Args:
+            group_columns: 分组列，取值为 'hour'、'weekday'、'direction'
+            time_range: 时间段筛选
+            direction_filter: 方向筛选 ('1', '2', '3', '4')
+            start: 时间窗口起始时间戳（包含），None表示不限
+            end: 时间窗口结束时间戳（不包含），None表示不限
+            id_range: 只统计 [起始id, 结束id) 内的记录（并行聚合的分段），None表示不限
+            parallel: 是否允许按id范围并行统计
+            
+        Returns:
+            list: [(分组值..., 数量)] 按分组列排序
+        """
+        windowed = start is not None or end is not None
+        if ANALYTICS_BACKEND == 'numpy' and not windowed and id_range is None:
+            engine = self._get_analytics_engine()
+            if engine is not None:
+                engine.sync(self.connection)
+                return engine.aggregate(group_columns, time_range=time_range,
+                                        direction_filter=direction_filter)
+        
+        if windowed:
+            local = {'hour': LOCAL_HOUR_SQL, 'weekday': LOCAL_WEEKDAY_SQL}
+        else:
+            local = self._local_time_sql()
+        live_columns = {
+            'hour': local['hour'],
+            'weekday': local['weekday'],
+            'direction': 'direction'
+        }
+        group_list = ', '.join(group_columns)
+        
+        def build_conditions(hour_column):
             conditions = []
             params = []
-            
+            if time_range:
+                time_condition = self._get_time_condition(time_range, hour_column)
+                if time_condition:
+                    conditions.append(time_condition)
             if direction_filter and direction_filter.strip():
                 conditions.append("direction = ?")
                 params.append(int(direction_filter))
+            return conditions, params
+        
+        live_select = ', '.join(f"{live_columns[column]} AS {column}" for column in group_columns)
+        live_conditions, live_params = build_conditions(local['hour'])
+        window, window_params = window_conditions(start, end)
+        live_conditions += window
+        live_params += window_params
+        if id_range is not None:
+            live_conditions += ["id >= ?", "id < ?"]
+            live_params += list(id_range)
+        last_id = None if windowed or id_range is not None else self._get_rollup_last_id()
+        
+        if (last_id is None and not windowed and id_range is None and parallel
+                and AGGREGATE_WORKERS > 1 and not self.connection.in_transaction):
+            rows = self._parallel_aggregate_counts(group_columns, time_range, direction_filter)
+            if rows is not None:
+                return rows
+        
+        if last_id is None:
+            # 没有汇总表：全表扫描（有时间窗口时为索引范围扫描）
+            where_clause = f" WHERE {' AND '.join(live_conditions)}" if live_conditions else ""
+            query = f"""
+                SELECT {live_select}, COUNT(*) AS count
+                FROM {self._source(start, end)}{where_clause}
+                GROUP BY {group_list} ORDER BY {group_list}
+            """
+            params = live_params
+        else:
+            rollup_conditions, rollup_params = build_conditions('hour')
+            rollup_where = f" WHERE {' AND '.join(rollup_conditions)}" if rollup_conditions else ""
+            tail_where = ' AND '.join(['id > ?'] + live_conditions)
+            query = f"""
+                SELECT {group_list}, SUM(count) AS count FROM (
+                    SELECT {group_list}, count FROM traffic_rollup{rollup_where}
+                    UNION ALL
+                    SELECT {live_select}, COUNT(*) AS count
+                    FROM traffic WHERE {tail_where}
+                    GROUP BY {group_list}
+                )
+                GROUP BY {group_list} ORDER BY {group_list}
+            """
+            params = rollup_params + [last_id] + live_params
+        
+        cursor = self.connection.cursor()
+        cursor.execute(query, params)
+        return [tuple(row) for row in cursor.fetchall()]
+
+    def _parallel_aggregate_counts(self, group_columns: List[str], time_range: str = None,
+                                   direction_filter: str = None) -> Optional[list]:
+        """
+        把全表扫描聚合按id范围切分到进程池中并行统计
+        
+        Returns:
+            Optional[list]: [(分组值..., 数量)] 按分组列排序；id范围太小不值得并行或进程池不可用时返回None
+        """
+        low, high = self._id_bound('MIN'), self._id_bound('MAX')
+        if low is None or high - low + 1 < AGGREGATE_PARALLEL_MIN_ROWS:
+            return None
+        
+        try:
+            from .parallel import parallel_aggregate
+        except ImportError:
+            from parallel import parallel_aggregate
+        return parallel_aggregate(self.db_path, (low, high + 1), group_columns, time_range, direction_filter)
+
+    def _get_analytics_engine(self):
+        """
+        获取NumPy分析引擎（numpy为可选依赖，未安装时退回SQL路径）
+        
+        Returns:
+            ColumnarAnalytics: 分析引擎，不可用时返回None
+        """
+        try:
+            try:
+                from .analytics import get_analytics_engine
+            except ImportError:
+                from analytics import get_analytics_engine
+        except ImportError as e:
+            logger.warning("⚠️ NumPy分析引擎不可用，使用SQL聚合: %s", e)
+            return None
+        return get_analytics_engine(self.db_path)
+
+    def get_hourly_traffic_trend(self, direction_filter: str = None,
+                                 start: float = None, end: float = None) -> dict:
+        """
+        获取24小时车流量趋势数据
+        
+        Args:
+            direction_filter: 方向筛选 ('1', '2', '3', '4')
+            start: 时间窗口起始时间戳（包含），None表示不限
+            end: 时间窗口结束时间戳（不包含），None表示不限
             
-            if conditions:
-                base_query += " WHERE " + " AND ".join(conditions)
-            
-            base_query += " GROUP BY hour ORDER BY hour"
-            
-            # 执行查询
-            cursor = self.connection.cursor()
-            cursor.execute(base_query, params)
-            results = cursor.fetchall()
+        Returns:
+            dict: {hour: count} 格式的24小时数据
+        """
+        try:
+            # 按小时统计车流量
+            results = self._aggregate_counts(['hour'], direction_filter=direction_filter, start=start, end=end)
             
             # 初始化24小时数据（0-23小时）
             hourly_data = {hour: 0 for hour in range(24)}
             
             # 填充查询结果
-            for row in results:
-                hour, count = row
+            for hour, count in results:
                 hourly_data[hour] = count
             
-            print(f"📈 获取24小时趋势数据成功，总计 {sum(hourly_data.values())} 条记录")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("📈 获取24小时趋势数据成功，总计 %d 条记录", sum(hourly_data.values()))
             return hourly_data
             
         except sqlite3.Error as e:
-            print(f"❌ 获取时间趋势数据失败: {e}")
+            logger.error("❌ 获取时间趋势数据失败: %s", e)
             return {hour: 0 for hour in range(24)}
 
-    def get_hourly_traffic_trend_by_weekday(self, direction_filter: str = None) -> dict:
+    def get_hourly_traffic_trend_by_weekday(self, direction_filter: str = None,
+                                            start: float = None, end: float = None) -> dict:
         """
         获取按工作日/周末区分的24小时车流量趋势数据（平均每小时）
         
         Args:
             direction_filter: 方向筛选 ('1', '2', '3', '4')
+            start: 时间窗口起始时间戳（包含），None表示不限
+            end: 时间窗口结束时间戳（不包含），None表示不限
             
         Returns:
             dict: {
@@ -282,40 +1848,17 @@ class TrafficDatabase:
             }
         """
         try:
-            # 构建SQL查询，按小时和星期几统计车流量
+            # 按小时和星期几统计车流量
             # strftime('%w', datetime) 返回星期几：0=周日, 1=周一, ..., 6=周六
-            base_query = """
-                SELECT CAST(strftime('%H', datetime(time, 'unixepoch', 'localtime')) AS INTEGER) as hour,
-                       CAST(strftime('%w', datetime(time, 'unixepoch', 'localtime')) AS INTEGER) as weekday,
-                       COUNT(*) as count
-                FROM traffic
-            """
-            
-            # 添加方向筛选条件
-            conditions = []
-            params = []
-            
-            if direction_filter and direction_filter.strip():
-                conditions.append("direction = ?")
-                params.append(int(direction_filter))
-            
-            if conditions:
-                base_query += " WHERE " + " AND ".join(conditions)
-            
-            base_query += " GROUP BY hour, weekday ORDER BY hour, weekday"
-            
-            # 执行查询
-            cursor = self.connection.cursor()
-            cursor.execute(base_query, params)
-            results = cursor.fetchall()
+            results = self._aggregate_counts(['hour', 'weekday'], direction_filter=direction_filter,
+                                             start=start, end=end)
             
             # 初始化数据结构
             weekday_data = {hour: 0 for hour in range(24)}  # 工作日累计
             weekend_data = {hour: 0 for hour in range(24)}  # 周末累计
             
             # 填充查询结果
-            for row in results:
-                hour, weekday, count = row
+            for hour, weekday, count in results:
                 # weekday: 0=周日, 1=周一, 2=周二, 3=周三, 4=周四, 5=周五, 6=周六
                 # 工作日: 1-5 (周一到周五)
                 # 周末: 0,6 (周日和周六)
@@ -330,18 +1873,12 @@ class TrafficDatabase:
             weekday_avg = {hour: count / 5 for hour, count in weekday_data.items()}
             weekend_avg = {hour: count / 2 for hour, count in weekend_data.items()}
             
-            weekday_total = sum(weekday_data.values())
-            weekend_total = sum(weekend_data.values())
-            weekday_avg_total = sum(weekday_avg.values())
-            weekend_avg_total = sum(weekend_avg.values())
-            
-            print(f"📈 获取周末/工作日平均趋势数据成功")
-            print(f"   工作日总计: {weekday_total} 条记录 (5天)")
-            print(f"   工作日平均每天: {weekday_total/5:.0f} 条记录")
-            print(f"   工作日平均每小时总和: {weekday_avg_total:.0f} 条记录")
-            print(f"   周末总计: {weekend_total} 条记录 (2天)")
-            print(f"   周末平均每天: {weekend_total/2:.0f} 条记录")
-            print(f"   周末平均每小时总和: {weekend_avg_total:.0f} 条记录")
+            if logger.isEnabledFor(logging.DEBUG):
+                weekday_total = sum(weekday_data.values())
+                weekend_total = sum(weekend_data.values())
+                logger.debug("📈 获取周末/工作日平均趋势数据成功：工作日总计 %d 条（平均每天 %.0f 条），"
+                             "周末总计 %d 条（平均每天 %.0f 条）",
+                             weekday_total, weekday_total / 5, weekend_total, weekend_total / 2)
             
             return {
                 'weekday': weekday_avg,
@@ -349,64 +1886,218 @@ class TrafficDatabase:
             }
             
         except sqlite3.Error as e:
-            print(f"❌ 获取周末/工作日趋势数据失败: {e}")
+            logger.error("❌ 获取周末/工作日趋势数据失败: %s", e)
             return {
                 'weekday': {hour: 0 for hour in range(24)},
                 'weekend': {hour: 0 for hour in range(24)}
             }
 
-    def get_direction_distribution(self, time_range: Optional[str] = None) -> Dict[int, int]:
+    def get_direction_distribution(self, time_range: Optional[str] = None,
+                                   start: float = None, end: float = None) -> Dict[int, int]:
         """
         获取交通方向分布统计
         
         Args:
             time_range: 时间段筛选 ('morning', 'noon', 'afternoon', 'evening', 'night')
+            start: 时间窗口起始时间戳（包含），None表示不限
+            end: 时间窗口结束时间戳（不包含），None表示不限
         
         Returns:
             Dict[int, int]: {方向ID: 记录数量}
         """
         if not self.connection:
-            print("❌ 请先连接数据库")
+            logger.error("❌ 请先连接数据库")
             return {}
         
         try:
-            cursor = self.connection.cursor()
-            
-            # 构建查询条件
-            query = "SELECT direction, COUNT(*) as count FROM traffic"
-            params = []
-            
-            # 根据时间段添加WHERE条件
-            if time_range:
-                time_condition = self._get_time_condition(time_range)
-                if time_condition:
-                    query += f" WHERE {time_condition}"
-            
-            query += " GROUP BY direction ORDER BY direction"
-            
-            cursor.execute(query, params)
-            rows = cursor.fetchall()
+            rows = self._aggregate_counts(['direction'], time_range=time_range, start=start, end=end)
             
             # 转换为字典格式
             direction_stats = {}
-            for row in rows:
-                direction_stats[row[0]] = row[1]
+            for direction, count in rows:
+                direction_stats[direction] = count
             
-            print(f"📊 方向分布统计：{direction_stats}")
+            logger.debug("📊 方向分布统计：%s", direction_stats)
             return direction_stats
             
         except sqlite3.Error as e:
-            print(f"❌ 查询方向分布失败: {e}")
+            logger.error("❌ 查询方向分布失败: %s", e)
             return {}
 
-# 返回数据库实例
-def get_database(db_path: str = None) -> TrafficDatabase:
+# 记录调用耗时的数据库方法（traffic_db_method_duration_seconds，见 /metrics）
+INSTRUMENTED_METHODS = (
+    'connect', 'get_data_version', 'count_with_filters', 'search_with_filters', 'search_with_cursor',
+    'find_by_plate', 'search_plates', 'refresh_rollup', 'get_hourly_traffic_trend',
+    'get_hourly_traffic_trend_by_weekday', 'get_direction_distribution'
+)
+instrument_methods(TrafficDatabase, INSTRUMENTED_METHODS)
+
+
+# 共享聚合统计的分组列
+CUBE_COLUMNS = ('hour', 'weekday', 'direction')
+
+
+def reduce_aggregate_cube(cube: list, group_columns: List[str], time_range: str = None,
+                          direction_filter: str = None) -> list:
+    """
+    从 (小时, 星期, 方向, 数量) 统计中筛选并重新分组，结果与直接查询相同
+    
+    Args:
+        cube: 按CUBE_COLUMNS分组的统计结果
+        group_columns: 分组列，取值为 'hour'、'weekday'、'direction'
+        time_range: 时间段筛选
+        direction_filter: 方向筛选 ('1', '2', '3', '4')
+        
+    Returns:
+        list: [(分组值..., 数量)] 按分组列排序
+    """
+    hours = None
+    if time_range in TIME_RANGE_HOURS:
+        start_hour, end_hour = TIME_RANGE_HOURS[time_range]
+        if start_hour <= end_hour:
+            hours = set(range(start_hour, end_hour + 1))
+        else:
+            hours = set(range(start_hour, 24)) | set(range(0, end_hour + 1))
+    direction = int(direction_filter) if direction_filter and direction_filter.strip() else None
+    
+    positions = [CUBE_COLUMNS.index(column) for column in group_columns]
+    totals = {}
+    for row in cube:
+        if hours is not None and row[0] not in hours:
+            continue
+        if direction is not None and row[2] != direction:
+            continue
+        key = tuple(row[position] for position in positions)
+        totals[key] = totals.get(key, 0) + row[3]
+    return [key + (count,) for key, count in sorted(totals.items())]
+
+
+def merge_aggregate_counts(results: List[list]) -> list:
+    """
+    合并多个查询（分片、id区间）的分组计数
+
+    Args:
+        results: 各查询的 [(分组值..., 数量)]
+
+    Returns:
+        list: [(分组值..., 数量)] 按分组列排序
+    """
+    totals = {}
+    for rows in results:
+        for row in rows:
+            key = tuple(row[:-1])
+            totals[key] = totals.get(key, 0) + row[-1]
+    return [key + (count,) for key, count in sorted(totals.items())]
+
+
+def resolve_db_path(db_path: str = None) -> str:
+    """返回数据库路径：参数 > 环境变量 TRAFFIC_DB_PATH > 项目默认路径"""
+    if db_path is None:
+        db_path = os.environ.get('TRAFFIC_DB_PATH')
     if db_path is None:
         # 默认数据库路径（相对于项目根目录）
         current_dir = os.path.dirname(os.path.dirname(__file__))  # 回到项目根目录
         db_path = os.path.join(current_dir, 'data', 'traffic.db')
+    return db_path
+
+
+# 连接池注册表 {(进程id, 数据库路径): ConnectionPool}
+# 按进程区分，避免gunicorn fork之后子进程复用父进程的连接
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_connection_pool(db_path: str = None) -> ConnectionPool:
+    """
+    获取（按需创建）指定数据库的共享只读连接池
     
-    return TrafficDatabase(db_path)
+    Args:
+        db_path: 数据库文件路径
+        
+    Returns:
+        ConnectionPool: 当前进程共享的连接池
+    """
+    key = (os.getpid(), resolve_db_path(db_path))
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = ConnectionPool(key[1])
+            _pools[key] = pool
+        return pool
+
+
+def get_page_anchor_stats() -> dict:
+    """返回当前进程页锚点缓存的统计信息"""
+    return _page_anchor_cache.stats()
+
+
+def get_single_flight_stats() -> dict:
+    """返回当前进程聚合查询合并（single-flight）的统计信息"""
+    return _single_flight.stats()
+
+
+def get_pool_stats() -> List[dict]:
+    """返回当前进程所有连接池的统计信息"""
+    pid = os.getpid()
+    with _pools_lock:
+        pools = [pool for (pool_pid, _), pool in _pools.items() if pool_pid == pid]
+    return [dict(pool.stats(), pid=pid) for pool in pools]
+
+
+# 返回数据库实例
+def get_database(db_path: str = None, pooled: bool = False, intersections: Optional[tuple] = None) -> TrafficDatabase:
+    """
+    创建数据库实例
+    
+    Args:
+        db_path: 数据库文件路径，默认见resolve_db_path；为目录时目录中的每个 *.db 文件是一个路口分片
+        pooled: 是否使用共享只读连接池（Web请求使用；维护命令需要写入，不使用连接池）
+        intersections: 只查询这些路口（仅分片目录）
+        
+    Returns:
+        TrafficDatabase: 数据库实例（分片目录时为只读的 ShardedTrafficDatabase）
+        
+    Raises:
+        ValueError: 路口不存在，或未使用分片目录时指定了路口
+    """
+    db_path = resolve_db_path(db_path)
+    if os.path.isdir(db_path):
+        try:
+            from .shards import open_sharded_database
+        except ImportError:
+            from shards import open_sharded_database
+        return open_sharded_database(db_path, intersections)
+    if intersections:
+        raise ValueError("未配置分片数据库（TRAFFIC_DB_PATH不是目录），不支持按路口筛选")
+    pool = get_connection_pool(db_path) if pooled else None
+    return TrafficDatabase(db_path, pool=pool)
+
+@contextmanager
+def database_session(db: Optional[TrafficDatabase] = None):
+    """
+    获取一个可用的数据库实例
+    
+    提供了已连接的db时直接使用（由调用方负责断开）；
+    否则从共享连接池借出连接，使用完毕后自动归还。
+    
+    Args:
+        db: 已连接的数据库实例（可选）
+        
+    Raises:
+        Exception: 无法连接数据库
+    """
+    if db is not None:
+        yield db
+        return
+    
+    db = get_database(pooled=True)
+    if not db.connect():
+        logger.error("❌ 数据库连接失败")
+        raise Exception("无法连接数据库")
+    try:
+        yield db
+    finally:
+        db.disconnect()
 
 # 简单的测试函数
 def test_pagination():
@@ -425,5 +2116,86 @@ def test_pagination():
     return True
 
 if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="交通数据库维护工具")
+    subparsers = parser.add_subparsers(dest='command')
+    
+    rollup_parser = subparsers.add_parser('rollup', help='增量刷新小时×星期×方向汇总表')
+    rollup_parser.add_argument('--db', default=None, help='数据库文件路径（分片目录时对每个分片执行）')
+    rollup_parser.add_argument('--rebuild', action='store_true', help='删除已有汇总并全量重建')
+    
+    migrate_parser = subparsers.add_parser('migrate', help='增加本地时间列、分批回填并建立索引')
+    migrate_parser.add_argument('--db', default=None, help='数据库文件路径（分片目录时对每个分片执行）')
+    migrate_parser.add_argument('--batch-size', type=int, default=100000, help='每批回填的id区间大小')
+    
+    index_parser = subparsers.add_parser('index', help='建立时间窗口和车牌查询使用的索引')
+    index_parser.add_argument('--db', default=None, help='数据库文件路径（分片目录时对每个分片执行）')
+    
+    partition_parser = subparsers.add_parser('partition', help='把traffic表转换为按时间分区存储')
+    partition_parser.add_argument('--db', default=None, help='数据库文件路径（分片目录时对每个分片执行）')
+    partition_parser.add_argument('--months', type=int, default=None,
+                                  help='每个分区覆盖的月数（默认 TRAFFIC_PARTITION_MONTHS，即按月）')
+    
+    archive_parser = subparsers.add_parser('archive', help='把旧分区压缩归档（.csv.gz）并从数据库删除')
+    archive_parser.add_argument('--db', default=None, help='数据库文件路径（分片目录时对每个分片执行）')
+    archive_group = archive_parser.add_mutually_exclusive_group(required=True)
+    archive_group.add_argument('--before', help='归档在此时间之前结束的分区（YYYY-MM-DD）')
+    archive_group.add_argument('--keep-months', type=int, help='保留最近N个月（含本月）的分区')
+    archive_parser.add_argument('--archive-dir', default=None, help='归档目录（默认与数据库同目录的 archive/）')
+    
+    args = parser.parse_args()
+    configure_logging()
+    
+    def run_maintenance(command) -> bool:
+        """对数据库（分片目录时依次对每个分片）执行维护命令"""
+        db_path = resolve_db_path(args.db)
+        if os.path.isdir(db_path):
+            try:
+                from .shards import list_shards
+            except ImportError:
+                from shards import list_shards
+            paths = list(list_shards(db_path).values())
+        else:
+            paths = [db_path]
+        success = True
+        for path in paths:
+            db = get_database(path)
+            if not db.connect():
+                return False
+            success = command(db) and success
+            db.disconnect()
+        return success
+    
+    if args.command == 'index':
+        raise SystemExit(0 if run_maintenance(lambda db: db.create_search_indexes()) else 1)
+    
+    if args.command == 'migrate':
+        success = run_maintenance(lambda db: db.migrate_local_time_columns(batch_size=args.batch_size))
+        raise SystemExit(0 if success else 1)
+    
+    if args.command == 'rollup':
+        success = run_maintenance(lambda db: db.refresh_rollup(rebuild=args.rebuild) >= 0)
+        raise SystemExit(0 if success else 1)
+    
+    if args.command in ('partition', 'archive'):
+        try:
+            from .partitions import PARTITION_MONTHS, archive_partitions, month_start, partition_database
+        except ImportError:
+            from partitions import PARTITION_MONTHS, archive_partitions, month_start, partition_database
+        
+        if args.command == 'partition':
+            success = run_maintenance(lambda db: partition_database(db, args.months or PARTITION_MONTHS))
+            raise SystemExit(0 if success else 1)
+        
+        if args.keep_months is not None and args.keep_months < 1:
+            parser.error("--keep-months 至少为1")
+        try:
+            before = parse_time_bound(args.before) if args.before else month_start(args.keep_months - 1)
+        except ValueError as e:
+            parser.error(str(e))
+        success = run_maintenance(lambda db: archive_partitions(db, before, args.archive_dir) is not None)
+        raise SystemExit(0 if success else 1)
+    
     # 运行测试
     test_pagination()
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+搜索结果导出模块
+把 TrafficDatabase.iter_filtered_rows 逐批读出的记录编码为流式响应的数据块：
+- csv: 每批写成一个CSV数据块（UTF-8）
+- parquet / arrow: 每批写成一个Parquet行组 / Arrow IPC记录批（需要可选依赖pyarrow）
+
+每次只编码一批记录，导出任意规模的数据时内存占用保持不变。
+"""
+
+import csv
+import io
+import os
+import sys
+from datetime import datetime
+from typing import Iterable, Iterator, List
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from utils.constants import DIRECTION_MAP
+from utils.database import EXPORT_COLUMNS, LOCAL_TZ
+
+# 导出文件的列：原始列 + 本地时间 + 方向描述
+EXPORT_HEADER = ['id', 'direction', 'direction_text', 'time', 'local_time', 'plate']
+
+# 导出格式 -> (Content-Type, 文件扩展名)
+EXPORT_FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrows'),
+}
+
+# 需要pyarrow的格式
+ARROW_FORMATS = ('parquet', 'arrow')
+
+
+def format_local_time(timestamp: float) -> str:
+    """按统计时区格式化时间戳"""
+    return datetime.fromtimestamp(timestamp, tz=LOCAL_TZ).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def expand_rows(rows: List[tuple]) -> List[tuple]:
+    """
+    EXPORT_COLUMNS 顺序的 (id, direction, time, plate, [附加列...]) -> EXPORT_HEADER（+附加列）对应的行
+    """
+    return [(row[0], row[1], DIRECTION_MAP.get(row[1], ''), row[2], format_local_time(row[2])) + tuple(row[3:])
+            for row in rows]
+
+
+def iter_csv(batches: Iterable[List[tuple]], extra_columns: tuple = ()) -> Iterator[bytes]:
+    """
+    把记录批次编码为CSV数据块（第一块为表头）
+
+    Args:
+        batches: iter_filtered_rows 产生的记录批次
+        extra_columns: plate之后的附加列（如分片数据库的 intersection）
+
+    Yields:
+        bytes: CSV数据块
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(EXPORT_HEADER + list(extra_columns))
+    yield buffer.getvalue().encode('utf-8')
+
+    for rows in batches:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(expand_rows(rows))
+        yield buffer.getvalue().encode('utf-8')
+
+
+def pyarrow_available() -> bool:
+    """检查可选依赖pyarrow是否可用"""
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class _DrainableSink:
+    """
+    只追加的输出对象：pyarrow写入的数据暂存在内存中，每批写完后由生成器取走，
+    tell() 返回累计写入的字节数（Parquet文件尾部的偏移量依赖它）
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def drain(self) -> bytes:
+        """取走已写入的数据"""
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _arrow_schema(extra_columns: tuple = ()):
+    """导出文件的Arrow结构（附加列为字符串）"""
+    import pyarrow as pa
+
+    return pa.schema([
+        ('id', pa.int64()),
+        ('direction', pa.int8()),
+        ('direction_text', pa.string()),
+        ('time', pa.float64()),
+        ('local_time', pa.string()),
+        ('plate', pa.string()),
+    ] + [(column, pa.string()) for column in extra_columns])
+
+
+def _arrow_batch(rows: List[tuple], schema):
+    """把一批记录转换为Arrow记录批"""
+    import pyarrow as pa
+
+    columns = list(zip(*expand_rows(rows)))
+    return pa.RecordBatch.from_arrays([pa.array(column, type=field.type)
+                                       for column, field in zip(columns, schema)], schema=schema)
+
+
+def iter_arrow(batches: Iterable[List[tuple]], file_format: str = 'parquet',
+               extra_columns: tuple = ()) -> Iterator[bytes]:
+    """
+    把记录批次编码为Parquet（每批一个行组）或Arrow IPC流
+
+    Args:
+        batches: iter_filtered_rows 产生的记录批次
+        file_format: 'parquet' 或 'arrow'
+        extra_columns: plate之后的附加列
+
+    Yields:
+        bytes: 文件数据块
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _arrow_schema(extra_columns)
+    sink = _DrainableSink()
+    output = pa.PythonFile(sink, mode='w')
+    if file_format == 'parquet':
+        writer = pq.ParquetWriter(output, schema)
+
+        def write(batch):
+            writer.write_table(pa.Table.from_batches([batch]))
+    else:
+        writer = pa.ipc.new_stream(output, schema)
+        write = writer.write_batch
+
+    for rows in batches:
+        write(_arrow_batch(rows, schema))
+        chunk = sink.drain()
+        if chunk:
+            yield chunk
+    writer.close()
+    yield sink.drain()
+
+
+def iter_export(batches: Iterable[List[tuple]], file_format: str,
+                columns: tuple = EXPORT_COLUMNS) -> Iterator[bytes]:
+    """
+    按格式编码导出数据
+
+    Args:
+        batches: iter_filtered_rows 产生的记录批次
+        file_format: EXPORT_FORMATS 中的格式
+        columns: 记录元组的列（TrafficDatabase.record_columns）
+
+    Returns:
+        Iterator[bytes]: 文件数据块
+    """
+    extra_columns = tuple(columns[len(EXPORT_COLUMNS):])
+    if file_format == 'csv':
+        return iter_csv(batches, extra_columns)
+    return iter_arrow(batches, file_format, extra_columns)
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+交通数据批量导入模块
+以流式分块的方式把CSV/JSONL格式的车牌识别记录写入traffic表
+
+用法：
+    python -m utils.ingest data/batch_0801.csv data/batch_0802.jsonl.gz
+    python -m utils.ingest --db data/traffic.db --chunk-size 50000 new_records.csv
+
+- 每块记录先用executemany写入临时表，再一次性去重插入traffic表
+- 多个块合并在一个大事务中提交，减少fsync次数
+- 数据库切换为WAL模式，导入期间app.py的读请求不会被阻塞
+- 按 (plate, time, direction) 去重，重复导入同一文件不会产生重复记录
+- 按时间分区存储时，记录经traffic视图的插入触发器写入所属分区，缺少的月份分区自动建立
+"""
+
+import csv
+import gzip
+import io
+import json
+import logging
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime, timezone, timedelta
+from typing import Iterable, Iterator, List, Optional
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from utils.database import get_database, partition_object_name, LOCAL_DATE_SQL, LOCAL_TIME_COLUMNS
+from utils.partitions import ensure_partitions, last_assigned_id
+from utils.constants import DIRECTION_MAP, TIMEZONE_OFFSET_HOURS
+from utils.metrics import configure_logging
+
+logger = logging.getLogger(__name__)
+
+# 导入文件中不带时区的时间字符串按统计时区解析
+INPUT_TZ = timezone(timedelta(hours=TIMEZONE_OFFSET_HOURS))
+
+# 去重使用的索引（同时可用于按车牌查询）
+DEDUP_INDEX = 'idx_traffic_plate_time_direction'
+
+
+def open_input(path: str) -> io.TextIOBase:
+    """打开输入文件，.gz结尾的文件自动解压"""
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', newline='')
+    return open(path, 'r', encoding='utf-8', newline='')
+
+
+def parse_timestamp(value) -> float:
+    """
+    解析时间字段
+
+    Args:
+        value: Unix时间戳（数字或数字字符串），或 'YYYY-MM-DD HH:MM:SS' 格式的时间字符串
+
+    Returns:
+        float: Unix时间戳
+    """
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value).strip()
+    try:
+        return float(text)
+    except ValueError:
+        moment = datetime.fromisoformat(text)
+        if moment.tzinfo is None:
+            moment = moment.replace(tzinfo=INPUT_TZ)
+        return moment.timestamp()
+
+
+def parse_record(raw: dict) -> Optional[tuple]:
+    """
+    校验并转换一条原始记录
+
+    Args:
+        raw: 包含 direction、time、plate 字段的字典
+
+    Returns:
+        Optional[tuple]: (direction, time, plate)，记录无效时返回None
+    """
+    try:
+        direction = int(raw['direction'])
+        timestamp = parse_timestamp(raw['time'])
+        plate = str(raw['plate']).strip()
+    except (KeyError, TypeError, ValueError):
+        return None
+
+    if direction not in DIRECTION_MAP or not plate:
+        return None
+    return direction, timestamp, plate
+
+
+def read_records(path: str) -> Iterator[Optional[tuple]]:
+    """
+    流式读取文件中的记录
+
+    Args:
+        path: CSV（带表头）或JSONL文件路径，可以是.gz压缩文件
+
+    Yields:
+        Optional[tuple]: 解析后的记录，无效记录为None
+    """
+    is_jsonl = path.endswith(('.jsonl', '.jsonl.gz', '.json', '.json.gz'))
+    with open_input(path) as handle:
+        if is_jsonl:
+            for line in handle:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield parse_record(json.loads(line))
+                except json.JSONDecodeError:
+                    yield None
+        else:
+            for row in csv.DictReader(handle):
+                yield parse_record(row)
+
+
+def chunked(records: Iterable, chunk_size: int) -> Iterator[List]:
+    """把记录流切分为固定大小的块"""
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class TrafficIngestor:
+    """交通记录批量导入器"""
+
+    def __init__(self, db_path: str = None, chunk_size: int = 50000, commit_rows: int = 500000):
+        """
+        初始化导入器
+
+        Args:
+            db_path: 数据库文件路径
+            chunk_size: 每次executemany写入的记录数
+            commit_rows: 每个事务包含的记录数
+        """
+        self.db = get_database(db_path)
+        self.chunk_size = chunk_size
+        self.commit_rows = commit_rows
+        self.stats = {'read': 0, 'inserted': 0, 'duplicates': 0, 'rejected': 0, 'seconds': 0.0}
+
+    def prepare(self) -> None:
+        """切换WAL模式、创建去重索引和临时表"""
+        connection = self.db.connection
+        # WAL模式下写入不阻塞读取；导入期间降低同步级别以提升吞吐
+        connection.execute("PRAGMA journal_mode = WAL")
+        connection.execute("PRAGMA synchronous = NORMAL")
+        connection.execute("PRAGMA temp_store = MEMORY")
+        connection.execute("PRAGMA cache_size = -262144")
+        for table in self.db._storage_tables():
+            connection.execute(f"CREATE INDEX IF NOT EXISTS {partition_object_name(DEDUP_INDEX, table)} "
+                               f"ON {table} (plate, time, direction)")
+        connection.execute("""
+            CREATE TEMP TABLE IF NOT EXISTS ingest_staging (
+                direction INTEGER,
+                time REAL,
+                plate TEXT
+            )
+        """)
+        connection.commit()
+
+        # 已迁移本地时间列时在插入语句中直接计算，避免触发器逐行更新
+        existing_columns = {row[1] for row in connection.execute("PRAGMA table_info(traffic)")}
+        local_columns = [column for column in LOCAL_TIME_COLUMNS if column in existing_columns]
+        insert_columns = ', '.join(['direction', 'time', 'plate'] + local_columns)
+        select_columns = ', '.join(['direction', 'time', 'plate']
+                                   + [LOCAL_TIME_COLUMNS[column][1] for column in local_columns])
+        self._insert_sql = f"""
+            INSERT INTO traffic ({insert_columns})
+            SELECT {select_columns} FROM (
+                SELECT DISTINCT direction, time, plate FROM ingest_staging s
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM traffic t
+                    WHERE t.plate = s.plate AND t.time = s.time AND t.direction = s.direction
+                )
+            )
+        """
+
+    def _load_chunk(self, chunk: List[Optional[tuple]]) -> None:
+        """写入一个块（不提交）"""
+        valid = [record for record in chunk if record is not None]
+        self.stats['read'] += len(chunk)
+        self.stats['rejected'] += len(chunk) - len(valid)
+
+        cursor = self.db.connection.cursor()
+        cursor.execute("DELETE FROM ingest_staging")
+        cursor.executemany("INSERT INTO ingest_staging (direction, time, plate) VALUES (?, ?, ?)", valid)
+        if self.db._partitions() is None:
+            cursor.execute(self._insert_sql)
+            inserted = cursor.rowcount
+        else:
+            # 每个本地月份取一条记录的时间，建立缺少的分区；经触发器写入的行数不计入rowcount
+            cursor.execute(f"SELECT MIN(time) FROM ingest_staging GROUP BY substr({LOCAL_DATE_SQL}, 1, 7)")
+            ensure_partitions(self.db, [row[0] for row in cursor.fetchall()])
+            assigned = last_assigned_id(self.db)
+            cursor.execute(self._insert_sql)
+            inserted = last_assigned_id(self.db) - assigned
+        self.stats['inserted'] += inserted
+        self.stats['duplicates'] += len(valid) - inserted
+
+    def ingest_files(self, paths: List[str], refresh_rollup: bool = True) -> dict:
+        """
+        导入多个文件
+
+        Args:
+            paths: 输入文件路径列表
+            refresh_rollup: 导入完成后是否增量刷新汇总表（汇总表存在时）
+
+        Returns:
+            dict: 导入统计（读取、插入、重复、无效条数，耗时和每秒行数）
+        """
+        if not self.db.connect():
+            raise RuntimeError(f"无法连接数据库: {self.db.db_path}")
+
+        start = time.perf_counter()
+        try:
+            self.prepare()
+            connection = self.db.connection
+            pending_rows = 0
+
+            for path in paths:
+                logger.info("📥 开始导入: %s", path)
+                connection.execute("BEGIN")
+                for chunk in chunked(read_records(path), self.chunk_size):
+                    self._load_chunk(chunk)
+                    pending_rows += len(chunk)
+                    if pending_rows >= self.commit_rows:
+                        connection.commit()
+                        pending_rows = 0
+                        self._report(start)
+                        connection.execute("BEGIN")
+                connection.commit()
+                pending_rows = 0
+                self._report(start)
+
+            if refresh_rollup and self.db._get_rollup_last_id() is not None:
+                self.db.refresh_rollup()
+        except Exception:
+            if self.db.connection.in_transaction:
+                self.db.connection.rollback()
+            raise
+        finally:
+            self.db.connection.execute("DROP TABLE IF EXISTS temp.ingest_staging")
+            self.db.disconnect()
+
+        self.stats['seconds'] = round(time.perf_counter() - start, 3)
+        self.stats['rows_per_sec'] = round(self.stats['read'] / self.stats['seconds']) if self.stats['seconds'] else 0
+        logger.info("✅ 导入完成：读取 %d 条，插入 %d 条，重复 %d 条，无效 %d 条，%s 行/秒",
+                    self.stats['read'], self.stats['inserted'], self.stats['duplicates'],
+                    self.stats['rejected'], self.stats['rows_per_sec'])
+        return self.stats
+
+    def _report(self, start: float) -> None:
+        """记录当前吞吐量"""
+        elapsed = time.perf_counter() - start
+        rate = self.stats['read'] / elapsed if elapsed else 0
+        logger.info("⏳ 已处理 %d 条，插入 %d 条，%s 行/秒", self.stats['read'], self.stats['inserted'], f"{rate:,.0f}")
+
+
+def main(argv: List[str] = None) -> int:
+    """命令行入口"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="批量导入交通记录（CSV/JSONL，支持.gz）")
+    parser.add_argument('files', nargs='+', help='输入文件，CSV需包含表头 direction,time,plate')
+    parser.add_argument('--db', default=None, help='数据库文件路径')
+    parser.add_argument('--chunk-size', type=int, default=50000, help='每块记录数')
+    parser.add_argument('--commit-rows', type=int, default=500000, help='每个事务包含的记录数')
+    parser.add_argument('--no-rollup', action='store_true', help='导入后不刷新汇总表')
+    args = parser.parse_args(argv)
+    configure_logging()
+
+    ingestor = TrafficIngestor(args.db, chunk_size=args.chunk_size, commit_rows=args.commit_rows)
+    try:
+        ingestor.ingest_files(args.files, refresh_rollup=not args.no_rollup)
+    except (RuntimeError, OSError, sqlite3.Error) as e:
+        logger.error("❌ 导入失败: %s", e)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
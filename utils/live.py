@@ -0,0 +1,430 @@
+#!/usr/bin/env python3
+"""
+实时推送模块（Server-Sent Events）
+每个进程、每个数据库只有一个LiveFeed轮询线程：按固定间隔读取traffic表的最大id（主键查找），
+发现新记录时只按id范围统计新增部分，得到 本地小时 × 方向 的增量，由所有订阅者共享。
+各订阅者（LiveSubscription）再按自己的筛选条件把共享增量换算为三个图表和记录总数的变化量，
+浏览器直接在已绘制的图表上累加，不需要重新请求完整的图表配置。
+"""
+
+import json
+import logging
+import os
+import sys
+import threading
+from collections import Counter, deque
+from typing import Callable, Iterator, List, Optional
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from utils.constants import DIRECTION_STR_MAP
+from utils.database import (TIMEZONE_OFFSET_MINUTES, get_connection_pool, get_partitions, id_bound_sql,
+                            reduce_aggregate_cube, resolve_db_path)
+
+logger = logging.getLogger(__name__)
+
+# 轮询间隔（秒）
+STREAM_INTERVAL = float(os.environ.get('TRAFFIC_STREAM_INTERVAL', '2'))
+# 没有新数据时发送心跳的间隔（秒），用于保持连接并及时发现已断开的客户端
+STREAM_KEEPALIVE = 15.0
+# 保留最近的增量数，断线重连的客户端直接从中补发
+STREAM_HISTORY = 256
+# 补发范围超过历史时按id范围重新统计，超过该记录数时通知客户端重新加载
+STREAM_CATCHUP_MAX_ROWS = 500000
+# 浏览器断线后的重连等待时间（毫秒）
+STREAM_RETRY_MS = 3000
+
+# WSGI environ中保存订阅对象的键，ASGI入口据此直接在事件循环中驱动订阅
+LIVE_SUBSCRIPTION_KEY = 'traffic.live_subscription'
+
+KEEPALIVE_MESSAGE = ': keepalive\n\n'
+
+# 按本地小时分桶：bucket = (time + 时区偏移) // 3600
+_OFFSET_SECONDS = TIMEZONE_OFFSET_MINUTES * 60
+_DELTA_SQL = """
+    SELECT CAST((time + ?) / 3600 AS INTEGER) AS bucket, direction, COUNT(*) AS count
+    FROM traffic WHERE id > ? AND id <= ?
+    GROUP BY bucket, direction
+"""
+
+
+def bucket_start(bucket: int) -> float:
+    """本地小时桶的起始时间戳"""
+    return bucket * 3600 - _OFFSET_SECONDS
+
+
+def bucket_hour_weekday(bucket: int) -> tuple:
+    """
+    本地小时桶对应的 (小时, 星期)
+
+    星期与 strftime('%w') 一致：0=周日 … 6=周六（1970-01-01为周四）
+    """
+    return bucket % 24, (bucket // 24 + 4) % 7
+
+
+class LiveFeed:
+    """
+    所有订阅者共享的新记录轮询器
+
+    只在有订阅者时轮询；每次轮询一次主键查找，有新记录时再执行一次id范围的分组统计，
+    与订阅者数量无关。
+    """
+
+    def __init__(self, db_path: str = None, interval: float = STREAM_INTERVAL, history: int = STREAM_HISTORY):
+        """
+        初始化（轮询线程在第一个订阅者到来时启动）
+
+        Args:
+            db_path: 数据库文件路径
+            interval: 轮询间隔（秒）
+            history: 保留的最近增量数
+        """
+        self.db_path = resolve_db_path(db_path)
+        self.interval = interval
+        self.last_id = None
+        # 最近的增量 [(起始id, 结束id, [(小时桶, 方向, 数量)])]，相邻增量首尾相接
+        self._events = deque(maxlen=history)
+        self._condition = threading.Condition()
+        self._query_lock = threading.Lock()
+        self._listeners = []
+        self._subscribers = 0
+        self._thread = None
+        self._stopped = threading.Event()
+        # 统计信息
+        self._polls = 0
+        self._deltas = 0
+        self._catch_ups = 0
+        self._resets = 0
+        self._max_subscribers = 0
+
+    def _query(self, sql: str, params: tuple) -> list:
+        """从共享连接池借出连接执行查询"""
+        pool = get_connection_pool(self.db_path)
+        connection = pool.acquire()
+        try:
+            return [tuple(row) for row in connection.execute(sql, params)]
+        finally:
+            pool.release(connection)
+
+    def _query_max_id(self) -> int:
+        """读取最大id（按时间分区存储时逐个分区按主键查找）"""
+        pool = get_connection_pool(self.db_path)
+        connection = pool.acquire()
+        try:
+            sql = id_bound_sql(get_partitions(connection, self.db_path))
+            return connection.execute(sql).fetchone()[0] or 0
+        finally:
+            pool.release(connection)
+
+    def _query_delta(self, after_id: int, to_id: int) -> list:
+        """统计 (after_id, to_id] 范围内的新记录 [(小时桶, 方向, 数量)]"""
+        return self._query(_DELTA_SQL, (_OFFSET_SECONDS, after_id, to_id))
+
+    def poll(self) -> bool:
+        """
+        轮询一次最大id，有新记录时保存增量并唤醒所有订阅者
+
+        Returns:
+            bool: 最大id是否变化
+        """
+        with self._query_lock:
+            max_id = self._query_max_id()
+            last_id = self.last_id
+            buckets = None
+            if last_id is not None and max_id > last_id:
+                buckets = self._query_delta(last_id, max_id)
+
+            with self._condition:
+                self._polls += 1
+                if max_id == last_id:
+                    return False
+                if buckets is not None:
+                    self._events.append((last_id, max_id, buckets))
+                    self._deltas += 1
+                elif last_id is not None:
+                    # 最大id变小（数据被删除或重建），已保存的增量不再有效
+                    self._events.clear()
+                self.last_id = max_id
+                listeners = list(self._listeners)
+                self._condition.notify_all()
+
+        for listener in listeners:
+            listener()
+        return True
+
+    def _run(self) -> None:
+        """轮询线程：没有订阅者时等待，有订阅者时按间隔轮询"""
+        while not self._stopped.is_set():
+            with self._condition:
+                while self._subscribers == 0 and not self._stopped.is_set():
+                    self._condition.wait()
+            if self._stopped.is_set():
+                break
+            try:
+                self.poll()
+            except Exception as e:
+                logger.error("❌ 实时数据轮询失败: %s", e)
+            self._stopped.wait(self.interval)
+
+    def subscribe(self) -> int:
+        """
+        注册订阅者（按需启动轮询线程）
+
+        Returns:
+            int: 当前最大id
+        """
+        with self._condition:
+            self._subscribers += 1
+            self._max_subscribers = max(self._max_subscribers, self._subscribers)
+            if self._thread is None or not self._thread.is_alive():
+                self._stopped.clear()
+                self._thread = threading.Thread(target=self._run, name='traffic-live-feed', daemon=True)
+                self._thread.start()
+            self._condition.notify_all()
+            last_id = self.last_id
+        if last_id is None:
+            self.poll()
+        return self.last_id
+
+    def unsubscribe(self) -> None:
+        """注销订阅者"""
+        with self._condition:
+            self._subscribers = max(0, self._subscribers - 1)
+
+    def add_listener(self, callback: Callable[[], None]) -> None:
+        """注册最大id变化时调用的回调（在轮询线程中调用，需自行切换线程）"""
+        with self._condition:
+            self._listeners.append(callback)
+
+    def remove_listener(self, callback: Callable[[], None]) -> None:
+        """移除回调"""
+        with self._condition:
+            if callback in self._listeners:
+                self._listeners.remove(callback)
+
+    def wait_for_change(self, after_id: int, timeout: float) -> bool:
+        """
+        等待最大id不再等于after_id
+
+        Returns:
+            bool: 超时前是否有变化
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: self.last_id != after_id, timeout)
+
+    def changes_since(self, after_id: int) -> Optional[tuple]:
+        """
+        after_id之后的全部增量（已合并）
+
+        优先由最近的增量拼接；after_id不在历史范围内时按id范围重新统计一次。
+
+        Args:
+            after_id: 订阅者已经包含的最大id
+
+        Returns:
+            Optional[tuple]: 没有变化时为None；否则为 (最新id, [(小时桶, 方向, 数量)])，
+                             无法给出增量（数据被删除或落后太多）时列表为None，客户端应重新加载
+        """
+        with self._condition:
+            last_id = self.last_id
+            if last_id is None or last_id == after_id:
+                return None
+            if after_id > last_id:
+                self._resets += 1
+                return last_id, None
+            events = list(self._events)
+
+        start = next((index for index, event in enumerate(events) if event[0] == after_id), None)
+        if start is not None and events[-1][1] == last_id:
+            totals = Counter()
+            for _, _, buckets in events[start:]:
+                for bucket, direction, count in buckets:
+                    totals[(bucket, direction)] += count
+            return last_id, [key + (count,) for key, count in sorted(totals.items())]
+
+        if last_id - after_id > STREAM_CATCHUP_MAX_ROWS:
+            with self._condition:
+                self._resets += 1
+            return last_id, None
+        with self._condition:
+            self._catch_ups += 1
+        return last_id, self._query_delta(after_id, last_id)
+
+    def close(self) -> None:
+        """停止轮询线程"""
+        self._stopped.set()
+        with self._condition:
+            self._condition.notify_all()
+            thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=5)
+
+    def stats(self) -> dict:
+        """返回轮询统计信息"""
+        with self._condition:
+            return {
+                'db_path': self.db_path,
+                'interval': self.interval,
+                'subscribers': self._subscribers,
+                'max_subscribers': self._max_subscribers,
+                'last_id': self.last_id,
+                'polls': self._polls,
+                'deltas': self._deltas,
+                'history': len(self._events),
+                'catch_ups': self._catch_ups,
+                'resets': self._resets
+            }
+
+
+def build_live_delta(buckets: list, time_range: str = None, direction_filter: str = None,
+                     start: float = None, end: float = None) -> dict:
+    """
+    把共享增量换算为某组筛选条件下各图表的变化量
+
+    与 /api/dashboard 的筛选规则一致：饼图只受时间段影响，两个趋势图只受方向影响，
+    记录总数同时受两者影响。时间窗口按本地小时桶判断（窗口边界为整点时精确，
+    页面上的日期筛选都是整点）。
+
+    Args:
+        buckets: [(小时桶, 方向, 数量)]
+        time_range: 时间段筛选
+        direction_filter: 方向筛选 ('1', '2', '3', '4')
+        start: 时间窗口起始时间戳（包含），None表示不限
+        end: 时间窗口结束时间戳（不包含），None表示不限
+
+    Returns:
+        dict: {'new_records': 记录数增量, 'pie': {方向名称: 增量},
+               'trend': [24小时增量], 'weekday': [24小时平均值增量], 'weekend': [24小时平均值增量]}
+    """
+    cube = []
+    for bucket, direction, count in buckets:
+        bucket_time = bucket_start(bucket)
+        if (start is not None and bucket_time < start) or (end is not None and bucket_time >= end):
+            continue
+        cube.append(bucket_hour_weekday(bucket) + (direction, count))
+
+    total = reduce_aggregate_cube(cube, [], time_range=time_range, direction_filter=direction_filter)
+    pie = reduce_aggregate_cube(cube, ['direction'], time_range=time_range)
+    trend = [0] * 24
+    for hour, count in reduce_aggregate_cube(cube, ['hour'], direction_filter=direction_filter):
+        trend[hour] = count
+    # 与 get_hourly_traffic_trend_by_weekday 相同：工作日按5天平均，周末按2天平均
+    weekday = [0.0] * 24
+    weekend = [0.0] * 24
+    for hour, day, count in reduce_aggregate_cube(cube, ['hour', 'weekday'], direction_filter=direction_filter):
+        if day in (0, 6):
+            weekend[hour] += count / 2
+        else:
+            weekday[hour] += count / 5
+
+    return {
+        'new_records': total[0][0] if total else 0,
+        'pie': {DIRECTION_STR_MAP.get(str(direction), f'方向{direction}'): count for direction, count in pie},
+        'trend': trend,
+        'weekday': weekday,
+        'weekend': weekend
+    }
+
+
+def format_sse(event: str, data: dict, event_id: int = None) -> str:
+    """格式化一条SSE消息"""
+    lines = [f'id: {event_id}'] if event_id is not None else []
+    lines.append(f'event: {event}')
+    lines.append(f"data: {json.dumps(data, ensure_ascii=False, separators=(',', ':'))}")
+    return '\n'.join(lines) + '\n\n'
+
+
+class LiveSubscription:
+    """一个SSE客户端的订阅：记录筛选条件和已推送到的位置"""
+
+    def __init__(self, feed: LiveFeed, time_range: str = None, direction_filter: str = None,
+                 start: float = None, end: float = None, after_id: int = None):
+        """
+        注册订阅
+
+        Args:
+            feed: 共享的轮询器
+            time_range: 时间段筛选
+            direction_filter: 方向筛选
+            start: 时间窗口起始时间戳（包含），None表示不限
+            end: 时间窗口结束时间戳（不包含），None表示不限
+            after_id: 客户端已经包含的最大id（/api/dashboard 返回的 last_id 或 Last-Event-ID），
+                      None表示从当前开始
+        """
+        self.feed = feed
+        self.filters = {'time_range': time_range, 'direction_filter': direction_filter, 'start': start, 'end': end}
+        current_id = feed.subscribe()
+        self.last_id = current_id if after_id is None else after_id
+        self._closed = False
+
+    def ready_message(self) -> str:
+        """连接建立后的第一条消息（设置重连间隔，告知订阅起点）"""
+        return f'retry: {STREAM_RETRY_MS}\n' + format_sse('ready', {'last_id': self.last_id})
+
+    def poll_message(self) -> Optional[str]:
+        """
+        生成自上次推送以来的消息（不等待）
+
+        Returns:
+            Optional[str]: 增量消息；没有变化时为None。增量对本订阅为零时只推进事件id
+        """
+        changes = self.feed.changes_since(self.last_id)
+        if changes is None:
+            return None
+        self.last_id, buckets = changes
+        if buckets is None:
+            return format_sse('reset', {'last_id': self.last_id}, self.last_id)
+
+        delta = build_live_delta(buckets, **self.filters)
+        if not delta['new_records'] and not delta['pie'] and not any(delta['trend']):
+            return f'id: {self.last_id}\n\n'
+        delta['last_id'] = self.last_id
+        return format_sse('delta', delta, self.last_id)
+
+    def next_message(self, timeout: float = STREAM_KEEPALIVE) -> Optional[str]:
+        """等待下一条消息，超时返回None"""
+        if self.feed.wait_for_change(self.last_id, timeout):
+            return self.poll_message()
+        return None
+
+    def close(self) -> None:
+        """注销订阅（可重复调用）"""
+        if not self._closed:
+            self._closed = True
+            self.feed.unsubscribe()
+
+
+def iter_live_messages(subscription: LiveSubscription, keepalive: float = STREAM_KEEPALIVE) -> Iterator[bytes]:
+    """
+    WSGI响应体：持续输出订阅消息，没有新数据时定期发送心跳
+
+    客户端断开后服务器写入失败并关闭响应，由 call_on_close 注销订阅。
+    """
+    yield subscription.ready_message().encode('utf-8')
+    while True:
+        message = subscription.next_message(keepalive)
+        yield (message or KEEPALIVE_MESSAGE).encode('utf-8')
+
+
+# 轮询器注册表 {(进程id, 数据库路径): LiveFeed}
+_feeds = {}
+_feeds_lock = threading.Lock()
+
+
+def get_live_feed(db_path: str = None) -> LiveFeed:
+    """获取（按需创建）当前进程指定数据库的共享轮询器"""
+    key = (os.getpid(), resolve_db_path(db_path))
+    with _feeds_lock:
+        feed = _feeds.get(key)
+        if feed is None:
+            feed = LiveFeed(key[1])
+            _feeds[key] = feed
+        return feed
+
+
+def get_live_feed_stats() -> List[dict]:
+    """返回当前进程所有轮询器的统计信息"""
+    with _feeds_lock:
+        feeds = [feed for (pid, _), feed in _feeds.items() if pid == os.getpid()]
+    return [feed.stats() for feed in feeds]
@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+指标与日志模块
+- configure_logging: 按环境变量 TRAFFIC_LOG_LEVEL 配置分级日志（默认INFO）
+- Histogram / Counter: 线程安全、按标签分组的直方图和计数器
+- span: 请求内的计时区段（connect、count、query、serialize、chart），同时累计到直方图
+- instrument_methods: 记录 TrafficDatabase 各方法的调用耗时
+- render_prometheus: 以Prometheus文本格式输出全部指标（/metrics）
+
+指标只在当前进程内累计，多个工作进程时由Prometheus分别抓取。
+"""
+
+import os
+import time
+import logging
+import functools
+import threading
+import contextvars
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Iterable, List, Optional
+
+# 日志级别（DEBUG时输出每个请求的参数和耗时区段）
+LOG_LEVEL = os.environ.get('TRAFFIC_LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s'
+
+# TRAFFIC_METRICS=0 时不记录任何耗时（span为空操作，数据库方法不包装）
+METRICS_ENABLED = os.environ.get('TRAFFIC_METRICS', '1') != '0'
+
+# 直方图默认分桶上限（秒）
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Prometheus文本格式的Content-Type
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# 已注册的指标（按注册顺序输出）
+_registry = []
+_registry_lock = threading.Lock()
+
+# 当前请求的耗时区段 [(名称, 秒)]，不在请求中时为None
+_request_spans = contextvars.ContextVar('traffic_request_spans', default=None)
+
+
+def configure_logging(level: Optional[str] = None) -> None:
+    """
+    配置根日志（入口调用一次；已有处理器时不重复添加）
+
+    Args:
+        level: 日志级别名称，默认取 TRAFFIC_LOG_LEVEL
+    """
+    logging.basicConfig(level=level or LOG_LEVEL, format=LOG_FORMAT)
+
+
+def _format_labels(label_names: tuple, label_values: tuple, extra: str = '') -> str:
+    """生成 {name="value",...}，按Prometheus规则转义"""
+    pairs = []
+    for name, value in zip(label_names, label_values):
+        escaped = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{escaped}"')
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    """Prometheus数值格式（整数不带小数点）"""
+    if value == float('inf'):
+        return '+Inf'
+    return repr(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    """按标签分组的单调递增计数器"""
+
+    metric_type = 'counter'
+
+    def __init__(self, name: str, help_text: str, label_names: tuple = ()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+        register(self)
+
+    def inc(self, label_values: tuple = (), amount: float = 1) -> None:
+        """增加计数"""
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def get(self, label_values: tuple = ()) -> float:
+        """读取计数"""
+        with self._lock:
+            return self._values.get(label_values, 0)
+
+    def render(self) -> List[str]:
+        """输出样本行"""
+        with self._lock:
+            items = sorted(self._values.items(), key=lambda item: tuple(map(str, item[0])))
+        return [f'{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}'
+                for labels, value in items]
+
+
+class Histogram:
+    """按标签分组的直方图（各桶计数在输出时累加为Prometheus的累积分桶）"""
+
+    metric_type = 'histogram'
+
+    def __init__(self, name: str, help_text: str, label_names: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        # {标签值: [各桶计数..., +Inf桶计数, 总和]}
+        self._series = {}
+        self._lock = threading.Lock()
+        register(self)
+
+    def observe(self, label_values: tuple, value: float) -> None:
+        """
+        记录一次观测值
+
+        Args:
+            label_values: 与label_names对应的标签值
+            value: 观测值（秒）
+        """
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def snapshot(self, label_values: tuple = ()) -> dict:
+        """
+        读取一组标签的统计
+
+        Returns:
+            dict: {'count': 观测次数, 'sum': 总和}
+        """
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                return {'count': 0, 'sum': 0.0}
+            return {'count': sum(series[:-1]), 'sum': series[-1]}
+
+    def render(self) -> List[str]:
+        """输出 _bucket / _sum / _count 样本行"""
+        with self._lock:
+            items = sorted(((labels, list(series)) for labels, series in self._series.items()),
+                           key=lambda item: tuple(map(str, item[0])))
+        lines = []
+        for labels, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series[:-1]):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f'{self.name}_bucket{_format_labels(self.label_names, labels, le)} {cumulative}')
+            label_text = _format_labels(self.label_names, labels)
+            lines.append(f'{self.name}_sum{label_text} {_format_value(series[-1])}')
+            lines.append(f'{self.name}_count{label_text} {cumulative}')
+        return lines
+
+
+def register(metric) -> None:
+    """注册指标（同名指标只保留第一个）"""
+    with _registry_lock:
+        if all(existing.name != metric.name for existing in _registry):
+            _registry.append(metric)
+
+
+def render_prometheus(extra: Iterable[tuple] = ()) -> str:
+    """
+    以Prometheus文本格式输出全部已注册指标
+
+    Args:
+        extra: 额外的即时指标 [(名称, 类型, 说明, [(标签字典, 值)])]，如连接池和缓存统计
+
+    Returns:
+        str: 文本格式的指标
+    """
+    with _registry_lock:
+        metrics = list(_registry)
+    lines = []
+    for metric in metrics:
+        lines.append(f'# HELP {metric.name} {metric.help_text}')
+        lines.append(f'# TYPE {metric.name} {metric.metric_type}')
+        lines.extend(metric.render())
+    for name, metric_type, help_text, samples in extra:
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {metric_type}')
+        for labels, value in samples:
+            lines.append(f'{name}{_format_labels(tuple(labels), tuple(labels.values()))} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+# 内置指标
+REQUEST_SECONDS = Histogram('traffic_http_request_duration_seconds',
+                            'HTTP请求处理耗时（到返回响应头为止）', ('route', 'method'))
+REQUESTS_TOTAL = Counter('traffic_http_requests_total', 'HTTP请求数', ('route', 'method', 'status'))
+SPAN_SECONDS = Histogram('traffic_span_duration_seconds',
+                         '请求内各区段耗时（connect/count/query/serialize/chart）', ('span',))
+DB_METHOD_SECONDS = Histogram('traffic_db_method_duration_seconds', 'TrafficDatabase方法耗时', ('method',))
+
+
+def start_request_spans() -> contextvars.Token:
+    """开始收集当前请求的耗时区段，返回用于 finish_request_spans 的令牌"""
+    return _request_spans.set([])
+
+
+def current_spans() -> list:
+    """当前请求已记录的耗时区段 [(名称, 秒)]"""
+    return list(_request_spans.get() or ())
+
+
+def finish_request_spans(token: contextvars.Token) -> None:
+    """结束当前请求的区段收集"""
+    _request_spans.reset(token)
+
+
+@contextmanager
+def span(name: str):
+    """
+    记录一个耗时区段：累计到 traffic_span_duration_seconds，
+    在请求中时同时加入当前请求的区段列表（响应头 Server-Timing）
+
+    Args:
+        name: 区段名称
+    """
+    if not METRICS_ENABLED:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        SPAN_SECONDS.observe((name,), elapsed)
+        spans = _request_spans.get()
+        if spans is not None:
+            spans.append((name, elapsed))
+
+
+def server_timing(spans: list, total: float) -> str:
+    """
+    生成 Server-Timing 响应头（同名区段合并耗时）
+
+    Args:
+        spans: [(名称, 秒)]
+        total: 请求总耗时（秒）
+
+    Returns:
+        str: 如 'count;dur=0.41, query;dur=1.20, total;dur=2.05'
+    """
+    merged = {}
+    for name, elapsed in spans:
+        merged[name] = merged.get(name, 0.0) + elapsed
+    merged['total'] = total
+    return ', '.join(f'{name};dur={elapsed * 1000:.2f}' for name, elapsed in merged.items())
+
+
+def _timed(func, name: str):
+    """包装方法：调用耗时记录到 traffic_db_method_duration_seconds"""
+    label = (name,)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            DB_METHOD_SECONDS.observe(label, time.perf_counter() - started)
+
+    return wrapper
+
+
+def instrument_methods(cls, method_names: Iterable[str]):
+    """
+    为类的方法记录调用耗时（METRICS关闭时不包装，没有任何开销）
+
+    Args:
+        cls: 类
+        method_names: 方法名列表（只适用于普通方法，不包括生成器和上下文管理器）
+
+    Returns:
+        类本身
+    """
+    if METRICS_ENABLED:
+        for name in method_names:
+            setattr(cls, name, _timed(getattr(cls, name), name))
+    return cls
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+并行聚合模块
+没有汇总表时，图表聚合需要对traffic表做一次全表扫描，而一个SQLite连接只能使用一个CPU核。
+配置 TRAFFIC_AGGREGATE_WORKERS（大于1）后，TrafficDatabase 把 [最小id, 最大id] 切分成与进程数相同的若干段，
+在进程池中各自通过只读连接按主键范围扫描一段，再把各段的 {小时/星期/方向: 数量} 相加。
+
+- 各段只按主键（rowid）范围读取，互不重叠，合并结果与串行扫描相同
+- 统计开始时确定id上界，之后写入的新记录不计入本次结果（与串行扫描开始后写入的记录相同）
+- 有时间窗口（按time索引范围扫描）或汇总表（只实时计算汇总位置之后的新记录）时扫描量本来就小，不并行
+- 进程池使用spawn方式创建并在同一个进程内复用，工作进程为每个数据库保留自己的只读连接池
+"""
+
+import os
+import sys
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Optional
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from utils import database
+from utils.database import get_database, merge_aggregate_counts
+
+logger = logging.getLogger(__name__)
+
+# 进程池注册表 {进程id: (进程数, 执行器)}，fork之后子进程重新创建
+_process_pools = {}
+_pools_lock = threading.Lock()
+
+
+def split_id_range(low: int, high: int, chunks: int) -> List[tuple]:
+    """
+    把id范围切分成大小相近的若干段
+
+    Args:
+        low: 起始id（包含）
+        high: 结束id（不包含）
+        chunks: 段数
+
+    Returns:
+        List[tuple]: [(起始id, 结束id)]，首尾相接地覆盖 [low, high)
+    """
+    chunks = max(1, min(chunks, high - low))
+    step = -(-(high - low) // chunks)
+    return [(start, min(start + step, high)) for start in range(low, high, step)]
+
+
+def aggregate_id_range(db_path: str, id_range: tuple, group_columns: List[str], time_range: str = None,
+                       direction_filter: str = None) -> list:
+    """
+    统计一段id范围内的分组计数（在聚合进程中执行）
+
+    Returns:
+        list: [(分组值..., 数量)]
+    """
+    db = get_database(db_path, pooled=True)
+    if not db.connect():
+        raise RuntimeError(f"无法连接数据库: {db_path}")
+    try:
+        return db._query_aggregate_counts(group_columns, time_range, direction_filter, id_range=id_range)
+    finally:
+        db.disconnect()
+
+
+def get_aggregate_process_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    获取当前进程的并行聚合进程池（进程数变化时重新创建）
+
+    使用spawn方式创建子进程（Web服务进程是多线程的，fork可能复制持有中的锁）。
+
+    Args:
+        workers: 进程数
+
+    Returns:
+        ProcessPoolExecutor: 进程池
+    """
+    pid = os.getpid()
+    with _pools_lock:
+        entry = _process_pools.get(pid)
+        if entry is None or entry[0] != workers:
+            if entry is not None:
+                entry[1].shutdown(wait=False)
+            entry = (workers, ProcessPoolExecutor(max_workers=workers,
+                                                  mp_context=multiprocessing.get_context('spawn')))
+            _process_pools[pid] = entry
+        return entry[1]
+
+
+def parallel_aggregate(db_path: str, id_range: tuple, group_columns: List[str], time_range: str = None,
+                       direction_filter: str = None, workers: Optional[int] = None) -> Optional[list]:
+    """
+    把id范围切分到进程池中并行统计分组计数并合并
+
+    Args:
+        db_path: 数据库文件路径
+        id_range: (起始id, 结束id)，结束id不包含
+        group_columns: 分组列，取值为 'hour'、'weekday'、'direction'
+        time_range: 时间段筛选
+        direction_filter: 方向筛选 ('1', '2', '3', '4')
+        workers: 进程数，None表示使用 database.AGGREGATE_WORKERS
+
+    Returns:
+        Optional[list]: [(分组值..., 数量)] 按分组列排序；进程池异常退出时返回None（由调用方串行统计）
+    """
+    workers = workers or database.AGGREGATE_WORKERS
+    ranges = split_id_range(*id_range, workers)
+    executor = get_aggregate_process_pool(workers)
+    args = (group_columns, time_range, direction_filter)
+    try:
+        results = list(executor.map(aggregate_id_range, [db_path] * len(ranges), ranges,
+                                    *([arg] * len(ranges) for arg in args)))
+    except BrokenProcessPool as e:
+        logger.warning("⚠️ 并行聚合进程池异常退出，改为串行统计: %s", e)
+        with _pools_lock:
+            if _process_pools.get(os.getpid(), (None, None))[1] is executor:
+                del _process_pools[os.getpid()]
+        return None
+    logger.debug("并行聚合 %s: %d 段, id %d-%d", db_path, len(ranges), id_range[0], id_range[1] - 1)
+    return merge_aggregate_counts(results)
@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+"""
+按时间分区存储模块
+把traffic表拆分为按月（TRAFFIC_PARTITION_MONTHS 个月一个分区）的分区表 traffic_pYYYYMM，
+traffic变为各分区表的UNION ALL视图，原有查询语句无需修改：
+
+- 分区注册表 traffic_partitions 记录每个分区覆盖的 [start_time, end_time)（按统计时区的月份边界）
+- 带时间窗口的查询只访问与窗口重叠的分区（见 utils/database.py 的 traffic_source）
+- 写入视图的记录由 INSTEAD OF 触发器按时间路由到所属分区，id由 traffic_id_sequence 统一分配
+- 归档整个分区只需导出并 DROP TABLE，不产生大范围DELETE
+
+用法：
+    python -m utils.database partition [--months 1]
+    python -m utils.database archive --keep-months 12 [--archive-dir data/archive]
+"""
+
+import csv
+import gzip
+import logging
+import os
+import re
+import sqlite3
+import sys
+import time
+from datetime import datetime
+from typing import Iterable, List, Optional
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from utils.database import EXPORT_BATCH_ROWS, LOCAL_TZ, PARTITION_REGISTRY, TrafficDatabase
+
+logger = logging.getLogger(__name__)
+
+# 每个分区覆盖的月数（1为按月，3为按季度，12为按年）；已分区的数据库以分区时的设置为准
+PARTITION_MONTHS = int(os.environ.get('TRAFFIC_PARTITION_MONTHS', '1'))
+
+# 分区表名前缀：traffic_p202503
+PARTITION_PREFIX = 'traffic_p'
+
+# 分区元数据（months）、id分配表、已归档分区的记录
+PARTITION_META = 'traffic_partition_meta'
+ID_SEQUENCE = 'traffic_id_sequence'
+ARCHIVE_REGISTRY = 'traffic_archives'
+
+# 视图上的插入触发器
+INSERT_TRIGGER = 'trg_traffic_insert'
+
+# 归档文件的列（CSV表头包含 direction,time,plate，可以直接用 utils.ingest 重新导入）
+ARCHIVE_COLUMNS = ('id', 'direction', 'time', 'plate')
+
+
+def period_bounds(timestamp: float, months: int = PARTITION_MONTHS) -> tuple:
+    """
+    时间戳所属分区的时间范围（按统计时区的月份对齐，如按季度时为1/4/7/10月）
+
+    Args:
+        timestamp: Unix时间戳
+        months: 每个分区覆盖的月数
+
+    Returns:
+        tuple: (起始时间戳, 结束时间戳)
+    """
+    moment = datetime.fromtimestamp(timestamp, LOCAL_TZ)
+    index = (moment.year * 12 + moment.month - 1) // months * months
+    start = datetime(index // 12, index % 12 + 1, 1, tzinfo=LOCAL_TZ)
+    end = datetime((index + months) // 12, (index + months) % 12 + 1, 1, tzinfo=LOCAL_TZ)
+    return start.timestamp(), end.timestamp()
+
+
+def month_start(months_ago: int = 0, now: Optional[float] = None) -> float:
+    """统计时区中 months_ago 个月之前的月初时间戳（0为本月月初）"""
+    moment = datetime.fromtimestamp(time.time() if now is None else now, LOCAL_TZ)
+    index = moment.year * 12 + moment.month - 1 - months_ago
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=LOCAL_TZ).timestamp()
+
+
+def partition_name(start: float) -> str:
+    """分区表名：traffic_p + 起始月份（YYYYMM）"""
+    return f"{PARTITION_PREFIX}{datetime.fromtimestamp(start, LOCAL_TZ):%Y%m}"
+
+
+def _read_partitions(cursor: sqlite3.Cursor) -> List[tuple]:
+    """直接读取分区注册表（维护操作在事务中修改注册表，不使用缓存）"""
+    cursor.execute(f"SELECT name, start_time, end_time FROM {PARTITION_REGISTRY} ORDER BY start_time")
+    return [tuple(row) for row in cursor.fetchall()]
+
+
+def _clone_schema(cursor: sqlite3.Cursor, source: str, target: str) -> tuple:
+    """
+    按源表的定义生成目标表的建表语句，以及索引和触发器的建立语句
+
+    Args:
+        cursor: 数据库游标
+        source: 源表（traffic或已有分区）
+        target: 目标分区表名
+
+    Returns:
+        tuple: (建表语句, [索引/触发器语句])
+    """
+    cursor.execute("SELECT type, sql FROM sqlite_master WHERE tbl_name = ? AND sql IS NOT NULL", (source,))
+    table_sql, other_sql = None, []
+    for object_type, sql in cursor.fetchall():
+        # 表名整词替换；索引/触发器名 idx_<source>_time → idx_<target>_time
+        sql = re.sub(rf'\b{source}\b', target, sql).replace(f'_{source}_', f'_{target}_')
+        if object_type == 'table':
+            table_sql = sql
+        else:
+            other_sql.append(sql)
+    return table_sql, other_sql
+
+
+def rebuild_router(db: TrafficDatabase) -> None:
+    """
+    按分区注册表重建traffic视图和插入触发器（不提交）
+
+    触发器先检查存在覆盖记录时间的分区（否则中止整条语句），再分配id并插入所属分区；
+    指定了id的记录保留原id。
+
+    Args:
+        db: 已连接（可写）的数据库实例
+    """
+    cursor = db.connection.cursor()
+    partitions = _read_partitions(cursor)
+    cursor.execute(f"PRAGMA table_info({partitions[0][0]})")
+    columns = [row[1] for row in cursor.fetchall()]
+    column_list = ', '.join(columns)
+    values = ', '.join('COALESCE(NEW.id, last_id)' if column == 'id' else f'NEW.{column}' for column in columns)
+    inserts = '\n'.join(
+        f"INSERT INTO {name} ({column_list}) SELECT {values} FROM {ID_SEQUENCE} "
+        f"WHERE NEW.time >= {start!r} AND NEW.time < {end!r};"
+        for name, start, end in partitions
+    )
+
+    cursor.execute("DROP VIEW IF EXISTS traffic")
+    cursor.execute("CREATE VIEW traffic AS "
+                   + ' UNION ALL '.join(f"SELECT * FROM {name}" for name, _, _ in partitions))
+    cursor.execute(f"""
+        CREATE TRIGGER {INSERT_TRIGGER} INSTEAD OF INSERT ON traffic
+        BEGIN
+            SELECT RAISE(ABORT, '没有覆盖该记录时间的分区') WHERE NOT EXISTS (
+                SELECT 1 FROM {PARTITION_REGISTRY} WHERE NEW.time >= start_time AND NEW.time < end_time
+            );
+            UPDATE {ID_SEQUENCE} SET last_id = MAX(last_id, COALESCE(NEW.id, last_id + 1));
+            {inserts}
+        END
+    """)
+
+
+def partition_database(db: TrafficDatabase, months: int = PARTITION_MONTHS) -> bool:
+    """
+    把traffic表转换为按时间分区存储
+
+    在一个事务中按分区时间范围复制记录（保留id）、复制索引和触发器，核对记录数后删除原表并建立视图，
+    最后执行VACUUM回收原表占用的空间。已分区的数据库直接返回。
+
+    Args:
+        db: 已连接（可写）的数据库实例
+        months: 每个分区覆盖的月数
+
+    Returns:
+        bool: 是否成功
+    """
+    if db._partitions() is not None:
+        logger.info("🗂️ 数据库已按时间分区，无需转换")
+        return True
+
+    connection = db.connection
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT MIN(time), MAX(time), COUNT(*), MAX(id) FROM traffic")
+        min_time, max_time, total, max_id = cursor.fetchone()
+        periods = []
+        start, end = period_bounds(min_time if min_time is not None else time.time(), months)
+        periods.append((start, end))
+        while max_time is not None and end <= max_time:
+            start, end = period_bounds(end, months)
+            periods.append((start, end))
+
+        cursor.execute("BEGIN")
+        cursor.execute(f"""
+            CREATE TABLE {PARTITION_REGISTRY} (
+                name TEXT PRIMARY KEY,
+                start_time REAL NOT NULL,
+                end_time REAL NOT NULL
+            )
+        """)
+        cursor.execute(f"CREATE TABLE {ID_SEQUENCE} (last_id INTEGER NOT NULL)")
+        cursor.execute(f"INSERT INTO {ID_SEQUENCE} (last_id) VALUES (?)", (max_id or 0,))
+
+        copied = 0
+        for start, end in periods:
+            name = partition_name(start)
+            table_sql, other_sql = _clone_schema(cursor, 'traffic', name)
+            cursor.execute(table_sql)
+            cursor.execute(f"INSERT INTO {name} SELECT * FROM traffic WHERE time >= ? AND time < ? ORDER BY id",
+                           (start, end))
+            rows = cursor.rowcount
+            copied += rows
+            # 复制数据之后再建立索引和触发器
+            for sql in other_sql:
+                cursor.execute(sql)
+            cursor.execute(f"INSERT INTO {PARTITION_REGISTRY} (name, start_time, end_time) VALUES (?, ?, ?)",
+                           (name, start, end))
+            logger.info("🧱 分区 %s 已建立：%d 条记录", name, rows)
+
+        if copied != total:
+            raise ValueError(f"分区记录数 {copied} 与原表 {total} 不一致（存在时间为空的记录）")
+
+        cursor.execute("DROP TABLE traffic")
+        rebuild_router(db)
+        db._set_meta(PARTITION_META, 'months', months)
+        connection.commit()
+    except (sqlite3.Error, ValueError) as e:
+        connection.rollback()
+        logger.error("❌ 分区转换失败: %s", e)
+        return False
+
+    connection.execute("VACUUM")
+    logger.info("✅ 已转换为 %d 个分区（每个分区 %d 个月），共 %d 条记录", len(periods), months, copied)
+    return db.create_search_indexes()
+
+
+def ensure_partitions(db: TrafficDatabase, timestamps: Iterable[float]) -> int:
+    """
+    为落在已有分区之外的时间建立新分区（按最新分区的结构，包括索引和触发器；不提交）
+
+    Args:
+        db: 已连接（可写）的分区数据库实例
+        timestamps: 即将写入的记录时间（每个月份一个即可）
+
+    Returns:
+        int: 新建的分区数
+    """
+    cursor = db.connection.cursor()
+    partitions = _read_partitions(cursor)
+    months = int(db._get_meta(PARTITION_META, 'months') or PARTITION_MONTHS)
+    template = partitions[-1][0]
+
+    created = 0
+    for timestamp in timestamps:
+        if any(start <= timestamp < end for _, start, end in partitions):
+            continue
+        start, end = period_bounds(timestamp, months)
+        name = partition_name(start)
+        table_sql, other_sql = _clone_schema(cursor, template, name)
+        cursor.execute(table_sql)
+        for sql in other_sql:
+            cursor.execute(sql)
+        cursor.execute(f"INSERT INTO {PARTITION_REGISTRY} (name, start_time, end_time) VALUES (?, ?, ?)",
+                       (name, start, end))
+        partitions.append((name, start, end))
+        created += 1
+        logger.info("🧱 新建分区 %s", name)
+
+    if created:
+        rebuild_router(db)
+    return created
+
+
+def last_assigned_id(db: TrafficDatabase) -> int:
+    """插入触发器最后分配的id（INSTEAD OF触发器不计入rowcount，导入据此统计插入条数）"""
+    cursor = db.connection.cursor()
+    cursor.execute(f"SELECT last_id FROM {ID_SEQUENCE}")
+    return cursor.fetchone()[0]
+
+
+def default_archive_dir(db_path: str) -> str:
+    """归档目录默认与数据库放在同一目录：data/traffic.db -> data/archive"""
+    return os.path.join(os.path.dirname(db_path), 'archive')
+
+
+def archive_partitions(db: TrafficDatabase, before: float, archive_dir: Optional[str] = None) -> Optional[List[dict]]:
+    """
+    把结束时间不晚于before的分区压缩归档并从数据库删除
+
+    每个分区按id顺序流式写入 <分区表名>.csv.gz（先写临时文件，完整写入后再替换），
+    然后在一个事务中删除分区表、更新注册表和视图；最新的分区始终保留。
+    归档后汇总表（存在时）全量重建、列式快照删除，使图表不再包含已归档的记录
+    （其他工作进程的分析引擎在下次同步时发现最小id变化后重新加载）。
+
+    Args:
+        db: 已连接（可写）的分区数据库实例
+        before: 截止时间戳
+        archive_dir: 归档目录，默认见default_archive_dir
+
+    Returns:
+        Optional[List[dict]]: 已归档的分区 [{'name', 'start_time', 'end_time', 'rows', 'path'}]，失败时返回None
+    """
+    if db._partitions() is None:
+        logger.error("❌ 数据库未按时间分区，请先执行 partition")
+        return None
+
+    archive_dir = archive_dir or default_archive_dir(db.db_path)
+    connection = db.connection
+    cursor = connection.cursor()
+    partitions = _read_partitions(cursor)
+    candidates = [partition for partition in partitions[:-1] if partition[2] <= before]
+    if partitions[-1][2] <= before:
+        logger.warning("⚠️ 保留最新的分区 %s", partitions[-1][0])
+
+    os.makedirs(archive_dir, exist_ok=True)
+    archived = []
+    try:
+        for name, start, end in candidates:
+            path = os.path.join(archive_dir, f"{name}.csv.gz")
+            temp_path = path + '.tmp'
+            rows = 0
+            reader = connection.cursor()
+            reader.row_factory = None
+            reader.execute(f"SELECT {', '.join(ARCHIVE_COLUMNS)} FROM {name} ORDER BY id")
+            with gzip.open(temp_path, 'wt', encoding='utf-8', newline='') as handle:
+                writer = csv.writer(handle)
+                writer.writerow(ARCHIVE_COLUMNS)
+                while True:
+                    batch = reader.fetchmany(EXPORT_BATCH_ROWS)
+                    if not batch:
+                        break
+                    writer.writerows(batch)
+                    rows += len(batch)
+            os.replace(temp_path, path)
+
+            cursor.execute("BEGIN")
+            cursor.execute(f"""
+                CREATE TABLE IF NOT EXISTS {ARCHIVE_REGISTRY} (
+                    name TEXT PRIMARY KEY,
+                    start_time REAL NOT NULL,
+                    end_time REAL NOT NULL,
+                    row_count INTEGER NOT NULL,
+                    path TEXT NOT NULL,
+                    archived_at REAL NOT NULL
+                )
+            """)
+            cursor.execute(f"INSERT OR REPLACE INTO {ARCHIVE_REGISTRY} VALUES (?, ?, ?, ?, ?, ?)",
+                           (name, start, end, rows, path, time.time()))
+            cursor.execute(f"DELETE FROM {PARTITION_REGISTRY} WHERE name = ?", (name,))
+            cursor.execute(f"DROP TABLE {name}")
+            rebuild_router(db)
+            connection.commit()
+            archived.append({'name': name, 'start_time': start, 'end_time': end, 'rows': rows, 'path': path})
+            logger.info("📦 分区 %s 已归档：%d 条记录 -> %s", name, rows, path)
+    except (sqlite3.Error, OSError) as e:
+        if connection.in_transaction:
+            connection.rollback()
+        logger.error("❌ 归档失败: %s", e)
+        return None
+
+    if archived:
+        if db._get_rollup_last_id() is not None:
+            db.refresh_rollup(rebuild=True)
+        discard_columnar_data(db.db_path)
+        connection.execute("VACUUM")
+    return archived
+
+
+def discard_columnar_data(db_path: str) -> None:
+    """丢弃当前进程的NumPy分析引擎并删除列式快照（二者都包含已归档的记录；numpy未安装时两者都不存在）"""
+    try:
+        from utils.analytics import discard_analytics_engine
+    except ImportError:
+        return
+    discard_analytics_engine(db_path, remove_snapshot=True)
@@ -0,0 +1,616 @@
+#!/usr/bin/env python3
+"""
+SQL语句耗时分析模块
+设置 TRAFFIC_SLOW_QUERY_MS（如100毫秒，默认0为关闭）后数据库连接使用 ProfiledConnection，每条语句的执行和读取耗时
+累计到 traffic_sql_statement_duration_seconds（按语句计时，逐行迭代按批读取，不为每行计时）；超过阈值的语句
+放入队列，由后台线程在自己的只读连接上记录 EXPLAIN QUERY PLAN（标记全表扫描和使用的索引），写入警告日志，
+保留最近的若干条（/api/slow-queries），并写入与数据库同目录的慢查询旁路表
+（data/traffic.slowlog.db，超过上限时删除最旧的记录）。请求线程上不执行任何额外的SQL。
+
+慢查询报告：python -m utils.profiling report [--sort total|max|avg|count] [--since-hours 24]
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import queue
+import logging
+import sqlite3
+import threading
+import weakref
+from collections import deque
+from typing import List, Optional
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from utils.metrics import METRICS_ENABLED, Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+# 慢查询阈值（毫秒），默认0表示不分析语句耗时（连接不使用ProfiledConnection，没有任何额外开销）
+SLOW_QUERY_MS = float(os.environ.get('TRAFFIC_SLOW_QUERY_MS', '0'))
+
+# 慢查询旁路表路径：未设置时与数据库同目录（见default_slow_query_log_path），设为off时不写入
+SLOW_QUERY_LOG = os.environ.get('TRAFFIC_SLOW_QUERY_LOG')
+
+# 旁路表保留的最大记录数
+SLOW_QUERY_LOG_MAX_ROWS = 10000
+
+# 内存中保留的最近慢查询条数
+RECENT_SLOW_QUERIES = 50
+
+# 日志和记录中参数的最大个数
+MAX_LOGGED_PARAMS = 20
+
+# 逐行迭代游标时每批读取的行数（按批计时）
+ITER_BATCH_ROWS = 256
+
+# 等待后台线程分析和写入的慢查询上限（超过时丢弃）
+MAX_PENDING_SLOW_QUERIES = 1000
+
+# 报告的排序方式 -> 排序列
+REPORT_SORT_COLUMNS = {
+    'total': 'total_ms',
+    'max': 'max_ms',
+    'avg': 'avg_ms',
+    'count': 'count'
+}
+
+SQL_SECONDS = Histogram('traffic_sql_statement_duration_seconds', 'SQL语句耗时（执行+读取结果）')
+SLOW_QUERIES_TOTAL = Counter('traffic_slow_queries_total', '超过阈值的SQL语句数')
+
+_recent_slow_queries = deque(maxlen=RECENT_SLOW_QUERIES)
+_recent_lock = threading.Lock()
+
+# 执行计划中的表访问：SCAN/SEARCH 表名 [AS 别名] [USING [COVERING] INDEX 索引名 | USING INTEGER PRIMARY KEY]
+_PLAN_ACCESS = re.compile(
+    r'^(SCAN|SEARCH) (\S+)(?: AS \S+)?(?: USING (?:(?:COVERING )?INDEX (\S+)|(INTEGER PRIMARY KEY)))?'
+)
+
+
+def normalize_sql(sql: str) -> str:
+    """合并空白，便于在日志中单行显示和按语句分组"""
+    return ' '.join(sql.split())
+
+
+def explain_query_plan(connection: sqlite3.Connection, sql: str, parameters=()) -> List[str]:
+    """
+    获取语句的执行计划
+
+    Args:
+        connection: 执行该语句的连接
+        sql: SQL语句
+        parameters: 语句参数
+
+    Returns:
+        List[str]: 执行计划各行（按层级缩进），非查询语句或无法分析时为空列表
+    """
+    if not sql.lstrip().upper().startswith(('SELECT', 'WITH')):
+        return []
+    try:
+        cursor = connection.cursor(sqlite3.Cursor)
+        cursor.execute(f"EXPLAIN QUERY PLAN {sql}", parameters)
+        rows = cursor.fetchall()
+    except sqlite3.Error as e:
+        logger.debug("无法获取执行计划: %s", e)
+        return []
+
+    depths = {0: -1}
+    plan = []
+    for node_id, parent_id, _, detail in (tuple(row) for row in rows):
+        depth = depths.get(parent_id, -1) + 1
+        depths[node_id] = depth
+        plan.append('  ' * depth + detail)
+    return plan
+
+
+def analyze_plan(plan: List[str]) -> dict:
+    """
+    分析执行计划中的表访问方式
+
+    Args:
+        plan: explain_query_plan 返回的执行计划各行
+
+    Returns:
+        dict: {
+            'full_scan': 是否有不使用索引的全表扫描（如 SCAN traffic）,
+            'scanned_tables': 全表扫描的表,
+            'indexes': 使用的索引（主键查找记为 PRIMARY KEY）,
+            'temp_btree': 是否需要临时B树排序/分组/去重
+        }
+    """
+    scanned_tables = []
+    indexes = []
+    temp_btree = False
+    for line in plan:
+        detail = line.strip()
+        if detail.startswith('USE TEMP B-TREE'):
+            temp_btree = True
+            continue
+        match = _PLAN_ACCESS.match(detail)
+        if match is None:
+            continue
+        operation, table, index, primary_key = match.groups()
+        # 子查询、CTE物化结果和常量行不是对表的扫描
+        if table.startswith('(') or table == 'CONSTANT':
+            continue
+        if index:
+            indexes.append(index)
+        elif primary_key:
+            indexes.append('PRIMARY KEY')
+        elif operation == 'SCAN':
+            scanned_tables.append(table)
+    return {
+        'full_scan': bool(scanned_tables),
+        'scanned_tables': list(dict.fromkeys(scanned_tables)),
+        'indexes': list(dict.fromkeys(indexes)),
+        'temp_btree': temp_btree
+    }
+
+
+def default_slow_query_log_path(db_path: str) -> Optional[str]:
+    """
+    旁路表默认与数据库放在同一目录：data/traffic.db -> data/traffic.slowlog.db
+
+    Returns:
+        Optional[str]: 旁路表路径，内存数据库或 TRAFFIC_SLOW_QUERY_LOG=off 时为None
+    """
+    if SLOW_QUERY_LOG is not None:
+        return None if SLOW_QUERY_LOG.lower() == 'off' else SLOW_QUERY_LOG
+    if not db_path:
+        return None
+    return os.path.splitext(db_path)[0] + '.slowlog.db'
+
+
+class SlowQueryLog:
+    """慢查询旁路表（独立的SQLite文件，多个工作进程可同时写入，超过max_rows时删除最旧的记录）"""
+
+    def __init__(self, path: str, max_rows: int = SLOW_QUERY_LOG_MAX_ROWS):
+        self.path = path
+        self.max_rows = max_rows
+        self._lock = threading.Lock()
+        # 普通连接：旁路表自身的语句不参与分析
+        self._connection = sqlite3.connect(path, timeout=5, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS slow_queries (
+                id INTEGER PRIMARY KEY,
+                timestamp REAL NOT NULL,
+                db_path TEXT,
+                sql TEXT NOT NULL,
+                params TEXT,
+                duration_ms REAL NOT NULL,
+                rows INTEGER,
+                full_scan INTEGER NOT NULL,
+                indexes TEXT,
+                plan TEXT
+            )
+        """)
+        self._connection.commit()
+
+    def record(self, entry: dict) -> None:
+        """
+        写入一条慢查询并删除超出上限的旧记录
+
+        Args:
+            entry: record_statement 生成的慢查询记录
+        """
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT INTO slow_queries (timestamp, db_path, sql, params, duration_ms, rows, full_scan, indexes, plan) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (entry['timestamp'], entry['db_path'], entry['sql'],
+                 json.dumps(entry['params'], ensure_ascii=False, default=str), entry['duration_ms'], entry['rows'],
+                 int(entry['full_scan']), ','.join(entry['indexes']), '\n'.join(entry['plan']))
+            )
+            self._connection.execute(
+                "DELETE FROM slow_queries WHERE id <= (SELECT MAX(id) FROM slow_queries) - ?", (self.max_rows,)
+            )
+
+    def report(self, limit: int = 10, since: Optional[float] = None, sort: str = 'total') -> List[dict]:
+        """
+        按语句汇总慢查询
+
+        Args:
+            limit: 返回的语句数
+            since: 只统计该时间戳之后的记录
+            sort: 排序方式（total/max/avg/count，见REPORT_SORT_COLUMNS）
+
+        Returns:
+            List[dict]: 每条语句的次数、总/平均/最大耗时、最大返回行数、是否全表扫描，
+                        以及最慢一次的参数和执行计划
+        """
+        if sort not in REPORT_SORT_COLUMNS:
+            raise ValueError(f"不支持的排序方式: {sort}")
+        since = since or 0
+        with self._lock:
+            cursor = self._connection.execute(f"""
+                SELECT sql, COUNT(*) AS count, SUM(duration_ms) AS total_ms, AVG(duration_ms) AS avg_ms,
+                       MAX(duration_ms) AS max_ms, MAX(rows) AS max_rows, MAX(full_scan) AS full_scan,
+                       MAX(timestamp) AS last_seen
+                FROM slow_queries
+                WHERE timestamp >= ?
+                GROUP BY sql
+                ORDER BY {REPORT_SORT_COLUMNS[sort]} DESC
+                LIMIT ?
+            """, (since, limit))
+            columns = [column[0] for column in cursor.description]
+            groups = [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+            for group in groups:
+                params, indexes, plan = self._connection.execute("""
+                    SELECT params, indexes, plan FROM slow_queries
+                    WHERE sql = ? AND timestamp >= ?
+                    ORDER BY duration_ms DESC
+                    LIMIT 1
+                """, (group['sql'], since)).fetchone()
+                group['full_scan'] = bool(group['full_scan'])
+                group['slowest_params'] = json.loads(params) if params else []
+                group['indexes'] = indexes.split(',') if indexes else []
+                group['plan'] = plan.split('\n') if plan else []
+        return groups
+
+    def close(self) -> None:
+        """关闭旁路表连接"""
+        with self._lock:
+            self._connection.close()
+
+
+# 旁路表注册表 {(进程id, 路径): SlowQueryLog 或 None（无法写入）}
+_slow_query_logs = {}
+_slow_query_logs_lock = threading.Lock()
+
+
+def get_slow_query_log(path: str) -> Optional[SlowQueryLog]:
+    """获取（按需创建）当前进程的旁路表，无法打开时返回None且不再重试"""
+    key = (os.getpid(), path)
+    with _slow_query_logs_lock:
+        if key not in _slow_query_logs:
+            try:
+                _slow_query_logs[key] = SlowQueryLog(path)
+            except sqlite3.Error as e:
+                logger.warning("⚠️ 无法打开慢查询旁路表 %s，慢查询只记录到日志: %s", path, e)
+                _slow_query_logs[key] = None
+        return _slow_query_logs[key]
+
+
+def _database_file(connection: sqlite3.Connection) -> str:
+    """连接的主数据库文件路径（内存数据库为空字符串），结果缓存在连接上（在使用该连接的线程中调用）"""
+    path = getattr(connection, '_profiling_db_file', None)
+    if path is None:
+        try:
+            rows = connection.cursor(sqlite3.Cursor).execute("PRAGMA database_list").fetchall()
+            path = next((tuple(row)[2] for row in rows if tuple(row)[1] == 'main'), '') or ''
+        except sqlite3.Error:
+            path = ''
+        try:
+            connection._profiling_db_file = path
+        except AttributeError:
+            pass
+    return path
+
+
+class SlowQueryWriter:
+    """
+    慢查询后台写入线程
+
+    请求线程只把慢查询放入队列；执行计划在写入线程自己的只读连接上分析（不占用、不打断请求的连接），
+    再写入警告日志、最近慢查询列表和旁路表。队列已满时丢弃新的慢查询。
+    """
+
+    def __init__(self, max_pending: int = MAX_PENDING_SLOW_QUERIES):
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._connections = {}
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._run, name='traffic-slow-query-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, entry: dict) -> None:
+        """放入一条待分析的慢查询（不阻塞）"""
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped == 1 or self.dropped % 1000 == 0:
+                logger.warning("⚠️ 慢查询写入队列已满，已丢弃 %d 条", self.dropped)
+
+    def wait(self) -> None:
+        """等待队列中的慢查询全部处理完"""
+        self._queue.join()
+
+    def _run(self) -> None:
+        while True:
+            entry = self._queue.get()
+            try:
+                self._process(entry)
+            except Exception as e:
+                logger.warning("⚠️ 处理慢查询记录失败: %s", e)
+            finally:
+                self._queue.task_done()
+
+    def _explain_connection(self, db_path: str) -> Optional[sqlite3.Connection]:
+        """写入线程分析执行计划用的只读连接（每个数据库一个，普通连接不参与分析）"""
+        if db_path not in self._connections:
+            try:
+                self._connections[db_path] = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+            except sqlite3.Error as e:
+                logger.debug("无法打开数据库分析执行计划: %s", e)
+                self._connections[db_path] = None
+        return self._connections[db_path]
+
+    def _process(self, entry: dict) -> None:
+        """分析执行计划并记录一条慢查询"""
+        sql, parameters = entry.pop('statement')
+        connection = self._explain_connection(entry['db_path']) if entry['db_path'] else None
+        plan = explain_query_plan(connection, sql, parameters) if connection is not None else []
+        entry['plan'] = plan
+        entry.update(analyze_plan(plan))
+        with _recent_lock:
+            _recent_slow_queries.append(entry)
+        logger.warning("🐢 慢查询 %.1fms 返回%s行%s: %s 参数=%s 执行计划=%s",
+                       entry['duration_ms'], entry['rows'], '（全表扫描）' if entry['full_scan'] else '',
+                       entry['sql'], entry['params'], ' | '.join(plan))
+
+        log_path = default_slow_query_log_path(entry['db_path'])
+        slow_query_log = get_slow_query_log(log_path) if log_path else None
+        if slow_query_log is not None:
+            try:
+                slow_query_log.record(entry)
+            except sqlite3.Error as e:
+                logger.warning("⚠️ 写入慢查询旁路表失败: %s", e)
+
+
+# 写入线程注册表 {进程id: SlowQueryWriter}，fork之后子进程重新创建
+_writers = {}
+
+
+def get_slow_query_writer() -> SlowQueryWriter:
+    """获取（按需启动）当前进程的慢查询写入线程"""
+    pid = os.getpid()
+    with _slow_query_logs_lock:
+        writer = _writers.get(pid)
+        if writer is None:
+            writer = _writers[pid] = SlowQueryWriter()
+        return writer
+
+
+def wait_slow_queries() -> None:
+    """等待已提交的慢查询分析和写入完成（测试和基准工具使用）"""
+    get_slow_query_writer().wait()
+
+
+def record_statement(db_path: str, sql: str, parameters, elapsed: float, rows: Optional[int] = None) -> None:
+    """
+    记录一条语句的耗时，超过阈值时交给后台线程分析执行计划并写入慢查询记录
+
+    Args:
+        db_path: 执行该语句的数据库文件（内存数据库为空字符串，不分析执行计划）
+        sql: SQL语句
+        parameters: 语句参数
+        elapsed: 耗时（秒）
+        rows: 返回（或修改）的行数
+    """
+    SQL_SECONDS.observe((), elapsed)
+    if SLOW_QUERY_MS <= 0 or elapsed * 1000 < SLOW_QUERY_MS:
+        return
+
+    SLOW_QUERIES_TOTAL.inc()
+    params = list(parameters)[:MAX_LOGGED_PARAMS] if isinstance(parameters, (list, tuple)) else parameters
+    get_slow_query_writer().submit({
+        'sql': normalize_sql(sql),
+        'statement': (sql, parameters),
+        'params': params,
+        'duration_ms': round(elapsed * 1000, 3),
+        'rows': rows,
+        'timestamp': time.time(),
+        'db_path': db_path
+    })
+
+
+def get_recent_slow_queries() -> List[dict]:
+    """最近的慢查询（最新的在前）"""
+    with _recent_lock:
+        return list(reversed(_recent_slow_queries))
+
+
+class _Statement:
+    """一条语句的累计耗时和行数（记录后不再累计）"""
+
+    __slots__ = ('sql', 'parameters', 'elapsed', 'rows', 'finished')
+
+    def __init__(self, sql, parameters):
+        self.sql = sql
+        self.parameters = parameters
+        self.elapsed = 0.0
+        self.rows = 0
+        self.finished = False
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    """
+    记录语句耗时和返回行数的游标：execute 及随后的 fetch*/迭代累计为同一条语句，
+    结果读完、执行下一条语句或关闭游标时记录
+
+    只读取了部分结果就被丢弃的游标（如 COUNT 查询的 fetchone）由连接在创建下一个游标、提交、
+    归还连接池或关闭时记录——都在使用该连接的线程中，从不在垃圾回收（__del__）时执行。
+    for 循环迭代时按 ITER_BATCH_ROWS 行一批调用 fetchmany，计时在批次粒度上进行。
+    """
+
+    _statement = None
+
+    def execute(self, sql, parameters=()):
+        self._finish_statement()
+        statement = self._statement = _Statement(sql, parameters)
+        self.connection._track_statement(self, statement)
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            statement.elapsed = time.perf_counter() - started
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._add(time.perf_counter() - started, 0 if row is None else 1)
+        if row is None:
+            self._finish_statement()
+        return row
+
+    def fetchmany(self, size: Optional[int] = None):
+        size = self.arraysize if size is None else size
+        started = time.perf_counter()
+        rows = super().fetchmany(size)
+        self._add(time.perf_counter() - started, len(rows))
+        if len(rows) < size:
+            self._finish_statement()
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._add(time.perf_counter() - started, len(rows))
+        self._finish_statement()
+        return rows
+
+    def __iter__(self):
+        return self._iter_batches()
+
+    def _iter_batches(self):
+        """按批读取结果并逐行返回"""
+        while True:
+            rows = self.fetchmany(ITER_BATCH_ROWS)
+            yield from rows
+            if len(rows) < ITER_BATCH_ROWS:
+                return
+
+    def close(self):
+        self._finish_statement()
+        super().close()
+
+    def _add(self, elapsed: float, rows: int) -> None:
+        statement = self._statement
+        if statement is not None:
+            statement.elapsed += elapsed
+            statement.rows += rows
+
+    def _finish_statement(self) -> None:
+        """记录当前语句（每条语句只记录一次）"""
+        statement = self._statement
+        if statement is None:
+            return
+        self._statement = None
+        if not statement.rows:
+            statement.rows = max(self.rowcount, 0)
+        self.connection._finish_statement(statement)
+
+
+class ProfiledConnection(sqlite3.Connection):
+    """cursor() 和 execute() 都使用 ProfiledCursor 的连接，并记录被丢弃游标上未读完的语句"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # 未结束的语句 [(游标弱引用, _Statement)]
+        self._open_statements = []
+
+    def cursor(self, factory=ProfiledCursor):
+        self._flush_statements(abandoned_only=True)
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def commit(self):
+        self._flush_statements()
+        super().commit()
+
+    def close(self):
+        self._flush_statements()
+        super().close()
+
+    def flush_statements(self) -> None:
+        """记录所有未结束的语句（归还连接池前调用）"""
+        self._flush_statements()
+
+    def _track_statement(self, cursor: ProfiledCursor, statement: _Statement) -> None:
+        self._open_statements.append((weakref.ref(cursor), statement))
+
+    def _finish_statement(self, statement: _Statement) -> None:
+        if statement.finished:
+            return
+        statement.finished = True
+        record_statement(_database_file(self), statement.sql, statement.parameters, statement.elapsed,
+                         statement.rows)
+
+    def _flush_statements(self, abandoned_only: bool = False) -> None:
+        """记录已结束或（abandoned_only时仅）游标已被回收的语句，并从跟踪列表中移除"""
+        remaining = []
+        for cursor_ref, statement in self._open_statements:
+            if statement.finished:
+                continue
+            if abandoned_only and cursor_ref() is not None:
+                remaining.append((cursor_ref, statement))
+                continue
+            self._finish_statement(statement)
+        self._open_statements = remaining
+
+
+def connection_factory():
+    """sqlite3.connect 的 factory 参数：启用语句分析时为 ProfiledConnection"""
+    return ProfiledConnection if METRICS_ENABLED and SLOW_QUERY_MS > 0 else sqlite3.Connection
+
+
+def format_report(groups: List[dict]) -> str:
+    """
+    把 SlowQueryLog.report 的结果格式化为文本报告
+
+    Args:
+        groups: 按语句汇总的慢查询
+
+    Returns:
+        str: 报告文本
+    """
+    if not groups:
+        return "✅ 没有慢查询记录"
+    lines = []
+    for rank, group in enumerate(groups, 1):
+        access = "⚠️ 全表扫描" if group['full_scan'] else f"索引: {', '.join(group['indexes']) or '无'}"
+        lines.append(f"#{rank} {group['count']}次  总计{group['total_ms']:.1f}ms  平均{group['avg_ms']:.1f}ms  "
+                     f"最大{group['max_ms']:.1f}ms  最多返回{group['max_rows']}行  {access}")
+        lines.append(f"    {group['sql']}")
+        lines.append(f"    最慢一次参数: {group['slowest_params']}")
+        lines.extend(f"    | {line}" for line in group['plan'])
+        lines.append('')
+    return '\n'.join(lines).rstrip('\n')
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from utils.database import resolve_db_path
+
+    parser = argparse.ArgumentParser(description="慢查询报告工具")
+    parser.add_argument('command', choices=['report'], help='report: 按语句汇总最耗时的慢查询')
+    parser.add_argument('--db', default=None, help='数据库文件路径（用于确定默认旁路表路径）')
+    parser.add_argument('--log', default=None, help='慢查询旁路表路径')
+    parser.add_argument('--limit', type=int, default=10, help='显示的语句数')
+    parser.add_argument('--since-hours', type=float, default=None, help='只统计最近若干小时')
+    parser.add_argument('--sort', choices=sorted(REPORT_SORT_COLUMNS), default='total', help='排序方式')
+    parser.add_argument('--json', action='store_true', help='以JSON格式输出')
+    args = parser.parse_args()
+
+    log_path = args.log or default_slow_query_log_path(resolve_db_path(args.db))
+    if not log_path or not os.path.exists(log_path):
+        print(f"❌ 慢查询旁路表不存在: {log_path}")
+        sys.exit(1)
+
+    since = time.time() - args.since_hours * 3600 if args.since_hours else None
+    slow_query_log = SlowQueryLog(log_path)
+    groups = slow_query_log.report(limit=args.limit, since=since, sort=args.sort)
+    slow_query_log.close()
+    if args.json:
+        print(json.dumps(groups, ensure_ascii=False, indent=2))
+    else:
+        print(format_report(groups))
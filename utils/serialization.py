@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+记录序列化模块
+把数据库返回的记录元组转换为接口响应，避免逐行构造 sqlite3.Row / datetime / timezone 对象：
+- format_local_times: 按统计时区批量格式化时间戳（日期字符串按天缓存，时分秒查表拼接）
+- record_dicts: 行格式，每条记录一个字典（含 formatted_time 和 direction_text）
+- columnar_payload: 列式格式 {"columns": [...], "rows": [[...]]}，时间和方向由浏览器格式化
+- FastJSONProvider: Flask的JSON序列化，安装orjson时使用orjson，否则使用紧凑的标准库json
+"""
+
+import os
+import sys
+from datetime import date
+from typing import Iterable, List
+
+from flask.json.provider import DefaultJSONProvider
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from utils.constants import DIRECTION_MAP, get_direction_text
+from utils.database import RECORD_COLUMNS, TIMEZONE_OFFSET_MINUTES
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# 数据表格的响应格式：records（行，默认）或 columns（列式）
+PAYLOAD_FORMATS = ('records', 'columns')
+
+# 时间后缀中的时区名称
+TIME_LABEL = '北京时间' if TIMEZONE_OFFSET_MINUTES == 480 else f'UTC{TIMEZONE_OFFSET_MINUTES / 60:+g}'
+
+_OFFSET_SECONDS = TIMEZONE_OFFSET_MINUTES * 60
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+# 'HH:MM:' 和 'SS (时区)' 查找表，按分钟/秒下标取出
+_CLOCK_TEXT = [f'{hour:02d}:{minute:02d}:' for hour in range(24) for minute in range(60)]
+_SECOND_TEXT = [f'{second:02d} ({TIME_LABEL})' for second in range(60)]
+# {距1970-01-01的天数: 'YYYY-MM-DD '}
+_date_cache = {}
+_DATE_CACHE_MAX_ENTRIES = 4096
+
+# 方向描述（未知方向退回 get_direction_text）
+_DIRECTION_TEXT = {direction: get_direction_text(direction) for direction in DIRECTION_MAP}
+
+
+def format_local_times(timestamps: Iterable[float]) -> List[str]:
+    """
+    批量格式化时间戳，结果与
+    datetime.fromtimestamp(t, tz=LOCAL_TZ).strftime('%Y-%m-%d %H:%M:%S (北京时间)') 相同
+
+    Args:
+        timestamps: Unix时间戳序列
+
+    Returns:
+        List[str]: 格式化后的本地时间
+    """
+    if len(_date_cache) > _DATE_CACHE_MAX_ENTRIES:
+        _date_cache.clear()
+    dates = _date_cache
+    clock = _CLOCK_TEXT
+    seconds_text = _SECOND_TEXT
+    result = []
+    append = result.append
+    for timestamp in timestamps:
+        # 与datetime相同：先舍入到微秒再截断到秒
+        local = timestamp + _OFFSET_SECONDS + 5e-7
+        whole = int(local)
+        if whole > local:
+            whole -= 1
+        day, second_of_day = divmod(whole, 86400)
+        date_text = dates.get(day)
+        if date_text is None:
+            date_text = dates[day] = date.fromordinal(_EPOCH_ORDINAL + day).isoformat() + ' '
+        minute, second = divmod(second_of_day, 60)
+        append(date_text + clock[minute] + seconds_text[second])
+    return result
+
+
+def direction_text(direction) -> str:
+    """方向描述"""
+    text = _DIRECTION_TEXT.get(direction)
+    return text if text is not None else get_direction_text(direction)
+
+
+def record_dicts(rows: List[tuple], columns: tuple = RECORD_COLUMNS) -> List[dict]:
+    """
+    RECORD_COLUMNS 顺序的元组 -> 接口的记录字典（含 formatted_time 和 direction_text）
+
+    Args:
+        rows: 记录元组列表
+        columns: 元组的列（RECORD_COLUMNS之后的附加列原样放入字典，如分片数据库的 intersection）
+
+    Returns:
+        List[dict]: 记录字典列表
+    """
+    if len(columns) > len(RECORD_COLUMNS):
+        extra_columns = columns[len(RECORD_COLUMNS):]
+        records = record_dicts([row[:len(RECORD_COLUMNS)] for row in rows])
+        for record, row in zip(records, rows):
+            record.update(zip(extra_columns, row[len(RECORD_COLUMNS):]))
+        return records
+    formatted_times = format_local_times([row[2] for row in rows])
+    return [
+        {'id': row_id, 'direction': direction, 'time': timestamp, 'plate': plate,
+         'formatted_time': formatted_time, 'direction_text': direction_text(direction)}
+        for (row_id, direction, timestamp, plate), formatted_time in zip(rows, formatted_times)
+    ]
+
+
+def columnar_payload(rows: List[tuple], columns: tuple = RECORD_COLUMNS) -> dict:
+    """
+    列式响应：只包含原始列，附带浏览器格式化所需的时区偏移和方向描述
+
+    Args:
+        rows: 记录元组列表
+        columns: 元组的列
+
+    Returns:
+        dict: {'columns', 'rows', 'utc_offset_minutes', 'time_label', 'direction_labels'}
+    """
+    return {
+        'columns': list(columns),
+        'rows': rows,
+        'utc_offset_minutes': TIMEZONE_OFFSET_MINUTES,
+        'time_label': TIME_LABEL,
+        'direction_labels': {str(direction): text for direction, text in _DIRECTION_TEXT.items()}
+    }
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    更快的JSON序列化：不排序键、不转义中文；安装orjson时由orjson序列化
+    （调试模式需要缩进输出时仍使用标准库）
+    """
+
+    sort_keys = False
+    ensure_ascii = False
+
+    def dumps(self, obj, **kwargs) -> str:
+        if orjson is not None and not kwargs.get('indent'):
+            return orjson.dumps(obj, default=self.default, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+        return super().dumps(obj, **kwargs)
+
+    def response(self, *args, **kwargs):
+        """jsonify：orjson直接生成响应字节，不经过str"""
+        pretty = self.compact is False or (self.compact is None and self._app.debug)
+        if orjson is None or pretty:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        content = orjson.dumps(obj, default=self.default,
+                               option=orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE)
+        return self._app.response_class(content, mimetype=self.mimetype)
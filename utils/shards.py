@@ -0,0 +1,575 @@
+#!/usr/bin/env python3
+"""
+多路口分片模块
+TRAFFIC_DB_PATH 指向目录时，目录下的每个 *.db 文件是一个分片（文件名即路口名称，如 data/shards/north_gate.db；
+也可以按月份拆分），各分片是结构相同的traffic表，可以各自建立索引、本地时间列和汇总表。
+
+ShardedTrafficDatabase 与 TrafficDatabase 接口相同：
+- 聚合（图表、共享统计）在进程池中并行查询各分片，按 小时/星期/方向 合并计数
+- 计数、分页搜索、导出和车牌查询在线程池中并行查询各分片（SQLite执行查询时释放GIL，启动进程的开销不值得）
+- 分页搜索按排序键 k 路归并，每个分片只读取本页需要的记录；记录在原有列之后附加所属路口（intersection）
+- 所有接口支持 intersection 参数（逗号分隔）只查询部分路口
+"""
+
+import os
+import sys
+import heapq
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from utils.database import (CURSOR_SORT_KEYS, EXPORT_BATCH_ROWS, PLATE_LOOKUP_MAX_LIMIT, RECORD_COLUMNS,
+                            TrafficDatabase, decode_cursor, encode_cursor, get_database,
+                            merge_aggregate_counts)
+
+logger = logging.getLogger(__name__)
+
+# 分片文件扩展名（慢查询旁路表 *.slowlog.db 不是分片）
+SHARD_SUFFIX = '.db'
+IGNORED_SUFFIXES = ('.slowlog.db',)
+
+# 分片记录的列：原有列 + 所属路口
+SHARD_RECORD_COLUMNS = RECORD_COLUMNS + ('intersection',)
+
+# 并行聚合的进程数：默认 min(分片数, CPU核数)；设为1时在当前进程中依次查询
+SHARD_WORKERS = int(os.environ.get('TRAFFIC_SHARD_WORKERS', '0'))
+
+# 并行读取分片的线程数
+SHARD_THREADS = 16
+
+# 按页码分页时每个分片一次最多跳过的记录数：更深的页按归并后的排序键分段定位，
+# 每段各分片只读取这么多条记录（内存和单次查询量与页码无关）
+SHARD_SEEK_ROWS = 5000
+
+# 进程池/线程池注册表 {进程id: 执行器}，fork之后子进程重新创建
+_process_pools = {}
+_thread_pools = {}
+_executors_lock = threading.Lock()
+
+
+def is_sharded(db_path: str) -> bool:
+    """数据库路径是否为分片目录"""
+    return os.path.isdir(db_path)
+
+
+def list_shards(directory: str) -> Dict[str, str]:
+    """
+    列出目录中的分片
+
+    Args:
+        directory: 分片目录
+
+    Returns:
+        Dict[str, str]: {路口名称: 分片文件路径}，按名称排序
+    """
+    shards = {}
+    for filename in sorted(os.listdir(directory)):
+        if filename.endswith(SHARD_SUFFIX) and not filename.endswith(IGNORED_SUFFIXES):
+            shards[filename[:-len(SHARD_SUFFIX)]] = os.path.join(directory, filename)
+    return shards
+
+
+def resolve_intersections(db_path: str, value: str) -> Optional[tuple]:
+    """
+    解析 intersection 参数
+
+    Args:
+        db_path: 数据库路径（分片目录或单个数据库文件）
+        value: 逗号分隔的路口名称，为空表示全部路口
+
+    Returns:
+        Optional[tuple]: 按名称排序的路口名称，未指定时为None
+
+    Raises:
+        ValueError: 未使用分片目录，或路口不存在
+    """
+    names = sorted({name.strip() for name in (value or '').split(',') if name.strip()})
+    if not names:
+        return None
+    if not is_sharded(db_path):
+        raise ValueError("未配置分片数据库（TRAFFIC_DB_PATH不是目录），不支持按路口筛选")
+    available = list_shards(db_path)
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        raise ValueError(f"路口不存在: {', '.join(unknown)}（可选: {', '.join(available)}）")
+    return tuple(names)
+
+
+def open_sharded_database(directory: str, intersections: Optional[tuple] = None) -> 'ShardedTrafficDatabase':
+    """
+    创建分片数据库实例
+
+    Args:
+        directory: 分片目录
+        intersections: 只查询这些路口，None表示全部
+
+    Returns:
+        ShardedTrafficDatabase: 分片数据库实例
+
+    Raises:
+        ValueError: 目录中没有分片或路口不存在
+    """
+    shards = list_shards(directory)
+    if intersections:
+        missing = [name for name in intersections if name not in shards]
+        if missing:
+            raise ValueError(f"路口不存在: {', '.join(missing)}")
+        shards = {name: shards[name] for name in sorted(intersections)}
+    if not shards:
+        raise ValueError(f"分片目录中没有数据库文件: {directory}")
+    return ShardedTrafficDatabase(shards, directory)
+
+
+def aggregate_shard(db_path: str, group_columns: List[str], time_range: str = None,
+                    direction_filter: str = None, start: float = None, end: float = None) -> list:
+    """
+    查询单个分片的分组计数（在聚合进程中执行，每个进程为各分片保留自己的连接池；
+    各分片已经并行，分片内不再按id范围切分）
+
+    Returns:
+        list: [(分组值..., 数量)]
+    """
+    db = get_database(db_path, pooled=True)
+    if not db.connect():
+        raise RuntimeError(f"无法连接分片: {db_path}")
+    try:
+        return db._query_aggregate_counts(group_columns, time_range, direction_filter, start, end, parallel=False)
+    finally:
+        db.disconnect()
+
+
+def get_shard_process_pool(shard_count: int) -> Optional[ProcessPoolExecutor]:
+    """
+    获取当前进程的聚合进程池
+
+    使用spawn方式创建子进程（Web服务进程是多线程的，fork可能复制持有中的锁）。
+
+    Args:
+        shard_count: 分片数
+
+    Returns:
+        Optional[ProcessPoolExecutor]: 进程池，只需一个进程时返回None（在当前进程中查询）
+    """
+    workers = SHARD_WORKERS or min(shard_count, os.cpu_count() or 1)
+    if workers <= 1 or shard_count <= 1:
+        return None
+    pid = os.getpid()
+    with _executors_lock:
+        executor = _process_pools.get(pid)
+        if executor is None:
+            executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+            _process_pools[pid] = executor
+        return executor
+
+
+def _get_thread_pool() -> ThreadPoolExecutor:
+    """获取当前进程读取分片的线程池"""
+    pid = os.getpid()
+    with _executors_lock:
+        executor = _thread_pools.get(pid)
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=SHARD_THREADS, thread_name_prefix='traffic-shard')
+            _thread_pools[pid] = executor
+        return executor
+
+
+class ShardedTrafficDatabase(TrafficDatabase):
+    """
+    由多个分片（路口）组成的只读数据库，接口与 TrafficDatabase 相同
+
+    分片通过各自的共享只读连接池访问；维护命令（migrate/index/rollup）需要对每个分片分别执行。
+    """
+
+    record_columns = SHARD_RECORD_COLUMNS
+
+    def __init__(self, shards: Dict[str, str], directory: str = ''):
+        """
+        初始化分片数据库
+
+        Args:
+            shards: {路口名称: 分片文件路径}
+            directory: 分片目录
+        """
+        # db_path 区分不同的分片组合，作为缓存和查询合并的键
+        super().__init__(f"{directory}#{','.join(shards)}")
+        self.directory = directory
+        self.shard_paths = dict(shards)
+        self.shards = {name: get_database(path, pooled=True) for name, path in shards.items()}
+
+    @property
+    def intersections(self) -> List[str]:
+        """查询的路口名称"""
+        return list(self.shards)
+
+    @property
+    def live_db_path(self) -> Optional[str]:
+        """只查询一个路口时可以使用该分片的实时推送，多个路口时不支持"""
+        if len(self.shard_paths) == 1:
+            return next(iter(self.shard_paths.values()))
+        return None
+
+    def connect(self) -> bool:
+        """
+        从各分片的连接池借出连接
+
+        Returns:
+            bool: 全部分片是否都连接成功
+        """
+        connected = []
+        for shard in self.shards.values():
+            if not shard.connect():
+                for other in connected:
+                    other.disconnect()
+                return False
+            connected.append(shard)
+        # 第一个分片的连接用于连接状态检查（基类方法据此判断是否已连接）
+        self.connection = connected[0].connection
+        self._local_columns_ready = None
+        return True
+
+    def disconnect(self):
+        """归还各分片的连接"""
+        for shard in self.shards.values():
+            shard.disconnect()
+        self.connection = None
+
+    def get_data_version(self) -> tuple:
+        """
+        各分片数据版本的组合
+
+        Returns:
+            tuple: (各分片最大id之和, 各分片的文件修改时间...)；只有一个分片时与该分片的版本相同
+        """
+        versions = [shard.get_data_version() for shard in self.shards.values()]
+        return (sum(version[0] for version in versions),) + tuple(
+            value for version in versions for value in version[1:]
+        )
+
+    def _map_shards(self, func: Callable) -> list:
+        """
+        在线程池中对每个分片执行 func(路口名称, 分片)
+
+        Returns:
+            list: 按路口名称顺序的结果
+        """
+        items = list(self.shards.items())
+        if len(items) == 1:
+            return [func(*items[0])]
+        return list(_get_thread_pool().map(lambda item: func(*item), items))
+
+    def count_with_filters(self, time_range: str = '', direction_filter: str = '',
+                           estimate: bool = False, start: float = None, end: float = None) -> tuple:
+        """
+        各分片匹配总数之和（各分片使用自己的计数缓存、汇总表和估算）
+
+        Returns:
+            tuple: (总记录数, 是否为估算值)
+        """
+        if self._shared_depth:
+            rows = self._aggregate_counts(['direction'], time_range=time_range,
+                                          direction_filter=direction_filter, start=start, end=end)
+            return sum(count for _, count in rows), False
+
+        results = self._map_shards(lambda name, shard: shard.count_with_filters(
+            time_range, direction_filter, estimate=estimate, start=start, end=end
+        ))
+        return sum(total for total, _ in results), any(estimated for _, estimated in results)
+
+    def _query_aggregate_counts(self, group_columns: List[str], time_range: str = None,
+                                direction_filter: str = None, start: float = None, end: float = None,
+                                id_range: tuple = None, parallel: bool = True) -> list:
+        """
+        在进程池中并行统计各分片的分组计数并合并
+
+        Args:
+            id_range: 不支持（各分片的id互相重叠），必须为None
+            parallel: 忽略，各分片总是并行统计，分片内不再按id范围切分
+
+        Returns:
+            list: [(分组值..., 数量)] 按分组列排序
+
+        Raises:
+            ValueError: 指定了id_range
+        """
+        if id_range is not None:
+            raise ValueError("分片数据库不支持按id范围统计（各分片的id互相重叠）")
+        paths = list(self.shard_paths.values())
+        args = (group_columns, time_range, direction_filter, start, end)
+        executor = get_shard_process_pool(len(paths))
+        if executor is None:
+            results = [aggregate_shard(path, *args) for path in paths]
+        else:
+            results = list(executor.map(aggregate_shard, paths, *([arg] * len(paths) for arg in args)))
+        return merge_aggregate_counts(results)
+
+    def _merge_key(self, sort: str) -> Callable:
+        """
+        归并排序键：(第一排序列, 路口, 其余排序列)，不同路口的id可以相同，路口名称保证全局唯一
+
+        Returns:
+            Callable: 记录元组 -> 排序键
+        """
+        positions = [RECORD_COLUMNS.index(column) for column in CURSOR_SORT_KEYS[sort]]
+        first, rest = positions[0], positions[1:]
+        shard_position = len(RECORD_COLUMNS)
+
+        def merge_key(row):
+            return (row[first], row[shard_position]) + tuple(row[position] for position in rest)
+        return merge_key
+
+    def _shard_seek(self, shard: TrafficDatabase, name: str, sort: str, key: tuple, operator: str) -> tuple:
+        """
+        把全局归并键转换为单个分片内的定位条件
+
+        Args:
+            shard: 分片
+            name: 分片的路口名称
+            sort: 排序方式
+            key: 全局归并键 (第一排序列, 路口, 其余排序列)
+            operator: '>' 或 '<'
+
+        Returns:
+            tuple: (条件, 参数)
+        """
+        sort_columns = CURSOR_SORT_KEYS[sort]
+        first_value, key_shard, rest = key[0], key[1], list(key[2:])
+        if name == key_shard:
+            return shard._seek_condition(sort_columns, operator), [first_value] + rest
+        # 排在该路口之后的分片包含第一排序列相等的记录，之前的分片不包含
+        after_key_shard = name > key_shard
+        inclusive = after_key_shard if operator == '>' else not after_key_shard
+        return f"{sort_columns[0]} {operator}{'=' if inclusive else ''} ?", [first_value]
+
+    def _fetch_merged(self, time_range: str, direction_filter: str, start: float, end: float, sort: str,
+                      limit: int, seek: tuple = None, descending: bool = False) -> list:
+        """
+        k 路归并读取：每个分片按排序键取前 limit 条，归并后取前 limit 条
+
+        Args:
+            time_range: 时间段筛选
+            direction_filter: 方向筛选
+            start: 时间窗口起始时间戳（包含）
+            end: 时间窗口结束时间戳（不包含）
+            sort: 排序方式
+            limit: 记录数
+            seek: 全局归并键，只读取排在其后（descending时为其前）的记录
+            descending: 是否倒序
+
+        Returns:
+            list: SHARD_RECORD_COLUMNS 顺序的记录元组
+        """
+        sort_columns = CURSOR_SORT_KEYS[sort]
+        order = 'DESC' if descending else 'ASC'
+        order_clause = ', '.join(f"{column} {order}" for column in sort_columns)
+
+        def fetch(name, shard):
+            conditions, params = shard._build_filter_conditions(time_range, direction_filter, start, end)
+            if seek is not None:
+                condition, seek_params = self._shard_seek(shard, name, sort, seek, '<' if descending else '>')
+                conditions.append(condition)
+                params.extend(seek_params)
+            where_clause = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+            cursor = shard.connection.cursor()
+            cursor.row_factory = None
+            cursor.execute(f"""
+                SELECT {', '.join(RECORD_COLUMNS)} FROM {shard._source(start, end)}
+                {where_clause}
+                ORDER BY {order_clause}
+                LIMIT ?
+            """, params + [limit])
+            return [row + (name,) for row in cursor.fetchall()]
+
+        merged = heapq.merge(*self._map_shards(fetch), key=self._merge_key(sort), reverse=descending)
+        return [row for _, row in zip(range(limit), merged)]
+
+    def _fetch_page(self, time_range: str, direction_filter: str, start: float, end: float, sort: str,
+                    offset: int, limit: int) -> list:
+        """
+        按偏移量读取归并结果中的一段记录
+
+        偏移量超过 SHARD_SEEK_ROWS 时，每次归并读取 SHARD_SEEK_ROWS 条，
+        用最后一条的全局归并键定位各分片（与游标翻页相同）后继续跳过，
+        每个分片每次查询最多读取 SHARD_SEEK_ROWS + limit 条。
+
+        Args:
+            time_range: 时间段筛选
+            direction_filter: 方向筛选
+            start: 时间窗口起始时间戳（包含）
+            end: 时间窗口结束时间戳（不包含）
+            sort: 排序方式
+            offset: 跳过的记录数
+            limit: 记录数
+
+        Returns:
+            list: SHARD_RECORD_COLUMNS 顺序的记录元组
+        """
+        merge_key = self._merge_key(sort)
+        seek = None
+        while offset > SHARD_SEEK_ROWS:
+            rows = self._fetch_merged(time_range, direction_filter, start, end, sort, SHARD_SEEK_ROWS, seek=seek)
+            if len(rows) < SHARD_SEEK_ROWS:
+                return []
+            seek = merge_key(rows[-1])
+            offset -= SHARD_SEEK_ROWS
+        rows = self._fetch_merged(time_range, direction_filter, start, end, sort, offset + limit, seek=seek)
+        return rows[offset:]
+
+    def _as_records(self, rows: list, as_tuples: bool) -> list:
+        """记录元组，或按 SHARD_RECORD_COLUMNS 转换为字典"""
+        if as_tuples:
+            return rows
+        return [dict(zip(SHARD_RECORD_COLUMNS, row)) for row in rows]
+
+    def search_with_filters(self, time_range: str = '', direction_filter: str = '', page: int = 1,
+                            per_page: int = 20, total_records: int = None,
+                            start: float = None, end: float = None, as_tuples: bool = False) -> tuple:
+        """
+        跨分片的组合搜索（按 (time, 路口, id) 归并排序，支持分页）
+
+        每个分片最多读取 SHARD_SEEK_ROWS + per_page 条记录后归并，更深的页分段定位（见_fetch_page），
+        逐页翻阅时 search_with_cursor 的代价更低。
+
+        Returns:
+            tuple: (记录列表, 总记录数, 总页数)
+        """
+        counted = total_records is None
+        if counted:
+            total_records, _ = self.count_with_filters(time_range, direction_filter, start=start, end=end)
+        total_pages = (total_records + per_page - 1) // per_page
+        # 调用方传入的总数可能是估算值，为0时仍查询各分片
+        if counted and total_records == 0:
+            return [], 0, 0
+
+        rows = self._fetch_page(time_range, direction_filter, start, end, 'time', (page - 1) * per_page, per_page)
+        return self._as_records(rows, as_tuples), total_records, total_pages
+
+    def search_with_cursor(self, time_range: str = '', direction_filter: str = '', after: str = None,
+                           before: str = None, page: int = 1, per_page: int = 20, sort: str = 'id',
+                           total_records: int = None, start: float = None, end: float = None,
+                           as_tuples: bool = False) -> dict:
+        """
+        跨分片的游标分页：游标为全局归并键 (第一排序列, 路口, 其余排序列)，
+        每个分片按游标定位后只读取 per_page+1 条，翻页代价与分片数成正比、与页码无关
+
+        Returns:
+            dict: 与 TrafficDatabase.search_with_cursor 相同
+
+        Raises:
+            ValueError: 排序方式或游标无效
+        """
+        if sort not in CURSOR_SORT_KEYS:
+            raise ValueError(f"不支持的排序方式: {sort}")
+        key_length = len(CURSOR_SORT_KEYS[sort]) + 1
+
+        counted = total_records is None
+        if counted:
+            total_records, _ = self.count_with_filters(time_range, direction_filter, start=start, end=end)
+        total_pages = (total_records + per_page - 1) // per_page
+        # 调用方传入的总数可能是估算值，为0时仍查询各分片
+        if counted and total_records == 0:
+            return {
+                'records': [], 'total_records': 0, 'total_pages': 0,
+                'next_cursor': None, 'prev_cursor': None, 'has_next': False, 'has_prev': False
+            }
+
+        def fetch(limit, **kwargs):
+            return self._fetch_merged(time_range, direction_filter, start, end, sort, limit, **kwargs)
+
+        if after:
+            rows = fetch(per_page + 1, seek=self._decode_key(after, sort, key_length))
+            has_prev, has_next = True, len(rows) > per_page
+            rows = rows[:per_page]
+        elif before:
+            rows = fetch(per_page + 1, seek=self._decode_key(before, sort, key_length), descending=True)
+            has_prev, has_next = len(rows) > per_page, True
+            rows = rows[:per_page]
+            rows.reverse()
+        else:
+            rows = self._fetch_page(time_range, direction_filter, start, end, sort,
+                                    (page - 1) * per_page, per_page + 1)
+            has_prev, has_next = page > 1, len(rows) > per_page
+            rows = rows[:per_page]
+
+        if not rows:
+            has_prev = has_next = False
+        merge_key = self._merge_key(sort)
+        return {
+            'records': self._as_records(rows, as_tuples),
+            'total_records': total_records,
+            'total_pages': total_pages,
+            'next_cursor': encode_cursor(sort, merge_key(rows[-1])) if has_next else None,
+            'prev_cursor': encode_cursor(sort, merge_key(rows[0])) if has_prev else None,
+            'has_next': has_next,
+            'has_prev': has_prev
+        }
+
+    def _decode_key(self, token: str, sort: str, key_length: int) -> tuple:
+        """解析全局归并键游标，第二个值必须是路口名称，其余为排序列的数值"""
+        values = decode_cursor(token, sort, key_length=key_length)
+        if not isinstance(values[1], str) or any(isinstance(value, str) for value in values[:1] + values[2:]):
+            raise ValueError(f"无效的分页游标: {token}")
+        return values
+
+    def iter_filtered_rows(self, time_range: str = '', direction_filter: str = '', start: float = None,
+                           end: float = None, batch_size: int = EXPORT_BATCH_ROWS) -> Iterator[list]:
+        """
+        依次按id顺序导出各分片的匹配记录（记录附加所属路口），任意时刻只有一个分片游标打开
+
+        Yields:
+            list: 一批 SHARD_RECORD_COLUMNS 顺序的元组
+        """
+        for name, shard in self.shards.items():
+            batches = shard.iter_filtered_rows(time_range, direction_filter, start, end, batch_size)
+            try:
+                for rows in batches:
+                    yield [row + (name,) for row in rows]
+            finally:
+                batches.close()
+
+    def find_by_plate(self, plate: str, limit: int = 100, start: float = None, end: float = None) -> list:
+        """
+        跨分片的车牌通行记录（按 (time, 路口, id) 归并）
+
+        Returns:
+            list: 记录字典列表（含 intersection）
+        """
+        def lookup(name, shard):
+            records = shard.find_by_plate(plate, limit=limit, start=start, end=end)
+            for record in records:
+                record['intersection'] = name
+            return records
+
+        merged = heapq.merge(*self._map_shards(lookup),
+                             key=lambda record: (record['time'], record['intersection'], record['id']))
+        return [record for _, record in zip(range(limit), merged)]
+
+    def search_plates(self, prefix: str, limit: int = 20, start: float = None, end: float = None) -> list:
+        """
+        跨分片的车牌前缀搜索：合并各分片按车牌排序的前 limit 个车牌
+        （全局前 limit 个车牌在其出现的每个分片中都排在前 limit 个之内，合并结果是精确的）
+
+        Returns:
+            list: [{'plate', 'passages', 'first_time', 'last_time', 'intersections'}] 按车牌排序
+        """
+        if not 1 <= limit <= PLATE_LOOKUP_MAX_LIMIT:
+            raise ValueError(f"limit必须在1到{PLATE_LOOKUP_MAX_LIMIT}之间")
+
+        results = self._map_shards(lambda name, shard: (name, shard.search_plates(prefix, limit=limit,
+                                                                                  start=start, end=end)))
+        merged = {}
+        for name, matches in results:
+            for match in matches:
+                existing = merged.get(match['plate'])
+                if existing is None:
+                    merged[match['plate']] = dict(match, intersections=[name])
+                    continue
+                existing['passages'] += match['passages']
+                existing['first_time'] = min(existing['first_time'], match['first_time'])
+                existing['last_time'] = max(existing['last_time'], match['last_time'])
+                existing['intersections'].append(name)
+        return [merged[plate] for plate in sorted(merged)[:limit]]
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+内存映射的列式快照
+把traffic表的数值列导出为一个带版本号的二进制文件（默认 data/traffic.columns），
+加载时通过mmap直接映射为NumPy数组：不需要扫描SQLite，也不复制数据，
+多个gunicorn工作进程映射同一个文件时共享操作系统的页缓存
+
+文件格式（版本1）：
+    8字节魔数 b'TRFCOL\\x00\\x01' | 4字节小端整数：头部长度 | JSON头部 | 按64字节对齐的列数据
+    JSON头部记录格式版本、数据版本（max_id、行数、时区）以及每列的 dtype/偏移/长度
+
+列：
+    id, time, direction, local_hour, local_weekday  - 每行一个值（direction为int8，NULL存为-1，超出0-127的值存为-2；
+                                                    time为NULL时存为NaN，local_hour/local_weekday为-1）
+    plate_index                                      - 车牌在字典中的下标
+    plate_offsets, plate_bytes                       - 车牌字典（UTF-8字节串及其起始偏移）
+
+用法：
+    python -m utils.snapshot export [--db data/traffic.db] [--output data/traffic.columns]
+    python -m utils.snapshot info
+"""
+
+import os
+import sys
+import json
+import mmap
+import logging
+import struct
+import sqlite3
+from typing import Dict, Optional
+
+import numpy as np
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from utils.analytics import encode_directions, local_hour_weekday
+from utils.constants import TIMEZONE_OFFSET_HOURS
+from utils.database import get_partitions, id_bound_sql
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_MAGIC = b'TRFCOL\x00\x01'
+SNAPSHOT_FORMAT_VERSION = 1
+_ALIGNMENT = 64
+_EXPORT_CHUNK_ROWS = 500000
+
+
+def default_snapshot_path(db_path: str) -> str:
+    """快照默认与数据库放在同一目录：data/traffic.db -> data/traffic.columns"""
+    return os.path.splitext(db_path)[0] + '.columns'
+
+
+def export_snapshot(db_path: str, output_path: Optional[str] = None) -> str:
+    """
+    从SQLite导出列式快照
+
+    先写入临时文件再原子替换，正在映射旧文件的进程不受影响。
+
+    Args:
+        db_path: 数据库文件路径
+        output_path: 快照文件路径，默认见default_snapshot_path
+
+    Returns:
+        str: 快照文件路径
+    """
+    output_path = output_path or default_snapshot_path(db_path)
+    offset_minutes = int(round(TIMEZONE_OFFSET_HOURS * 60))
+
+    connection = sqlite3.connect(db_path)
+    try:
+        cursor = connection.cursor()
+        cursor.execute(id_bound_sql(get_partitions(connection, db_path)))
+        max_id = cursor.fetchone()[0] or 0
+
+        ids, times, directions, plate_indexes = [], [], [], []
+        plate_lookup: Dict[str, int] = {}
+        cursor.execute("SELECT id, time, direction, plate FROM traffic WHERE id <= ? ORDER BY id", (max_id,))
+        while True:
+            rows = cursor.fetchmany(_EXPORT_CHUNK_ROWS)
+            if not rows:
+                break
+            ids.append(np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows)))
+            times.append(np.fromiter((row[1] for row in rows), dtype=np.float64, count=len(rows)))
+            directions.append(encode_directions(np.array([row[2] for row in rows], dtype=np.float64)))
+            plate_indexes.append(np.fromiter(
+                (plate_lookup.setdefault(row[3] or '', len(plate_lookup)) for row in rows),
+                dtype=np.uint32, count=len(rows)
+            ))
+    finally:
+        connection.close()
+
+    def join(chunks, dtype):
+        return np.concatenate(chunks) if chunks else np.empty(0, dtype=dtype)
+
+    time_column = join(times, np.float64)
+    hours, weekdays = local_hour_weekday(time_column, offset_minutes)
+
+    # 车牌字典：按下标顺序拼接UTF-8字节
+    encoded_plates = [plate.encode('utf-8') for plate in plate_lookup]
+    plate_offsets = np.zeros(len(encoded_plates) + 1, dtype=np.uint64)
+    if encoded_plates:
+        plate_offsets[1:] = np.cumsum([len(plate) for plate in encoded_plates])
+    plate_bytes = np.frombuffer(b''.join(encoded_plates), dtype=np.uint8)
+
+    columns = {
+        'id': join(ids, np.int64),
+        'time': time_column,
+        'direction': join(directions, np.int8),
+        'local_hour': hours,
+        'local_weekday': weekdays,
+        'plate_index': join(plate_indexes, np.uint32),
+        'plate_offsets': plate_offsets,
+        'plate_bytes': plate_bytes
+    }
+
+    header = {
+        'format_version': SNAPSHOT_FORMAT_VERSION,
+        'max_id': int(max_id),
+        'row_count': int(len(time_column)),
+        'plate_count': len(encoded_plates),
+        'tz_offset_minutes': offset_minutes,
+        'columns': {}
+    }
+
+    # 先计算各列偏移（头部长度依赖偏移的位数，预留足够空间）
+    header_reserve = 4096
+    offset = _align(len(SNAPSHOT_MAGIC) + 4 + header_reserve)
+    for name, array in columns.items():
+        header['columns'][name] = {'dtype': array.dtype.str, 'offset': offset, 'length': int(len(array))}
+        offset = _align(offset + array.nbytes)
+
+    header_bytes = json.dumps(header).encode('utf-8')
+    if len(header_bytes) > header_reserve:
+        raise ValueError("快照头部过大")
+
+    temp_path = output_path + '.tmp'
+    with open(temp_path, 'wb') as handle:
+        handle.write(SNAPSHOT_MAGIC)
+        handle.write(struct.pack('<I', len(header_bytes)))
+        handle.write(header_bytes)
+        for name, array in columns.items():
+            handle.seek(header['columns'][name]['offset'])
+            handle.write(np.ascontiguousarray(array).tobytes())
+        handle.truncate(offset)
+    os.replace(temp_path, output_path)
+
+    logger.info("💾 列式快照已导出: %s（%d 条记录，%d 个车牌，id ≤ %d）",
+                output_path, header['row_count'], header['plate_count'], max_id)
+    return output_path
+
+
+def _align(position: int) -> int:
+    """按64字节对齐"""
+    return (position + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+
+class ColumnSnapshot:
+    """只读的内存映射列式快照"""
+
+    def __init__(self, path: str):
+        """
+        映射快照文件
+
+        Args:
+            path: 快照文件路径
+
+        Raises:
+            ValueError: 文件格式或版本不受支持
+        """
+        self.path = path
+        with open(path, 'rb') as handle:
+            self._mmap = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._mmap[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+            self._mmap.close()
+            raise ValueError(f"不是有效的列式快照文件: {path}")
+        header_length = struct.unpack_from('<I', self._mmap, len(SNAPSHOT_MAGIC))[0]
+        header_start = len(SNAPSHOT_MAGIC) + 4
+        self.header = json.loads(self._mmap[header_start:header_start + header_length].decode('utf-8'))
+        if self.header['format_version'] != SNAPSHOT_FORMAT_VERSION:
+            self._mmap.close()
+            raise ValueError(f"不支持的快照版本: {self.header['format_version']}")
+
+        # np.frombuffer直接引用映射的内存，不复制数据
+        self.columns = {
+            name: np.frombuffer(self._mmap, dtype=np.dtype(meta['dtype']),
+                                count=meta['length'], offset=meta['offset'])
+            for name, meta in self.header['columns'].items()
+        }
+
+    @property
+    def max_id(self) -> int:
+        """快照包含的最大记录id"""
+        return self.header['max_id']
+
+    @property
+    def row_count(self) -> int:
+        """快照包含的记录数"""
+        return self.header['row_count']
+
+    @property
+    def tz_offset_minutes(self) -> int:
+        """计算本地时间列使用的时区偏移（分钟）"""
+        return self.header['tz_offset_minutes']
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.columns[name]
+
+    def plate(self, plate_index: int) -> str:
+        """根据字典下标返回车牌号"""
+        offsets = self.columns['plate_offsets']
+        start, end = int(offsets[plate_index]), int(offsets[plate_index + 1])
+        return self.columns['plate_bytes'][start:end].tobytes().decode('utf-8')
+
+
+def load_snapshot(path: str) -> Optional[ColumnSnapshot]:
+    """
+    加载快照，文件不存在或格式不受支持时返回None
+
+    Args:
+        path: 快照文件路径
+
+    Returns:
+        Optional[ColumnSnapshot]: 快照
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        return ColumnSnapshot(path)
+    except (ValueError, KeyError, OSError) as e:
+        logger.warning("⚠️ 无法加载列式快照 %s: %s", path, e)
+        return None
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from utils.database import resolve_db_path
+    from utils.metrics import configure_logging
+
+    parser = argparse.ArgumentParser(description="内存映射列式快照工具")
+    parser.add_argument('command', choices=['export', 'info'], help='export: 导出快照；info: 查看快照信息')
+    parser.add_argument('--db', default=None, help='数据库文件路径')
+    parser.add_argument('--output', default=None, help='快照文件路径')
+    args = parser.parse_args()
+    configure_logging()
+
+    db_path = resolve_db_path(args.db)
+    snapshot_path = args.output or default_snapshot_path(db_path)
+
+    if args.command == 'export':
+        export_snapshot(db_path, snapshot_path)
+    else:
+        snapshot = load_snapshot(snapshot_path)
+        if snapshot is None:
+            print(f"❌ 快照不存在: {snapshot_path}")
+            sys.exit(1)
+        info = {key: value for key, value in snapshot.header.items() if key != 'columns'}
+        print(json.dumps(info, ensure_ascii=False, indent=2))